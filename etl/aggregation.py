@@ -0,0 +1,204 @@
+# Robust daily price aggregation for the PPMT-AMP ETL
+# Computes the fact_prices measures from docs/ETL_PIPELINE.md for every product in a partition:
+# a robust market price (median, MAD outlier rejection, trimmed mean of the inliers), a
+# confidence score from sample size and dispersion, the change versus the previous day, and a
+# trend indicator against a rolling window of earlier days. Listings arrive as one columnar
+# batch sorted by (product_id, price), so every product is a contiguous, already-sorted slice
+# and its inliers are a sub-slice found by bisection. The MAD merges the deviations below and
+# above the median, which are already in order, up to their middle; nothing per product is sorted.
+
+import math
+import os
+import sqlite3
+from bisect import bisect_left, bisect_right
+
+from columnar import ColumnBatch
+
+PRICE_HISTORY_DB = os.environ.get(
+    'ETL_PRICE_HISTORY_DB',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'processed', 'price_history.db')
+)
+
+MAD_SCALE = 1.4826         # MAD -> standard deviation for normally distributed prices
+OUTLIER_Z = 3.5            # modified z-score beyond which a listing is rejected
+MIN_DISPERSION = 0.1       # floor for the MAD scale as a fraction of the median (small or identical samples)
+MIN_OUTLIER_SAMPLE = 3     # fewer listings than this are all kept
+TRIM_FRACTION = 0.1        # trimmed from each end of the inliers for the trimmed mean
+
+CONFIDENCE_SAMPLE_SCALE = 4.0   # inliers at which the sample-size factor reaches 63%
+CONFIDENCE_CV_SCALE = 0.15      # robust coefficient of variation at which the dispersion factor halves
+
+TREND_WINDOW = 7           # previous days in the rolling mean
+TREND_THRESHOLD = 3.0      # percent away from the rolling mean to count as rising/falling
+
+AGGREGATE_SCHEMA = [
+    'product_id', 'listing_count', 'outlier_count', 'source_count', 'median_price', 'trimmed_mean', 'mad',
+    'min_price', 'max_price', 'market_price', 'confidence_score'
+]
+TREND_SCHEMA = ['previous_price', 'rolling_mean', 'history_days', 'price_change_pct', 'trend_indicator']
+
+
+def group_offsets(keys):
+    """Start offsets of the runs of equal keys in a sorted column, followed by its length"""
+    offsets = [0] if keys else []
+    offsets.extend(i for i in range(1, len(keys)) if keys[i] != keys[i - 1])
+    offsets.append(len(keys))
+    return offsets
+
+
+def _median(values, lo, hi):
+    n = hi - lo
+    mid = lo + n // 2
+    return values[mid] if n % 2 else (values[mid - 1] + values[mid]) / 2
+
+
+def _mad(prices, lo, hi, median):
+    """Median absolute deviation of a sorted slice: the deviations below and above the median are
+    two ascending runs walking outward from it, merged only as far as their middle"""
+    n = hi - lo
+    left = bisect_left(prices, median, lo, hi) - 1
+    right = left + 1
+    previous = current = 0.0
+    for _ in range(n // 2 + 1):
+        if right >= hi or (left >= lo and median - prices[left] <= prices[right] - median):
+            deviation = median - prices[left]
+            left -= 1
+        else:
+            deviation = prices[right] - median
+            right += 1
+        previous, current = current, deviation
+    return current if n % 2 else (previous + current) / 2
+
+
+def confidence_score(inliers, median, mad):
+    """0-1: grows with the number of agreeing listings, shrinks with their relative spread"""
+    if inliers == 0 or median <= 0:
+        return 0.0
+    size_factor = 1 - math.exp(-inliers / CONFIDENCE_SAMPLE_SCALE)
+    cv = MAD_SCALE * mad / median
+    dispersion_factor = 1 / (1 + (cv / CONFIDENCE_CV_SCALE) ** 2)
+    return round(size_factor * dispersion_factor, 2)
+
+
+def aggregate_prices(listings):
+    """Per-product robust statistics from a batch of (product_id, price, source) sorted by product_id, price"""
+    product_ids = listings.column('product_id')
+    prices = listings.column('price')
+    sources = listings.column('source')
+    columns = {name: [] for name in AGGREGATE_SCHEMA}
+    offsets = group_offsets(product_ids)
+    for lo, hi in zip(offsets, offsets[1:]):
+        median = _median(prices, lo, hi)
+        mad = _mad(prices, lo, hi, median)
+        scale = max(MAD_SCALE * mad, MIN_DISPERSION * median)
+        if hi - lo >= MIN_OUTLIER_SAMPLE:
+            first = bisect_left(prices, median - OUTLIER_Z * scale, lo, hi)
+            last = bisect_right(prices, median + OUTLIER_Z * scale, lo, hi)
+        else:
+            first, last = lo, hi
+        inliers = last - first
+        trim = int(inliers * TRIM_FRACTION)
+        trimmed = prices[first + trim:last - trim]
+        trimmed_mean = sum(trimmed) / len(trimmed)
+
+        columns['product_id'].append(product_ids[lo])
+        columns['listing_count'].append(hi - lo)
+        columns['outlier_count'].append(hi - lo - inliers)
+        columns['source_count'].append(len(set(sources[first:last])))
+        columns['median_price'].append(round(median, 2))
+        columns['trimmed_mean'].append(round(trimmed_mean, 2))
+        columns['mad'].append(round(mad, 2))
+        columns['min_price'].append(prices[first])
+        columns['max_price'].append(prices[last - 1])
+        columns['market_price'].append(round(trimmed_mean, 2))
+        columns['confidence_score'].append(confidence_score(inliers, median, mad))
+    return ColumnBatch(columns)
+
+
+def classify_trend(price, rolling_mean):
+    if not rolling_mean:
+        return 'stable'
+    deviation = (price - rolling_mean) / rolling_mean * 100
+    if deviation > TREND_THRESHOLD:
+        return 'rising'
+    if deviation < -TREND_THRESHOLD:
+        return 'falling'
+    return 'stable'
+
+
+def add_trends(aggregates, history, price_date, previous_prices=None):
+    """Append TREND_SCHEMA columns; history is a PriceHistory (or None), previous_prices a fallback
+    {product_id: price} used when the history has no earlier day for a product"""
+    context = history.context(aggregates.column('product_id'), price_date) if history is not None else {}
+    previous_prices = previous_prices or {}
+    columns = {name: [] for name in TREND_SCHEMA}
+    for product_id, price in aggregates.rows(['product_id', 'market_price']):
+        previous, rolling_mean, days = context.get(product_id, (previous_prices.get(product_id), None, 0))
+        change = round((price - previous) / previous * 100, 2) if previous else 0.0
+        columns['previous_price'].append(previous)
+        columns['rolling_mean'].append(round(rolling_mean, 2) if rolling_mean else None)
+        columns['history_days'].append(days)
+        columns['price_change_pct'].append(change)
+        columns['trend_indicator'].append(classify_trend(price, rolling_mean))
+    for name, values in columns.items():
+        aggregates = aggregates.with_column(name, values)
+    return aggregates
+
+
+class PriceHistory:
+    """SQLite store of each product's daily market price (the fact_prices history)"""
+
+    def __init__(self, path=PRICE_HISTORY_DB):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS price_history (
+                product_id TEXT NOT NULL,
+                price_date TEXT NOT NULL,
+                market_price REAL NOT NULL,
+                median_price REAL,
+                confidence_score REAL,
+                listing_count INTEGER,
+                PRIMARY KEY (product_id, price_date)
+            ) WITHOUT ROWID
+        """)
+        self.db.commit()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM price_history").fetchone()[0]
+
+    def close(self):
+        self.db.close()
+
+    def context(self, product_ids, price_date, window=TREND_WINDOW):
+        """{product_id: (previous day's price, mean of the last `window` days, days found)} before price_date"""
+        self.db.execute("DROP TABLE IF EXISTS temp.products")
+        self.db.execute("CREATE TEMP TABLE products (product_id TEXT PRIMARY KEY) WITHOUT ROWID")
+        self.db.executemany("INSERT OR IGNORE INTO temp.products VALUES (?)", ((pid,) for pid in product_ids))
+        rows = self.db.execute("""
+            SELECT product_id,
+                   MAX(CASE WHEN rn = 1 THEN market_price END),
+                   AVG(market_price),
+                   COUNT(*)
+            FROM (
+                SELECT h.product_id, h.market_price,
+                       ROW_NUMBER() OVER (PARTITION BY h.product_id ORDER BY h.price_date DESC) AS rn
+                FROM price_history h JOIN temp.products p ON p.product_id = h.product_id
+                WHERE h.price_date < ?
+            )
+            WHERE rn <= ?
+            GROUP BY product_id
+        """, (price_date, window)).fetchall()
+        return {product_id: (previous, rolling_mean, days) for product_id, previous, rolling_mean, days in rows}
+
+    def record(self, price_date, aggregates):
+        """Store (or replace) the partition's market prices"""
+        self.db.executemany(
+            "INSERT OR REPLACE INTO price_history VALUES (?, ?, ?, ?, ?, ?)",
+            ((product_id, price_date, market_price, median_price, confidence, listings)
+             for product_id, market_price, median_price, confidence, listings in aggregates.rows(
+                 ['product_id', 'market_price', 'median_price', 'confidence_score', 'listing_count']))
+        )
+        self.db.commit()
@@ -0,0 +1,101 @@
+# Columnar batches for the PPMT-AMP ETL engine
+# A batch holds one Python list per column (all the same length). Stages work column-at-a-time
+# and hand whole batches to SQLite with executemany, instead of passing row dicts around.
+# Staged batches are stored column-major as gzip-compressed JSON part files (.col.gz).
+
+import gzip
+import json
+import os
+
+STAGED_EXTENSION = '.col.gz'
+
+
+class ColumnBatch:
+    """A set of equal-length named columns"""
+
+    def __init__(self, columns=None):
+        self.columns = dict(columns or {})
+        lengths = {len(values) for values in self.columns.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"Column lengths differ: {sorted(lengths)}")
+
+    @classmethod
+    def from_rows(cls, rows, schema):
+        """Build a batch from row dicts; missing fields become None"""
+        columns = {name: [] for name in schema}
+        for row in rows:
+            for name in schema:
+                columns[name].append(row.get(name))
+        return cls(columns)
+
+    @classmethod
+    def concat(cls, batches, schema=None):
+        batches = [batch for batch in batches if batch.num_rows]
+        if schema is None:
+            schema = batches[0].schema if batches else []
+        columns = {name: [] for name in schema}
+        for batch in batches:
+            for name in schema:
+                columns[name].extend(batch.columns.get(name) or [None] * batch.num_rows)
+        return cls(columns)
+
+    @property
+    def schema(self):
+        return list(self.columns)
+
+    @property
+    def num_rows(self):
+        for values in self.columns.values():
+            return len(values)
+        return 0
+
+    def __len__(self):
+        return self.num_rows
+
+    def column(self, name):
+        return self.columns[name]
+
+    def with_column(self, name, values):
+        if self.columns and len(values) != self.num_rows:
+            raise ValueError(f"Column '{name}' has {len(values)} values, batch has {self.num_rows} rows")
+        columns = dict(self.columns)
+        columns[name] = list(values)
+        return ColumnBatch(columns)
+
+    def select(self, names):
+        return ColumnBatch({name: self.columns[name] for name in names})
+
+    def filter(self, mask):
+        """Keep the rows where mask is truthy"""
+        keep = [i for i, flag in enumerate(mask) if flag]
+        return self.take(keep)
+
+    def take(self, indices):
+        return ColumnBatch({name: [values[i] for i in indices] for name, values in self.columns.items()})
+
+    def slice(self, start, stop):
+        return ColumnBatch({name: values[start:stop] for name, values in self.columns.items()})
+
+    def rows(self, names=None):
+        """Row tuples in schema (or the given column) order, for executemany"""
+        names = names or self.schema
+        return zip(*(self.columns[name] for name in names))
+
+    def to_dicts(self):
+        names = self.schema
+        return [dict(zip(names, row)) for row in self.rows(names)]
+
+
+def write_batch_file(path, batch):
+    """Write a batch as a column-major part file (byte-identical for identical batches)"""
+    document = {'schema': batch.schema, 'num_rows': batch.num_rows, 'columns': batch.columns}
+    tmp_path = f"{path}.tmp"
+    with gzip.GzipFile(tmp_path, 'wb', compresslevel=6, mtime=0) as f:
+        f.write(json.dumps(document, separators=(',', ':'), ensure_ascii=False).encode())
+    os.replace(tmp_path, path)
+
+
+def read_batch_file(path):
+    with gzip.open(path, 'rb') as f:
+        document = json.loads(f.read())
+    return ColumnBatch({name: document['columns'][name] for name in document['schema']})
@@ -0,0 +1,277 @@
+# Lightweight DAG runner for the PPMT-AMP pipeline
+# Each stage declares the paths it reads and writes. Dependencies follow from those declarations:
+# a stage runs after every stage whose outputs contain one of its inputs. A stage's cache key is
+# a hash of its name, version, parameters and the content of its inputs; when the key matches
+# the last successful run and its outputs are still as that run left them, the stage is
+# skipped. Ready stages run in parallel on a thread pool; a failure blocks only the stages
+# downstream of it. Every run appends a record with per-stage status, timings and row counts.
+
+import hashlib
+import json
+import os
+import time
+import traceback
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+from engine import REPO_ROOT
+
+PIPELINE_CACHE_FILE = os.environ.get(
+    'ETL_PIPELINE_CACHE', os.path.join(REPO_ROOT, 'data', 'processed', 'pipeline_cache.json')
+)
+RUN_LOG_FILE = os.environ.get('ETL_RUN_LOG', os.path.join(REPO_ROOT, 'data', 'processed', 'pipeline_runs.jsonl'))
+MAX_WORKERS = 4
+
+
+class StageFailed(Exception):
+    """Raised by a stage function to fail the stage with a message instead of a traceback"""
+
+
+class Stage:
+    """A unit of work: func(stage) -> dict of stats (a 'rows' entry is recorded in the run log)
+
+    inputs: paths (files or directories) or callables returning a version token (e.g. an S3 ETag)
+    outputs: paths the stage writes
+    """
+
+    def __init__(self, name, func, inputs=(), outputs=(), params=None, version='1', after=()):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = [os.path.abspath(path) for path in outputs]
+        self.params = params or {}
+        self.version = version
+        self.after = list(after)
+
+    def __repr__(self):
+        return f"Stage({self.name!r})"
+
+
+def _contains(directory, path):
+    return path == directory or path.startswith(directory.rstrip(os.sep) + os.sep)
+
+
+class Fingerprinter:
+    """Content hashes of files and directories; a file is re-read only when its size or mtime changes"""
+
+    def __init__(self, known=None):
+        self.files = dict(known or {})
+
+    def file_hash(self, path):
+        stat = os.stat(path)
+        known = self.files.get(path)
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known[2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        self.files[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def path_hash(self, path):
+        """Hash of a file, of every file under a directory (names included), or 'missing'"""
+        if callable(path):
+            return str(path())
+        path = os.path.abspath(path)
+        if os.path.isfile(path):
+            return self.file_hash(path)
+        if not os.path.isdir(path):
+            return 'missing'
+        digest = hashlib.sha256()
+        for root, dirs, names in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+            for name in sorted(names):
+                if name.startswith('.'):
+                    continue
+                full = os.path.join(root, name)
+                digest.update(os.path.relpath(full, path).encode())
+                digest.update(self.file_hash(full).encode())
+        return digest.hexdigest()
+
+
+class Pipeline:
+    """Stages plus their derived dependency graph"""
+
+    def __init__(self, name, stages, cache_path=PIPELINE_CACHE_FILE, log_path=RUN_LOG_FILE, workers=MAX_WORKERS):
+        self.name = name
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("Stage names must be unique")
+        self.cache_path = cache_path
+        self.log_path = log_path
+        self.workers = workers
+        self.dependencies = self._dependencies()
+        self.order = self._topological_order()
+
+    def _dependencies(self):
+        dependencies = {}
+        for stage in self.stages.values():
+            upstream = set(stage.after)
+            for path in (os.path.abspath(p) for p in stage.inputs if not callable(p)):
+                for other in self.stages.values():
+                    if other is not stage and any(_contains(output, path) or _contains(path, output)
+                                                  for output in other.outputs):
+                        upstream.add(other.name)
+            unknown = upstream - set(self.stages)
+            if unknown:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stages: {sorted(unknown)}")
+            dependencies[stage.name] = upstream
+        return dependencies
+
+    def _topological_order(self):
+        order, done, visiting = [], set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle through stage '{name}'")
+            visiting.add(name)
+            for upstream in sorted(self.dependencies[name]):
+                visit(upstream)
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def downstream(self, name):
+        found, pending = set(), [name]
+        while pending:
+            current = pending.pop()
+            for other, upstream in self.dependencies.items():
+                if current in upstream and other not in found:
+                    found.add(other)
+                    pending.append(other)
+        return found
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {'stages': {}, 'files': {}}
+
+    def _save_cache(self, cache):
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(cache, f, indent=2)
+        os.replace(tmp_path, self.cache_path)
+
+    def _cache_key(self, stage, fingerprinter):
+        payload = {
+            'stage': stage.name,
+            'version': stage.version,
+            'params': stage.params,
+            'inputs': [fingerprinter.path_hash(path) for path in stage.inputs]
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _outputs_hash(self, stage, fingerprinter):
+        return [fingerprinter.path_hash(path) for path in stage.outputs]
+
+    def _execute(self, stage):
+        start = time.perf_counter()
+        record = {'stage': stage.name, 'started_at': datetime.now().isoformat()}
+        try:
+            result = stage.func(stage) or {}
+            record.update(status='ok', rows=result.get('rows'), result=result)
+        except StageFailed as e:
+            record.update(status='failed', error=str(e))
+        except Exception as e:
+            record.update(status='failed', error=f"{type(e).__name__}: {e}", traceback=traceback.format_exc())
+        record['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        return record
+
+    def run(self, force=False, only=None):
+        """Run every stage whose inputs changed (all with force; `only` names plus their upstream)"""
+        cache = self._load_cache()
+        fingerprinter = Fingerprinter(cache.get('files'))
+        selected = set(self.order)
+        if only:
+            selected = set()
+            for name in only:
+                selected.add(name)
+                pending = [name]
+                while pending:
+                    for upstream in self.dependencies[pending.pop()]:
+                        if upstream not in selected:
+                            selected.add(upstream)
+                            pending.append(upstream)
+
+        run = {'run_id': uuid.uuid4().hex[:12], 'pipeline': self.name, 'started_at': datetime.now().isoformat()}
+        start = time.perf_counter()
+        records = {}
+        pending = [name for name in self.order if name in selected]
+        running = {}
+
+        def finished(name):
+            return name in records and records[name]['status'] in ('ok', 'skipped')
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while pending or running:
+                for name in list(pending):
+                    upstream = self.dependencies[name] & selected
+                    if any(records.get(u, {}).get('status') in ('failed', 'blocked') for u in upstream):
+                        failed = [u for u in upstream if records.get(u, {}).get('status') in ('failed', 'blocked')]
+                        records[name] = {'stage': name, 'status': 'blocked', 'blocked_by': failed, 'elapsed_ms': 0.0}
+                        pending.remove(name)
+                        continue
+                    if not all(finished(u) for u in upstream):
+                        continue
+                    pending.remove(name)
+                    stage = self.stages[name]
+                    key = self._cache_key(stage, fingerprinter)
+                    previous = cache['stages'].get(name)
+                    if (not force and previous and previous['key'] == key
+                            and previous.get('outputs') == self._outputs_hash(stage, fingerprinter)):
+                        records[name] = {'stage': name, 'status': 'skipped', 'rows': previous.get('rows'),
+                                         'elapsed_ms': 0.0, 'key': key}
+                        continue
+                    running[pool.submit(self._execute, stage)] = (name, key)
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, key = running.pop(future)
+                    record = future.result()
+                    record['key'] = key
+                    records[name] = record
+                    if record['status'] == 'ok':
+                        cache['stages'][name] = {
+                            'key': key,
+                            'outputs': self._outputs_hash(self.stages[name], fingerprinter),
+                            'rows': record.get('rows'),
+                            'finished_at': datetime.now().isoformat()
+                        }
+                        cache['files'] = fingerprinter.files
+                        self._save_cache(cache)
+
+        run['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        run['stages'] = [records[name] for name in self.order if name in records]
+        run['status'] = 'failed' if any(r['status'] in ('failed', 'blocked') for r in run['stages']) else 'ok'
+        cache['files'] = fingerprinter.files
+        self._save_cache(cache)
+        self._append_log(run)
+        return run
+
+    def _append_log(self, run):
+        os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+        entry = dict(run, stages=[{key: value for key, value in record.items() if key not in ('result', 'traceback')}
+                                  for record in run['stages']])
+        with open(self.log_path, 'a') as f:
+            f.write(json.dumps(entry, default=str) + '\n')
+
+
+def read_run_log(path=RUN_LOG_FILE, limit=None):
+    try:
+        with open(path) as f:
+            runs = [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+    return runs[-limit:] if limit else runs
@@ -0,0 +1,163 @@
+# Change-detection sync for PPMT-AMP-Items
+# Keeps a compact local fingerprint index (16-byte content hash per SeriesId/ProductId) of what
+# was last written to the table, diffs each new snapshot against it inside SQLite, and turns
+# only the inserts, updates and deletes into BatchWriteItem requests. Write volume then scales
+# with churn instead of catalog size.
+
+import hashlib
+import json
+import os
+import sqlite3
+from decimal import Decimal
+
+from engine import BATCH_WRITE_SIZE, ITEMS_TABLE, REPO_ROOT
+from storage_backend import serialize_dynamodb_item
+
+FINGERPRINT_DB = os.environ.get('ETL_FINGERPRINT_DB', os.path.join(REPO_ROOT, 'data', 'processed', 'fingerprints.db'))
+
+# Bookkeeping attributes that change on every run without changing what clients see
+IGNORED_FIELDS = {'UpdatedAt', 'Timestamp', 'TTL'}
+
+# Enrichment recomputed from each run's listings and price history (listing counts, price
+# spread, confidence, trend). It moves on every run even when the price does not, so it is
+# written along with a price change but does not cause a write by itself
+DERIVED_FIELDS = {'ListingCount', 'OutlierCount', 'SourceCount', 'ConfidenceScore', 'TrendIndicator',
+                  'DailyChangePercent', 'MinPrice', 'MaxPrice'}
+FINGERPRINT_IGNORED = IGNORED_FIELDS | DERIVED_FIELDS
+
+
+def _canonical(value):
+    """JSON-able form where equal DynamoDB values are equal (69 == 69.0, key order ignored)"""
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float, Decimal)):
+        return {'N': str(Decimal(str(value)).normalize())}
+    if isinstance(value, dict):
+        return {key: _canonical(v) for key, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    return str(value)
+
+
+def content_hash(item, ignored=FINGERPRINT_IGNORED):
+    payload = {key: _canonical(value) for key, value in item.items() if key not in ignored}
+    encoded = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode()
+    return hashlib.blake2b(encoded, digest_size=16).digest()
+
+
+class ChangeSet:
+    """Result of diffing a snapshot against the fingerprint index"""
+
+    def __init__(self, inserts, updates, deletes, unchanged, hashes):
+        self.inserts = inserts      # items
+        self.updates = updates      # items
+        self.deletes = deletes      # (SeriesId, ProductId)
+        self.unchanged = unchanged  # count
+        self.hashes = hashes        # (SeriesId, ProductId) -> hash for inserts and updates
+
+    @property
+    def changed(self):
+        return len(self.inserts) + len(self.updates) + len(self.deletes)
+
+    @property
+    def total(self):
+        return self.changed + self.unchanged
+
+    @property
+    def change_ratio(self):
+        return self.changed / self.total if self.total else 0.0
+
+    def write_batches(self, table_name=ITEMS_TABLE):
+        """BatchWriteItem RequestItems (at most 25 requests each) for the changed keys only"""
+        requests = [{'PutRequest': {'Item': serialize_dynamodb_item(item)}} for item in self.inserts + self.updates]
+        requests.extend(
+            {'DeleteRequest': {'Key': {'SeriesId': {'S': series_id}, 'ProductId': {'S': product_id}}}}
+            for series_id, product_id in self.deletes
+        )
+        return [{table_name: requests[i:i + BATCH_WRITE_SIZE]} for i in range(0, len(requests), BATCH_WRITE_SIZE)]
+
+    def summary(self):
+        return {
+            'inserts': len(self.inserts),
+            'updates': len(self.updates),
+            'deletes': len(self.deletes),
+            'unchanged': self.unchanged,
+            'change_ratio': round(self.change_ratio, 4)
+        }
+
+
+class FingerprintIndex:
+    """SQLite-backed map of (SeriesId, ProductId) -> content hash of the last written item"""
+
+    def __init__(self, path=FINGERPRINT_DB):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                series_id TEXT NOT NULL,
+                product_id TEXT NOT NULL,
+                hash BLOB NOT NULL,
+                PRIMARY KEY (series_id, product_id)
+            ) WITHOUT ROWID
+        """)
+        self.db.commit()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM fingerprints").fetchone()[0]
+
+    def close(self):
+        self.db.close()
+
+    def diff(self, items, full=False):
+        """Classify items against the index; with full=True, indexed keys missing from items are deletes"""
+        by_key = {}
+        for item in items:
+            by_key[(item['SeriesId'], item['ProductId'])] = item
+        self.db.execute("DROP TABLE IF EXISTS temp.snapshot")
+        self.db.execute("""
+            CREATE TEMP TABLE snapshot (
+                series_id TEXT, product_id TEXT, hash BLOB, PRIMARY KEY (series_id, product_id)
+            ) WITHOUT ROWID
+        """)
+        self.db.executemany("INSERT INTO temp.snapshot VALUES (?, ?, ?)",
+                            ((key[0], key[1], content_hash(item)) for key, item in by_key.items()))
+
+        inserts, updates, hashes = [], [], {}
+        for series_id, product_id, new_hash, old_hash in self.db.execute("""
+            SELECT s.series_id, s.product_id, s.hash, f.hash
+            FROM temp.snapshot s
+            LEFT JOIN fingerprints f ON f.series_id = s.series_id AND f.product_id = s.product_id
+            WHERE f.hash IS NULL OR f.hash != s.hash
+            ORDER BY s.series_id, s.product_id
+        """):
+            key = (series_id, product_id)
+            (inserts if old_hash is None else updates).append(by_key[key])
+            hashes[key] = new_hash
+        deletes = []
+        if full:
+            deletes = self.db.execute("""
+                SELECT f.series_id, f.product_id FROM fingerprints f
+                LEFT JOIN temp.snapshot s ON s.series_id = f.series_id AND s.product_id = f.product_id
+                WHERE s.product_id IS NULL
+                ORDER BY f.series_id, f.product_id
+            """).fetchall()
+        self.db.execute("DROP TABLE temp.snapshot")
+        unchanged = len(by_key) - len(inserts) - len(updates)
+        return ChangeSet(inserts, updates, [tuple(key) for key in deletes], unchanged, hashes)
+
+    def commit(self, changes):
+        """Record a change set as written (call only after the table writes succeeded)"""
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?)",
+                                ((key[0], key[1], value) for key, value in changes.hashes.items()))
+            self.db.executemany("DELETE FROM fingerprints WHERE series_id = ? AND product_id = ?", changes.deletes)
+
+    def rebuild(self, items):
+        """Replace the index with the hashes of the table's current items"""
+        with self.db:
+            self.db.execute("DELETE FROM fingerprints")
+            self.db.executemany("INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?)",
+                                ((item['SeriesId'], item['ProductId'], content_hash(item)) for item in items))
+        return len(self)
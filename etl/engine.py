@@ -0,0 +1,549 @@
+# Local incremental ETL engine for PPMT-AMP
+# Replaces the Redshift staging / stored-procedure stage from docs/ETL_PIPELINE.md. Daily
+# partitions (raw feeds in data/raw/YYYY-MM-DD/, or the staged parts written by ingest.py in
+# data/staging/YYYY-MM-DD/) are loaded as columnar batches into an in-process SQLite
+# database, validated, normalized, deduplicated and enriched, and turned into PPMT-AMP-Items
+# BatchWriteItem requests. Only partitions whose files changed since the last run are processed.
+
+import contextlib
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda'))
+
+from aggregation import add_trends, aggregate_prices  # noqa: E402
+from columnar import STAGED_EXTENSION, ColumnBatch, read_batch_file  # noqa: E402
+from parsers import detect_format, iter_records  # noqa: E402
+from storage_backend import bump_series_versions, deserialize_dynamodb_item, serialize_dynamodb_item  # noqa: E402
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+RAW_DIR = os.environ.get('ETL_RAW_DIR', os.path.join(REPO_ROOT, 'data', 'raw'))
+STAGING_DIR = os.environ.get('ETL_STAGING_DIR', os.path.join(REPO_ROOT, 'data', 'staging'))
+OUTPUT_DIR = os.environ.get('ETL_OUTPUT_DIR', os.path.join(REPO_ROOT, 'data', 'output'))
+STATE_FILE = os.environ.get('ETL_STATE_FILE', os.path.join(REPO_ROOT, 'data', 'processed', 'etl_state.json'))
+
+ITEMS_TABLE = "PPMT-AMP-Items"
+BATCH_WRITE_SIZE = 25  # BatchWriteItem limit
+
+# Raw staging columns (staging_source* in the Redshift design)
+RAW_SCHEMA = ['raw_id', 'product_id', 'product_name', 'price', 'currency', 'source', 'scraped_date']
+COLUMN_ALIASES = {
+    'id': 'raw_id',
+    'listing_id': 'raw_id',
+    'sku': 'raw_id',
+    'title': 'product_name',
+    'name': 'product_name',
+    'amount': 'price',
+    'scraped_at': 'scraped_date'
+}
+RAW_EXTENSIONS = ('.csv', '.json', '.jsonl', '.ndjson', '.xml')
+METADATA_FILES = {'manifest.json', 'metadata.json'}
+PARTITION_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+# Prices are stored in the currency of PPMT-AMP-Items
+TARGET_CURRENCY = 'CNY'
+EXCHANGE_RATES = {  # 1 unit -> CNY (example rates, override with ETL_EXCHANGE_RATES)
+    'CNY': 1.0,
+    'USD': 7.10,
+    'EUR': 7.80,
+    'GBP': 9.10,
+    'HKD': 0.91,
+    'JPY': 0.048
+}
+EXCHANGE_RATES.update(json.loads(os.environ.get('ETL_EXCHANGE_RATES', '{}')))
+PRICE_ANOMALY_THRESHOLD = 50000  # CNY; flagged rows are kept out of the market price
+
+STAGING_DDL = """
+CREATE TABLE staging (
+    row_num INTEGER PRIMARY KEY,
+    raw_id TEXT,
+    product_id TEXT,
+    product_name TEXT,
+    normalized_name TEXT,
+    price REAL,
+    currency TEXT,
+    source TEXT,
+    scraped_date TEXT,
+    validation_flag TEXT,
+    reject_reason TEXT
+);
+CREATE TABLE exchange_rates (currency TEXT PRIMARY KEY, rate REAL);
+CREATE TABLE dim_products (product_id TEXT PRIMARY KEY, normalized_name TEXT);
+CREATE INDEX dim_products_name ON dim_products(normalized_name);
+"""
+
+
+def normalize_name(name):
+    """Upper-case, trim and collapse whitespace (sp_normalize_prices)"""
+    if name is None:
+        return None
+    return re.sub(r'\s+', ' ', str(name)).strip().upper()
+
+
+def parse_price(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    try:
+        return float(str(value).replace(',', '').strip().lstrip('¥$€£').strip())
+    except ValueError:
+        return None
+
+
+def canonical_row(row, source):
+    """Map a raw record's field names onto RAW_SCHEMA (source defaults to the feed name)"""
+    canonical = {}
+    for key, value in row.items():
+        if key is None:
+            continue
+        name = key.strip().lower()
+        canonical[COLUMN_ALIASES.get(name, name)] = value
+    canonical.setdefault('source', source)
+    if not canonical.get('source'):
+        canonical['source'] = source
+    return canonical
+
+
+def source_name(path):
+    return os.path.basename(path).split('.', 1)[0]
+
+
+def staging_batch(records, source):
+    """Normalize raw records into a RAW_SCHEMA batch with parsed prices"""
+    batch = ColumnBatch.from_rows((canonical_row(record, source) for record in records), RAW_SCHEMA)
+    return batch.with_column('price', [parse_price(v) for v in batch.column('price')])
+
+
+def read_raw_file(path):
+    """Load one raw CSV / JSON / JSON-lines / XML file into a staging batch"""
+    with open(path, 'rb') as f:
+        return staging_batch(iter_records(f, detect_format(path)), source_name(path))
+
+
+def read_input_file(path):
+    if path.endswith(STAGED_EXTENSION):
+        return read_batch_file(path)
+    return read_raw_file(path)
+
+
+def raw_files(partition_dir):
+    """Input files of a partition (relative paths): raw feeds and/or staged .col.gz parts"""
+    files = []
+    for dirpath, dirnames, filenames in os.walk(partition_dir):
+        dirnames[:] = [name for name in dirnames if not name.startswith(('.', '_'))]
+        for name in filenames:
+            if name.startswith(('.', '_')) or name in METADATA_FILES:
+                continue
+            if name.endswith(RAW_EXTENSIONS + (STAGED_EXTENSION,)):
+                files.append(os.path.relpath(os.path.join(dirpath, name), partition_dir))
+    return sorted(files)
+
+
+def discover_partitions(raw_dir=RAW_DIR):
+    if not os.path.isdir(raw_dir):
+        return []
+    return sorted(
+        name for name in os.listdir(raw_dir)
+        if PARTITION_PATTERN.match(name) and os.path.isdir(os.path.join(raw_dir, name))
+    )
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def partition_fingerprint(partition_dir, previous_files=None):
+    """Content fingerprint of a partition; files with unchanged size and mtime are not re-hashed"""
+    previous_files = previous_files or {}
+    files = {}
+    for name in raw_files(partition_dir):
+        stat = os.stat(os.path.join(partition_dir, name))
+        previous = previous_files.get(name)
+        if previous and previous['size'] == stat.st_size and previous['mtime_ns'] == stat.st_mtime_ns:
+            sha256 = previous['sha256']
+        else:
+            sha256 = file_sha256(os.path.join(partition_dir, name))
+        files[name] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256}
+    fingerprint = hashlib.sha256(
+        ''.join(f"{name}:{info['sha256']}\n" for name, info in sorted(files.items())).encode()
+    ).hexdigest()
+    return fingerprint, files
+
+
+def load_state(path=STATE_FILE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'partitions': {}}
+
+
+def save_state(state, path=STATE_FILE):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def changed_partitions(state, raw_dir=RAW_DIR, only=None, force=False):
+    """[(partition, fingerprint, files)] for partitions that are new or changed since the last run"""
+    changed = []
+    for partition in discover_partitions(raw_dir):
+        if only and partition not in only:
+            continue
+        previous = state['partitions'].get(partition, {})
+        fingerprint, files = partition_fingerprint(os.path.join(raw_dir, partition), previous.get('files'))
+        if force or fingerprint != previous.get('fingerprint'):
+            changed.append((partition, fingerprint, files))
+    return changed
+
+
+def load_catalog_from_backend(backend, table_name=ITEMS_TABLE):
+    """Current PPMT-AMP-Items keyed by ProductId (the dim_products role)"""
+    catalog = {}
+    params = {'TableName': table_name}
+    while True:
+        response = backend.scan(**params)
+        for raw_item in response.get('Items', []):
+            item = deserialize_dynamodb_item(raw_item)
+            catalog[item['ProductId']] = item
+        if 'LastEvaluatedKey' not in response:
+            return catalog
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def load_catalog_file(path):
+    with open(path) as f:
+        items = json.load(f)
+    return {item['ProductId']: item for item in items}
+
+
+@contextlib.contextmanager
+def _timed(stats, stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats['stage_ms'][stage] = round((time.perf_counter() - start) * 1000, 3)
+
+
+def _reject(db, stats, reason, condition):
+    cursor = db.execute(f"UPDATE staging SET reject_reason = ? WHERE reject_reason IS NULL AND ({condition})",
+                        (reason,))
+    if cursor.rowcount:
+        stats['rejected'][reason] = stats['rejected'].get(reason, 0) + cursor.rowcount
+
+
+def _open_staging(catalog):
+    db = sqlite3.connect(':memory:')
+    db.create_function('normalize_name', 1, normalize_name, deterministic=True)
+    db.executescript(STAGING_DDL)
+    db.executemany("INSERT INTO exchange_rates VALUES (?, ?)", EXCHANGE_RATES.items())
+    db.executemany("INSERT INTO dim_products VALUES (?, ?)",
+                   ((product_id, normalize_name(item.get('ProductName'))) for product_id, item in catalog.items()))
+    return db
+
+
+def load_partition(partition_dir, stats):
+    batches = []
+    for name in raw_files(partition_dir):
+        batch = read_input_file(os.path.join(partition_dir, name))
+        stats['files'][name] = batch.num_rows
+        batches.append(batch)
+    return ColumnBatch.concat(batches, RAW_SCHEMA)
+
+
+def validate(db, stats):
+    """Reject rows missing required fields or with unusable prices; flag anomalies (sp_validate_data)"""
+    _reject(db, stats, 'missing_product_name',
+            "(product_name IS NULL OR trim(product_name) = '') AND (product_id IS NULL OR product_id = '')")
+    _reject(db, stats, 'invalid_price', "price IS NULL OR price <= 0")
+    _reject(db, stats, 'missing_currency', "currency IS NULL OR trim(currency) = ''")
+    _reject(db, stats, 'unknown_currency',
+            "upper(trim(currency)) NOT IN (SELECT currency FROM exchange_rates)")
+    stats['rejected_total'] = db.execute("SELECT COUNT(*) FROM staging WHERE reject_reason IS NOT NULL").fetchone()[0]
+    db.execute("DELETE FROM staging WHERE reject_reason IS NOT NULL")
+
+
+def normalize(db, stats):
+    """Convert prices to the target currency and normalize product names (sp_normalize_prices)"""
+    db.execute("""
+        UPDATE staging
+        SET price = round(price * (SELECT rate FROM exchange_rates WHERE currency = upper(trim(staging.currency))), 2),
+            currency = ?,
+            normalized_name = normalize_name(product_name),
+            source = lower(trim(source))
+    """, (TARGET_CURRENCY,))
+    cursor = db.execute("UPDATE staging SET validation_flag = 'price_anomaly' WHERE price > ?",
+                        (PRICE_ANOMALY_THRESHOLD,))
+    stats['anomalies'] = cursor.rowcount
+
+
+def deduplicate(db, stats):
+    """Keep the latest copy of each listing (sp_deduplicate)"""
+    removed = 0
+    for partition_by, where in (("source, raw_id", "raw_id IS NOT NULL AND raw_id != ''"),
+                                ("normalized_name, price, source", "1")):
+        cursor = db.execute(f"""
+            DELETE FROM staging WHERE row_num IN (
+                SELECT row_num FROM (
+                    SELECT row_num, ROW_NUMBER() OVER (
+                        PARTITION BY {partition_by} ORDER BY scraped_date DESC, row_num DESC
+                    ) AS rn
+                    FROM staging WHERE {where}
+                ) WHERE rn > 1
+            )
+        """)
+        removed += cursor.rowcount
+    stats['duplicates'] = removed
+
+
+def match_products(db, stats, resolver=None):
+    """Resolve listings to catalog ProductIds; reject the rest
+
+    Without a resolver only exact normalized names match. With one (entity_resolution.EntityResolver)
+    each distinct title is resolved once by MinHash-LSH blocking and n-gram similarity.
+    """
+    if resolver is None:
+        db.execute("""
+            UPDATE staging SET product_id = (
+                SELECT MIN(d.product_id) FROM dim_products d
+                WHERE d.normalized_name = staging.normalized_name
+                GROUP BY d.normalized_name HAVING COUNT(*) = 1
+            )
+            WHERE product_id IS NULL OR product_id = ''
+        """)
+    else:
+        titles = [row[0] for row in db.execute(
+            "SELECT DISTINCT product_name FROM staging WHERE product_id IS NULL OR product_id = ''")]
+        resolved = resolver.match_many(titles)
+        db.execute("CREATE TEMP TABLE resolved (product_name TEXT PRIMARY KEY, product_id TEXT, status TEXT)")
+        db.executemany("INSERT INTO resolved VALUES (?, ?, ?)",
+                       ((title, product_id, status) for title, (product_id, _, status) in resolved.items()))
+        stats['match'] = dict(db.execute("""
+            SELECT r.status, COUNT(*) FROM staging s JOIN resolved r ON r.product_name = s.product_name
+            GROUP BY r.status
+        """).fetchall())
+        db.execute("""
+            UPDATE staging SET product_id = (SELECT product_id FROM resolved r WHERE r.product_name = staging.product_name)
+            WHERE product_id IS NULL OR product_id = ''
+        """)
+        _reject(db, stats, 'ambiguous_product',
+                "product_id IS NULL AND product_name IN (SELECT product_name FROM resolved WHERE status = 'ambiguous')")
+    _reject(db, stats, 'unmatched_product',
+            "product_id IS NULL OR product_id NOT IN (SELECT product_id FROM dim_products)")
+    db.execute("DELETE FROM staging WHERE reject_reason IS NOT NULL")
+
+
+def enrich(db):
+    """Robust per-product market statistics for the day (sp_load_fact_prices)"""
+    rows = db.execute("""
+        SELECT product_id, price, source FROM staging
+        WHERE validation_flag IS NULL
+        ORDER BY product_id, price
+    """).fetchall()
+    names = ['product_id', 'price', 'source']
+    listings = ColumnBatch({name: [row[i] for row in rows] for i, name in enumerate(names)})
+    return aggregate_prices(listings)
+
+
+def previous_prices(catalog, partition):
+    """Stored AfterMarketPrice of products last priced before the partition (trend fallback)"""
+    timestamp = f"{partition}T00:00:00"
+    return {product_id: float(item['AfterMarketPrice']) for product_id, item in catalog.items()
+            if item.get('AfterMarketPrice') and str(item.get('Timestamp') or '') < timestamp}
+
+
+def build_items(aggregates, catalog, partition, stats):
+    """PPMT-AMP-Items rows for the partition date; never overwrite a newer price with a backfill"""
+    timestamp = f"{partition}T00:00:00"
+    updated_at = datetime.now().isoformat()
+    items = []
+    stale = []
+    for row in aggregates.to_dicts():
+        base = catalog[row['product_id']]
+        if str(base.get('Timestamp') or '') > timestamp:
+            stale.append(row['product_id'])
+            continue
+        retail_price = float(base.get('RetailPrice') or 0)
+        after_market_price = row['market_price']
+        price_change = round(after_market_price - retail_price, 2)
+        item = dict(base)
+        item.update({
+            'AfterMarketPrice': after_market_price,
+            'MedianPrice': row['median_price'],
+            'Currency': TARGET_CURRENCY,
+            'PriceChange': price_change,
+            'PriceChangePercent': round(price_change / retail_price * 100, 2) if retail_price > 0 else 0,
+            'DailyChangePercent': row['price_change_pct'],
+            'TrendIndicator': row['trend_indicator'],
+            'ConfidenceScore': row['confidence_score'],
+            'ListingCount': row['listing_count'],
+            'OutlierCount': row['outlier_count'],
+            'SourceCount': row['source_count'],
+            'MinPrice': round(row['min_price'], 2),
+            'MaxPrice': round(row['max_price'], 2),
+            'Timestamp': timestamp,
+            'UpdatedAt': updated_at
+        })
+        items.append(item)
+    stats['stale'] = len(stale)
+    stats['stale_products'] = stale
+    return items
+
+
+def build_write_batches(items, table_name=ITEMS_TABLE):
+    """Group items into BatchWriteItem RequestItems of at most 25 puts"""
+    return [
+        {table_name: [{'PutRequest': {'Item': serialize_dynamodb_item(item)}}
+                      for item in items[i:i + BATCH_WRITE_SIZE]]}
+        for i in range(0, len(items), BATCH_WRITE_SIZE)
+    ]
+
+
+def write_batch_files(partition, batches, output_dir=OUTPUT_DIR):
+    """Write each batch as a BatchWriteItem request file under <output_dir>/<partition>/"""
+    partition_dir = os.path.join(output_dir, partition)
+    os.makedirs(partition_dir, exist_ok=True)
+    for name in os.listdir(partition_dir):
+        if name.startswith('items-') and name.endswith('.json'):
+            os.remove(os.path.join(partition_dir, name))
+    for index, request_items in enumerate(batches):
+        with open(os.path.join(partition_dir, f"items-{index:05d}.json"), 'w') as f:
+            json.dump({'RequestItems': request_items}, f)
+    return partition_dir
+
+
+def apply_write_batches(backend, batches, max_attempts=8):
+    """Send batches with BatchWriteItem, retrying UnprocessedItems with exponential backoff, then
+    bump the Version of every series that was written; returns {SeriesId: new version}
+
+    A series is bumped once any batch holding its items has been sent, even if a later batch
+    fails, so readers never keep serving a version some of whose items have already changed.
+    """
+    series_ids = set()
+    try:
+        for request_items in batches:
+            for request in request_items.get(ITEMS_TABLE, []):
+                key = request['PutRequest']['Item'] if 'PutRequest' in request else request['DeleteRequest']['Key']
+                series_ids.add(key['SeriesId']['S'])
+            pending = request_items
+            for attempt in range(max_attempts):
+                response = backend.batch_write_item(RequestItems=pending)
+                pending = response.get('UnprocessedItems') or {}
+                if not pending:
+                    break
+                time.sleep(min(0.05 * 2 ** attempt, 2.0))
+            else:
+                raise RuntimeError(f"BatchWriteItem still had unprocessed items after {max_attempts} attempts")
+    finally:
+        versions = bump_series_versions(backend, series_ids)
+    return versions
+
+
+def process_partition(partition_dir, partition, catalog, resolver=None, history=None):
+    """Run validate -> normalize -> deduplicate -> match -> enrich for one partition
+
+    With a price history (aggregation.PriceHistory) trends use a rolling window of earlier days
+    and the day's prices are recorded; without one only the previous stored price is compared.
+    """
+    stats = {'partition': partition, 'files': {}, 'rejected': {}, 'stage_ms': {}}
+    with _timed(stats, 'load'):
+        batch = load_partition(partition_dir, stats)
+        stats['rows_in'] = batch.num_rows
+        db = _open_staging(catalog)
+        db.executemany(f"INSERT INTO staging ({', '.join(RAW_SCHEMA)}) VALUES ({', '.join('?' * len(RAW_SCHEMA))})",
+                       batch.rows(RAW_SCHEMA))
+    try:
+        with _timed(stats, 'validate'):
+            validate(db, stats)
+        with _timed(stats, 'normalize'):
+            normalize(db, stats)
+        with _timed(stats, 'deduplicate'):
+            deduplicate(db, stats)
+        with _timed(stats, 'match'):
+            match_products(db, stats, resolver)
+        stats['rows_clean'] = db.execute("SELECT COUNT(*) FROM staging").fetchone()[0]
+        with _timed(stats, 'enrich'):
+            aggregates = enrich(db)
+            aggregates = add_trends(aggregates, history, partition, previous_prices(catalog, partition))
+            items = build_items(aggregates, catalog, partition, stats)
+            if history is not None:
+                history.record(partition, aggregates)
+        stats['outliers'] = sum(aggregates.column('outlier_count'))
+        stats['trends'] = {}
+        for trend in aggregates.column('trend_indicator'):
+            stats['trends'][trend] = stats['trends'].get(trend, 0) + 1
+    finally:
+        db.close()
+    stats['items_out'] = len(items)
+    return items, stats
+
+
+def run_incremental(catalog, raw_dir=RAW_DIR, state_path=STATE_FILE, output_dir=OUTPUT_DIR,
+                    backend=None, only=None, force=False, save=True, index=None, resolver=None, history=None,
+                    full_load=False):
+    """Process new/changed partitions oldest first; returns per-partition stats
+
+    With a fingerprint index (diff_sync.FingerprintIndex) only items whose content changed are
+    written; the index is updated once the writes to the backend succeed. A resolver
+    (entity_resolution.EntityResolver) matches listing titles that are not exact catalog names,
+    and a price history (aggregation.PriceHistory) feeds the rolling trend classification.
+    With full_load, each partition prices the whole catalog: indexed products it no longer
+    prices are deleted (backfilled products it skipped as stale are kept).
+    A partition is recorded as processed only once its writes are applied (a backend is given),
+    so a dry run never makes a later run with a backend skip it.
+    """
+    state = load_state(state_path)
+    results = []
+    for partition, fingerprint, files in changed_partitions(state, raw_dir, only, force):
+        start = time.perf_counter()
+        items, stats = process_partition(os.path.join(raw_dir, partition), partition, catalog, resolver, history)
+        changes = None
+        if index is not None:
+            with _timed(stats, 'diff'):
+                snapshot = items
+                if full_load:
+                    # Skipped only because the table holds a newer price: still listed, so not deleted
+                    snapshot = items + [catalog[product_id] for product_id in stats['stale_products']]
+                changes = index.diff(snapshot, full=full_load)
+                batches = changes.write_batches()
+            stats['changes'] = changes.summary()
+        else:
+            batches = build_write_batches(items)
+        stats['batches'] = len(batches)
+        if output_dir:
+            stats['output_dir'] = write_batch_files(partition, batches, output_dir)
+        if backend is not None:
+            with _timed(stats, 'write'):
+                stats['series_versions'] = len(apply_write_batches(backend, batches))
+            if changes is not None:
+                index.commit(changes)
+            # Only a partition whose writes were applied is loaded; a dry run leaves it pending
+            state['partitions'][partition] = {
+                'fingerprint': fingerprint,
+                'files': files,
+                'processed_at': datetime.now().isoformat(),
+                'rows_in': stats['rows_in'],
+                'items_out': stats['items_out']
+            }
+            if save:
+                save_state(state, state_path)
+        # Later partitions in this run see the new prices (and the backfill guard sees new Timestamps)
+        for item in items:
+            catalog[item['ProductId']] = item
+        stats['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        results.append(stats)
+    return results
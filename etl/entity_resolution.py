@@ -0,0 +1,294 @@
+# Product-name entity resolution for the PPMT-AMP ETL
+# Matches raw listing titles to canonical catalog ProductIds. Titles are normalized and shingled
+# (character 3-grams plus word tokens); MinHash signatures are banded into an LSH index so each
+# title is compared with a handful of candidate products instead of the whole catalog, and the
+# candidates are scored by shingle Jaccard similarity (set intersections over precomputed shingle
+# sets). The index is persisted and updated incrementally as catalog products are added, renamed
+# or removed. NumPy, when installed, vectorizes signature computation; results are identical
+# without it.
+#
+# Aliases (listing title -> ProductId) are curated and resolve a title outright. Fuzzy matches
+# are never made aliases by themselves: they are kept as suggestions for review, and
+# approve() turns reviewed suggestions into aliases.
+
+import gzip
+import hashlib
+import json
+import os
+import random
+import re
+import unicodedata
+from array import array
+from collections import Counter
+
+from engine import REPO_ROOT
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+ENTITY_INDEX_FILE = os.environ.get(
+    'ETL_ENTITY_INDEX', os.path.join(REPO_ROOT, 'data', 'processed', 'entity_index.json.gz')
+)
+INDEX_VERSION = 2
+
+NUM_PERM = 64
+BANDS = 16  # 16 bands x 4 rows: products become candidates from ~0.5 Jaccard similarity
+SEED = 1
+
+MATCH_THRESHOLD = 0.6     # minimum score for a match
+AMBIGUITY_MARGIN = 0.05   # best must beat the runner-up (a different product) by this much
+NUMBER_MISMATCH_PENALTY = 0.5  # "Figure 1" vs "Figure 11"
+MAX_CANDIDATES = 256  # scored per title
+
+# Marketplace filler that says nothing about which figure is being sold
+NOISE_WORDS = {
+    'popmart', 'pop', 'mart', 'blind', 'box', 'authentic', 'genuine', 'official', 'sealed', 'new',
+    'confirmed', 'brand', 'nib', 'in', 'hand', 'free', 'shipping', 'the', 'a', 'and', 'with', 'of'
+}
+
+_MASK64 = (1 << 64) - 1
+
+
+def normalize_title(title):
+    """Lower-case, strip punctuation and marketplace filler words"""
+    if title is None:
+        return ''
+    text = unicodedata.normalize('NFKC', str(title)).lower()
+    text = re.sub(r'[^\w\s]', ' ', text)
+    return ' '.join(token for token in text.split() if token not in NOISE_WORDS)
+
+
+def shingles(normalized):
+    grams = {f"w:{token}" for token in normalized.split()}
+    padded = f" {normalized} "
+    grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def numbers(normalized):
+    return frozenset(re.findall(r'\d+', normalized))
+
+
+class MinHasher:
+    """MinHash over 64-bit shingle hashes with multiply-shift permutations (mod 2^64)
+
+    Without NumPy each shingle's permuted values are computed once and cached, so a title's
+    signature is an element-wise minimum over cached rows.
+    """
+
+    def __init__(self, num_perm=NUM_PERM, seed=SEED, cache_size=100_000):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.a = [rng.getrandbits(64) | 1 for _ in range(num_perm)]
+        self.b = [rng.getrandbits(64) for _ in range(num_perm)]
+        self.cache_size = cache_size
+        self._rows = {}
+        if np is not None:
+            self._a = np.array(self.a, dtype=np.uint64)
+            self._b = np.array(self.b, dtype=np.uint64)
+
+    @staticmethod
+    def shingle_hash(gram):
+        return int.from_bytes(hashlib.blake2b(gram.encode(), digest_size=8).digest(), 'little')
+
+    def _row(self, gram):
+        row = self._rows.get(gram)
+        if row is None:
+            if len(self._rows) >= self.cache_size:
+                self._rows.clear()
+            h = self.shingle_hash(gram)
+            row = array('I', [((a * h + b) & _MASK64) >> 32 for a, b in zip(self.a, self.b)])
+            self._rows[gram] = row
+        return row
+
+    def signature(self, grams):
+        if not grams:
+            return None
+        if np is not None:
+            values = np.array([self.shingle_hash(gram) for gram in grams], dtype=np.uint64)
+            return ((np.outer(values, self._a) + self._b) >> np.uint64(32)).min(axis=0).tolist()
+        return list(map(min, zip(*[self._row(gram) for gram in grams])))
+
+
+class _Product:
+    __slots__ = ('product_id', 'name', 'normalized', 'signature', 'grams', 'numbers')
+
+    def __init__(self, product_id, name, normalized, signature):
+        self.product_id = product_id
+        self.name = name
+        self.normalized = normalized
+        self.signature = signature
+        self.grams = shingles(normalized)
+        self.numbers = numbers(normalized)
+
+
+class EntityResolver:
+    """MinHash-LSH index of catalog product names"""
+
+    def __init__(self, num_perm=NUM_PERM, bands=BANDS, seed=SEED):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.seed = seed
+        self.hasher = MinHasher(num_perm, seed)
+        self.products = {}
+        self.aliases = {}    # normalized listing title -> ProductId, curated
+        self.suggested = {}  # normalized listing title -> [ProductId, score] of a fuzzy match, for review
+        self._matched = {}   # normalized listing title -> fuzzy match result of this process
+        self._exact = {}   # normalized product name -> {ProductId}
+        self._buckets = [{} for _ in range(bands)]
+
+    def __len__(self):
+        return len(self.products)
+
+    def _band_keys(self, signature):
+        rows = self.num_perm // self.bands
+        return [tuple(signature[i * rows:(i + 1) * rows]) for i in range(self.bands)]
+
+    def _index(self, product):
+        self._exact.setdefault(product.normalized, set()).add(product.product_id)
+        if product.signature:
+            for band, key in enumerate(self._band_keys(product.signature)):
+                self._buckets[band].setdefault(key, set()).add(product.product_id)
+
+    def add(self, product_id, name, signature=None):
+        if product_id in self.products:
+            self.remove(product_id)
+        normalized = normalize_title(name)
+        if signature is None:
+            signature = self.hasher.signature(shingles(normalized))
+        product = _Product(product_id, name, normalized, signature)
+        self.products[product_id] = product
+        self._index(product)
+
+    def remove(self, product_id):
+        product = self.products.pop(product_id, None)
+        if product is None:
+            return
+        self._exact.get(product.normalized, set()).discard(product_id)
+        if product.signature:
+            for band, key in enumerate(self._band_keys(product.signature)):
+                bucket = self._buckets[band].get(key)
+                if bucket is not None:
+                    bucket.discard(product_id)
+                    if not bucket:
+                        del self._buckets[band][key]
+        self.aliases = {title: pid for title, pid in self.aliases.items() if pid != product_id}
+        self.suggested = {title: match for title, match in self.suggested.items() if match[0] != product_id}
+        self._matched = {}
+
+    def update(self, catalog):
+        """Sync with the catalog ({ProductId: item}); only new, renamed and removed products are touched"""
+        added = renamed = removed = 0
+        for product_id, item in catalog.items():
+            name = item.get('ProductName') or ''
+            existing = self.products.get(product_id)
+            if existing is None:
+                self.add(product_id, name)
+                added += 1
+            elif existing.name != name:
+                self.remove(product_id)
+                self.add(product_id, name)
+                renamed += 1
+        for product_id in [pid for pid in self.products if pid not in catalog]:
+            self.remove(product_id)
+            removed += 1
+        if added:
+            self._matched = {}  # a new product may now be the better match
+        return {'added': added, 'renamed': renamed, 'removed': removed, 'products': len(self.products)}
+
+    def candidates(self, signature):
+        """Products sharing at least one LSH band, capped to the ones sharing the most bands"""
+        hits = Counter()
+        for band, key in enumerate(self._band_keys(signature)):
+            hits.update(self._buckets[band].get(key, ()))
+        if len(hits) <= MAX_CANDIDATES:
+            return list(hits)
+        ranked = sorted(hits.items(), key=lambda hit: (-hit[1], hit[0]))
+        return [product_id for product_id, _ in ranked[:MAX_CANDIDATES]]
+
+    def match(self, title):
+        """(ProductId or None, score, status); status is alias/exact/fuzzy/ambiguous/unmatched"""
+        normalized = normalize_title(title)
+        if not normalized:
+            return None, 0.0, 'unmatched'
+        if normalized in self.aliases:
+            return self.aliases[normalized], 1.0, 'alias'
+        exact = self._exact.get(normalized)
+        if exact and len(exact) == 1:
+            return next(iter(exact)), 1.0, 'exact'
+        if normalized in self._matched:
+            return self._matched[normalized]
+
+        grams = shingles(normalized)
+        signature = self.hasher.signature(grams)
+        title_numbers = numbers(normalized)
+        scored = []
+        for product_id in self.candidates(signature):
+            product = self.products[product_id]
+            score = len(grams & product.grams) / len(grams | product.grams)
+            if title_numbers and product.numbers != title_numbers:
+                score *= NUMBER_MISMATCH_PENALTY
+            scored.append((score, product_id))
+        if not scored:
+            return None, 0.0, 'unmatched'
+        scored.sort(reverse=True)
+        best_score, best_id = scored[0]
+        if best_score < MATCH_THRESHOLD:
+            return None, best_score, 'unmatched'
+        if len(scored) > 1 and best_score - scored[1][0] < AMBIGUITY_MARGIN:
+            return None, best_score, 'ambiguous'
+        self._matched[normalized] = (best_id, best_score, 'fuzzy')
+        self.suggested[normalized] = [best_id, round(best_score, 4)]
+        return best_id, best_score, 'fuzzy'
+
+    def match_many(self, titles):
+        """{title: (ProductId, score, status)}; each distinct title is resolved once"""
+        return {title: self.match(title) for title in set(titles)}
+
+    def approve(self, titles=None):
+        """Turn suggested fuzzy matches (all, or those of the given normalized titles) into
+        aliases; returns the number approved"""
+        titles = list(self.suggested) if titles is None else [t for t in titles if t in self.suggested]
+        for title in titles:
+            self.aliases[title] = self.suggested.pop(title)[0]
+        return len(titles)
+
+    def save(self, path=ENTITY_INDEX_FILE):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        document = {
+            'version': INDEX_VERSION,
+            'num_perm': self.num_perm,
+            'bands': self.bands,
+            'seed': self.seed,
+            'products': {pid: [p.name, p.signature] for pid, p in self.products.items()},
+            'aliases': self.aliases,
+            'suggested': self.suggested
+        }
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(document, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=ENTITY_INDEX_FILE, num_perm=NUM_PERM, bands=BANDS, seed=SEED):
+        """Load a persisted index; a missing or incompatible file yields an empty index"""
+        resolver = cls(num_perm, bands, seed)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                document = json.load(f)
+        except (FileNotFoundError, OSError, ValueError):
+            return resolver
+        if (document.get('version'), document.get('num_perm'), document.get('bands'), document.get('seed')) != (
+                INDEX_VERSION, num_perm, bands, seed):
+            return resolver
+        for product_id, (name, signature) in document['products'].items():
+            resolver.add(product_id, name, signature)
+        resolver.aliases = {title: pid for title, pid in document.get('aliases', {}).items()
+                            if pid in resolver.products}
+        resolver.suggested = {title: match for title, match in document.get('suggested', {}).items()
+                              if match[0] in resolver.products}
+        return resolver
@@ -0,0 +1,300 @@
+# Raw feed ingestion for the PPMT-AMP ETL
+# Reads raw/YYYY-MM-DD/manifest.json from the data bucket (or a local directory standing in for
+# S3), parses every listed feed with a streaming parser in a process pool while verifying its
+# checksum in the same pass, and writes each source as RAW_SCHEMA column parts under
+# staging/YYYY-MM-DD/<source>/. A source is published atomically and only if its checksum
+# matches; sources whose checksum is unchanged since the last ingest are skipped.
+
+import hashlib
+import io
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from columnar import STAGED_EXTENSION, write_batch_file
+from engine import METADATA_FILES, PARTITION_PATTERN, REPO_ROOT, STAGING_DIR, source_name, staging_batch
+from parsers import detect_format, iter_chunks, iter_records
+
+DATA_ROOT = os.environ.get('ETL_DATA_ROOT', os.path.join(REPO_ROOT, 'data'))
+S3_BUCKET = os.environ.get('S3_BUCKET')
+RAW_PREFIX = os.environ.get('S3_PREFIX', 'raw')
+
+CHUNK_ROWS = int(os.environ.get('ETL_CHUNK_ROWS', '50000'))  # rows per staged part file
+MANIFEST_FILE = 'manifest.json'
+SOURCE_STATE_FILE = '_source.json'
+
+
+class LocalObjectStore:
+    """A directory laid out like the S3 bucket (keys are relative paths)"""
+
+    def __init__(self, root=DATA_ROOT):
+        self.root = os.path.abspath(root)
+
+    @property
+    def spec(self):
+        return {'type': 'local', 'root': self.root}
+
+    def list(self, prefix):
+        base = os.path.join(self.root, prefix)
+        if not os.path.isdir(base):
+            return []
+        return sorted(f"{prefix.rstrip('/')}/{name}" for name in os.listdir(base))
+
+    def exists(self, key):
+        return os.path.exists(os.path.join(self.root, key))
+
+    def open(self, key):
+        return open(os.path.join(self.root, key), 'rb')
+
+    def stat(self, key):
+        stat = os.stat(os.path.join(self.root, key))
+        return {'size': stat.st_size, 'version': str(stat.st_mtime_ns)}
+
+    def put(self, key, data, content_type=None, content_encoding=None, cache_control=None):
+        """Write an object atomically (the headers only apply to S3)"""
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def delete(self, key):
+        try:
+            os.remove(os.path.join(self.root, key))
+        except FileNotFoundError:
+            pass
+
+
+class S3ObjectStore:
+    """The raw data bucket (requires boto3)"""
+
+    def __init__(self, bucket=S3_BUCKET):
+        self.bucket = bucket
+        self._client = None
+
+    @property
+    def spec(self):
+        return {'type': 's3', 'bucket': self.bucket}
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+            self._client = boto3.client('s3')
+        return self._client
+
+    def list(self, prefix):
+        keys = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix.rstrip('/') + '/', Delimiter='/'):
+            keys.extend(entry['Key'] for entry in page.get('Contents', []))
+            keys.extend(entry['Prefix'].rstrip('/') for entry in page.get('CommonPrefixes', []))
+        return sorted(keys)
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except self.client.exceptions.ClientError:
+            return False
+
+    def open(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=key)['Body']
+
+    def stat(self, key):
+        response = self.client.head_object(Bucket=self.bucket, Key=key)
+        return {'size': response['ContentLength'], 'version': response['ETag'].strip('"')}
+
+    def put(self, key, data, content_type=None, content_encoding=None, cache_control=None):
+        params = {'Bucket': self.bucket, 'Key': key, 'Body': data}
+        if content_type:
+            params['ContentType'] = content_type
+        if content_encoding:
+            params['ContentEncoding'] = content_encoding
+        if cache_control:
+            params['CacheControl'] = cache_control
+        self.client.put_object(**params)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+
+def open_store(spec):
+    if spec['type'] == 's3':
+        return S3ObjectStore(spec['bucket'])
+    return LocalObjectStore(spec['root'])
+
+
+class HashingReader(io.RawIOBase):
+    """Read-through wrapper that hashes and counts every byte the parser consumes"""
+
+    def __init__(self, raw, algorithm='sha256'):
+        self.raw = raw
+        self.digest = hashlib.new(algorithm)
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.raw.read(len(buffer))
+        n = len(data)
+        buffer[:n] = data
+        self.digest.update(data)
+        self.bytes_read += n
+        return n
+
+    def drain(self):
+        """Consume (and hash) whatever the parser left unread"""
+        while True:
+            data = self.raw.read(1 << 20)
+            if not data:
+                return
+            self.digest.update(data)
+            self.bytes_read += len(data)
+
+    def close(self):
+        try:
+            self.raw.close()
+        finally:
+            super().close()
+
+
+def read_manifest(store, partition):
+    """Manifest entries [{name, sha256|md5, source, format}], or all feed files when there is no manifest"""
+    prefix = f"{RAW_PREFIX}/{partition}"
+    key = f"{prefix}/{MANIFEST_FILE}"
+    if store.exists(key):
+        with store.open(key) as f:
+            manifest = json.loads(f.read())
+        entries = []
+        for entry in manifest.get('files', []):
+            name = entry.get('name') or os.path.basename(entry['key'])
+            entries.append(dict(entry, name=name))
+        return entries, True
+    names = [os.path.basename(k) for k in store.list(prefix)]
+    return [{'name': name} for name in names if detect_format(name) and name not in METADATA_FILES], False
+
+
+def _expected_checksum(entry):
+    for algorithm in ('sha256', 'md5'):
+        if entry.get(algorithm):
+            return algorithm, entry[algorithm].lower()
+    checksum = entry.get('checksum')
+    if checksum and ':' in checksum:
+        algorithm, value = checksum.split(':', 1)
+        return algorithm.lower(), value.lower()
+    return 'sha256', None
+
+
+def _load_source_state(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def ingest_file(task):
+    """Parse one feed into staged parts (runs in a worker process)"""
+    start = time.perf_counter()
+    store = open_store(task['store'])
+    entry = task['entry']
+    key = f"{RAW_PREFIX}/{task['partition']}/{entry['name']}"
+    source = entry.get('source') or source_name(entry['name'])
+    fmt = entry.get('format') or detect_format(entry['name'])
+    algorithm, expected = _expected_checksum(entry)
+    target_dir = os.path.join(task['staging_dir'], task['partition'], source)
+    result = {'name': entry['name'], 'source': source, 'rows': 0, 'parts': 0, 'bytes': 0, 'status': 'ok'}
+
+    try:
+        version = store.stat(key)
+    except Exception as e:
+        result.update(status='error', error=f"{type(e).__name__}: {e}", elapsed_ms=0.0)
+        return result
+    previous = _load_source_state(os.path.join(target_dir, SOURCE_STATE_FILE))
+    if previous and not task['force'] and previous.get('version') == version and (
+            not expected or previous.get('checksum') == f"{algorithm}:{expected}"):
+        result.update(status='unchanged', rows=previous['rows'], parts=previous['parts'], elapsed_ms=0.0)
+        return result
+
+    tmp_dir = os.path.join(task['staging_dir'], task['partition'], f".{source}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    try:
+        reader = HashingReader(store.open(key), algorithm)
+        with io.BufferedReader(reader, buffer_size=1 << 16) as stream:
+            for index, records in enumerate(iter_chunks(iter_records(stream, fmt), task['chunk_rows'])):
+                batch = staging_batch(records, source)
+                write_batch_file(os.path.join(tmp_dir, f"part-{index:05d}{STAGED_EXTENSION}"), batch)
+                result['rows'] += batch.num_rows
+                result['parts'] += 1
+            reader.drain()
+        actual = reader.digest.hexdigest()
+        result['bytes'] = reader.bytes_read
+        if expected and actual != expected:
+            result.update(status='checksum_mismatch', error=f"{algorithm} {actual} != manifest {expected}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return result
+
+        with open(os.path.join(tmp_dir, SOURCE_STATE_FILE), 'w') as f:
+            json.dump({'key': key, 'checksum': f"{algorithm}:{actual}", 'version': version, 'rows': result['rows'],
+                       'parts': result['parts'], 'format': fmt, 'ingested_at': datetime.now().isoformat()}, f)
+        old_dir = os.path.join(task['staging_dir'], task['partition'], f".{source}.old-{os.getpid()}")
+        if os.path.exists(target_dir):
+            os.rename(target_dir, old_dir)
+        os.rename(tmp_dir, target_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+    except Exception as e:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        result.update(status='error', error=f"{type(e).__name__}: {e}")
+    finally:
+        result['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 3)
+    return result
+
+
+def raw_partitions(store):
+    return [os.path.basename(key) for key in store.list(RAW_PREFIX) if PARTITION_PATTERN.match(os.path.basename(key))]
+
+
+def remove_dropped_sources(staging_dir, partition, entries):
+    """Delete staged sources that are no longer listed in the partition's manifest"""
+    listed = {entry.get('source') or source_name(entry['name']) for entry in entries}
+    partition_dir = os.path.join(staging_dir, partition)
+    removed = []
+    for name in os.listdir(partition_dir):
+        if not name.startswith(('.', '_')) and name not in listed:
+            shutil.rmtree(os.path.join(partition_dir, name), ignore_errors=True)
+            removed.append(name)
+    return removed
+
+
+def ingest(store, partitions=None, staging_dir=STAGING_DIR, workers=None, force=False, chunk_rows=CHUNK_ROWS):
+    """Ingest every manifest entry of the given (default: all) partitions; returns per-file results"""
+    partitions = partitions or raw_partitions(store)
+    tasks = []
+    notes = {}
+    for partition in partitions:
+        entries, has_manifest = read_manifest(store, partition)
+        notes[partition] = {'manifest': has_manifest, 'files': len(entries)}
+        os.makedirs(os.path.join(staging_dir, partition), exist_ok=True)
+        if has_manifest:
+            notes[partition]['removed'] = remove_dropped_sources(staging_dir, partition, entries)
+        for entry in entries:
+            tasks.append({'store': store.spec, 'partition': partition, 'entry': entry,
+                          'staging_dir': staging_dir, 'force': force, 'chunk_rows': chunk_rows})
+
+    results = []
+    if workers == 1 or len(tasks) <= 1:
+        results = [dict(ingest_file(task), partition=task['partition']) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(ingest_file, task): task for task in tasks}
+            for future in as_completed(futures):
+                results.append(dict(future.result(), partition=futures[future]['partition']))
+    results.sort(key=lambda r: (r['partition'], r['name']))
+    return results, notes
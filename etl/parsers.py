@@ -0,0 +1,141 @@
+# Streaming record parsers for raw price feeds
+# Each parser reads a binary stream incrementally and yields one dict per listing, so memory
+# stays bounded by a read chunk plus one record regardless of file size.
+
+import codecs
+import csv
+import io
+import json
+from xml.etree import ElementTree
+
+READ_CHUNK = 1 << 16
+
+# Element names that hold one listing in retailer XML feeds
+XML_RECORD_TAGS = {'item', 'listing', 'product', 'offer'}
+
+FORMATS = {'.csv': 'csv', '.json': 'json', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.xml': 'xml'}
+
+
+def detect_format(name):
+    for extension, fmt in FORMATS.items():
+        if name.endswith(extension):
+            return fmt
+    return None
+
+
+def _text(stream):
+    return io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+
+def iter_csv_records(stream):
+    text = _text(stream)
+    try:
+        yield from csv.DictReader(text)
+    finally:
+        text.detach()  # leave the binary stream open for the caller
+
+
+def iter_jsonl_records(stream):
+    text = _text(stream)
+    try:
+        for line in text:
+            if line.strip():
+                yield json.loads(line)
+    finally:
+        text.detach()
+
+
+def iter_json_records(stream, chunk_size=READ_CHUNK):
+    """Objects of a top-level JSON array, or of the first array inside a top-level object
+    (e.g. {"listings": [...]}), decoded one at a time from a sliding buffer"""
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8-sig')()
+
+    def read():
+        return utf8.decode(stream.read(chunk_size), final=False)
+
+    buffer = ''
+    while True:
+        chunk = read()
+        if not chunk and not buffer:
+            return
+        buffer += chunk
+        start = buffer.find('[')
+        if start >= 0:
+            break
+        if not chunk:
+            return
+    buffer = buffer[start + 1:]
+    pos = 0
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+        if pos == len(buffer):
+            chunk = read()
+            if not chunk:
+                raise ValueError("Unexpected end of JSON array")
+            buffer, pos = chunk, 0
+            continue
+        if buffer[pos] == ']':
+            return
+        try:
+            record, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            chunk = read()
+            if not chunk:
+                raise
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        yield record
+        pos = end
+        if pos > chunk_size:
+            buffer, pos = buffer[pos:], 0
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def iter_xml_records(stream, record_tags=XML_RECORD_TAGS):
+    """Listings from an XML feed via iterparse; finished records are detached from the tree"""
+    stack = []
+    for event, element in ElementTree.iterparse(stream, events=('start', 'end')):
+        if event == 'start':
+            stack.append(element)
+            continue
+        stack.pop()
+        if _local_name(element.tag) not in record_tags or any(_local_name(e.tag) in record_tags for e in stack):
+            continue
+        record = dict(element.attrib)
+        for child in element:
+            name = _local_name(child.tag)
+            record[name] = (child.text or '').strip()
+            for attribute, value in child.attrib.items():
+                record.setdefault(attribute, value)
+        yield record
+        element.clear()
+        if stack:
+            stack[-1].remove(element)
+
+
+PARSERS = {
+    'csv': iter_csv_records,
+    'json': iter_json_records,
+    'jsonl': iter_jsonl_records,
+    'xml': iter_xml_records
+}
+
+
+def iter_records(stream, fmt):
+    return PARSERS[fmt](stream)
+
+
+def iter_chunks(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,173 @@
+# Static page publishing for the PPMT-AMP query API
+# Runs after each data load. Renders the responses most requests ask for (the series list,
+# every series' items, and the items and series of every IpCharacter) with the query
+# handler's own query functions. Each page is written once as gzip-compressed JSON named by
+# a hash of its content, and manifest.json then maps each query to its page. Readers are
+# lambda/static_pages.py (the handler serves or redirects to a page) and clients that fetch
+# the manifest from the CDN.
+#
+# Layout under the prefix (a local directory, or the bucket behind the CDN):
+#   manifest.json                      current manifest (short cache lifetime)
+#   manifests/00000042.json            every published manifest, by version
+#   pages/<route>-<params>.<hash>.json.gz   immutable pages
+# Unchanged pages keep their name and are not written again. Pages no longer listed by the
+# last KEEP_VERSIONS manifests are deleted, so a client holding an older manifest can still
+# read its pages for a while.
+#
+# Each manifest entry records the Version of every series the page covers, read before the
+# page's query. A write between publishes bumps one of them, and the handler then answers
+# with a query instead of the outdated page. Pages that list series (the series list and the
+# IpCharacter pages) also record the catalog version, which writers bump too, so a series
+# added since the publish takes them off the page as well.
+
+import gzip
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import price_query_handler as handler
+from engine import REPO_ROOT
+from ingest import LocalObjectStore, S3ObjectStore
+from snapshot import parallel_scan
+from static_pages import MANIFEST_FILE, page_key
+from storage_backend import CATALOG_VERSION_ID
+
+STATIC_ROOT = os.environ.get('ETL_STATIC_ROOT', os.path.join(REPO_ROOT, 'data'))
+STATIC_BUCKET = os.environ.get('STATIC_BUCKET')
+STATIC_PREFIX = os.environ.get('STATIC_PREFIX', 'static')
+
+PAGE_LIMIT = int(os.environ.get('STATIC_PAGE_LIMIT', '500'))  # rows per page; a fuller result is not published
+PUBLISH_WORKERS = 8
+KEEP_VERSIONS = 3
+PAGE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+MANIFEST_CACHE_CONTROL = 'public, max-age=60'
+
+
+def open_static_store(root=STATIC_ROOT, bucket=STATIC_BUCKET):
+    """Where pages are published: the static bucket when set, else a local directory"""
+    return S3ObjectStore(bucket) if bucket else LocalObjectStore(root)
+
+
+def page_queries(series):
+    """(path, params, query, series ids) of every published page, from the scanned series;
+    query(backend, limit) runs it, and the page covers those series (and any in its results).
+    Pages that list series also cover the catalog version."""
+    all_ids = sorted(item['SeriesId'] for item in series)
+    queries = [('/series', {}, lambda db, limit: handler.query_series(db, limit=limit),
+                [CATALOG_VERSION_ID] + all_ids)]
+    for series_id in all_ids:
+        queries.append(('/prices', {'seriesId': series_id},
+                        lambda db, limit, sid=series_id: handler.query_prices(db, series_id=sid, limit=limit),
+                        [series_id]))
+    for ip_character in sorted({item['IpCharacter'] for item in series if item.get('IpCharacter')}):
+        ids = sorted(item['SeriesId'] for item in series if item.get('IpCharacter') == ip_character)
+        ids = [CATALOG_VERSION_ID] + ids
+        queries.append(('/prices', {'ipCharacter': ip_character},
+                        lambda db, limit, ip=ip_character: handler.query_prices(db, ip_character=ip, limit=limit),
+                        ids))
+        queries.append(('/series', {'ipCharacter': ip_character},
+                        lambda db, limit, ip=ip_character: handler.query_series(db, ip_character=ip, limit=limit),
+                        ids))
+    return queries
+
+
+def page_name(path, params, digest):
+    slug = '-'.join([path.strip('/')] + [f"{k}-{v}" for k, v in sorted(params.items())])
+    return f"pages/{re.sub(r'[^A-Za-z0-9_.-]+', '_', slug)}.{digest}.json.gz"
+
+
+def render_page(path, params, results, page_limit=PAGE_LIMIT):
+    """(manifest entry, compressed bytes) of one page"""
+    # The handler's response body, minus the per-device rate limit fields
+    raw = json.dumps({'success': True, 'message': 'Query successful', 'data': results}, default=str).encode()
+    digest = hashlib.sha256(raw).hexdigest()[:16]
+    data = gzip.compress(raw, compresslevel=9, mtime=0)
+    entry = {
+        'key': page_name(path, params, digest),
+        'etag': f'"{digest}"',
+        'items': len(results),
+        'complete': len(results) < page_limit,
+        'bytes': len(data),
+        'rawBytes': len(raw)
+    }
+    return entry, data
+
+
+def read_manifest(store, prefix=STATIC_PREFIX, name=MANIFEST_FILE):
+    key = f"{prefix}/{name}"
+    if not store.exists(key):
+        return None
+    with store.open(key) as f:
+        return json.loads(f.read())
+
+
+def prune(store, prefix, keep=KEEP_VERSIONS):
+    """Delete manifests past the last `keep` and the pages none of those lists; returns pages deleted"""
+    manifests = sorted(key for key in store.list(f"{prefix}/manifests") if key.endswith('.json'))
+    kept, dropped = manifests[-keep:], manifests[:-keep]
+    referenced = set()
+    for key in kept:
+        with store.open(key) as f:
+            referenced.update(f"{prefix}/{page['key']}" for page in json.loads(f.read())['pages'].values())
+    removed = 0
+    for key in store.list(f"{prefix}/pages"):
+        if key not in referenced:
+            store.delete(key)
+            removed += 1
+    for key in dropped:
+        store.delete(key)
+    return removed
+
+
+def publish(backend, store, prefix=STATIC_PREFIX, page_limit=PAGE_LIMIT, workers=PUBLISH_WORKERS,
+            keep=KEEP_VERSIONS, source=None):
+    """Render and publish every page, then the manifest; returns the publish summary"""
+    previous = read_manifest(store, prefix)
+    known = {page['key'] for page in previous['pages'].values()} if previous else set()
+    version = previous['version'] + 1 if previous else 1
+
+    # Versions are read before the queries: a write in between leaves the page marked outdated
+    series = parallel_scan(backend, segments=1, table_name=handler.SERIES_TABLE)
+    versions = {item['SeriesId']: int(item.get('Version') or 0) for item in series}
+    queries = page_queries([item for item in series if item['SeriesId'] != CATALOG_VERSION_ID])
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda query: query[2](backend, page_limit), queries))
+
+    pages = {}
+    written = raw_bytes = compressed_bytes = 0
+    for (path, params, _, series_ids), rows in zip(queries, results):
+        entry, data = render_page(path, params, rows, page_limit)
+        covered = set(series_ids) | {row['SeriesId'] for row in rows if row.get('SeriesId')}
+        entry['versions'] = {series_id: versions.get(series_id, 0) for series_id in sorted(covered)}
+        if entry['key'] not in known:
+            store.put(f"{prefix}/{entry['key']}", data, 'application/json', 'gzip', PAGE_CACHE_CONTROL)
+            written += 1
+        pages[page_key(path, params)] = entry
+        raw_bytes += entry['rawBytes']
+        compressed_bytes += entry['bytes']
+
+    manifest = {
+        'version': version,
+        'publishedAt': datetime.now().isoformat(timespec='seconds'),
+        'source': source,
+        'pageLimit': page_limit,
+        'pages': pages
+    }
+    body = json.dumps(manifest, indent=1).encode()
+    # Pages first, the current manifest last: a reader never sees a page it cannot fetch
+    store.put(f"{prefix}/manifests/{version:08d}.json", body, 'application/json', None, PAGE_CACHE_CONTROL)
+    store.put(f"{prefix}/{MANIFEST_FILE}", body, 'application/json', None, MANIFEST_CACHE_CONTROL)
+    removed = prune(store, prefix, keep)
+    return {
+        'version': version,
+        'pages': len(pages),
+        'written': written,
+        'unchanged': len(pages) - written,
+        'removed': removed,
+        'incomplete': sum(not page['complete'] for page in pages.values()),
+        'raw_bytes': raw_bytes,
+        'bytes': compressed_bytes
+    }
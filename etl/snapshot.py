@@ -0,0 +1,533 @@
+# Columnar snapshots of PPMT-AMP-Items
+# Exports the table (parallel Scan segments, or the files of a DynamoDB table export) into
+# part files sorted by SeriesId and Timestamp, with a manifest holding each part's SeriesId and
+# Timestamp range so readers can skip parts. Parts are Parquet when pyarrow is installed,
+# otherwise .ppcol files: fixed-width column buffers that are memory-mapped and read in place
+# (numbers as int64/float64, strings dictionary-encoded or as offsets into one UTF-8 blob).
+# Analysis and the ETL catalog load then read a local file instead of consuming table capacity.
+
+import gzip
+import json
+import math
+import mmap
+import operator
+import os
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from columnar import ColumnBatch
+from engine import ITEMS_TABLE, REPO_ROOT
+from storage_backend import deserialize_dynamodb_item
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+SNAPSHOT_DIR = os.environ.get('ETL_SNAPSHOT_DIR', os.path.join(REPO_ROOT, 'data', 'snapshots'))
+MANIFEST_FILE = 'manifest.json'
+ROWS_PER_PART = 100_000
+SCAN_SEGMENTS = 8
+SORT_KEYS = ('SeriesId', 'Timestamp')
+
+PPCOL_MAGIC = b'PPCOL001'
+PPCOL_EXTENSION = '.ppcol'
+PARQUET_EXTENSION = '.parquet'
+DICTIONARY_MAX_RATIO = 0.5  # dictionary-encode strings with at most this many distinct values per row
+
+_OPERATORS = {
+    '=': operator.eq, '!=': operator.ne, '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge
+}
+
+
+# --- Export ---------------------------------------------------------------
+
+
+def scan_segment(backend, segment, total_segments, table_name=ITEMS_TABLE):
+    """All items of one parallel-scan segment"""
+    items = []
+    params = {'TableName': table_name, 'Segment': segment, 'TotalSegments': total_segments}
+    while True:
+        response = backend.scan(**params)
+        items.extend(deserialize_dynamodb_item(raw_item) for raw_item in response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return items
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def parallel_scan(backend, segments=SCAN_SEGMENTS, table_name=ITEMS_TABLE):
+    with ThreadPoolExecutor(max_workers=segments) as pool:
+        results = pool.map(lambda segment: scan_segment(backend, segment, segments, table_name), range(segments))
+        return [item for items in results for item in items]
+
+
+def export_file_items(export_dir):
+    """Items from a DynamoDB export (DYNAMODB_JSON: data/*.json.gz with one {"Item": ...} per line)"""
+    for root, _, names in os.walk(export_dir):
+        for name in sorted(names):
+            if not name.endswith(('.json.gz', '.json')) or name.startswith('manifest'):
+                continue
+            path = os.path.join(root, name)
+            with (gzip.open(path, 'rt') if name.endswith('.gz') else open(path)) as f:
+                for line in f:
+                    if line.strip():
+                        yield deserialize_dynamodb_item(json.loads(line)['Item'])
+
+
+def _sort_key(item):
+    return tuple(str(item.get(key) or '') for key in SORT_KEYS)
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_numeric_string(value):
+    if not isinstance(value, str):
+        return False
+    try:
+        return math.isfinite(float(value))
+    except ValueError:
+        return False
+
+
+def _infer_type(values):
+    """'i8', 'f8', 'str' or 'json' for a column's values
+
+    A number column with some values stored as numeric strings (a price written as 'S' by one
+    writer) is 'f8'; export_snapshot converts those strings.
+    """
+    present = [value for value in values if value is not None]
+    if present and all(_is_number(value) for value in present):
+        if len(present) == len(values) and all(isinstance(value, int) for value in present):
+            return 'i8'
+        return 'f8'
+    if any(_is_number(value) for value in present) and all(
+            _is_number(value) or _is_numeric_string(value) for value in present):
+        return 'f8'
+    if any(isinstance(value, (dict, list, bool)) for value in present):
+        return 'json'
+    return 'str'
+
+
+def _pad(buffer, fill=b'\0'):
+    return buffer + fill * (-len(buffer) % 8)
+
+
+def write_ppcol(path, columns, types):
+    """Write columns ({name: values}) as a memory-mappable .ppcol file"""
+    num_rows = len(next(iter(columns.values()), []))
+    specs, buffers, offset = [], [], 0
+
+    def add(data):
+        nonlocal offset
+        start = offset
+        buffers.append(_pad(data))
+        offset += len(buffers[-1])
+        return start
+
+    for name, values in columns.items():
+        kind = types[name]
+        spec = {'name': name, 'type': kind}
+        if kind in ('i8', 'f8'):
+            data = array('q', values) if kind == 'i8' else array('d', [math.nan if v is None else v for v in values])
+            spec['offset'] = add(data.tobytes())
+        else:
+            strings = [None if v is None else (json.dumps(v) if kind == 'json' else str(v)) for v in values]
+            distinct = sorted({s for s in strings if s is not None})
+            if len(distinct) <= num_rows * DICTIONARY_MAX_RATIO:
+                codes = {value: i for i, value in enumerate(distinct)}
+                spec['encoding'] = 'dictionary'
+                spec['dictionary'] = distinct
+                spec['offset'] = add(array('i', [-1 if s is None else codes[s] for s in strings]).tobytes())
+            else:
+                blob = bytearray()
+                offsets = array('q', [0])
+                for s in strings:
+                    blob += (s or '').encode()
+                    offsets.append(len(blob))
+                spec['encoding'] = 'utf8'
+                spec['nulls'] = [i for i, s in enumerate(strings) if s is None]
+                spec['offset'] = add(offsets.tobytes())
+                spec['data_offset'] = add(bytes(blob))
+                spec['data_length'] = len(blob)
+        specs.append(spec)
+
+    header = json.dumps({'num_rows': num_rows, 'columns': specs}, separators=(',', ':')).encode()
+    header = _pad(header, b' ')
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(PPCOL_MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for data in buffers:
+            f.write(data)
+    os.replace(tmp_path, path)
+
+
+def write_parquet(path, columns, types):
+    arrays = {}
+    for name, values in columns.items():
+        if types[name] == 'json':
+            values = [None if v is None else json.dumps(v) for v in values]
+        elif types[name] == 'str':
+            values = [None if v is None else str(v) for v in values]
+        arrays[name] = values
+    table = pyarrow.table(arrays)
+    table = table.replace_schema_metadata({'ppmt_types': json.dumps(types)})
+    pyarrow.parquet.write_table(table, f"{path}.tmp", compression='zstd')
+    os.replace(f"{path}.tmp", path)
+
+
+def export_snapshot(items, out_dir, rows_per_part=ROWS_PER_PART, fmt=None, source=None):
+    """Sort items by SeriesId/Timestamp and write them as part files plus a manifest"""
+    fmt = fmt or ('parquet' if pyarrow is not None else 'ppcol')
+    if fmt == 'parquet' and pyarrow is None:
+        raise RuntimeError("Parquet snapshots require pyarrow (pip install pyarrow) - use format 'ppcol'")
+    items = sorted(items, key=_sort_key)
+    names = sorted({name for item in items for name in item}, key=lambda n: (n not in SORT_KEYS, n))
+    types = {name: _infer_type([item.get(name) for item in items]) for name in names}
+    os.makedirs(out_dir, exist_ok=True)
+    for name in os.listdir(out_dir):
+        if name.startswith('part-'):
+            os.remove(os.path.join(out_dir, name))
+
+    parts = []
+    extension = PARQUET_EXTENSION if fmt == 'parquet' else PPCOL_EXTENSION
+    writer = write_parquet if fmt == 'parquet' else write_ppcol
+    for index, start in enumerate(range(0, len(items), rows_per_part)):
+        chunk = items[start:start + rows_per_part]
+        file_name = f"part-{index:05d}{extension}"
+        columns = {name: [item.get(name) for item in chunk] for name in names}
+        for name, values in columns.items():
+            if types[name] == 'f8':
+                columns[name] = [float(value) if isinstance(value, str) else value for value in values]
+        writer(os.path.join(out_dir, file_name), columns, types)
+        first, last = _sort_key(chunk[0]), _sort_key(chunk[-1])
+        parts.append({
+            'file': file_name,
+            'num_rows': len(chunk),
+            'bytes': os.path.getsize(os.path.join(out_dir, file_name)),
+            'min_series_id': first[0],
+            'max_series_id': last[0],
+            'min_timestamp': min(str(item.get('Timestamp') or '') for item in chunk),
+            'max_timestamp': max(str(item.get('Timestamp') or '') for item in chunk)
+        })
+    manifest = {
+        'table': ITEMS_TABLE,
+        'format': fmt,
+        'exported_at': datetime.now().isoformat(),
+        'source': source,
+        'sort_keys': list(SORT_KEYS),
+        'num_rows': len(items),
+        'schema': types,
+        'parts': parts
+    }
+    with open(os.path.join(out_dir, f"{MANIFEST_FILE}.tmp"), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(os.path.join(out_dir, f"{MANIFEST_FILE}.tmp"), os.path.join(out_dir, MANIFEST_FILE))
+    return manifest
+
+
+# --- Read -----------------------------------------------------------------
+
+
+class DictionaryColumn:
+    """int32 codes (a view into the mapped file) over a sorted dictionary of strings"""
+
+    def __init__(self, codes, dictionary, is_json=False):
+        self.codes = codes
+        self.dictionary = dictionary
+        self.is_json = is_json
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        code = self.codes[index]
+        if code < 0:
+            return None
+        return json.loads(self.dictionary[code]) if self.is_json else self.dictionary[code]
+
+    def code_of(self, value):
+        i = bisect_left(self.dictionary, value)
+        return i if i < len(self.dictionary) and self.dictionary[i] == value else None
+
+    def to_list(self):
+        return [self[i] for i in range(len(self))]
+
+
+class Utf8Column:
+    """Strings as int64 offsets into one UTF-8 blob, both views into the mapped file"""
+
+    def __init__(self, offsets, data, nulls, is_json=False):
+        self.offsets = offsets
+        self.data = data
+        self.nulls = set(nulls)
+        self.is_json = is_json
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if index in self.nulls:
+            return None
+        value = bytes(self.data[self.offsets[index]:self.offsets[index + 1]]).decode()
+        return json.loads(value) if self.is_json else value
+
+    def to_list(self):
+        return [self[i] for i in range(len(self))]
+
+
+class NumericColumn:
+    """int64/float64 values read in place; NaN is None"""
+
+    def __init__(self, values):
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        value = self.values[index]
+        return None if value != value else value
+
+    def to_list(self):
+        values = self.values.tolist()
+        if self.values.format == 'd':
+            return [None if v != v else v for v in values]
+        return values
+
+
+class PpcolFile:
+    """A memory-mapped .ppcol part; columns are views into the mapping, decoded only on access"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        if bytes(self._view[:8]) != PPCOL_MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a .ppcol file")
+        (header_length,) = struct.unpack('<Q', self._view[8:16])
+        header = json.loads(bytes(self._view[16:16 + header_length]))
+        self._base = 16 + header_length
+        self.num_rows = header['num_rows']
+        self.specs = {spec['name']: spec for spec in header['columns']}
+        self._columns = {}
+
+    @property
+    def schema(self):
+        return list(self.specs)
+
+    def column(self, name):
+        if name not in self._columns:
+            spec = self.specs[name]
+            start = self._base + spec['offset']
+            if spec['type'] in ('i8', 'f8'):
+                raw = self._view[start:start + 8 * self.num_rows]
+                column = NumericColumn(raw.cast('q' if spec['type'] == 'i8' else 'd'))
+            elif spec['encoding'] == 'dictionary':
+                codes = self._view[start:start + 4 * self.num_rows].cast('i')
+                column = DictionaryColumn(codes, spec['dictionary'], spec['type'] == 'json')
+            else:
+                offsets = self._view[start:start + 8 * (self.num_rows + 1)].cast('q')
+                data_start = self._base + spec['data_offset']
+                column = Utf8Column(offsets, self._view[data_start:data_start + spec['data_length']],
+                                    spec['nulls'], spec['type'] == 'json')
+            self._columns[name] = column
+        return self._columns[name]
+
+    def series_range(self, series_id):
+        """Row range of one SeriesId (rows are sorted by it): a bisection over the dictionary codes"""
+        column = self.column('SeriesId')
+        if not isinstance(column, DictionaryColumn):
+            rows = [i for i in range(self.num_rows) if column[i] == series_id]
+            return (rows[0], rows[-1] + 1) if rows else (0, 0)
+        code = column.code_of(series_id)
+        if code is None:
+            return 0, 0
+        return bisect_left(column.codes, code), bisect_right(column.codes, code)
+
+    def close(self):
+        """Unmap the file; a column view still held by the caller keeps the mapping alive until released"""
+        self._columns = {}
+        self._view = None
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                pass
+            self._map = None
+        self._file.close()
+
+
+class ParquetFile:
+    """A Parquet part read through a pyarrow memory map"""
+
+    def __init__(self, path):
+        self.path = path
+        self._table = pyarrow.parquet.read_table(path, memory_map=True)
+        self.num_rows = self._table.num_rows
+        metadata = self._table.schema.metadata or {}
+        self._types = json.loads(metadata.get(b'ppmt_types', b'{}'))
+
+    @property
+    def schema(self):
+        return self._table.column_names
+
+    def column(self, name):
+        values = self._table.column(name).to_pylist()
+        if self._types.get(name) == 'json':
+            values = [None if v is None else json.loads(v) for v in values]
+        return _ListColumn(values)
+
+    def series_range(self, series_id):
+        series = self.column('SeriesId').values
+        return bisect_left(series, series_id), bisect_right(series, series_id)
+
+    def close(self):
+        self._table = None
+
+
+class _ListColumn:
+    def __init__(self, values):
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+    def to_list(self):
+        return list(self.values)
+
+
+def open_part(path):
+    if path.endswith(PARQUET_EXTENSION):
+        if pyarrow is None:
+            raise RuntimeError(f"{path} needs pyarrow to read")
+        return ParquetFile(path)
+    return PpcolFile(path)
+
+
+def _matches(column, rows, op, value):
+    """Rows (from `rows`) where column <op> value; dictionary columns compare codes, not strings"""
+    compare = _OPERATORS[op]
+    if isinstance(column, DictionaryColumn) and not column.is_json and op in ('=', '!='):
+        code = column.code_of(value)
+        codes = column.codes
+        if code is None:
+            return [] if op == '=' else [i for i in rows if codes[i] >= 0]
+        return [i for i in rows if compare(codes[i], code)]
+    return [i for i in rows if (v := column[i]) is not None and compare(v, value)]
+
+
+class SnapshotReader:
+    """Read a snapshot directory: part pruning by the manifest, in-place filtering and aggregation"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+        self.schema = self.manifest['schema']
+
+    @property
+    def num_rows(self):
+        return self.manifest['num_rows']
+
+    def parts(self, series_id=None, since=None):
+        """Part entries that can contain the SeriesId / Timestamps >= since"""
+        for part in self.manifest['parts']:
+            if series_id is not None and not part['min_series_id'] <= series_id <= part['max_series_id']:
+                continue
+            if since is not None and part['max_timestamp'] < since:
+                continue
+            yield part
+
+    def _selected(self, part_file, series_id, since, where):
+        rows = range(*part_file.series_range(series_id)) if series_id is not None else range(part_file.num_rows)
+        filters = list(where or [])
+        if since is not None:
+            filters.append(('Timestamp', '>=', since))
+        for name, op, value in filters:
+            if name not in part_file.schema:
+                return []
+            rows = _matches(part_file.column(name), rows, op, value)
+        return rows
+
+    def scan(self, columns=None, series_id=None, since=None, where=None):
+        """Yield one ColumnBatch per part with the selected rows
+
+        where: [(column, op, value)] with op in = != < <= > >=, all of which must hold.
+        """
+        for part in self.parts(series_id, since):
+            part_file = open_part(os.path.join(self.path, part['file']))
+            try:
+                rows = self._selected(part_file, series_id, since, where)
+                names = columns or part_file.schema
+                batch = {}
+                for name in names:
+                    column = part_file.column(name) if name in part_file.schema else None
+                    batch[name] = [column[i] for i in rows] if column is not None else [None] * len(rows)
+                yield ColumnBatch(batch)
+            finally:
+                part_file.close()
+
+    def read(self, columns=None, series_id=None, since=None, where=None):
+        return ColumnBatch.concat(list(self.scan(columns, series_id, since, where)), columns)
+
+    def items(self, series_id=None, since=None, where=None):
+        """Rows as item dicts without absent attributes"""
+        for batch in self.scan(None, series_id, since, where):
+            for row in batch.to_dicts():
+                yield {name: value for name, value in row.items() if value is not None}
+
+    def aggregate(self, group_by, value, series_id=None, since=None, where=None):
+        """{group: {count, sum, min, max, mean}} of a numeric column"""
+        if self.schema.get(value) not in ('i8', 'f8'):
+            raise ValueError(f"Cannot aggregate {value!r}: column type is {self.schema.get(value)!r}, not numeric")
+        groups = {}
+        for part in self.parts(series_id, since):
+            part_file = open_part(os.path.join(self.path, part['file']))
+            try:
+                rows = self._selected(part_file, series_id, since, where)
+                keys = part_file.column(group_by)
+                values = part_file.column(value)
+                for i in rows:
+                    number = values[i]
+                    if number is None:
+                        continue
+                    stats = groups.get(keys[i])
+                    if stats is None:
+                        groups[keys[i]] = {'count': 1, 'sum': number, 'min': number, 'max': number}
+                    else:
+                        stats['count'] += 1
+                        stats['sum'] += number
+                        stats['min'] = min(stats['min'], number)
+                        stats['max'] = max(stats['max'], number)
+            finally:
+                part_file.close()
+        for stats in groups.values():
+            stats['mean'] = stats['sum'] / stats['count']
+        return groups
+
+
+def latest_snapshot(root=SNAPSHOT_DIR):
+    """Most recent snapshot directory under root (names sort by export time), or None"""
+    if not os.path.isdir(root):
+        return None
+    names = sorted(name for name in os.listdir(root)
+                   if os.path.exists(os.path.join(root, name, MANIFEST_FILE)))
+    return os.path.join(root, names[-1]) if names else None
+
+
+def load_catalog_snapshot(path):
+    """The ETL catalog ({ProductId: item}) from a snapshot instead of a table scan"""
+    return {item['ProductId']: item for item in SnapshotReader(path).items()}
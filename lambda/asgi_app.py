@@ -0,0 +1,177 @@
+# ASGI application for the PPMT-AMP query API
+# Serves the query routes of price_query_handler (GET /prices, GET /series) from a long-lived
+# server process, for container deployments next to or instead of Lambda. Each HTTP request
+# becomes the API Gateway proxy event lambda_handler expects and is answered with the same
+# status, headers and JSON body, so signature verification, replay protection, rate limiting,
+# the query cache and request metrics are the handler's own.
+#
+# Per worker process, the storage client (with its connection pool), the key ring, the replay
+# guard and the query cache L1 are created once at startup (lifespan) and shared by every
+# request. Across the workers of a server the query cache L2 (/tmp or Redis) is shared, and
+# with REPLAY_STORE_TABLE so is the replay store:
+#
+#   uvicorn asgi_app:app --app-dir lambda --workers 4 --port 8080
+#   gunicorn asgi_app:app --chdir lambda -w 4 -k uvicorn.workers.UvicornWorker -b 0.0.0.0:8080
+#
+# The event loop only handles HTTP. botocore clients block, so each request runs on a thread
+# pool sized to the client's connection pool and the loop keeps accepting, reading and
+# writing while backend calls are in flight. With CONCURRENT_QUERY the query and the rate
+# limit of one request also overlap.
+
+import asyncio
+import base64
+import json
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+import price_query_handler as handler
+from storage_backend import MAX_POOL_CONNECTIONS
+
+ROUTES = ('/prices', '/prices/changes', '/series')
+HEALTH_PATH = '/health'
+
+# Requests run at once per worker; by default one per pooled connection, so no thread waits for one
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', str(MAX_POOL_CONNECTIONS)))
+MAX_BODY_BYTES = 64 * 1024
+
+_executor = None
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+class RequestContext:
+    """The part of the Lambda context object the handler reads"""
+
+    def __init__(self, request_id):
+        self.aws_request_id = request_id
+
+
+def get_executor():
+    """Request threads of this worker, created on first use"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix='asgi')
+    return _executor
+
+
+def build_event(scope, body):
+    """API Gateway proxy event of an ASGI HTTP request"""
+    headers = {}
+    for name, value in scope.get('headers', []):
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        # Repeated headers are combined, as API Gateway does in `headers`
+        headers[name] = f"{headers[name]},{value}" if name in headers else value
+    client = scope.get('client') or (None, None)
+    return {
+        'httpMethod': scope['method'],
+        'path': scope['path'],
+        'resource': scope['path'],
+        # Always a dict: the handler reads verification parameters from it
+        'queryStringParameters': dict(parse_qsl(scope.get('query_string', b'').decode('latin-1'),
+                                                keep_blank_values=True)),
+        'headers': headers,
+        'body': body.decode() if body else None,
+        'requestContext': {'identity': {'sourceIp': client[0]}}
+    }
+
+
+def error_response(status, message, headers=None):
+    return {
+        'statusCode': status,
+        'headers': headers or {},
+        'body': json.dumps({'success': False, 'message': message})
+    }
+
+
+def invoke(event, request_id):
+    """Answer one request as the API Gateway + Lambda deployment would (runs on a request thread)"""
+    path = event['path']
+    if path == HEALTH_PATH:
+        return {'statusCode': 200, 'body': json.dumps({'status': 'ok'})}
+    if path not in ROUTES:
+        return error_response(404, 'Not found')
+    if event['httpMethod'] != 'GET':
+        return error_response(405, 'Method not allowed', {'Allow': 'GET'})
+    try:
+        return handler.lambda_handler(event, RequestContext(request_id))
+    except Exception as e:
+        # What API Gateway returns when the function fails
+        print(f"Request {request_id} error: {e}")
+        return {'statusCode': 502, 'body': json.dumps({'message': 'Internal server error'})}
+
+
+async def read_body(receive):
+    """Request body, or None if the client disconnected"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            raise BodyTooLarge()
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def send_response(send, response):
+    body = response.get('body') or ''
+    payload = base64.b64decode(body) if response.get('isBase64Encoded') else body.encode()
+    headers = {name.lower(): str(value) for name, value in (response.get('headers') or {}).items()}
+    headers.setdefault('content-type', 'application/json')
+    headers['content-length'] = str(len(payload))
+    await send({
+        'type': 'http.response.start',
+        'status': response.get('statusCode', 200),
+        'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()]
+    })
+    await send({'type': 'http.response.body', 'body': payload})
+
+
+async def lifespan(receive, send):
+    """Warm this worker before it takes requests; stop its threads on shutdown"""
+    loop = asyncio.get_running_loop()
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                # Storage client, key ring, replay guard and query cache, as EAGER_INIT does in Lambda
+                await loop.run_in_executor(get_executor(), handler.initialize)
+            except Exception as e:
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if _executor is not None:
+                await loop.run_in_executor(None, _executor.shutdown)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI 3 entry point"""
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    try:
+        body = await read_body(receive)
+    except BodyTooLarge:
+        await send_response(send, error_response(413, 'Request body too large'))
+        return
+    if body is None:
+        return
+
+    event = build_event(scope, body)
+    request_id = event['headers'].get('x-request-id') or str(uuid.uuid4())
+    response = await asyncio.get_running_loop().run_in_executor(get_executor(), invoke, event, request_id)
+    await send_response(send, response)
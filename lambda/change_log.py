@@ -0,0 +1,227 @@
+# Change log of PPMT-AMP-Items for delta sync
+# The stream processor's `changelog` sink appends every coalesced change to the
+# PPMT-AMP-ChangeLog table: an insert or update with the item's new image, or a tombstone with
+# its key. Entries share one partition and are ordered by Position, the time the entry was
+# written (milliseconds) followed by the stream sequence number. A client syncs with
+# GET /prices/changes?since=<token>: the token is the Position it has read through, and the
+# answer is the net change of every item written after it, one entry per item.
+#
+# Reads stop SETTLE_SECONDS before now, so an entry still being written cannot be passed over
+# by a token; a write that would take longer than that fails and is retried with new positions.
+# When nothing changed the token stays as it was, so clients that are up to date send the same
+# token and the CDN can serve them from one cached answer.
+#
+# Compaction deletes entries older than CHANGE_LOG_RETENTION_DAYS. It first records the last
+# Position it deletes as the log's watermark; a token behind the watermark may have missed
+# deleted entries, so it is expired and the client reloads the full catalog.
+
+import os
+import time
+
+from storage_backend import deserialize_dynamodb_item, serialize_dynamodb_item
+
+CHANGE_LOG_TABLE = os.environ.get('CHANGE_LOG_TABLE', 'PPMT-AMP-ChangeLog')
+FEED = 'items'
+META_KEY = {'Feed': {'S': f"{FEED}#meta"}, 'Position': {'S': 'compaction'}}
+
+RETENTION_DAYS = int(os.environ.get('CHANGE_LOG_RETENTION_DAYS', '7'))
+SETTLE_SECONDS = int(os.environ.get('CHANGE_LOG_SETTLE_SECONDS', '5'))
+COMPACT_INTERVAL = 3600     # seconds between compactions by one writer
+PAGE_LIMIT = 500            # entries per answer unless the client asks for fewer
+MAX_PAGE_LIMIT = 1000
+
+SEQUENCE_DIGITS = 40        # stream sequence numbers have up to 40 digits
+START_TOKEN = f"{0:013d}-{0:0{SEQUENCE_DIGITS}d}"
+
+# Stream event -> change log operation
+OPERATIONS = {'INSERT': 'insert', 'MODIFY': 'update', 'REMOVE': 'delete'}
+
+# Net operation of two consecutive entries for the same item (None: the client never had it)
+_MERGED_OPERATIONS = {
+    ('insert', 'update'): 'insert',
+    ('insert', 'delete'): None,
+    ('update', 'delete'): 'delete',
+    ('delete', 'insert'): 'update',
+    ('delete', 'update'): 'update'
+}
+
+
+class TokenExpired(Exception):
+    """The sync token is behind the compaction watermark: the client must reload everything"""
+
+
+def position(millis, sequence):
+    """Sort key of an entry: write time in milliseconds, then the stream sequence number"""
+    return f"{int(millis):013d}-{str(sequence):0>{SEQUENCE_DIGITS}}"
+
+
+def parse_token(token):
+    """Validated sync token (a Position); raises ValueError for anything else"""
+    millis, separator, sequence = (token or '').partition('-')
+    if (not separator or len(millis) != 13 or len(sequence) != SEQUENCE_DIGITS
+            or not millis.isdigit() or not sequence.isdigit()):
+        raise ValueError(f"Invalid sync token: {token!r}")
+    return token
+
+
+def item_key(item):
+    return {'SeriesId': item.get('SeriesId'), 'ProductId': item.get('ProductId')}
+
+
+def merge_entries(entries):
+    """Net change per item, in the order of each item's last entry: (operation, item) pairs"""
+    changes = {}
+    for entry in entries:
+        key = (entry['SeriesId'], entry['ProductId'])
+        previous = changes.pop(key, None)
+        operation = entry['Op']
+        if previous is not None:
+            operation = _MERGED_OPERATIONS.get((previous[0], operation), operation)
+            if operation is None:
+                continue
+        changes[key] = (operation, entry.get('Item') or item_key(entry))
+    return list(changes.values())
+
+
+class ChangeLog:
+    """Reads and writes the change log of one feed"""
+
+    def __init__(self, dynamodb, table=CHANGE_LOG_TABLE, retention_days=RETENTION_DAYS,
+                 settle_seconds=SETTLE_SECONDS, clock=time.time):
+        self.dynamodb = dynamodb
+        self.table = table
+        self.retention = retention_days * 86400
+        self.settle = settle_seconds
+        self.clock = clock
+        self.compacted_at = None
+
+    def _write(self, requests, max_attempts=8, deadline=None):
+        """BatchWriteItem in chunks of 25, retrying unprocessed items with backoff; with a deadline
+        (clock time) it gives up rather than sleep past it"""
+        for start in range(0, len(requests), 25):
+            pending = {self.table: requests[start:start + 25]}
+            for attempt in range(max_attempts):
+                pending = self.dynamodb.batch_write_item(RequestItems=pending).get('UnprocessedItems') or {}
+                if not pending:
+                    break
+                delay = min(0.05 * 2 ** attempt, 2.0)
+                if deadline is not None and self.clock() + delay >= deadline:
+                    raise RuntimeError("BatchWriteItem still had unprocessed items at the settle deadline")
+                time.sleep(delay)
+            else:
+                raise RuntimeError(f"BatchWriteItem still had unprocessed items after {max_attempts} attempts")
+
+    def append(self, changes):
+        """Write one entry per coalesced stream change (stream_processor.Change); returns entries written"""
+        now = self.clock()
+        now_ms = int(now * 1000)
+        requests = []
+        for change in changes:
+            operation = OPERATIONS[change.event]
+            image = change.image
+            entry = {
+                'Feed': FEED,
+                'Position': position(now_ms, change.sequence),
+                'Op': operation,
+                'SeriesId': image['SeriesId'],
+                'ProductId': image['ProductId']
+            }
+            if operation != 'delete':
+                entry['Item'] = change.new
+            requests.append({'PutRequest': {'Item': serialize_dynamodb_item(entry)}})
+        # Readers pass a Position SETTLE_SECONDS after it was stamped, so the entries must land
+        # before then. A write that cannot fails instead: the stream retries the batch, which
+        # appends the changes again under new positions
+        deadline = now + self.settle if self.settle else None
+        self._write(requests, deadline=deadline)
+        if deadline is not None and self.clock() >= deadline:
+            raise RuntimeError(f"Change log write outlasted the {self.settle}s settle window")
+        return len(requests)
+
+    def watermark(self):
+        """Position compaction has deleted through (START_TOKEN if it never ran)"""
+        response = self.dynamodb.get_item(TableName=self.table, Key=META_KEY, ConsistentRead=True)
+        item = response.get('Item')
+        return item['CompactedThrough']['S'] if item else START_TOKEN
+
+    def _query(self, low, high, limit=None, forward=True, projection=None, start=None):
+        params = {
+            'TableName': self.table,
+            'KeyConditionExpression': 'Feed = :feed AND #pos BETWEEN :low AND :high',
+            'ExpressionAttributeNames': {'#pos': 'Position'},
+            'ExpressionAttributeValues': {':feed': {'S': FEED}, ':low': {'S': low}, ':high': {'S': high}},
+            'ScanIndexForward': forward
+        }
+        if limit is not None:
+            params['Limit'] = limit
+        if projection:
+            params['ProjectionExpression'] = projection
+        if start:
+            params['ExclusiveStartKey'] = start
+        return self.dynamodb.query(**params)
+
+    def horizon(self):
+        """Last Position a read may return: entries newer than this may still be in flight"""
+        return position(int((self.clock() - self.settle) * 1000), '9' * SEQUENCE_DIGITS)
+
+    def head(self):
+        """Token of a client that has everything up to now: the latest settled entry's Position"""
+        response = self._query(START_TOKEN, self.horizon(), limit=1, forward=False, projection='#pos')
+        items = response.get('Items') or []
+        return max(items[0]['Position']['S'] if items else START_TOKEN, self.watermark())
+
+    def changes_since(self, token, limit=PAGE_LIMIT):
+        """Net changes after `token`: (changes, next token, more); raises TokenExpired"""
+        if token < self.watermark():
+            raise TokenExpired(token)
+        horizon = self.horizon()
+        if token >= horizon:
+            return [], token, False
+        # BETWEEN includes the token's own entry, which the client already has: read one more
+        response = self._query(token, horizon, limit=limit + 1)
+        entries = [deserialize_dynamodb_item(item) for item in response.get('Items', [])]
+        entries = [entry for entry in entries if entry['Position'] > token]
+        more = len(entries) > limit or bool(response.get('LastEvaluatedKey'))
+        entries = entries[:limit]
+        next_token = entries[-1]['Position'] if entries else token
+        return merge_entries(entries), next_token, more
+
+    def compact(self, force=False):
+        """Delete entries past the retention period (at most once per COMPACT_INTERVAL unless
+        forced); returns the number deleted"""
+        now = self.clock()
+        if not force and self.compacted_at is not None and now - self.compacted_at < COMPACT_INTERVAL:
+            return 0
+        self.compacted_at = now
+        cutoff = f"{int((now - self.retention) * 1000):013d}-"  # before every entry of that millisecond
+        positions = []
+        start = None
+        while True:
+            response = self._query(START_TOKEN, cutoff, projection='#pos', start=start)
+            positions.extend(item['Position']['S'] for item in response.get('Items', []))
+            start = response.get('LastEvaluatedKey')
+            if not start:
+                break
+        if not positions:
+            return 0
+        # Watermark first: from now on a token before these entries is expired, then they go
+        try:
+            self.dynamodb.update_item(
+                TableName=self.table,
+                Key=META_KEY,
+                UpdateExpression='SET CompactedThrough = :through, CompactedAt = :now',
+                ConditionExpression='attribute_not_exists(CompactedThrough) OR CompactedThrough < :through',
+                ExpressionAttributeValues={':through': {'S': positions[-1]}, ':now': {'N': str(int(now))}}
+            )
+        except self.dynamodb.exceptions.ConditionalCheckFailedException:
+            pass  # Another writer compacted through here already; deleting again is harmless
+        self._write([{'DeleteRequest': {'Key': {'Feed': {'S': FEED}, 'Position': {'S': p}}}} for p in positions])
+        return len(positions)
+
+
+def create_change_log(dynamodb=None):
+    """Change log of PPMT-AMP-Items on the process-wide storage backend"""
+    if dynamodb is None:
+        from storage_backend import get_storage_backend
+        dynamodb = get_storage_backend()
+    return ChangeLog(dynamodb)
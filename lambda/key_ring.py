@@ -0,0 +1,135 @@
+# Request signing keys for PPMT-AMP apps
+# Signatures are base64(HMAC-SHA256(secret, "appId:deviceId:timestamp:METHOD:path")). Keys are
+# held in a ring keyed by app ID and key ID and loaded once per container: from APP_KEYS (JSON),
+# from the file named by APP_KEYS_FILE (e.g. a mounted secret), or else the legacy single
+# APP_SECRET for a handler's default app IDs. For each key the HMAC inner and outer SHA-256
+# states (key XOR ipad / opad) are computed at load; a verification copies them instead of
+# re-encoding the secret and rebuilding the HMAC.
+#
+# Rotation: an app may have several keys, each optionally limited to [notBefore, notAfter).
+# Clients may name the key they signed with (keyId) and are then checked against that key only.
+# A request without one (shipped clients) is checked against each key active at its timestamp,
+# newest first (latest notBefore, then the later entry): a client on the newest key costs one
+# HMAC, and the extra HMACs are bounded by the few keys active during a rotation window.
+#
+# APP_KEYS / APP_KEYS_FILE format:
+#   {"ppmt-amp-ios-v1": [{"keyId": "2026-10", "secret": "...", "notBefore": "2026-10-01T00:00:00Z"},
+#                        {"keyId": "2026-04", "secret": "...", "notAfter": "2026-11-01T00:00:00Z"}]}
+
+import binascii
+import hashlib
+import hmac
+import json
+import os
+from datetime import datetime, timezone
+
+LEGACY_KEY_ID = 'default'
+BLOCK_SIZE = 64  # SHA-256 block size in bytes
+DIGEST_SIZE = 32
+
+
+def _epoch(value):
+    """Epoch seconds from a number or an ISO 8601 string (naive means UTC)"""
+    if isinstance(value, (int, float)):
+        return value
+    parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class SigningKey:
+    """One secret with its precomputed HMAC-SHA256 states and validity window"""
+
+    def __init__(self, key_id, secret, not_before=None, not_after=None):
+        self.key_id = key_id
+        # Open ends as ±inf, so the active check is one chained comparison
+        self.not_before = _epoch(not_before) if not_before is not None else float('-inf')
+        self.not_after = _epoch(not_after) if not_after is not None else float('inf')
+        key = secret.encode() if isinstance(secret, str) else secret
+        if len(key) > BLOCK_SIZE:
+            key = hashlib.sha256(key).digest()
+        key = key.ljust(BLOCK_SIZE, b'\0')
+        self._inner = hashlib.sha256(bytes(b ^ 0x36 for b in key))
+        self._outer = hashlib.sha256(bytes(b ^ 0x5c for b in key))
+
+    def active(self, at):
+        return self.not_before <= at < self.not_after
+
+    def digest(self, message):
+        """HMAC-SHA256 of message (bytes), same result as hmac.new(secret, message, sha256)"""
+        inner = self._inner.copy()
+        inner.update(message)
+        outer = self._outer.copy()
+        outer.update(inner.digest())
+        return outer.digest()
+
+    def __repr__(self):
+        return f"SigningKey({self.key_id!r})"
+
+
+class KeyRing:
+    """Signing keys by app ID, then key ID"""
+
+    def __init__(self, keys=None, source='empty'):
+        self.keys = keys or {}
+        self.source = source
+        # Keys newest first (latest notBefore, then later in the config) for requests without a key ID
+        self._newest_first = {
+            app_id: tuple(key for _, key in sorted(enumerate(app_keys.values()),
+                                                   key=lambda entry: (-entry[1].not_before, -entry[0])))
+            for app_id, app_keys in self.keys.items()
+        }
+
+    @classmethod
+    def from_config(cls, config, source='config'):
+        keys = {}
+        for app_id, entries in config.items():
+            keys[app_id] = {}
+            for entry in entries:
+                key_id = entry.get('keyId') or LEGACY_KEY_ID
+                if key_id in keys[app_id]:
+                    raise ValueError(f"Duplicate key ID '{key_id}' for app '{app_id}'")
+                keys[app_id][key_id] = SigningKey(key_id, entry['secret'], entry.get('notBefore'),
+                                                  entry.get('notAfter'))
+        return cls(keys, source)
+
+    def has_app(self, app_id):
+        return app_id in self.keys
+
+    def app_ids(self):
+        return sorted(self.keys)
+
+    def keys_for(self, app_id, at, key_id=None):
+        """Keys to check a request against: the named key, or each key of the app active at `at`, newest first"""
+        if key_id:
+            key = self.keys.get(app_id, {}).get(key_id)
+            return (key,) if key is not None and key.active(at) else ()
+        return tuple(key for key in self._newest_first.get(app_id, ()) if key.active(at))
+
+    def verify(self, app_id, device_id, timestamp, payload, signature, key_id=None):
+        """Key ID that produced the signature, or None if no active key of the app did"""
+        try:
+            provided = binascii.a2b_base64(signature or '', strict_mode=True)
+            at = int(timestamp)
+        except (binascii.Error, TypeError, ValueError):
+            return None
+        if len(provided) != DIGEST_SIZE:
+            return None
+        message = f"{app_id}:{device_id}:{timestamp}:{payload}".encode()
+        for key in self.keys_for(app_id, at, key_id):
+            if hmac.compare_digest(key.digest(message), provided):
+                return key.key_id
+        return None
+
+
+def load_key_ring(default_app_ids, default_secret):
+    """Key ring from APP_KEYS, APP_KEYS_FILE, or else default_secret for each of default_app_ids"""
+    if os.environ.get('APP_KEYS'):
+        return KeyRing.from_config(json.loads(os.environ['APP_KEYS']), source='APP_KEYS')
+    path = os.environ.get('APP_KEYS_FILE')
+    if path:
+        with open(path) as f:
+            return KeyRing.from_config(json.load(f), source=path)
+    return KeyRing.from_config({app_id: [{'secret': default_secret}] for app_id in default_app_ids},
+                               source='APP_SECRET')
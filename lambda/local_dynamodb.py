@@ -0,0 +1,828 @@
+# SQLite-backed stand-in for the low-level DynamoDB client
+# Used by storage_backend when STORAGE_BACKEND=local, and by the offline benchmark scripts.
+# Kept out of storage_backend so the production Lambda never imports sqlite3 or the
+# expression parser.
+
+import json
+import math
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from decimal import Decimal
+
+# DynamoDB returns at most 1 MB of data per Query/Scan page
+MAX_PAGE_BYTES = 1024 * 1024
+
+
+# --- Errors ---------------------------------------------------------------
+# Mirrors botocore's ClientError shape so callers can inspect e.response['Error']['Code']
+
+class LocalClientError(Exception):
+    code = 'InternalServerError'
+
+    def __init__(self, message, operation=None):
+        super().__init__(f"An error occurred ({self.code}) when calling the {operation} operation: {message}")
+        self.operation_name = operation
+        self.response = {'Error': {'Code': self.code, 'Message': message}}
+
+
+class ResourceNotFoundException(LocalClientError):
+    code = 'ResourceNotFoundException'
+
+
+class ResourceInUseException(LocalClientError):
+    code = 'ResourceInUseException'
+
+
+class ValidationException(LocalClientError):
+    code = 'ValidationException'
+
+
+class ConditionalCheckFailedException(LocalClientError):
+    code = 'ConditionalCheckFailedException'
+
+
+class TransactionCanceledException(LocalClientError):
+    code = 'TransactionCanceledException'
+
+
+class _Exceptions:
+    """Namespace matching boto3's client.exceptions attribute"""
+    ClientError = LocalClientError
+    ResourceNotFoundException = ResourceNotFoundException
+    ResourceInUseException = ResourceInUseException
+    ValidationException = ValidationException
+    ConditionalCheckFailedException = ConditionalCheckFailedException
+    TransactionCanceledException = TransactionCanceledException
+
+
+# --- Expression evaluation ------------------------------------------------
+
+_TOKEN_RE = re.compile(r"\s*(<>|<=|>=|[=<>(),+\-]|:[A-Za-z0-9_]+|#[A-Za-z0-9_]+|[A-Za-z_][A-Za-z0-9_.\[\]]*)")
+_KEYWORDS = {'AND', 'OR', 'NOT', 'BETWEEN', 'IN', 'SET', 'REMOVE', 'ADD', 'DELETE'}
+_FUNCTIONS = {'attribute_exists', 'attribute_not_exists', 'begins_with', 'contains', 'size',
+              'if_not_exists', 'attribute_type'}
+
+
+def _tokenize(expression):
+    tokens = []
+    pos = 0
+    expression = expression.strip()
+    while pos < len(expression):
+        match = _TOKEN_RE.match(expression, pos)
+        if not match:
+            raise ValidationException(f"Invalid expression near '{expression[pos:]}'")
+        tokens.append(match.group(1))
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    """Recursive-descent parser for condition, key-condition and update expressions"""
+
+    def __init__(self, expression, names, values):
+        self.tokens = _tokenize(expression or '')
+        self.pos = 0
+        self.names = names or {}
+        self.values = values or {}
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def next(self):
+        token = self.peek()
+        if token is None:
+            raise ValidationException("Unexpected end of expression")
+        self.pos += 1
+        return token
+
+    def expect(self, token):
+        actual = self.next()
+        if actual.upper() != token:
+            raise ValidationException(f"Expected '{token}' but found '{actual}'")
+
+    def at_end(self):
+        return self.pos >= len(self.tokens)
+
+    # Conditions: OR > AND > NOT > comparison
+    def parse_condition(self):
+        node = self.parse_and()
+        while self.peek() and self.peek().upper() == 'OR':
+            self.next()
+            node = ('or', node, self.parse_and())
+        return node
+
+    def parse_and(self):
+        node = self.parse_not()
+        while self.peek() and self.peek().upper() == 'AND':
+            self.next()
+            node = ('and', node, self.parse_not())
+        return node
+
+    def parse_not(self):
+        if self.peek() and self.peek().upper() == 'NOT':
+            self.next()
+            return ('not', self.parse_not())
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        if self.peek() == '(':
+            self.next()
+            node = self.parse_condition()
+            self.expect(')')
+            return node
+
+        left = self.parse_operand()
+        if left[0] == 'func' and left[1] != 'size':
+            return left
+
+        op = self.peek()
+        if op in ('=', '<>', '<', '<=', '>', '>='):
+            self.next()
+            return ('cmp', op, left, self.parse_operand())
+        if op and op.upper() == 'BETWEEN':
+            self.next()
+            low = self.parse_operand()
+            self.expect('AND')
+            return ('between', left, low, self.parse_operand())
+        if op and op.upper() == 'IN':
+            self.next()
+            self.expect('(')
+            options = [self.parse_operand()]
+            while self.peek() == ',':
+                self.next()
+                options.append(self.parse_operand())
+            self.expect(')')
+            return ('in', left, options)
+        raise ValidationException(f"Expected comparison operator but found '{op}'")
+
+    def parse_operand(self):
+        token = self.next()
+        if token.startswith(':'):
+            if token not in self.values:
+                raise ValidationException(f"Value {token} not defined in ExpressionAttributeValues")
+            return ('value', self.values[token])
+        if token in _FUNCTIONS and self.peek() == '(':
+            self.next()
+            args = [self.parse_operand()]
+            while self.peek() == ',':
+                self.next()
+                args.append(self.parse_operand())
+            self.expect(')')
+            return ('func', token, args)
+        return ('path', self.resolve_path(token))
+
+    def resolve_path(self, token):
+        if token.startswith('#'):
+            if token not in self.names:
+                raise ValidationException(f"Name {token} not defined in ExpressionAttributeNames")
+            return self.names[token]
+        if token.upper() in _KEYWORDS:
+            raise ValidationException(f"Unexpected keyword '{token}'")
+        return token
+
+    # Updates: SET a = b [+|- c], REMOVE a, ADD a :v
+    def parse_update(self):
+        actions = []
+        while not self.at_end():
+            clause = self.next().upper()
+            while True:
+                if clause == 'SET':
+                    path = self.resolve_path(self.next())
+                    self.expect('=')
+                    value = self.parse_operand()
+                    if self.peek() in ('+', '-'):
+                        op = self.next()
+                        value = ('arith', op, value, self.parse_operand())
+                    actions.append(('set', path, value))
+                elif clause == 'REMOVE':
+                    actions.append(('remove', self.resolve_path(self.next())))
+                elif clause == 'ADD':
+                    path = self.resolve_path(self.next())
+                    actions.append(('add', path, self.parse_operand()))
+                else:
+                    raise ValidationException(f"Unsupported update clause '{clause}'")
+                if self.peek() != ',':
+                    break
+                self.next()
+        return actions
+
+
+def _comparable(value):
+    """Return (type, python value) used for comparisons and sorting"""
+    if value is None:
+        return (None, None)
+    if 'S' in value:
+        return ('S', value['S'])
+    if 'N' in value:
+        return ('N', Decimal(value['N']))
+    if 'B' in value:
+        return ('B', value['B'])
+    if 'BOOL' in value:
+        return ('BOOL', value['BOOL'])
+    if 'NULL' in value:
+        return ('NULL', None)
+    return ('OTHER', json.dumps(value, sort_keys=True, default=str))
+
+
+def _evaluate_operand(node, item):
+    kind = node[0]
+    if kind == 'value':
+        return node[1]
+    if kind == 'path':
+        return item.get(node[1])
+    if kind == 'func' and node[1] == 'size':
+        value = _evaluate_operand(node[2][0], item)
+        if value is None:
+            return None
+        inner = next(iter(value.values()))
+        return {'N': str(len(inner))}
+    if kind == 'func' and node[1] == 'if_not_exists':
+        value = _evaluate_operand(node[2][0], item)
+        return value if value is not None else _evaluate_operand(node[2][1], item)
+    if kind == 'arith':
+        left = _comparable(_evaluate_operand(node[2], item))
+        right = _comparable(_evaluate_operand(node[3], item))
+        if left[0] != 'N' or right[0] != 'N':
+            raise ValidationException("An operand in the update expression has an incorrect data type")
+        result = left[1] + right[1] if node[1] == '+' else left[1] - right[1]
+        return {'N': str(result)}
+    raise ValidationException(f"Unsupported operand {node}")
+
+
+def _compare(op, left, right):
+    left, right = _comparable(left), _comparable(right)
+    if left[0] is None or right[0] is None:
+        return op == '<>' and left != right
+    if op == '=':
+        return left == right
+    if op == '<>':
+        return left != right
+    if left[0] != right[0] or left[0] not in ('S', 'N', 'B'):
+        return False
+    if op == '<':
+        return left[1] < right[1]
+    if op == '<=':
+        return left[1] <= right[1]
+    if op == '>':
+        return left[1] > right[1]
+    return left[1] >= right[1]
+
+
+def _evaluate_condition(node, item):
+    kind = node[0]
+    if kind == 'and':
+        return _evaluate_condition(node[1], item) and _evaluate_condition(node[2], item)
+    if kind == 'or':
+        return _evaluate_condition(node[1], item) or _evaluate_condition(node[2], item)
+    if kind == 'not':
+        return not _evaluate_condition(node[1], item)
+    if kind == 'cmp':
+        return _compare(node[1], _evaluate_operand(node[2], item), _evaluate_operand(node[3], item))
+    if kind == 'between':
+        value = _evaluate_operand(node[1], item)
+        return (_compare('>=', value, _evaluate_operand(node[2], item))
+                and _compare('<=', value, _evaluate_operand(node[3], item)))
+    if kind == 'in':
+        value = _evaluate_operand(node[1], item)
+        return any(_compare('=', value, _evaluate_operand(option, item)) for option in node[2])
+    if kind == 'func':
+        name, args = node[1], node[2]
+        if name == 'attribute_exists':
+            return _evaluate_operand(args[0], item) is not None
+        if name == 'attribute_not_exists':
+            return _evaluate_operand(args[0], item) is None
+        if name == 'attribute_type':
+            value = _evaluate_operand(args[0], item)
+            return value is not None and _evaluate_operand(args[1], item).get('S') in value
+        if name == 'begins_with':
+            value = _comparable(_evaluate_operand(args[0], item))
+            prefix = _comparable(_evaluate_operand(args[1], item))
+            return value[0] == prefix[0] and value[0] in ('S', 'B') and value[1].startswith(prefix[1])
+        if name == 'contains':
+            value = _evaluate_operand(args[0], item)
+            operand = _evaluate_operand(args[1], item)
+            if value is None or operand is None:
+                return False
+            if 'S' in value:
+                return 'S' in operand and operand['S'] in value['S']
+            if 'L' in value:
+                return operand in value['L']
+            for set_type in ('SS', 'NS', 'BS'):
+                if set_type in value:
+                    return next(iter(operand.values())) in value[set_type]
+            return False
+    raise ValidationException(f"Unsupported condition {node}")
+
+
+def _apply_update(actions, item):
+    updated = dict(item)
+    for action in actions:
+        if action[0] == 'set':
+            updated[action[1]] = _evaluate_operand(action[2], item)
+        elif action[0] == 'remove':
+            updated.pop(action[1], None)
+        elif action[0] == 'add':
+            operand = _evaluate_operand(action[2], item)
+            current = item.get(action[1])
+            if 'N' in operand:
+                base = Decimal(current['N']) if current else Decimal(0)
+                updated[action[1]] = {'N': str(base + Decimal(operand['N']))}
+            else:
+                set_type = next(iter(operand))
+                existing = current.get(set_type, []) if current else []
+                updated[action[1]] = {set_type: existing + [v for v in operand[set_type] if v not in existing]}
+    return updated
+
+
+def _key_component(value):
+    """Sort component for a key attribute (missing attributes sort first)"""
+    kind, python_value = _comparable(value)
+    return (kind or '', python_value if python_value is not None else '')
+
+
+def _item_size(item):
+    """Approximate DynamoDB item size in bytes (attribute names + values)"""
+    return len(json.dumps(item, separators=(',', ':'), default=str).encode())
+
+
+def _consumed_capacity(kwargs, table_name, size, write=False):
+    """ConsumedCapacity entry when requested: 4 KB read units (halved unless
+    ConsistentRead) and 1 KB write units"""
+    if kwargs.get('ReturnConsumedCapacity', 'NONE') == 'NONE':
+        return {}
+    if write:
+        units = float(max(1, math.ceil(size / 1024)))
+    else:
+        units = max(1, math.ceil(size / 4096)) * (1.0 if kwargs.get('ConsistentRead') else 0.5)
+    return {'ConsumedCapacity': {'TableName': table_name, 'CapacityUnits': units}}
+
+
+def _project(item, projection, names):
+    if not projection:
+        return item
+    attributes = [names.get(a.strip(), a.strip()) for a in projection.split(',')]
+    return {key: item[key] for key in attributes if key in item}
+
+
+class LocalDynamoDB:
+    """SQLite-backed stand-in for the low-level DynamoDB client.
+
+    Implements the subset of the API used by PPMT-AMP: table management, get/put/update/delete,
+    batch and transactional writes, and Query/Scan with key conditions, GSIs, ScanIndexForward,
+    Limit (applied before FilterExpression), the 1 MB page limit and ExclusiveStartKey/
+    LastEvaluatedKey pagination. Results are deterministic so benchmarks are reproducible.
+
+    With stream_path set, every write to a table created with StreamSpecification enabled is
+    appended to that file as a DynamoDB Streams record (JSON lines), for stream_processor.py.
+    """
+
+    exceptions = _Exceptions
+
+    def __init__(self, path=':memory:', stream_path=None):
+        self._lock = threading.RLock()
+        self.stream_path = stream_path
+        self._stream = None
+        self._sequence = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ':memory:':
+            # A file may be shared by several processes (scripts/serve-asgi.py): readers do not
+            # block the writer, and commits are not synced to disk one by one
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS tables (name TEXT PRIMARY KEY, definition TEXT)')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS items ('
+            'table_name TEXT, hash_key TEXT, range_key TEXT, item TEXT, '
+            'PRIMARY KEY (table_name, hash_key, range_key))'
+        )
+        self._tables = {}
+        for name, definition in self._conn.execute('SELECT name, definition FROM tables'):
+            self._tables[name] = json.loads(definition)
+
+    # --- Table management -------------------------------------------------
+
+    def create_table(self, TableName, KeySchema, AttributeDefinitions, GlobalSecondaryIndexes=None, **kwargs):
+        with self._lock:
+            if TableName in self._tables:
+                raise ResourceInUseException(f"Table already exists: {TableName}", 'CreateTable')
+            definition = {
+                'TableName': TableName,
+                'KeySchema': KeySchema,
+                'AttributeDefinitions': AttributeDefinitions,
+                'GlobalSecondaryIndexes': GlobalSecondaryIndexes or [],
+                'StreamSpecification': kwargs.get('StreamSpecification'),
+                'BillingModeSummary': {'BillingMode': kwargs.get('BillingMode', 'PROVISIONED')}
+            }
+            self._conn.execute('INSERT INTO tables VALUES (?, ?)', (TableName, json.dumps(definition)))
+            # Expression index per GSI hash key keeps index queries off a full table read
+            for index in definition['GlobalSecondaryIndexes']:
+                attribute = self._key_names(index['KeySchema'])[0]
+                attribute_type = self._attribute_type(definition, attribute)
+                index_name = re.sub(r'[^A-Za-z0-9_]', '_', f"{TableName}_{index['IndexName']}")
+                self._conn.execute(
+                    f'CREATE INDEX IF NOT EXISTS "{index_name}" ON items '
+                    f"(table_name, json_extract(item, '$.\"{attribute}\".{attribute_type}'))"
+                )
+            self._tables[TableName] = definition
+        return {'TableDescription': self._describe(TableName)}
+
+    def delete_table(self, TableName):
+        with self._lock:
+            description = self._describe(TableName)
+            self._conn.execute('DELETE FROM items WHERE table_name = ?', (TableName,))
+            self._conn.execute('DELETE FROM tables WHERE name = ?', (TableName,))
+            del self._tables[TableName]
+        return {'TableDescription': description}
+
+    def describe_table(self, TableName):
+        return {'Table': self._describe(TableName)}
+
+    def list_tables(self, **kwargs):
+        return {'TableNames': sorted(self._tables)}
+
+    def _describe(self, table_name):
+        definition = self._table(table_name, 'DescribeTable')
+        count = self._conn.execute('SELECT COUNT(*) FROM items WHERE table_name = ?', (table_name,)).fetchone()[0]
+        description = dict(definition)
+        description['TableStatus'] = 'ACTIVE'
+        description['ItemCount'] = count
+        description['GlobalSecondaryIndexes'] = [
+            dict(index, IndexStatus='ACTIVE') for index in definition['GlobalSecondaryIndexes']
+        ]
+        return description
+
+    def _table(self, table_name, operation):
+        if table_name not in self._tables:
+            raise ResourceNotFoundException(f"Requested resource not found: Table: {table_name} not found", operation)
+        return self._tables[table_name]
+
+    @staticmethod
+    def _key_names(key_schema):
+        hash_key = next(k['AttributeName'] for k in key_schema if k['KeyType'] == 'HASH')
+        range_key = next((k['AttributeName'] for k in key_schema if k['KeyType'] == 'RANGE'), None)
+        return hash_key, range_key
+
+    @staticmethod
+    def _attribute_type(definition, attribute):
+        return next((a['AttributeType'] for a in definition['AttributeDefinitions']
+                     if a['AttributeName'] == attribute), 'S')
+
+    def _primary_key(self, definition, item, operation):
+        hash_name, range_name = self._key_names(definition['KeySchema'])
+        try:
+            hash_value = next(iter(item[hash_name].values()))
+            range_value = next(iter(item[range_name].values())) if range_name else ''
+        except KeyError:
+            raise ValidationException("The provided key element does not match the schema", operation)
+        return str(hash_value), str(range_value)
+
+    def _load(self, table_name, hash_value, range_value):
+        row = self._conn.execute(
+            'SELECT item FROM items WHERE table_name = ? AND hash_key = ? AND range_key = ?',
+            (table_name, hash_value, range_value)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _store(self, table_name, hash_value, range_value, item):
+        streaming = self._streaming(table_name)
+        old_item = self._load(table_name, hash_value, range_value) if streaming else None
+        self._conn.execute(
+            'INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?)',
+            (table_name, hash_value, range_value, json.dumps(item, separators=(',', ':')))
+        )
+        if streaming:
+            self._emit(table_name, old_item, item)
+
+    def _remove(self, table_name, hash_value, range_value):
+        streaming = self._streaming(table_name)
+        old_item = self._load(table_name, hash_value, range_value) if streaming else None
+        self._conn.execute(
+            'DELETE FROM items WHERE table_name = ? AND hash_key = ? AND range_key = ?',
+            (table_name, hash_value, range_value)
+        )
+        if streaming:
+            self._emit(table_name, old_item, None)
+
+    # --- Stream capture ---------------------------------------------------
+
+    def _streaming(self, table_name):
+        specification = self._tables[table_name].get('StreamSpecification') or {}
+        return bool(self.stream_path and specification.get('StreamEnabled'))
+
+    def _emit(self, table_name, old_item, new_item):
+        """Append a stream record for a write that changed the item (no-op writes emit nothing)"""
+        if old_item == new_item or (old_item is None and new_item is None):
+            return
+        definition = self._tables[table_name]
+        view_type = definition['StreamSpecification'].get('StreamViewType', 'NEW_AND_OLD_IMAGES')
+        image = new_item if new_item is not None else old_item
+        self._sequence = max(self._sequence + 1, time.time_ns())
+        record = {
+            'eventID': f"{self._sequence:x}",
+            'eventName': 'INSERT' if old_item is None else 'REMOVE' if new_item is None else 'MODIFY',
+            'eventVersion': '1.1',
+            'eventSource': 'aws:dynamodb',
+            'awsRegion': 'local',
+            'eventSourceARN': f"arn:aws:dynamodb:local:000000000000:table/{table_name}/stream/local",
+            'dynamodb': {
+                'ApproximateCreationDateTime': int(time.time()),
+                'Keys': {name: image[name] for name in self._key_names(definition['KeySchema']) if name},
+                'SequenceNumber': f"{self._sequence:021d}",
+                'SizeBytes': _item_size(image),
+                'StreamViewType': view_type
+            }
+        }
+        if new_item is not None and view_type in ('NEW_IMAGE', 'NEW_AND_OLD_IMAGES'):
+            record['dynamodb']['NewImage'] = new_item
+        if old_item is not None and view_type in ('OLD_IMAGE', 'NEW_AND_OLD_IMAGES'):
+            record['dynamodb']['OldImage'] = old_item
+        if self._stream is None:
+            self._stream = open(self.stream_path, 'a')
+        self._stream.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self._stream.flush()
+
+    @staticmethod
+    def _check_condition(kwargs, item, operation):
+        expression = kwargs.get('ConditionExpression')
+        if not expression:
+            return
+        node = _Parser(expression, kwargs.get('ExpressionAttributeNames'),
+                       kwargs.get('ExpressionAttributeValues')).parse_condition()
+        if not _evaluate_condition(node, item or {}):
+            raise ConditionalCheckFailedException("The conditional request failed", operation)
+
+    @staticmethod
+    def _return_values(kwargs, old_item, new_item):
+        mode = kwargs.get('ReturnValues', 'NONE')
+        if mode == 'ALL_OLD' and old_item:
+            return {'Attributes': old_item}
+        if mode == 'ALL_NEW' and new_item:
+            return {'Attributes': new_item}
+        if mode in ('UPDATED_NEW', 'UPDATED_OLD'):
+            source = new_item if mode == 'UPDATED_NEW' else (old_item or {})
+            changed = {k: v for k, v in (new_item or {}).items() if (old_item or {}).get(k) != v}
+            return {'Attributes': {k: source[k] for k in changed if k in source}}
+        return {}
+
+    # --- Item operations --------------------------------------------------
+
+    def get_item(self, TableName, Key, **kwargs):
+        with self._lock:
+            definition = self._table(TableName, 'GetItem')
+            item = self._load(TableName, *self._primary_key(definition, Key, 'GetItem'))
+        response = _consumed_capacity(kwargs, TableName, _item_size(item) if item else 0)
+        if item is not None:
+            response['Item'] = _project(item, kwargs.get('ProjectionExpression'),
+                                        kwargs.get('ExpressionAttributeNames') or {})
+        return response
+
+    def put_item(self, TableName, Item, **kwargs):
+        with self._lock:
+            definition = self._table(TableName, 'PutItem')
+            key = self._primary_key(definition, Item, 'PutItem')
+            old_item = self._load(TableName, *key)
+            self._check_condition(kwargs, old_item, 'PutItem')
+            self._store(TableName, *key, Item)
+        response = self._return_values(kwargs, old_item, None)
+        response.update(_consumed_capacity(kwargs, TableName, max(_item_size(Item), _item_size(old_item or {})), True))
+        return response
+
+    def update_item(self, TableName, Key, **kwargs):
+        with self._lock:
+            definition = self._table(TableName, 'UpdateItem')
+            key = self._primary_key(definition, Key, 'UpdateItem')
+            old_item = self._load(TableName, *key)
+            self._check_condition(kwargs, old_item, 'UpdateItem')
+            actions = _Parser(kwargs.get('UpdateExpression'), kwargs.get('ExpressionAttributeNames'),
+                              kwargs.get('ExpressionAttributeValues')).parse_update()
+            new_item = _apply_update(actions, dict(old_item or Key))
+            new_item.update(Key)
+            self._store(TableName, *key, new_item)
+        response = self._return_values(kwargs, old_item, new_item)
+        response.update(_consumed_capacity(kwargs, TableName, max(_item_size(new_item), _item_size(old_item or {})), True))
+        return response
+
+    def delete_item(self, TableName, Key, **kwargs):
+        with self._lock:
+            definition = self._table(TableName, 'DeleteItem')
+            key = self._primary_key(definition, Key, 'DeleteItem')
+            old_item = self._load(TableName, *key)
+            self._check_condition(kwargs, old_item, 'DeleteItem')
+            self._remove(TableName, *key)
+        response = self._return_values(kwargs, old_item, None)
+        response.update(_consumed_capacity(kwargs, TableName, _item_size(old_item or {}), True))
+        return response
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        with self._lock:
+            for table_name, requests in RequestItems.items():
+                definition = self._table(table_name, 'BatchWriteItem')
+                for request in requests:
+                    if 'PutRequest' in request:
+                        item = request['PutRequest']['Item']
+                        self._store(table_name, *self._primary_key(definition, item, 'BatchWriteItem'), item)
+                    else:
+                        key = request['DeleteRequest']['Key']
+                        self._remove(table_name, *self._primary_key(definition, key, 'BatchWriteItem'))
+        return {'UnprocessedItems': {}}
+
+    def batch_get_item(self, RequestItems, **kwargs):
+        responses = {}
+        with self._lock:
+            for table_name, request in RequestItems.items():
+                definition = self._table(table_name, 'BatchGetItem')
+                found = []
+                for key in request['Keys']:
+                    item = self._load(table_name, *self._primary_key(definition, key, 'BatchGetItem'))
+                    if item is not None:
+                        found.append(item)
+                responses[table_name] = found
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+    def transact_write_items(self, TransactItems, **kwargs):
+        """All-or-nothing writes: every condition is checked before anything is stored"""
+        with self._lock:
+            staged = []
+            reasons = []
+            for entry in TransactItems:
+                operation, request = next(iter(entry.items()))
+                definition = self._table(request['TableName'], 'TransactWriteItems')
+                key_source = request.get('Item') or request['Key']
+                key = self._primary_key(definition, key_source, 'TransactWriteItems')
+                old_item = self._load(request['TableName'], *key)
+                try:
+                    self._check_condition(request, old_item, 'TransactWriteItems')
+                    reasons.append({'Code': 'None'})
+                except ConditionalCheckFailedException:
+                    reasons.append({'Code': 'ConditionalCheckFailed'})
+                staged.append((operation, request, key, old_item))
+
+            if any(reason['Code'] != 'None' for reason in reasons):
+                error = TransactionCanceledException(
+                    "Transaction cancelled, please refer cancellation reasons for specific reasons "
+                    f"[{', '.join(reason['Code'] for reason in reasons)}]", 'TransactWriteItems')
+                error.response['CancellationReasons'] = reasons
+                raise error
+
+            for operation, request, key, old_item in staged:
+                table_name = request['TableName']
+                if operation == 'Put':
+                    self._store(table_name, *key, request['Item'])
+                elif operation == 'Delete':
+                    self._remove(table_name, *key)
+                elif operation == 'Update':
+                    actions = _Parser(request['UpdateExpression'], request.get('ExpressionAttributeNames'),
+                                      request.get('ExpressionAttributeValues')).parse_update()
+                    new_item = _apply_update(actions, dict(old_item or request['Key']))
+                    new_item.update(request['Key'])
+                    self._store(table_name, *key, new_item)
+        return {}
+
+    # --- Query / Scan -----------------------------------------------------
+
+    def query(self, TableName, KeyConditionExpression, **kwargs):
+        definition = self._table(TableName, 'Query')
+        names = kwargs.get('ExpressionAttributeNames') or {}
+        values = kwargs.get('ExpressionAttributeValues') or {}
+        hash_name, range_name, key_attributes = self._index_keys(definition, kwargs.get('IndexName'))
+
+        conditions = self._flatten_and(_Parser(KeyConditionExpression, names, values).parse_condition())
+        hash_condition = next((c for c in conditions if c[0] == 'cmp' and c[1] == '='
+                               and c[2] == ('path', hash_name)), None)
+        if hash_condition is None:
+            raise ValidationException("Query condition missed key schema element", 'Query')
+        range_conditions = [c for c in conditions if c is not hash_condition]
+        for condition in range_conditions:
+            if range_name is None or self._condition_path(condition) != range_name:
+                raise ValidationException("Query key condition not supported", 'Query')
+
+        hash_value = hash_condition[3][1]
+        with self._lock:
+            if kwargs.get('IndexName'):
+                attribute_type = self._attribute_type(definition, hash_name)
+                rows = self._conn.execute(
+                    f"SELECT item FROM items WHERE table_name = ? "
+                    f"AND json_extract(item, '$.\"{hash_name}\".{attribute_type}') = ?",
+                    (TableName, next(iter(hash_value.values())))
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    'SELECT item FROM items WHERE table_name = ? AND hash_key = ?',
+                    (TableName, str(next(iter(hash_value.values()))))
+                ).fetchall()
+
+        candidates = []
+        for (raw,) in rows:
+            item = json.loads(raw)
+            if range_name and range_name not in item:
+                continue  # Sparse index: items without the sort key are not indexed
+            if all(_evaluate_condition(c, item) for c in range_conditions):
+                candidates.append(item)
+
+        candidates.sort(key=lambda item: self._sort_key(item, key_attributes))
+        descending = kwargs.get('ScanIndexForward', True) is False
+        if descending:
+            candidates.reverse()
+        return self._paginate(TableName, candidates, key_attributes, kwargs, names, values, descending=descending)
+
+    def scan(self, TableName, **kwargs):
+        definition = self._table(TableName, 'Scan')
+        names = kwargs.get('ExpressionAttributeNames') or {}
+        values = kwargs.get('ExpressionAttributeValues') or {}
+        hash_name, range_name, key_attributes = self._index_keys(definition, kwargs.get('IndexName'))
+
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT item FROM items WHERE table_name = ? ORDER BY hash_key, range_key', (TableName,)
+            ).fetchall()
+        candidates = [json.loads(raw) for (raw,) in rows]
+        order = self._stored_key
+        if kwargs.get('IndexName'):
+            candidates = [item for item in candidates if hash_name in item and (not range_name or range_name in item)]
+            candidates.sort(key=lambda item: self._sort_key(item, key_attributes))
+            order = self._sort_key
+
+        # Parallel scan: deterministic segment assignment by primary key
+        if 'TotalSegments' in kwargs:
+            segment, total = kwargs['Segment'], kwargs['TotalSegments']
+            table_keys = key_attributes[-2:] if kwargs.get('IndexName') else key_attributes
+            candidates = [item for item in candidates
+                          if zlib.crc32(json.dumps([item.get(k) for k in table_keys]).encode()) % total == segment]
+        return self._paginate(TableName, candidates, key_attributes, kwargs, names, values, order=order)
+
+    def _index_keys(self, definition, index_name):
+        table_keys = [k for k in self._key_names(definition['KeySchema']) if k]
+        if not index_name:
+            hash_name, range_name = self._key_names(definition['KeySchema'])
+            return hash_name, range_name, table_keys
+        index = next((i for i in definition['GlobalSecondaryIndexes'] if i['IndexName'] == index_name), None)
+        if index is None:
+            raise ValidationException(f"The table does not have the specified index: {index_name}", 'Query')
+        hash_name, range_name = self._key_names(index['KeySchema'])
+        index_keys = [k for k in (hash_name, range_name) if k]
+        return hash_name, range_name, index_keys + [k for k in table_keys if k not in index_keys]
+
+    @staticmethod
+    def _flatten_and(node):
+        if node[0] == 'and':
+            return LocalDynamoDB._flatten_and(node[1]) + LocalDynamoDB._flatten_and(node[2])
+        return [node]
+
+    @staticmethod
+    def _condition_path(condition):
+        if condition[0] == 'cmp':
+            return condition[2][1]
+        if condition[0] == 'between':
+            return condition[1][1]
+        if condition[0] == 'func' and condition[1] == 'begins_with':
+            return condition[2][0][1]
+        return None
+
+    @staticmethod
+    def _sort_key(item, key_attributes):
+        return tuple(_key_component(item.get(attribute)) for attribute in key_attributes)
+
+    @staticmethod
+    def _stored_key(item, key_attributes):
+        """Order of a table scan: the key values as stored in the hash_key/range_key columns"""
+        return tuple(str(next(iter(item[a].values()))) if a in item else '' for a in key_attributes)
+
+    def _paginate(self, table_name, candidates, key_attributes, kwargs, names, values, order=None,
+                  descending=False):
+        start_key = kwargs.get('ExclusiveStartKey')
+        if start_key:
+            # Resume after the marker's position, whether or not its item still exists
+            order = order or self._sort_key
+            marker = order(start_key, key_attributes)
+            position = next((i for i, item in enumerate(candidates)
+                             if (order(item, key_attributes) < marker if descending
+                                 else order(item, key_attributes) > marker)), len(candidates))
+            candidates = candidates[position:]
+
+        limit = kwargs.get('Limit')
+        filter_node = None
+        if kwargs.get('FilterExpression'):
+            filter_node = _Parser(kwargs['FilterExpression'], names, values).parse_condition()
+
+        items = []
+        scanned = 0
+        page_bytes = 0
+        last_evaluated = None
+        for item in candidates:
+            scanned += 1
+            page_bytes += _item_size(item)
+            if filter_node is None or _evaluate_condition(filter_node, item):
+                items.append(_project(item, kwargs.get('ProjectionExpression'), names))
+            if (limit is not None and scanned >= limit) or page_bytes >= MAX_PAGE_BYTES:
+                if scanned < len(candidates) or limit is not None:
+                    last_evaluated = {a: item[a] for a in key_attributes if a in item}
+                break
+
+        response = {'Items': items, 'Count': len(items), 'ScannedCount': scanned}
+        response.update(_consumed_capacity(kwargs, table_name, page_bytes))
+        if last_evaluated is not None:
+            response['LastEvaluatedKey'] = last_evaluated
+        return response
@@ -0,0 +1,169 @@
+# Stand-in for a Redis-protocol cache server (ElastiCache / Redis / Valkey)
+# Speaks enough RESP for query_cache.RedisTier and the benchmark scripts: PING, SELECT, GET,
+# SET (EX / PX / NX), DEL, DBSIZE, FLUSHALL and INFO. Keys expire lazily on access, and values are
+# bounded by maxmemory with least-recently-used eviction, like maxmemory-policy allkeys-lru.
+# Kept out of query_cache so the production Lambda never imports socketserver.
+
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Store:
+    """Values with expiry in LRU order, bounded by total key + value bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.values = OrderedDict()  # key -> (value, expires_at or None)
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.stats = {'keyspace_hits': 0, 'keyspace_misses': 0, 'evicted_keys': 0, 'expired_keys': 0}
+
+    def _drop(self, key):
+        value, _ = self.values.pop(key)
+        self.bytes -= len(key) + len(value)
+
+    def get(self, key, count=True):
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+                self._drop(key)
+                self.stats['expired_keys'] += 1
+                entry = None
+            if entry is None:
+                self.stats['keyspace_misses'] += count
+                return None
+            self.values.move_to_end(key)
+            self.stats['keyspace_hits'] += count
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        with self.lock:
+            if key in self.values:
+                self._drop(key)
+            self.values[key] = (value, time.monotonic() + ttl if ttl is not None else None)
+            self.bytes += len(key) + len(value)
+            while len(self.values) > 1 and self.bytes > self.max_bytes:
+                self._drop(next(iter(self.values)))
+                self.stats['evicted_keys'] += 1
+
+    def delete(self, keys):
+        with self.lock:
+            present = [key for key in keys if key in self.values]
+            for key in present:
+                self._drop(key)
+            return len(present)
+
+    def flush(self):
+        with self.lock:
+            self.values.clear()
+            self.bytes = 0
+
+    def info(self):
+        with self.lock:
+            lines = [f"used_memory:{self.bytes}", f"maxmemory:{self.max_bytes}", f"keys:{len(self.values)}"]
+            lines += [f"{name}:{value}" for name, value in self.stats.items()]
+        return '\r\n'.join(lines)
+
+
+def _read_command(rfile):
+    """One command as a list of bytes arguments (RESP array of bulk strings), or None at EOF"""
+    line = rfile.readline()
+    if not line:
+        return None
+    if not line.startswith(b'*'):
+        return line.split()  # inline command (redis-cli / telnet)
+    args = []
+    for _ in range(int(line[1:])):
+        length = int(rfile.readline()[1:])
+        args.append(rfile.read(length + 2)[:-2])
+    return args
+
+
+def _encode(reply):
+    if reply is None:
+        return b'$-1\r\n'
+    if isinstance(reply, Exception):
+        return f"-ERR {reply}\r\n".encode()
+    if isinstance(reply, int):
+        return f":{reply}\r\n".encode()
+    if isinstance(reply, str):
+        return f"+{reply}\r\n".encode()
+    return f"${len(reply)}\r\n".encode() + reply + b'\r\n'
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        store = self.server.store
+        while True:
+            try:
+                args = _read_command(self.rfile)
+            except (ConnectionError, ValueError):
+                return
+            if not args:
+                return
+            name = args[0].upper()
+            try:
+                if name == b'PING':
+                    reply = 'PONG'
+                elif name == b'GET':
+                    reply = store.get(args[1])
+                elif name == b'SET':
+                    ttl = None
+                    options = [arg.upper() for arg in args[3:]]
+                    if b'EX' in options:
+                        ttl = float(args[3 + options.index(b'EX') + 1])
+                    elif b'PX' in options:
+                        ttl = float(args[3 + options.index(b'PX') + 1]) / 1000
+                    if b'NX' in options and store.get(args[1], count=False) is not None:
+                        reply = None
+                    else:
+                        store.set(args[1], args[2], ttl)
+                        reply = 'OK'
+                elif name == b'DEL':
+                    reply = store.delete(args[1:])
+                elif name == b'DBSIZE':
+                    reply = len(store.values)
+                elif name == b'FLUSHALL':
+                    store.flush()
+                    reply = 'OK'
+                elif name == b'INFO':
+                    reply = store.info().encode()
+                elif name in (b'SELECT', b'QUIT'):
+                    reply = 'OK'
+                else:
+                    reply = ValueError(f"unknown command '{name.decode()}'")
+            except (IndexError, ValueError) as e:
+                reply = e
+            self.wfile.write(_encode(reply))
+            if name == b'QUIT':
+                return
+
+
+class LocalRedisServer:
+    """Threaded RESP server on localhost; port 0 picks a free port"""
+
+    def __init__(self, host='127.0.0.1', port=0, max_bytes=64 * 1024 * 1024):
+        self.server = socketserver.ThreadingTCPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.store = _Store(max_bytes)
+        self.host, self.port = self.server.server_address
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"redis://{self.host}:{self.port}/0"
+
+    @property
+    def store(self):
+        return self.server.store
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='local-redis', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,233 @@
+# Request metrics for the PPMT-AMP Lambda functions
+# Monotonic per-phase timers, DynamoDB consumed capacity and page counts for each request,
+# emitted as CloudWatch Embedded Metric Format (EMF) or JSON lines, and optionally returned
+# to the client in a Server-Timing header.
+
+import contextvars
+import json
+import os
+import threading
+import time
+
+# Metrics output: 'emf' (stdout, picked up by CloudWatch Logs), 'json' (local file), 'off'
+METRICS_MODE = os.environ.get('METRICS_MODE', 'emf')
+METRICS_FILE = os.environ.get('METRICS_FILE', '/tmp/ppmt-amp-metrics.jsonl')
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'PPMT-AMP/API')
+SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING', 'false').lower() == 'true'
+
+# Phase name -> short Server-Timing metric name
+PHASES = {
+    'signature': 'sig',
+    'replay_check': 'replay',
+    'static': 'static',
+    'rate_limit_check': 'rl-check',
+    'rate_limit_update': 'rl-update',
+    'version_check': 'ver',
+    'cache': 'cache',
+    'query': 'query',
+    'deserialize': 'deser',
+    'serialize': 'ser',
+    'validate': 'val',
+    'idempotency_check': 'idem',
+    'load': 'load',
+    'write': 'write'
+}
+
+_current = contextvars.ContextVar('ppmt_amp_request_metrics', default=None)
+_sinks = []
+_cold_start = True
+
+
+class _NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase:
+    """Context manager timing one phase; nested phases are excluded from the parent"""
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.stack = self.metrics._thread_stack()
+        self.stack.append(0.0)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        children = self.stack.pop()
+        if self.stack:
+            self.stack[-1] += elapsed
+        with self.metrics._lock:
+            timings = self.metrics.timings
+            timings[self.name] = timings.get(self.name, 0.0) + elapsed - children
+        return False
+
+
+class RequestMetrics:
+    """Timings and counters collected while handling a single request"""
+
+    def __init__(self, route, request_id=None):
+        global _cold_start
+        self.route = route
+        self.request_id = request_id
+        self.cold_start = _cold_start
+        _cold_start = False
+        self.start = time.perf_counter()
+        self.timings = {}
+        self.counters = {'DynamoDBCalls': 0, 'DynamoDBPages': 0, 'ConsumedRCU': 0.0, 'ConsumedWCU': 0.0}
+        self.properties = {}
+        # Phases may run on several threads at once (concurrent query mode): nesting is tracked
+        # per thread, and shared totals are updated under a lock
+        self._stacks = {}
+        self._lock = threading.Lock()
+        self._token = None
+
+    def _thread_stack(self):
+        return self._stacks.setdefault(threading.get_ident(), [])
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_property(self, name, value):
+        self.properties[name] = value
+
+    def record_dynamodb(self, response, write=False, paged=False):
+        """Record one DynamoDB call's consumed capacity (and page, for Query/Scan)"""
+        capacity = response.get('ConsumedCapacity') if isinstance(response, dict) else None
+        with self._lock:
+            self.counters['DynamoDBCalls'] += 1
+            if paged:
+                self.counters['DynamoDBPages'] += 1
+            if capacity:
+                for entry in capacity if isinstance(capacity, list) else [capacity]:
+                    units = entry.get('CapacityUnits', 0.0)
+                    if write:
+                        self.counters['ConsumedWCU'] += units
+                    else:
+                        self.counters['ConsumedRCU'] += units
+
+    def total_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+    def server_timing(self):
+        """Server-Timing header value (durations in milliseconds)"""
+        parts = [f"{PHASES.get(name, name)};dur={seconds * 1000:.3f}" for name, seconds in self.timings.items()]
+        parts.append(f"total;dur={self.total_ms():.3f}")
+        return ', '.join(parts)
+
+    def record(self, status_code):
+        record = {
+            'Route': self.route,
+            'StatusCode': status_code,
+            'ColdStart': self.cold_start,
+            'TotalMs': round(self.total_ms(), 3)
+        }
+        for name, seconds in self.timings.items():
+            record[_metric_name(name)] = round(seconds * 1000, 3)
+        record.update(self.counters)
+        record.update(self.properties)
+        if self.request_id:
+            record['RequestId'] = self.request_id
+        return record
+
+    def finish(self, response):
+        """Attach Server-Timing (if enabled), emit the request record and return the response"""
+        if self._token is not None:
+            _current.reset(self._token)
+            self._token = None
+        status_code = response.get('statusCode', 200)
+        if SERVER_TIMING_ENABLED:
+            headers = response.setdefault('headers', {})
+            headers['Server-Timing'] = self.server_timing()
+        emit(self.record(status_code))
+        return response
+
+
+def _metric_name(phase):
+    return ''.join(part.capitalize() for part in phase.split('_')) + 'Ms'
+
+
+def start_request(route, context=None):
+    """Begin collecting metrics for a request; subsequent phase() calls attach to it"""
+    metrics = RequestMetrics(route, getattr(context, 'aws_request_id', None))
+    metrics._token = _current.set(metrics)
+    return metrics
+
+
+def mark_cold_start():
+    """Report the next request as a cold start (e.g. after a SnapStart restore)"""
+    global _cold_start
+    _cold_start = True
+
+
+def current():
+    return _current.get()
+
+
+def phase(name):
+    """Time a phase of the current request (no-op outside a request)"""
+    metrics = _current.get()
+    return metrics.phase(name) if metrics is not None else _NULL_PHASE
+
+
+def record_dynamodb(response, write=False, paged=False):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.record_dynamodb(response, write=write, paged=paged)
+
+
+def add_sink(sink):
+    """Register a callable receiving every request record (benchmarks, tests)"""
+    _sinks.append(sink)
+
+
+def remove_sink(sink):
+    _sinks.remove(sink)
+
+
+def to_emf(record):
+    """Wrap a request record in CloudWatch Embedded Metric Format"""
+    dimensions_and_properties = {'ColdStart', 'StatusCode', 'Route', 'RequestId'}
+    metric_definitions = []
+    for name, value in record.items():
+        if name in dimensions_and_properties or not isinstance(value, (int, float)) or isinstance(value, bool):
+            continue
+        unit = 'Milliseconds' if name.endswith('Ms') else 'Count'
+        metric_definitions.append({'Name': name, 'Unit': unit})
+    document = dict(record)
+    document['_aws'] = {
+        'Timestamp': int(time.time() * 1000),
+        'CloudWatchMetrics': [{
+            'Namespace': METRICS_NAMESPACE,
+            'Dimensions': [['Route']],
+            'Metrics': metric_definitions
+        }]
+    }
+    return document
+
+
+def emit(record):
+    if METRICS_MODE == 'emf':
+        print(json.dumps(to_emf(record)))
+    elif METRICS_MODE == 'json':
+        try:
+            with open(METRICS_FILE, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+        except OSError as e:
+            print(f"Metrics write error: {e}")
+    for sink in _sinks:
+        sink(record)
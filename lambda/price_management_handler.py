@@ -0,0 +1,525 @@
+# AWS Lambda Function for PPMT-AMP price management (superuser write path)
+# Accepts batches of price updates from the admin portal. Updates are coalesced per product,
+# PriceChange/PriceChangePercent are recomputed server-side, and each item update is written
+# in the same TransactWriteItems call as its PPMT-AMP-AuditLog entry. Batches are idempotent:
+# every transaction also writes a request marker keyed by (request ID, chunk), so a retried
+# request replays the stored results instead of applying the updates twice. The same
+# transaction bumps the Version of every series it changed.
+
+import json
+import hashlib
+import time
+import os
+import uuid
+from datetime import datetime
+
+import metrics
+from key_ring import load_key_ring
+from storage_backend import (CATALOG_VERSION_ID, deserialize_dynamodb_item, get_storage_backend,
+                             reset_storage_backend, serialize_dynamodb_value, series_version_update,
+                             warm_storage_backend)
+
+# DynamoDB table names
+ITEMS_TABLE = os.environ.get('PRICES_TABLE', "PPMT-AMP-Items")
+SERIES_TABLE = "PPMT-AMP-Series"
+AUDIT_LOG_TABLE = os.environ.get('AUDIT_LOG_TABLE', "PPMT-AMP-AuditLog")
+
+# App verification: signing keys come from APP_KEYS / APP_KEYS_FILE (see key_ring.py),
+# or else APP_SECRET is the one key of VALID_APP_IDS
+APP_SECRET = os.environ.get('APP_SECRET', 'your-secret-key-change-this-in-production')
+VALID_APP_IDS = ["ppmt-amp-ios-v1", "ppmt-amp-portal-v1"]
+SIGNATURE_WINDOW = 300  # 5 minutes in seconds
+SUPERUSER_ROLE = "superuser"
+
+# Batch limits
+MAX_BATCH_UPDATES = 500  # update entries per request (before coalescing)
+TRANSACT_MAX_ITEMS = 100  # DynamoDB TransactWriteItems limit
+BATCH_GET_MAX_KEYS = 100
+MAX_CONFLICT_RETRIES = 2  # re-read and retry a chunk when another writer changed one of its items
+AUDIT_LOG_TTL = 90 * 24 * 60 * 60  # 90 days
+
+# Fields an update may set; prices must be non-negative numbers
+PRICE_FIELDS = ('AfterMarketPrice', 'RetailPrice')
+UPDATABLE_FIELDS = PRICE_FIELDS + ('ProductName', 'Category', 'Rarity', 'Status', 'Currency', 'Description', 'ImageUrl')
+
+# Operations used on the write path (warmed during init)
+WARM_OPERATIONS = ['BatchGetItem', 'TransactWriteItems', 'Query']
+
+# Create and warm the storage client at import time (on by default inside Lambda)
+EAGER_INIT = os.environ.get(
+    'EAGER_INIT', 'true' if 'AWS_LAMBDA_FUNCTION_NAME' in os.environ else 'false'
+).lower() == 'true'
+
+_cognito = None
+_key_ring = None
+
+def api_response(status_code, body):
+    """API Gateway proxy response with the JSON body"""
+    return {
+        'statusCode': status_code,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json.dumps(body, default=str)
+    }
+
+def get_key_ring():
+    """Signing keys of this container, loaded on first use"""
+    global _key_ring
+    if _key_ring is None:
+        _key_ring = load_key_ring(VALID_APP_IDS, APP_SECRET)
+    return _key_ring
+
+def verify_signature(event):
+    """Verify the HMAC-SHA256 request signature sent in the X-Signature headers"""
+    headers = {key.lower(): value for key, value in (event.get('headers') or {}).items()}
+    app_id = headers.get('x-app-id', '')
+    device_id = headers.get('x-device-id', '')
+    timestamp = headers.get('x-timestamp', '')
+    signature = headers.get('x-signature', '')
+    
+    if not get_key_ring().has_app(app_id):
+        return False, 'Invalid app identifier'
+    
+    try:
+        if abs(int(time.time()) - int(timestamp)) > SIGNATURE_WINDOW:
+            return False, 'Request timestamp expired'
+    except (TypeError, ValueError):
+        return False, 'Invalid timestamp'
+    
+    payload = f"{event.get('httpMethod', 'POST')}:{event.get('path', '')}"
+    signing_key = get_key_ring().verify(app_id, device_id, timestamp, payload, signature, headers.get('x-key-id'))
+    if signing_key is None:
+        return False, 'Invalid request signature'
+    
+    request_metrics = metrics.current()
+    if request_metrics is not None:
+        request_metrics.set_property('SigningKey', f"{app_id}/{signing_key}")
+    return True, None
+
+def get_user_info(event):
+    """User attributes from the API Gateway Cognito authorizer, or from the bearer token via Cognito"""
+    claims = ((event.get('requestContext') or {}).get('authorizer') or {}).get('claims')
+    if claims:
+        return dict(claims, username=claims.get('cognito:username') or claims.get('username') or claims.get('sub'))
+    
+    headers = {key.lower(): value for key, value in (event.get('headers') or {}).items()}
+    token = headers.get('authorization', '').replace('Bearer ', '')
+    if not token:
+        return None
+    
+    global _cognito
+    try:
+        if _cognito is None:
+            import botocore.session
+            _cognito = botocore.session.get_session().create_client('cognito-idp')
+        response = _cognito.get_user(AccessToken=token)
+        attributes = {attr['Name']: attr['Value'] for attr in response['UserAttributes']}
+        attributes['username'] = response['Username']
+        return attributes
+    except Exception as e:
+        print(f"Cognito verification failed: {e}")
+        return None
+
+def parse_price(value):
+    """Non-negative price as a float, or None"""
+    try:
+        price = float(value)
+    except (TypeError, ValueError):
+        return None
+    return price if price >= 0 else None
+
+def validate_updates(updates):
+    """Per-entry validation errors for a list of update entries"""
+    errors = []
+    for index, update in enumerate(updates):
+        if not isinstance(update, dict):
+            errors.append({'index': index, 'error': 'Update must be an object'})
+            continue
+        if not update.get('SeriesId') or not update.get('ProductId'):
+            errors.append({'index': index, 'error': 'SeriesId and ProductId are required'})
+            continue
+        fields = [field for field in update if field not in ('SeriesId', 'ProductId')]
+        unknown = [field for field in fields if field not in UPDATABLE_FIELDS]
+        if unknown:
+            errors.append({'index': index, 'error': f"Fields cannot be updated: {', '.join(unknown)}"})
+        elif not fields:
+            errors.append({'index': index, 'error': 'No fields to update'})
+        for field in PRICE_FIELDS:
+            if field in update and parse_price(update[field]) is None:
+                errors.append({'index': index, 'error': f"{field} must be a non-negative number"})
+    return errors
+
+def coalesce_updates(updates):
+    """Merge updates to the same product in batch order (later fields win); returns [(key, fields)]"""
+    coalesced = {}
+    for update in updates:
+        key = (update['SeriesId'], update['ProductId'])
+        fields = coalesced.setdefault(key, {})
+        for field, value in update.items():
+            if field in PRICE_FIELDS:
+                fields[field] = parse_price(value)
+            elif field in UPDATABLE_FIELDS:
+                fields[field] = value
+    return list(coalesced.items())
+
+def batch_fingerprint(coalesced):
+    """Hash of the coalesced batch, stored with the request marker to detect reused request IDs"""
+    canonical = json.dumps([[list(key), fields] for key, fields in coalesced], sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+def plan_chunks(coalesced):
+    """Split coalesced updates into transactions of at most TRANSACT_MAX_ITEMS actions: the request
+    marker, an item update and an audit entry per product, a version bump per series and one of the
+    catalog version"""
+    chunks = []
+    current, series = [], set()
+    for key, fields in coalesced:
+        actions = 2 + 2 * (len(current) + 1) + len(series | {key[0]})
+        if current and actions > TRANSACT_MAX_ITEMS:
+            chunks.append(current)
+            current, series = [], set()
+        current.append((key, fields))
+        series.add(key[0])
+    if current:
+        chunks.append(current)
+    return chunks
+
+def request_marker_id(user_id, request_id):
+    return f"request#{user_id}#{request_id}"
+
+def load_request_markers(dynamodb, marker_id):
+    """{chunk: marker item} already written for this request"""
+    markers = {}
+    params = {
+        'TableName': AUDIT_LOG_TABLE,
+        'KeyConditionExpression': 'logId = :id',
+        'ExpressionAttributeValues': {':id': {'S': marker_id}},
+        'ConsistentRead': True
+    }
+    while True:
+        response = dynamodb.query(ReturnConsumedCapacity='TOTAL', **params)
+        metrics.record_dynamodb(response, paged=True)
+        for item in response.get('Items', []):
+            marker = deserialize_dynamodb_item(item)
+            markers[int(marker['timestamp'])] = marker
+        if not response.get('LastEvaluatedKey'):
+            return markers
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def load_items(dynamodb, keys):
+    """{(SeriesId, ProductId): item} for the keys that exist (consistent reads, 100 keys per call)"""
+    items = {}
+    for start in range(0, len(keys), BATCH_GET_MAX_KEYS):
+        request = {ITEMS_TABLE: {
+            'Keys': [{'SeriesId': {'S': sid}, 'ProductId': {'S': pid}} for sid, pid in keys[start:start + BATCH_GET_MAX_KEYS]],
+            'ConsistentRead': True
+        }}
+        while request:
+            response = dynamodb.batch_get_item(RequestItems=request, ReturnConsumedCapacity='TOTAL')
+            metrics.record_dynamodb(response)
+            for raw in response.get('Responses', {}).get(ITEMS_TABLE, []):
+                item = deserialize_dynamodb_item(raw)
+                items[(item['SeriesId'], item['ProductId'])] = item
+            request = response.get('UnprocessedKeys') or None
+    return items
+
+def apply_update(item, fields):
+    """(changed fields, old values) for applying fields to item, with PriceChange/PriceChangePercent recomputed"""
+    changes = {}
+    for field, value in fields.items():
+        current = item.get(field)
+        if field in PRICE_FIELDS:
+            if parse_price(current) != value:
+                changes[field] = value
+        elif current != value:
+            changes[field] = value
+    if not changes:
+        return {}, {}
+    
+    if any(field in changes for field in PRICE_FIELDS):
+        retail_price = changes.get('RetailPrice', parse_price(item.get('RetailPrice')) or 0)
+        after_market_price = changes.get('AfterMarketPrice', parse_price(item.get('AfterMarketPrice')) or 0)
+        price_change = round(after_market_price - retail_price, 2)
+        changes['PriceChange'] = price_change
+        changes['PriceChangePercent'] = round(price_change / retail_price * 100, 2) if retail_price > 0 else 0
+    old_values = {field: item.get(field) for field in changes}
+    return changes, old_values
+
+def build_item_update(key, item, changes, user_id, now):
+    """TransactWriteItems Update for one item, conditioned on it not having changed since it was read"""
+    names = {}
+    values = {':updated': {'S': now.isoformat()}, ':user': {'S': user_id}}
+    assignments = ['UpdatedAt = :updated', 'UpdatedBy = :user']
+    if 'AfterMarketPrice' in changes:
+        changes = dict(changes, Timestamp=now.isoformat(timespec='seconds'))
+    for index, (field, value) in enumerate(changes.items()):
+        names[f"#f{index}"] = field
+        values[f":v{index}"] = serialize_dynamodb_value(value)
+        assignments.append(f"#f{index} = :v{index}")
+    
+    condition = 'attribute_exists(ProductId)'
+    if item.get('UpdatedAt') is not None:
+        condition += ' AND UpdatedAt = :seen'
+        values[':seen'] = serialize_dynamodb_value(item['UpdatedAt'])
+    else:
+        condition += ' AND attribute_not_exists(UpdatedAt)'
+    
+    return {'Update': {
+        'TableName': ITEMS_TABLE,
+        'Key': {'SeriesId': {'S': key[0]}, 'ProductId': {'S': key[1]}},
+        'UpdateExpression': 'SET ' + ', '.join(assignments),
+        'ConditionExpression': condition,
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': values
+    }}
+
+def build_audit_entry(user_info, request_id, key, old_values, changes, now):
+    """TransactWriteItems Put of the PPMT-AMP-AuditLog entry for one item update"""
+    timestamp = int(time.time())
+    entry = {
+        'logId': f"log-{uuid.uuid4().hex[:12]}",
+        'timestamp': timestamp,
+        'userId': user_info.get('sub') or user_info['username'],
+        'username': user_info['username'],
+        'action': 'update',
+        'requestId': request_id,
+        'seriesId': key[0],
+        'priceId': key[1],
+        'oldValue': old_values,
+        'newValue': changes,
+        'ttl': timestamp + AUDIT_LOG_TTL
+    }
+    return {'Put': {
+        'TableName': AUDIT_LOG_TABLE,
+        'Item': {field: serialize_dynamodb_value(value) for field, value in entry.items()}
+    }}
+
+def build_request_marker(marker_id, request_id, chunk, chunks, fingerprint, results, user_info, now):
+    """TransactWriteItems Put of the request marker; fails if this chunk was already applied"""
+    timestamp = int(time.time())
+    marker = {
+        'logId': marker_id,
+        'timestamp': chunk,  # sort key: a retried chunk writes the same key
+        'action': 'batch',
+        'requestId': request_id,
+        'requestedBy': user_info['username'],
+        'chunks': chunks,
+        'batchHash': fingerprint,
+        'results': results,
+        'createdAt': now.isoformat(),
+        'ttl': timestamp + AUDIT_LOG_TTL
+    }
+    return {'Put': {
+        'TableName': AUDIT_LOG_TABLE,
+        'Item': {field: serialize_dynamodb_value(value) for field, value in marker.items()},
+        'ConditionExpression': 'attribute_not_exists(logId)'
+    }}
+
+def cancellation_reasons(error):
+    return [reason.get('Code') for reason in getattr(error, 'response', {}).get('CancellationReasons', [])]
+
+def write_chunk(dynamodb, chunk_updates, items, user_info, request_id, marker_id, chunk, chunks, fingerprint):
+    """Apply one chunk in a single transaction; returns (results, replayed)"""
+    user_id = user_info.get('sub') or user_info['username']
+    for attempt in range(MAX_CONFLICT_RETRIES + 1):
+        now = datetime.utcnow()
+        transact_items = []
+        results = []
+        for key, fields in chunk_updates:
+            result = {'SeriesId': key[0], 'ProductId': key[1]}
+            item = items.get(key)
+            if item is None:
+                results.append(dict(result, status='not_found'))
+                continue
+            changes, old_values = apply_update(item, fields)
+            if not changes:
+                results.append(dict(result, status='unchanged'))
+                continue
+            transact_items.append(build_item_update(key, item, changes, user_id, now))
+            transact_items.append(build_audit_entry(user_info, request_id, key, old_values, changes, now))
+            results.append(dict(result, status='updated', **{
+                field: changes[field] for field in ('AfterMarketPrice', 'RetailPrice', 'PriceChange', 'PriceChangePercent')
+                if field in changes
+            }))
+        updated_series = sorted({result['SeriesId'] for result in results if result['status'] == 'updated'})
+        for series_id in updated_series:
+            transact_items.append({'Update': series_version_update(series_id, SERIES_TABLE)})
+        if updated_series:
+            transact_items.append({'Update': series_version_update(CATALOG_VERSION_ID, SERIES_TABLE)})
+        transact_items.insert(0, build_request_marker(marker_id, request_id, chunk, chunks, fingerprint, results, user_info, now))
+        
+        try:
+            response = dynamodb.transact_write_items(TransactItems=transact_items, ReturnConsumedCapacity='TOTAL')
+            metrics.record_dynamodb(response, write=True)
+            return results, False
+        except dynamodb.exceptions.TransactionCanceledException as e:
+            reasons = cancellation_reasons(e)
+            if reasons and reasons[0] == 'ConditionalCheckFailed':
+                # A concurrent retry of this request applied the chunk first
+                marker = load_request_markers(dynamodb, marker_id).get(chunk)
+                return (marker or {}).get('results', results), True
+            if attempt == MAX_CONFLICT_RETRIES:
+                print(f"Price update conflict: request {request_id} chunk {chunk}: {e}")
+                return [dict(result, status='conflict') if result['status'] == 'updated' else result
+                        for result in results], False
+            # Another writer changed an item between our read and write: re-read and rebuild
+            items.update(load_items(dynamodb, [key for key, _ in chunk_updates]))
+
+def handle_batch_update(dynamodb, body, user_info):
+    """Apply a batch of price updates: {"requestId": ..., "updates": [{SeriesId, ProductId, fields...}]}"""
+    with metrics.phase('validate'):
+        updates = body.get('updates')
+        if updates is None and body.get('ProductId'):
+            updates = [{field: value for field, value in body.items() if field != 'requestId'}]
+        if not isinstance(updates, list) or not updates:
+            return api_response(400, {'success': False, 'message': 'Request must contain a non-empty updates list'})
+        if len(updates) > MAX_BATCH_UPDATES:
+            return api_response(400, {'success': False,
+                                      'message': f"At most {MAX_BATCH_UPDATES} updates per request"})
+        errors = validate_updates(updates)
+        if errors:
+            return api_response(400, {'success': False, 'message': 'Invalid updates', 'errors': errors})
+        
+        coalesced = coalesce_updates(updates)
+        fingerprint = batch_fingerprint(coalesced)
+        request_id = str(body.get('requestId') or uuid.uuid4())
+        marker_id = request_marker_id(user_info.get('sub') or user_info['username'], request_id)
+        chunk_updates = plan_chunks(coalesced)
+    
+    # Idempotency: chunks recorded by an earlier attempt are replayed, not re-applied
+    with metrics.phase('idempotency_check'):
+        markers = load_request_markers(dynamodb, marker_id) if body.get('requestId') else {}
+    if any(marker.get('batchHash') != fingerprint for marker in markers.values()):
+        return api_response(409, {'success': False,
+                                  'message': 'Request ID was already used for a different batch',
+                                  'requestId': request_id})
+    
+    with metrics.phase('load'):
+        pending_keys = [key for chunk, entries in enumerate(chunk_updates) if chunk not in markers
+                        for key, _ in entries]
+        items = load_items(dynamodb, pending_keys) if pending_keys else {}
+    
+    results = []
+    replayed_chunks = 0
+    with metrics.phase('write'):
+        for chunk, entries in enumerate(chunk_updates):
+            if chunk in markers:
+                chunk_results, replayed = markers[chunk].get('results', []), True
+            else:
+                chunk_results, replayed = write_chunk(dynamodb, entries, items, user_info, request_id,
+                                                      marker_id, chunk, len(chunk_updates), fingerprint)
+            results.extend(chunk_results)
+            replayed_chunks += replayed
+    
+    summary = {}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    conflicts = summary.get('conflict', 0)
+    
+    return api_response(409 if conflicts else 200, {
+        'success': not conflicts,
+        'message': 'Prices updated' if not conflicts else 'Some items were changed concurrently; retry the request',
+        'requestId': request_id,
+        'replayed': replayed_chunks == len(chunk_updates),
+        'received': len(updates),
+        'coalesced': len(updates) - len(coalesced),
+        'summary': summary,
+        'data': results
+    })
+
+def handle_audit_logs(dynamodb, query_params):
+    """Most recent audit entries, for one user (UserIndex) or across users"""
+    limit = int(query_params.get('limit', '50'))
+    user_id = query_params.get('userId')
+    if user_id:
+        response = dynamodb.query(
+            TableName=AUDIT_LOG_TABLE,
+            IndexName='UserIndex',
+            KeyConditionExpression='userId = :uid',
+            ExpressionAttributeValues={':uid': {'S': user_id}},
+            ScanIndexForward=False,  # Newest first
+            Limit=limit,
+            ReturnConsumedCapacity='TOTAL'
+        )
+    else:
+        response = dynamodb.scan(
+            TableName=AUDIT_LOG_TABLE,
+            FilterExpression='attribute_exists(userId)',  # request markers carry no userId
+            Limit=limit,
+            ReturnConsumedCapacity='TOTAL'
+        )
+    metrics.record_dynamodb(response, paged=True)
+    logs = [deserialize_dynamodb_item(item) for item in response.get('Items', [])]
+    return api_response(200, {'success': True, 'message': 'Query successful', 'data': logs, 'count': len(logs)})
+
+def lambda_handler(event, context):
+    """Main Lambda handler for price management requests"""
+    # Handle warmup requests from EventBridge (keeps Lambda container warm)
+    if event.get('source') == 'aws.events' or event.get('warmup') == True:
+        return {
+            'statusCode': 200,
+            'body': json.dumps({'status': 'warm', 'message': 'Container ready'})
+        }
+    
+    request_metrics = metrics.start_request(event.get('path', '/prices/batch'), context)
+    response = {'statusCode': 500}
+    try:
+        response = handle_api_request(event)
+    finally:
+        request_metrics.finish(response)
+    return response
+
+def handle_api_request(event):
+    """Verify the signature and superuser role, then route the request"""
+    dynamodb = get_storage_backend()
+    http_method = event.get('httpMethod', 'POST')
+    path = event.get('path', '')
+    
+    with metrics.phase('signature'):
+        signature_valid, error = verify_signature(event)
+    if not signature_valid:
+        return api_response(403, {'success': False, 'message': error})
+    
+    user_info = get_user_info(event)
+    if not user_info:
+        return api_response(401, {'success': False, 'message': 'Unauthorized'})
+    if user_info.get('custom:role') != SUPERUSER_ROLE:
+        return api_response(403, {'success': False, 'message': 'Insufficient permissions. Superuser required.'})
+    
+    try:
+        if http_method == 'POST' and path in ('/prices/batch', '/prices/update'):
+            try:
+                body = json.loads(event.get('body') or '{}')
+            except ValueError:
+                return api_response(400, {'success': False, 'message': 'Request body must be JSON'})
+            if not isinstance(body, dict):
+                return api_response(400, {'success': False, 'message': 'Request body must be a JSON object'})
+            return handle_batch_update(dynamodb, body, user_info)
+        if http_method == 'GET' and path == '/audit-logs':
+            return handle_audit_logs(dynamodb, event.get('queryStringParameters') or {})
+    except Exception as e:
+        print(f"Price management error: {e}")
+        return api_response(500, {'success': False, 'message': 'Internal error'})
+    
+    return api_response(404, {'success': False, 'message': 'Not found'})
+
+def initialize():
+    """Create and warm the storage backend before the first request"""
+    warm_storage_backend(WARM_OPERATIONS)
+    get_key_ring()
+
+def after_restore():
+    """SnapStart restore hook: reconnect and report the next request as a cold start"""
+    reset_storage_backend()
+    warm_storage_backend(WARM_OPERATIONS)
+    metrics.mark_cold_start()
+
+if EAGER_INIT:
+    initialize()
+    try:
+        from snapshot_restore_py import register_after_restore
+        register_after_restore(after_restore)
+    except ImportError:
+        pass
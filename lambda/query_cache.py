@@ -0,0 +1,543 @@
+# Two-tier cache for PPMT-AMP query results
+# L1 is this process's memory: an LRU bounded by entries and bytes. L2 is shared and outlives
+# the process:
+#   disk   files under QUERY_CACHE_DIR (/tmp), kept across warm invocations of a container and
+#          shared by the workers of one host; bounded by QUERY_CACHE_DISK_BYTES, least
+#          recently used first out
+#   redis  any server speaking the Redis protocol (redis://host:port/db); size is bounded by the
+#          server's maxmemory policy (allkeys-lru). local_redis.py is a local stand-in.
+# A lookup tries L1, then L2 (an L2 hit is copied into L1), then loads and writes both tiers.
+# An L2 that fails or times out counts as a miss; the cache never fails a request.
+#
+# Lifetimes: an entry is fresh for its TTL and usable until its stale TTL. Between the two it
+# is served at once while a background thread reloads it (stale-while-revalidate). Past the
+# stale TTL it is loaded before answering; if that load fails, the last good value is served
+# and reported as such (stale-if-error, for up to QUERY_CACHE_STALE_IF_ERROR seconds more).
+#
+# Stampedes: every entry records how long its load took. A reader treats an entry as expired
+# slightly early, with a probability that rises as expiry nears and with the cost of the load
+# (probabilistic early expiration, "XFetch"), and starts the background refresh then, so a hot
+# key is reloaded once, ahead of time, while every reader is still served. Across processes the
+# refresher claims a short lease in L2 (SET NX / an exclusive file), so the other workers keep
+# serving the entry until the refreshed one lands. Concurrent misses of one key within a
+# process share a single load.
+
+import hashlib
+import json
+import math
+import os
+import random
+import struct
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import metrics
+
+L1_ENTRIES = int(os.environ.get('QUERY_CACHE_L1_ENTRIES', '256'))
+L1_BYTES = int(os.environ.get('QUERY_CACHE_L1_BYTES', str(16 * 1024 * 1024)))
+
+# L2: 'disk', 'redis://host:port/db' or 'none' (disk by default inside Lambda)
+L2_URL = os.environ.get('QUERY_CACHE_L2', 'disk' if 'AWS_LAMBDA_FUNCTION_NAME' in os.environ else 'none')
+CACHE_DIR = os.environ.get('QUERY_CACHE_DIR', '/tmp/ppmt-amp-cache')
+DISK_BYTES = int(os.environ.get('QUERY_CACHE_DISK_BYTES', str(64 * 1024 * 1024)))
+REDIS_TIMEOUT = float(os.environ.get('QUERY_CACHE_REDIS_TIMEOUT', '0.05'))  # seconds per command
+REDIS_RETRY_SECONDS = 5.0   # an unreachable server is skipped this long before reconnecting
+KEY_PREFIX = 'ppmt-amp:q:'
+
+BETA = float(os.environ.get('QUERY_CACHE_BETA', '1.0'))  # > 1 refreshes earlier, 0 disables
+LOAD_WAIT_SECONDS = 5.0     # how long a concurrent miss waits for (or a refresh claims) a running load
+STALE_IF_ERROR = float(os.environ.get('QUERY_CACHE_STALE_IF_ERROR', '86400'))  # seconds past the stale TTL
+REFRESH_WORKERS = 2         # background refresh threads per process
+
+# Request metric counters for loads (tiers count as CacheL1Hits, CacheL2Misses, ...)
+_COUNTER_NAMES = {'loads': 'CacheLoads', 'refreshes': 'CacheRefreshes', 'stale': 'CacheStaleServed',
+                  'stale_on_error': 'CacheStaleOnError', 'shared': 'CacheSharedLoads',
+                  'refresh_errors': 'CacheRefreshErrors'}
+
+# Entry: (value, stored_at, fresh_until, stale_until, load seconds); encoded, the numbers come first
+_HEADER = struct.Struct('<dddd')
+
+
+def encode_entry(entry):
+    value, stored_at, fresh_until, stale_until, delta = entry
+    return (_HEADER.pack(stored_at, fresh_until, stale_until, delta) +
+            json.dumps(value, separators=(',', ':'), default=str).encode())
+
+
+def decode_entry(data):
+    return (json.loads(data[_HEADER.size:]),) + _HEADER.unpack_from(data)
+
+
+class MemoryTier:
+    """L1: decoded values in an LRU bounded by entry count and encoded size"""
+
+    name = 'l1'
+
+    def __init__(self, max_entries=L1_ENTRIES, max_bytes=L1_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (entry, encoded size)
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            stored = self.entries.get(key)
+            if stored is None:
+                return None
+            self.entries.move_to_end(key)
+            return stored[0]
+
+    def set(self, key, entry, size):
+        """Store an entry; returns the number of entries evicted to make room"""
+        evicted = 0
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[1]
+            self.entries[key] = (entry, size)
+            self.bytes += size
+            while len(self.entries) > 1 and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+                _, (_, oldest_size) = self.entries.popitem(last=False)
+                self.bytes -= oldest_size
+                evicted += 1
+        return evicted
+
+    def summary(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.bytes}
+
+
+class DiskTier:
+    """L2 on local disk: one file per key, written atomically; LRU eviction by total size
+
+    Recency is tracked in this process (seeded from file mtimes on start), so with several
+    processes on one directory the bound holds per process and files written elsewhere are
+    picked up as they are read.
+    """
+
+    name = 'l2'
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=DISK_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.index = OrderedDict()  # file name -> size, least recently used first
+        self.bytes = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        files = [entry for entry in os.scandir(directory) if entry.name.endswith('.entry')]
+        for entry in sorted(files, key=lambda e: e.stat().st_mtime):
+            size = entry.stat().st_size
+            self.index[entry.name] = size
+            self.bytes += size
+
+    @staticmethod
+    def file_name(key):
+        return hashlib.sha1(key.encode()).hexdigest() + '.entry'
+
+    def get(self, key):
+        name = self.file_name(key)
+        try:
+            with open(os.path.join(self.directory, name), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            with self.lock:
+                self.bytes -= self.index.pop(name, 0)
+            return None
+        with self.lock:
+            if name not in self.index:
+                self.bytes += len(data)
+            self.index[name] = len(data)
+            self.index.move_to_end(name)
+        return data
+
+    def set(self, key, data, ttl):
+        """Store an entry (its lifetimes are in the entry itself); returns the number of files evicted"""
+        name = self.file_name(key)
+        path = os.path.join(self.directory, name)
+        temp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp, 'wb') as f:
+            f.write(data)
+        os.replace(temp, path)
+        evicted = []
+        with self.lock:
+            self.bytes += len(data) - self.index.pop(name, 0)
+            self.index[name] = len(data)
+            while len(self.index) > 1 and self.bytes > self.max_bytes:
+                oldest, size = self.index.popitem(last=False)
+                self.bytes -= size
+                evicted.append(oldest)
+        for oldest in evicted:
+            try:
+                os.remove(os.path.join(self.directory, oldest))
+            except FileNotFoundError:
+                pass
+        return len(evicted)
+
+    def claim(self, key, seconds):
+        """Take the refresh lease of key (an exclusively created file); False if another process holds it"""
+        path = os.path.join(self.directory, self.file_name(key) + '.lease')
+        for _ in range(2):
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return True
+            except FileExistsError:
+                try:
+                    if time.time() - os.stat(path).st_mtime < seconds:
+                        return False
+                    os.remove(path)  # left by a process that died while refreshing
+                except FileNotFoundError:
+                    pass
+        return False
+
+    def release(self, key):
+        try:
+            os.remove(os.path.join(self.directory, self.file_name(key) + '.lease'))
+        except FileNotFoundError:
+            pass
+
+    def summary(self):
+        with self.lock:
+            return {'entries': len(self.index), 'bytes': self.bytes}
+
+
+class RedisError(Exception):
+    """Error reply from the server"""
+
+
+class RedisTier:
+    """L2 on a Redis-protocol server: GET, and SET with a PX expiry, over one kept-alive connection"""
+
+    name = 'l2'
+
+    def __init__(self, url, timeout=REDIS_TIMEOUT):
+        parsed = urlsplit(url)
+        self.address = (parsed.hostname or '127.0.0.1', parsed.port or 6379)
+        self.db = int(parsed.path.strip('/') or 0)
+        self.timeout = timeout
+        self.sock = None
+        self.reader = None
+        self.down_until = 0.0
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        import socket  # only with a Redis L2 (kept off the import path)
+        self.sock = socket.create_connection(self.address, timeout=self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+        if self.db:
+            self._send('SELECT', self.db)
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = self.reader = None
+
+    def _send(self, *args):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(f"${len(arg)}\r\n".encode() + arg + b'\r\n')
+        self.sock.sendall(b''.join(parts))
+        return self._reply()
+
+    def _reply(self):
+        line = self.reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError('Connection closed by the cache server')
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode()
+        if kind == b'-':
+            raise RedisError(rest.decode())
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            return None if length < 0 else self.reader.read(length + 2)[:-2]
+        if kind == b'*':
+            length = int(rest)
+            return None if length < 0 else [self._reply() for _ in range(length)]
+        raise ConnectionError(f"Unexpected reply from the cache server: {line[:40]!r}")
+
+    def command(self, *args):
+        """Run one command, reconnecting once if the kept-alive connection has gone away"""
+        with self.lock:
+            if self.sock is None and time.monotonic() < self.down_until:
+                raise ConnectionError('Cache server unreachable, retrying later')
+            for attempt in range(2):
+                try:
+                    if self.sock is None:
+                        self._connect()
+                    return self._send(*args)
+                except RedisError:
+                    raise
+                except OSError:
+                    self.close()
+                    if attempt:
+                        self.down_until = time.monotonic() + REDIS_RETRY_SECONDS
+                        raise
+
+    def get(self, key):
+        return self.command('GET', KEY_PREFIX + key)
+
+    def set(self, key, data, ttl):
+        self.command('SET', KEY_PREFIX + key, data, 'PX', max(1, int(ttl * 1000)))
+        return 0  # evictions happen on the server (see its INFO stats)
+
+    def claim(self, key, seconds):
+        """Take the refresh lease of key; False if another process holds it"""
+        return self.command('SET', KEY_PREFIX + 'lease:' + key, b'1', 'NX', 'PX', int(seconds * 1000)) is not None
+
+    def release(self, key):
+        self.command('DEL', KEY_PREFIX + 'lease:' + key)
+
+    def summary(self):
+        return {'server': f"{self.address[0]}:{self.address[1]}"}
+
+
+class TieredCache:
+    """L1 in memory, optional shared L2; early expiration, stale-while-revalidate and stale-if-error"""
+
+    def __init__(self, l1=None, l2=None, beta=BETA, stale_if_error=STALE_IF_ERROR, clock=time.time,
+                 rng=random.random):
+        self.l1 = l1 if l1 is not None else MemoryTier()
+        self.l2 = l2
+        self.beta = beta
+        self.stale_if_error = stale_if_error
+        self.clock = clock
+        self.rng = rng
+        self.lock = threading.Lock()
+        self._loading = {}  # key -> Event set when its load (or background refresh) finishes
+        self._refresh_pool = None
+        self.stats = {tier: {'hits': 0, 'misses': 0, 'evictions': 0, 'errors': 0} for tier in ('l1', 'l2')}
+        self.stats['loads'] = {name: 0 for name in _COUNTER_NAMES}
+
+    def _count(self, tier, outcome, value=1):
+        with self.lock:
+            self.stats[tier][outcome] += value
+        request_metrics = metrics.current()
+        if request_metrics is not None:
+            request_metrics.increment(_COUNTER_NAMES[outcome] if tier == 'loads' else
+                                      f"Cache{tier.upper()}{outcome.capitalize()}", value)
+
+    def fresh(self, fresh_until, delta, now):
+        """XFetch: expired once now - delta * beta * ln(u) reaches fresh_until, u uniform in (0, 1]"""
+        return now - delta * self.beta * math.log(1.0 - self.rng()) < fresh_until
+
+    def _l2_get(self, key):
+        try:
+            data = self.l2.get(key)
+            return decode_entry(data) if data else None
+        except Exception as e:
+            self._count('l2', 'errors')
+            print(f"Query cache L2 read error: {e}")
+            return None
+
+    def lookup(self, key, now):
+        """(entry, tier, fresh): a fresh entry, else the newest one either tier holds (or None)"""
+        entry = self.l1.get(key)
+        if entry is not None and self.fresh(entry[2], entry[4], now):
+            self._count('l1', 'hits')
+            return entry, 'l1', True
+        self._count('l1', 'misses')
+        found, tier = entry, ('l1' if entry is not None else None)
+        if self.l2 is None:
+            return found, tier, False
+        decoded = self._l2_get(key)
+        if decoded is not None:
+            if self.fresh(decoded[2], decoded[4], now):
+                self._count('l2', 'hits')
+                self._store_l1(key, decoded)
+                return decoded, 'l2', True
+            if found is None or decoded[1] > found[1]:
+                found, tier = decoded, 'l2'
+        self._count('l2', 'misses')
+        return found, tier, False
+
+    def _claim(self, key):
+        """Refresh lease in L2 (always granted without one, or when L2 fails)"""
+        if self.l2 is None:
+            return True
+        try:
+            return self.l2.claim(key, LOAD_WAIT_SECONDS)
+        except Exception as e:
+            self._count('l2', 'errors')
+            print(f"Query cache L2 lease error: {e}")
+            return True
+
+    def _release(self, key):
+        try:
+            self.l2.release(key)
+        except Exception as e:
+            self._count('l2', 'errors')
+            print(f"Query cache L2 lease error: {e}")
+
+    def _finish(self, key):
+        with self.lock:
+            self._loading.pop(key).set()
+
+    def _store_l1(self, key, entry, size=None):
+        if size is None:
+            size = len(encode_entry(entry))
+        evicted = self.l1.set(key, entry, size)
+        if evicted:
+            self._count('l1', 'evictions', evicted)
+
+    def store(self, key, value, ttl, stale_ttl, delta):
+        """Store a value fresh for ttl and usable for stale_ttl seconds; returns its entry"""
+        now = self.clock()
+        entry = (value, now, now + ttl, now + stale_ttl, delta)
+        data = encode_entry(entry)
+        self._store_l1(key, entry, len(data))
+        if self.l2 is not None:
+            try:
+                evicted = self.l2.set(key, data, stale_ttl + self.stale_if_error)
+                if evicted:
+                    self._count('l2', 'evictions', evicted)
+            except Exception as e:
+                self._count('l2', 'errors')
+                print(f"Query cache L2 write error: {e}")
+        return entry
+
+    def _load(self, key, loader, ttl, stale_ttl, alias):
+        start = time.perf_counter()
+        value = loader()
+        delta = time.perf_counter() - start
+        if alias is not None:
+            self.store(alias[0], value, alias[1], alias[2], delta)
+        return self.store(key, value, ttl, stale_ttl, delta)
+
+    def get_or_load(self, key, loader, ttl, stale_ttl=None, alias=None):
+        """(value, stored_at, state) of key: cached, or loader() kept fresh for ttl seconds
+
+        From ttl (or a little before, see fresh) until stale_ttl the cached value is returned at
+        once and reloaded in the background; state is 'stale' once past ttl, else 'fresh'.
+        Without a usable entry the value is loaded first. If that load fails, the last good value
+        is returned with state 'error' while within stale_if_error, else the error is raised.
+        alias: (key, ttl, stale_ttl) a loaded value is also stored under, and whose entry serves
+        as the last good value when key has none. The QueryCache request property records the
+        outcome: l1, l2, miss, refresh (served, early refresh started), stale or stale-error.
+        """
+        stale_ttl = max(ttl, stale_ttl or 0)
+        now = self.clock()
+        entry, tier, fresh = self.lookup(key, now)
+        if fresh:
+            self._set_property(tier)
+            return entry[0], entry[1], 'fresh'
+        if entry is not None and now < entry[3]:
+            # Usable: answer with it now and reload it in the background
+            expired = now >= entry[2]
+            if expired:
+                self._count('loads', 'stale')
+            self._refresh_async(key, loader, ttl, stale_ttl, alias, entry[1])
+            self._set_property('stale' if expired else 'refresh')
+            return entry[0], entry[1], 'stale' if expired else 'fresh'
+        try:
+            return self._load_shared(key, loader, ttl, stale_ttl, alias)
+        except Exception as e:
+            last_good = entry
+            if alias is not None:
+                alias_entry, _, _ = self.lookup(alias[0], now)
+                if alias_entry is not None and (last_good is None or alias_entry[1] > last_good[1]):
+                    last_good = alias_entry
+            if last_good is None or now >= last_good[3] + self.stale_if_error:
+                raise
+            self._count('loads', 'stale_on_error')
+            self._set_property('stale-error')
+            print(f"Query cache serving the last good value of {key} ({now - last_good[1]:.0f}s old): {e}")
+            return last_good[0], last_good[1], 'error'
+
+    def _load_shared(self, key, loader, ttl, stale_ttl, alias):
+        """Load now; concurrent misses of the key in this process wait for the first one's load"""
+        with self.lock:
+            loading = self._loading.get(key)
+            if loading is None:
+                self._loading[key] = threading.Event()
+        if loading is not None:
+            loading.wait(LOAD_WAIT_SECONDS)
+            entry = self.l1.get(key)
+            if entry is not None and self.clock() < entry[2]:
+                self._count('loads', 'shared')
+                self._set_property('l1')
+                return entry[0], entry[1], 'fresh'
+        self._count('loads', 'loads')
+        self._set_property('miss')
+        try:
+            entry = self._load(key, loader, ttl, stale_ttl, alias)
+            return entry[0], entry[1], 'fresh'
+        finally:
+            if loading is None:
+                self._finish(key)
+
+    def _refresh_async(self, key, loader, ttl, stale_ttl, alias, stored_at):
+        """Start one background reload of key, unless this or another process is already reloading it"""
+        with self.lock:
+            if key in self._loading:
+                return
+            self._loading[key] = threading.Event()
+            if self._refresh_pool is None:
+                from concurrent.futures import ThreadPoolExecutor  # imported on the first refresh, not at cold start
+                self._refresh_pool = ThreadPoolExecutor(max_workers=REFRESH_WORKERS,
+                                                        thread_name_prefix='cache-refresh')
+        if not self._claim(key):
+            self._finish(key)
+            return
+        self._count('loads', 'refreshes')
+        # Pool threads run outside the request's context: the reload is not part of its metrics
+        self._refresh_pool.submit(self._refresh, key, loader, ttl, stale_ttl, alias, stored_at)
+
+    def _refresh(self, key, loader, ttl, stale_ttl, alias, stored_at):
+        try:
+            if self.l2 is not None:
+                # The lease may have been freed by a refresh that landed after our lookup
+                decoded = self._l2_get(key)
+                if decoded is not None and decoded[1] > stored_at and self.clock() < decoded[2]:
+                    self._store_l1(key, decoded)
+                    return
+            self._load(key, loader, ttl, stale_ttl, alias)
+        except Exception as e:
+            # The current entry keeps being served until its stale TTL
+            self._count('loads', 'refresh_errors')
+            print(f"Query cache refresh error for {key}: {e}")
+        finally:
+            if self.l2 is not None:
+                self._release(key)
+            self._finish(key)
+
+    @staticmethod
+    def _set_property(outcome):
+        request_metrics = metrics.current()
+        if request_metrics is not None:
+            request_metrics.set_property('QueryCache', outcome)
+
+    def summary(self):
+        with self.lock:
+            stats = {tier: dict(values) for tier, values in self.stats.items()}
+        stats['l1'].update(self.l1.summary())
+        if self.l2 is not None:
+            stats['l2'].update(self.l2.summary())
+        return stats
+
+
+def create_l2(url=None):
+    """L2 tier for QUERY_CACHE_L2 ('disk', a redis:// URL, or 'none')"""
+    url = L2_URL if url is None else url
+    if not url or url == 'none':
+        return None
+    if url == 'disk':
+        return DiskTier()
+    if url.startswith('redis://'):
+        return RedisTier(url)
+    raise ValueError(f"Unknown QUERY_CACHE_L2: {url}")
+
+
+def create_query_cache(l2_url=None):
+    """Cache configured from the environment"""
+    return TieredCache(MemoryTier(), create_l2(l2_url))
@@ -0,0 +1,266 @@
+# Region-aware DynamoDB access for PPMT-AMP
+# With PPMT-AMP-Items and PPMT-AMP-Series replicated as DynamoDB global tables, a read can be
+# served by any replica. The router holds one client per region and, for each, a rolling
+# latency (EWMA) and a window of recent outcomes. Reads of replicated tables go to the fastest
+# healthy region and fail over to the next one when a replica errors or is unreachable; a
+# region with too many recent failures is skipped for a cooldown, then probed with a single
+# request. Writes, strongly consistent reads and every other table stay in the home region,
+# where writes are accepted and read-your-writes holds. Per-region state that is not
+# replicated (REGIONAL_TABLES: rate limits, the replay store) lives in each region and is read
+# and written in the function's own region.
+#
+# Local stand-in: SimulatedRegion wraps a backend with a per-region round trip and injectable
+# failures; all regions sharing one LocalDynamoDB behave like a fully replicated global table.
+
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import metrics
+
+# Regions come from storage_backend (HOME_REGION, DYNAMODB_REGIONS); reads of these tables may use any replica
+REPLICATED_TABLES = [table.strip() for table in
+                     os.environ.get('REPLICATED_TABLES', 'PPMT-AMP-Items,PPMT-AMP-Series').split(',') if table.strip()]
+# Tables deployed separately in every region (not global tables): always the function's own region
+REGIONAL_TABLES = [table.strip() for table in
+                   os.environ.get('REGIONAL_TABLES', 'PPMT-AMP-RateLimits,PPMT-AMP-ReplayGuard').split(',')
+                   if table.strip()]
+
+READ_OPERATIONS = ('get_item', 'query', 'scan', 'batch_get_item')
+WRITE_OPERATIONS = ('put_item', 'update_item', 'delete_item', 'batch_write_item', 'transact_write_items')
+
+LATENCY_ALPHA = 0.2             # weight of the newest sample in the rolling latency
+HEALTH_WINDOW = 20              # recent outcomes kept per region
+MIN_SAMPLES = 5                 # outcomes needed before the error rate counts
+MAX_ERROR_RATE = 0.5
+MAX_CONSECUTIVE_FAILURES = 3
+COOLDOWN_SECONDS = float(os.environ.get('REGION_COOLDOWN_SECONDS', '30'))
+
+# Errors that say the replica (not the request) is the problem
+FAILOVER_ERROR_CODES = {
+    'InternalServerError', 'ServiceUnavailable', 'ThrottlingException', 'RequestLimitExceeded',
+    'ProvisionedThroughputExceededException', 'ResourceNotFoundException', 'ReplicatedWriteConflictException'
+}
+CONNECTION_ERRORS = {'EndpointConnectionError', 'ConnectTimeoutError', 'ReadTimeoutError', 'ConnectionClosedError'}
+
+
+def request_tables(kwargs):
+    """Tables a low-level request touches"""
+    if 'TableName' in kwargs:
+        return {kwargs['TableName']}
+    if 'RequestItems' in kwargs:
+        return set(kwargs['RequestItems'])
+    return {next(iter(action.values()))['TableName'] for action in kwargs.get('TransactItems', [])}
+
+
+def is_replica_failure(error):
+    code = (getattr(error, 'response', None) or {}).get('Error', {}).get('Code')
+    if code:
+        return code in FAILOVER_ERROR_CODES
+    return isinstance(error, (ConnectionError, TimeoutError)) or type(error).__name__ in CONNECTION_ERRORS
+
+
+class RegionHealth:
+    """Rolling latency and recent outcomes of one region"""
+
+    def __init__(self, region, rank):
+        self.region = region
+        self.rank = rank
+        self.latency_ms = None
+        self.outcomes = deque(maxlen=HEALTH_WINDOW)
+        self.consecutive_failures = 0
+        self.down_until = 0.0
+        self.probing = False
+        self.calls = 0
+        self.failures = 0
+
+    def available(self, now):
+        """Healthy, or due for its single probe after the cooldown"""
+        if not self.down_until:
+            return True
+        return now >= self.down_until and not self.probing
+
+    def record(self, ok, elapsed_ms, now):
+        self.calls += 1
+        self.outcomes.append(ok)
+        if ok:
+            self.consecutive_failures = 0
+            self.latency_ms = elapsed_ms if self.latency_ms is None else \
+                LATENCY_ALPHA * elapsed_ms + (1 - LATENCY_ALPHA) * self.latency_ms
+            if self.down_until:
+                # Probe succeeded: back in rotation with a clean window
+                self.down_until = 0.0
+                self.outcomes.clear()
+        else:
+            self.failures += 1
+            self.consecutive_failures += 1
+            error_rate = self.outcomes.count(False) / len(self.outcomes)
+            if (self.down_until or self.consecutive_failures >= MAX_CONSECUTIVE_FAILURES
+                    or (len(self.outcomes) >= MIN_SAMPLES and error_rate >= MAX_ERROR_RATE)):
+                self.down_until = now + COOLDOWN_SECONDS
+        self.probing = False
+
+    def summary(self):
+        return {
+            'rank': self.rank,
+            'latency_ms': round(self.latency_ms, 3) if self.latency_ms is not None else None,
+            'calls': self.calls,
+            'failures': self.failures,
+            'healthy': not self.down_until
+        }
+
+
+class RegionRouter:
+    """Low-level DynamoDB client API over per-region clients: nearest healthy reads, home writes"""
+
+    def __init__(self, clients, home_region, replicated_tables=REPLICATED_TABLES, regional_tables=REGIONAL_TABLES,
+                 clock=time.monotonic):
+        """clients: {region: client}, own region first, then nearest first (the order breaks ties
+        until latencies are known)"""
+        if home_region not in clients:
+            raise ValueError(f"No client for home region {home_region}")
+        self.clients = dict(clients)
+        self.home_region = home_region
+        self.home = self.clients[home_region]
+        self.local_region = next(iter(clients))
+        self.local = self.clients[self.local_region]
+        self.replicated_tables = set(replicated_tables)
+        self.regional_tables = set(regional_tables)
+        self.health = {region: RegionHealth(region, rank) for rank, region in enumerate(clients)}
+        self.clock = clock
+        self.lock = threading.Lock()
+
+    @property
+    def exceptions(self):
+        return self.home.exceptions
+
+    def __getattr__(self, name):
+        if name in READ_OPERATIONS:
+            return lambda **kwargs: self._read(name, kwargs)
+        if name in WRITE_OPERATIONS:
+            return lambda **kwargs: getattr(self._pinned(kwargs), name)(**kwargs)
+        # Anything else (paginators, meta, ...) goes to the home region
+        return getattr(self.home, name)
+
+    def _pinned(self, kwargs):
+        """Own region for per-region tables, home region for everything else"""
+        tables = request_tables(kwargs)
+        return self.local if tables and tables <= self.regional_tables else self.home
+
+    def routable(self, kwargs):
+        """Eventually consistent read of replicated tables only"""
+        if 'RequestItems' in kwargs:
+            return all(table in self.replicated_tables and not request.get('ConsistentRead')
+                       for table, request in kwargs['RequestItems'].items())
+        return kwargs.get('TableName') in self.replicated_tables and not kwargs.get('ConsistentRead')
+
+    def read_order(self):
+        """(available regions fastest first, regions in cooldown); unmeasured regions come early so
+        every region gets a latency"""
+        now = self.clock()
+        with self.lock:
+            available = [h for h in self.health.values() if h.available(now)]
+            down = sorted((h for h in self.health.values() if h not in available), key=lambda h: h.down_until)
+        available.sort(key=lambda h: (h.latency_ms if h.latency_ms is not None else 0.0, h.rank))
+        return available, down
+
+    def _claim(self, health):
+        """Healthy regions are always tried; a region past its cooldown gets one probe at a time"""
+        with self.lock:
+            if not health.down_until:
+                return True
+            if health.probing:
+                return False
+            health.probing = True
+            return True
+
+    def _candidates(self, available, down):
+        """Regions to try in order. Each available region is claimed only when the previous one has
+        failed, so a request holds a probe only for the region it is about to call; regions in
+        cooldown are only tried once every available region has failed"""
+        tried = []
+        for health in available:
+            if self._claim(health):
+                tried.append(health)
+                yield health
+        if not tried:
+            tried.append(self.health[self.home_region])
+            yield tried[0]
+        for health in down:
+            if health not in tried:
+                yield health
+
+    def _read(self, operation, kwargs):
+        if not self.routable(kwargs):
+            return getattr(self._pinned(kwargs), operation)(**kwargs)
+        available, down = self.read_order()
+        last_error = None
+        for attempt, health in enumerate(self._candidates(available, down)):
+            start = time.perf_counter()
+            try:
+                response = getattr(self.clients[health.region], operation)(**kwargs)
+            except Exception as e:
+                if not is_replica_failure(e):
+                    self._record(health, True, (time.perf_counter() - start) * 1000)
+                    raise
+                self._record(health, False, 0.0)
+                print(f"Region {health.region} read error, failing over: {e}")
+                last_error = e
+                continue
+            self._record(health, True, (time.perf_counter() - start) * 1000)
+            request_metrics = metrics.current()
+            if request_metrics is not None:
+                request_metrics.set_property('ReadRegion', health.region)
+                if attempt:
+                    request_metrics.increment('RegionFailovers', attempt)
+            return response
+        raise last_error
+
+    def _record(self, health, ok, elapsed_ms):
+        with self.lock:
+            health.record(ok, elapsed_ms, self.clock())
+
+    def summary(self):
+        with self.lock:
+            return {region: health.summary() for region, health in self.health.items()}
+
+
+class SimulatedRegion:
+    """Local stand-in for a regional endpoint: a round trip per call and injectable failures"""
+
+    def __init__(self, backend, region, round_trip_ms=0.0, failure_rate=0.0, seed=None):
+        self.backend = backend
+        self.region = region
+        self.round_trip_ms = round_trip_ms
+        self.failure_rate = failure_rate
+        self.down = False
+        self.rng = random.Random(seed)
+        self.exceptions = backend.exceptions
+
+    def __getattr__(self, name):
+        operation = getattr(self.backend, name)
+        if not callable(operation):
+            return operation
+
+        def call(*args, **kwargs):
+            time.sleep(self.round_trip_ms / 1000)
+            if self.down or (self.failure_rate and self.rng.random() < self.failure_rate):
+                raise ConnectionError(f"Could not connect to the endpoint for {self.region}")
+            return operation(*args, **kwargs)
+        return call
+
+
+def ordered_regions(regions, own_region=None):
+    """Configured regions with the function's own region first"""
+    own_region = own_region or os.environ.get('AWS_REGION')
+    return sorted(regions, key=lambda region: region != own_region)
+
+
+def create_region_router(create_client, regions, home_region):
+    """Router over create_client(region) for each region (home region included)"""
+    regions = ordered_regions(regions)
+    if home_region not in regions:
+        regions.append(home_region)
+    return RegionRouter({region: create_client(region) for region in regions}, home_region)
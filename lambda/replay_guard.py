@@ -0,0 +1,197 @@
+# Replay protection for signed PPMT-AMP requests
+# A signed request is valid for ±SIGNATURE_WINDOW seconds around its timestamp, so a captured
+# URL could be replayed until it expires. The guard records every accepted request in a Bloom
+# filter for the time bucket of its (signed) timestamp; a replay carries the same timestamp, so
+# it lands in the same bucket and is found with one filter lookup. Buckets older than the window
+# are dropped, so memory is fixed (buckets x bits per bucket) whatever the traffic. A Bloom
+# filter never misses a request it recorded; a fresh request is wrongly rejected with
+# probability REPLAY_FP_RATE while a bucket stays under REPLAY_BUCKET_CAPACITY requests.
+#
+# Each Lambda container only sees its own requests. With REPLAY_STORE_TABLE set, a request the
+# local filter has not seen is also checked and recorded in a shared DynamoDB table, split into
+# many small shard items (one conditional UpdateItem per request). Each shard is a Bloom filter
+# of STORE_SHARD_BITS bits kept as a number set, so an item stays under 1 KB and every update
+# is billed 1 WCU, however busy the bucket.
+
+import hashlib
+import math
+import os
+import threading
+import time
+
+SIGNATURE_WINDOW = 300      # seconds a signed timestamp is accepted on either side of now
+BUCKET_SECONDS = int(os.environ.get('REPLAY_BUCKET_SECONDS', '60'))
+BUCKET_CAPACITY = int(os.environ.get('REPLAY_BUCKET_CAPACITY', '50000'))  # requests per bucket at the target rate
+FP_RATE = float(os.environ.get('REPLAY_FP_RATE', '1e-6'))
+
+# Shared store (unset = per-container only)
+REPLAY_STORE_TABLE = os.environ.get('REPLAY_STORE_TABLE')
+STORE_SHARD_KEYS = int(os.environ.get('REPLAY_STORE_SHARD_KEYS', '6'))  # requests per shard item at bucket capacity
+STORE_SHARD_BITS = 320      # bits per shard item: at most 320 numbers below 320, under 1 KB
+
+
+def request_key(signature, params=()):
+    """Replay key of a request: its signature plus the parameters the signature does not cover"""
+    return '\n'.join([signature or ''] + [f"{k}={v}" for k, v in sorted(params)]).encode()
+
+
+def _hashes(key):
+    """Two independent 64-bit hashes (Kirsch-Mitzenmacher double hashing) and a shard hash"""
+    digest = hashlib.blake2b(key, digest_size=24).digest()
+    return (int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:16], 'little') | 1,
+            int.from_bytes(digest[16:], 'little'))
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter sized for `capacity` keys at false-positive rate `fp_rate`"""
+
+    def __init__(self, capacity, fp_rate):
+        self.size = max(64, math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, key):
+        h1, h2, _ = _hashes(key)
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        """Set the key's bits; returns True if they were all set already (probably seen)"""
+        seen = True
+        for position in self.positions(key):
+            byte, mask = position >> 3, 1 << (position & 7)
+            if not self.bits[byte] & mask:
+                seen = False
+                self.bits[byte] |= mask
+        if not seen:
+            self.count += 1
+        return seen
+
+    def __contains__(self, key):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self.positions(key))
+
+    def fp_rate(self):
+        """Current false-positive probability given the keys added so far"""
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+
+def shard_fp_rate(load, bits, hashes):
+    """Expected false-positive rate of a `bits`-bit filter holding Poisson(load) keys"""
+    rate = 0.0
+    for keys in range(int(load * 4 + 40)):
+        weight = math.exp(keys * math.log(load) - load - math.lgamma(keys + 1)) if load else float(keys == 0)
+        rate += weight * (1 - math.exp(-hashes * keys / bits)) ** hashes
+    return rate
+
+
+class DynamoDBReplayStore:
+    """Shared Bloom filter in DynamoDB: one small item per (bucket, shard) holding its set bits as a number set
+
+    A key's bits all fall in one shard item. The update adds them only if not all are present
+    already, so check and record are a single atomic round trip; a failed condition is a replay.
+    The shard count follows the bucket capacity, so shards hold `shard_keys` requests on average;
+    the hash count is the one with the lowest expected false-positive rate at that load.
+    """
+
+    def __init__(self, dynamodb, table=None, capacity=BUCKET_CAPACITY, shard_keys=STORE_SHARD_KEYS,
+                 shard_bits=STORE_SHARD_BITS):
+        self.dynamodb = dynamodb
+        self.table = table or REPLAY_STORE_TABLE
+        self.shards = max(1, math.ceil(capacity / shard_keys))
+        self.shard_bits = shard_bits
+        self.hashes = min(range(1, 65), key=lambda hashes: shard_fp_rate(shard_keys, shard_bits, hashes))
+        self.fp_rate = shard_fp_rate(shard_keys, shard_bits, self.hashes)
+
+    def max_item_bytes(self):
+        """Size of a shard item with every bit set: names, key, TTL and numbers as DynamoDB sizes them
+        (1 byte per two digits plus 1); updates are billed on it"""
+        numbers = sum((len(str(p)) + 1) // 2 + 1 for p in range(self.shard_bits))
+        key = len(f"{int(time.time()) // BUCKET_SECONDS}#{self.shards - 1}")
+        return len('block') + key + len('bits') + numbers + len('ttl') + 21
+
+    def add(self, bucket, key):
+        """Record the key in the bucket; returns True if it was (probably) there already"""
+        h1, h2, h3 = _hashes(key)
+        positions = sorted({(h1 + i * h2) % self.shard_bits for i in range(self.hashes)})
+        values = {f":p{i}": {'N': str(p)} for i, p in enumerate(positions)}
+        values[':bits'] = {'NS': [str(p) for p in positions]}
+        values[':ttl'] = {'N': str((bucket + 1) * BUCKET_SECONDS + SIGNATURE_WINDOW)}
+        try:
+            self.dynamodb.update_item(
+                TableName=self.table,
+                Key={'block': {'S': f"{bucket}#{h3 % self.shards}"}},
+                UpdateExpression='ADD #bits :bits SET #ttl = :ttl',
+                ConditionExpression='attribute_not_exists(#bits) OR NOT (' +
+                                    ' AND '.join(f"contains(#bits, :p{i})" for i in range(len(positions))) + ')',
+                ExpressionAttributeNames={'#bits': 'bits', '#ttl': 'ttl'},
+                ExpressionAttributeValues=values
+            )
+            return False
+        except self.dynamodb.exceptions.ConditionalCheckFailedException:
+            return True
+
+
+class ReplayGuard:
+    """Rolling set of per-bucket Bloom filters covering the signature window"""
+
+    def __init__(self, window=SIGNATURE_WINDOW, bucket_seconds=BUCKET_SECONDS, capacity=BUCKET_CAPACITY,
+                 fp_rate=FP_RATE, store=None):
+        self.window = window
+        self.bucket_seconds = bucket_seconds
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.store = store
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.stats = {'accepted': 0, 'replayed': 0, 'shared_replayed': 0, 'store_errors': 0}
+
+    def _expire(self, now):
+        oldest = (now - self.window) // self.bucket_seconds
+        for bucket in [b for b in self.buckets if b < oldest]:
+            del self.buckets[bucket]
+
+    def seen(self, key, timestamp, now=None):
+        """Record a request signed at `timestamp`; returns True if it is a replay
+
+        The caller has already rejected timestamps outside the window, so the bucket exists for
+        as long as the request could be replayed.
+        """
+        now = int(time.time()) if now is None else now
+        bucket = int(timestamp) // self.bucket_seconds
+        with self.lock:
+            self._expire(now)
+            if bucket not in self.buckets:
+                self.buckets[bucket] = BloomFilter(self.capacity, self.fp_rate)
+            if self.buckets[bucket].add(key):
+                self.stats['replayed'] += 1
+                return True
+        if self.store is not None:
+            try:
+                if self.store.add(bucket, key):
+                    self.stats['shared_replayed'] += 1
+                    return True
+            except Exception as e:
+                # The local filter still guards this container; do not fail the request
+                self.stats['store_errors'] += 1
+                print(f"Replay store error: {e}")
+        self.stats['accepted'] += 1
+        return False
+
+    def memory_bytes(self):
+        return sum(len(f.bits) for f in self.buckets.values())
+
+    def summary(self):
+        with self.lock:
+            return dict(self.stats, buckets=len(self.buckets), memory_bytes=self.memory_bytes(),
+                        worst_fp_rate=max((f.fp_rate() for f in self.buckets.values()), default=0.0))
+
+
+def create_replay_guard(dynamodb=None):
+    """Guard configured from the environment; shared through REPLAY_STORE_TABLE when it is set"""
+    store = None
+    if REPLAY_STORE_TABLE:
+        if dynamodb is None:
+            from storage_backend import get_storage_backend
+            dynamodb = get_storage_backend()
+        store = DynamoDBReplayStore(dynamodb)
+    return ReplayGuard(store=store)
@@ -0,0 +1,127 @@
+# Published static pages for the PPMT-AMP query API
+# The publish stage (etl/publish.py) renders the hottest responses after each data load: the
+# series list, each series' items and the items and series of each IpCharacter. Each is one
+# gzip-compressed JSON object whose name carries a hash of its content, so an object never
+# changes once written and can be cached forever. manifest.json maps each query to its
+# object and is the only file that changes on a publish.
+#
+# Clients that read the manifest fetch pages from the CDN and never reach the API. For the
+# others, the handler looks the verified request up in the manifest. It reads the Version of
+# each series the page covers (one BatchGetItem), plus the catalog version for pages that list
+# series, since a series may have been added. If they still match the manifest entry, it serves
+# the object itself (no rate limit record, no query) or redirects to it; if a write bumped one
+# since the publish, the request is answered by a query.
+#
+# Pages are read from STATIC_PAGES_URL: a local directory or an http(s) base URL (the bucket
+# behind the CDN). The manifest is reloaded every STATIC_MANIFEST_TTL seconds.
+
+import json
+import os
+import threading
+import time
+from urllib.parse import urlencode
+
+MANIFEST_FILE = 'manifest.json'
+STATIC_PAGES_URL = os.environ.get('STATIC_PAGES_URL', '')
+# Base URL redirects point to (the CDN); defaults to STATIC_PAGES_URL when that is a URL
+STATIC_PAGES_PUBLIC_URL = os.environ.get('STATIC_PAGES_PUBLIC_URL', '')
+MANIFEST_TTL = float(os.environ.get('STATIC_MANIFEST_TTL', '60'))
+FETCH_TIMEOUT = 2.0  # seconds per manifest or page fetch
+
+# Parameters that do not select a page (verification, and the limit checked against the page)
+PAGE_IGNORED_PARAMS = ('limit',)
+
+
+def page_key(path, params):
+    """Manifest key of a query: route and its business parameters, without the limit"""
+    return f"{path}?{urlencode(sorted((k, v) for k, v in params.items() if k not in PAGE_IGNORED_PARAMS))}"
+
+
+def _is_url(location):
+    return location.startswith(('http://', 'https://'))
+
+
+class StaticPages:
+    """The current manifest of a published page set, and the pages it lists"""
+
+    def __init__(self, location=STATIC_PAGES_URL, public_url=STATIC_PAGES_PUBLIC_URL, ttl=MANIFEST_TTL,
+                 clock=time.monotonic):
+        self.location = location.rstrip('/')
+        public_url = public_url or (location if _is_url(location) else '')
+        self.public_url = public_url.rstrip('/')
+        self.ttl = ttl
+        self.clock = clock
+        self.manifest = None
+        self.loaded_at = None
+        self.pages = {}          # object key -> compressed bytes of the current manifest's pages
+        self.lock = threading.Lock()
+
+    def _fetch(self, name):
+        if _is_url(self.location):
+            import urllib.request
+            with urllib.request.urlopen(f"{self.location}/{name}", timeout=FETCH_TIMEOUT) as response:
+                return response.read()
+        with open(os.path.join(self.location, name), 'rb') as f:
+            return f.read()
+
+    def current(self):
+        """The manifest, reloaded once it is older than the TTL (None if none could be read)"""
+        now = self.clock()
+        if self.loaded_at is not None and now - self.loaded_at < self.ttl:
+            return self.manifest
+        with self.lock:
+            if self.loaded_at is not None and now - self.loaded_at < self.ttl:
+                return self.manifest
+            try:
+                manifest = json.loads(self._fetch(MANIFEST_FILE))
+            except Exception as e:
+                # Keep the last manifest (if any); the dynamic path answers meanwhile
+                print(f"Static manifest error: {e}")
+                manifest = self.manifest
+            if manifest is not self.manifest:
+                keys = {page['key'] for page in manifest['pages'].values()}
+                self.pages = {key: data for key, data in self.pages.items() if key in keys}
+            self.manifest = manifest
+            self.loaded_at = now
+            return manifest
+
+    @property
+    def version(self):
+        return self.manifest['version'] if self.manifest else None
+
+    def lookup(self, path, params, limit):
+        """Page answering this query in full, or None"""
+        manifest = self.current()
+        if manifest is None:
+            return None
+        page = manifest['pages'].get(page_key(path, params))
+        # A page holds the whole result; a request for fewer rows than it has is left to the query
+        if page is None or not page['complete'] or page['items'] > limit:
+            return None
+        return page
+
+    def url(self, page):
+        return f"{self.public_url}/{page['key']}"
+
+    def read(self, page):
+        """Compressed bytes of a page (kept in memory while the manifest lists it)"""
+        data = self.pages.get(page['key'])
+        if data is None:
+            data = self._fetch(page['key'])
+            with self.lock:
+                self.pages[page['key']] = data
+        return data
+
+    def body(self, page, accept_gzip):
+        """(body, is_base64, content_encoding) of a page for an API Gateway response"""
+        data = self.read(page)
+        if accept_gzip:
+            import base64
+            return base64.b64encode(data).decode(), True, 'gzip'
+        import gzip
+        return gzip.decompress(data).decode(), False, None
+
+
+def create_static_pages():
+    """Page set configured from the environment"""
+    return StaticPages(STATIC_PAGES_URL, STATIC_PAGES_PUBLIC_URL, MANIFEST_TTL)
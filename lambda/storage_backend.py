@@ -0,0 +1,300 @@
+# Storage backends for the PPMT-AMP Lambda functions
+# The handler talks to storage through the low-level DynamoDB client API (get_item, query,
+# scan, put_item, update_item). This module selects the implementation: the real botocore
+# client in AWS, or LocalDynamoDB (local_dynamodb.py) - a SQLite-backed stand-in for
+# offline benchmarks/tests. With DYNAMODB_REGIONS set, the client is a RegionRouter
+# (region_router.py) over one client per region: nearest healthy replica for reads, home
+# region for writes.
+
+import os
+from datetime import datetime
+from decimal import Decimal
+
+# Backend selection ('dynamodb' or 'local')
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'dynamodb')
+LOCAL_DB_PATH = os.environ.get('LOCAL_DB_PATH', ':memory:')
+LOCAL_STREAM_FILE = os.environ.get('LOCAL_STREAM_FILE')  # capture Items changes as stream records
+
+# Regions: writes go to HOME_REGION; DYNAMODB_REGIONS lists the replicas reads may use
+HOME_REGION = os.environ.get('HOME_REGION', 'us-east-1')
+DYNAMODB_REGIONS = [region.strip() for region in os.environ.get('DYNAMODB_REGIONS', '').split(',') if region.strip()]
+
+# HTTP connections each client keeps open (botocore's default is 10); size it to the number of
+# threads that share the client, e.g. the ASGI app's request threads (asgi_app.py)
+MAX_POOL_CONNECTIONS = int(os.environ.get('DYNAMODB_MAX_POOL_CONNECTIONS', '10'))
+
+# Operations used on the request path (warmed during init)
+WARM_OPERATIONS = ['GetItem', 'PutItem', 'UpdateItem', 'Query', 'Scan']
+
+_backend = None
+_session = None
+
+
+def get_storage_backend():
+    """Return the process-wide storage backend, creating it on first use"""
+    global _backend
+    if _backend is None:
+        if STORAGE_BACKEND == 'local':
+            from local_dynamodb import LocalDynamoDB
+            backend = LocalDynamoDB(LOCAL_DB_PATH, stream_path=LOCAL_STREAM_FILE)
+            create_default_tables(backend)
+            _backend = backend
+        elif DYNAMODB_REGIONS:
+            from region_router import create_region_router
+            _backend = create_region_router(_create_dynamodb_client, DYNAMODB_REGIONS, HOME_REGION)
+        else:
+            _backend = _create_dynamodb_client()
+    return _backend
+
+
+def set_storage_backend(backend):
+    """Replace the process-wide storage backend (benchmarks and local runs)"""
+    global _backend
+    _backend = backend
+
+
+def _create_dynamodb_client(region=None):
+    """Create the DynamoDB client (for `region`, default: the function's own) straight from botocore.
+
+    boto3.client() only adds a session wrapper on top of botocore; importing botocore.session
+    directly skips boto3 and its resource layer. The botocore session is kept so clients can
+    be recreated cheaply (service models stay cached in its loader).
+    """
+    global _session
+    if _session is None:
+        import botocore.session
+        _session = botocore.session.get_session()
+    from botocore.config import Config
+    return _session.create_client('dynamodb', region_name=region,
+                                  config=Config(max_pool_connections=MAX_POOL_CONNECTIONS))
+
+
+def warm_storage_backend(operations=WARM_OPERATIONS):
+    """Load everything the request path needs lazily, so it happens during init.
+
+    botocore parses the service model and builds operation models on first use; doing it
+    here moves that cost out of the first request (and into a SnapStart snapshot).
+    """
+    backend = get_storage_backend()
+    for client in getattr(backend, 'clients', {None: backend}).values():
+        meta = getattr(client, 'meta', None)
+        if meta is not None:
+            for operation in operations:
+                meta.service_model.operation_model(operation)
+    return backend
+
+
+def reset_storage_backend():
+    """Drop the current client (keeping the botocore session and its cached models).
+
+    Called after a SnapStart restore: pooled connections captured in the snapshot are stale.
+    """
+    global _backend
+    if _backend is not None and STORAGE_BACKEND != 'local':
+        _backend = None
+
+
+def create_default_tables(backend):
+    """Create the PPMT-AMP tables with the production key schema and GSIs (idempotent)"""
+    existing = set(backend.list_tables().get('TableNames', []))
+
+    if 'PPMT-AMP-Items' not in existing:
+        backend.create_table(
+            TableName='PPMT-AMP-Items',
+            KeySchema=[
+                {'AttributeName': 'SeriesId', 'KeyType': 'HASH'},
+                {'AttributeName': 'ProductId', 'KeyType': 'RANGE'}
+            ],
+            AttributeDefinitions=[
+                {'AttributeName': 'SeriesId', 'AttributeType': 'S'},
+                {'AttributeName': 'ProductId', 'AttributeType': 'S'},
+                {'AttributeName': 'IpCharacter', 'AttributeType': 'S'},
+                {'AttributeName': 'Timestamp', 'AttributeType': 'S'},
+                {'AttributeName': 'Category', 'AttributeType': 'S'},
+                {'AttributeName': 'AfterMarketPrice', 'AttributeType': 'N'},
+                {'AttributeName': 'Status', 'AttributeType': 'S'}
+            ],
+            GlobalSecondaryIndexes=[
+                {
+                    'IndexName': 'IpCharacter-Timestamp-Index',
+                    'KeySchema': [
+                        {'AttributeName': 'IpCharacter', 'KeyType': 'HASH'},
+                        {'AttributeName': 'Timestamp', 'KeyType': 'RANGE'}
+                    ],
+                    'Projection': {'ProjectionType': 'ALL'}
+                },
+                {
+                    'IndexName': 'Category-AfterMarketPrice-Index',
+                    'KeySchema': [
+                        {'AttributeName': 'Category', 'KeyType': 'HASH'},
+                        {'AttributeName': 'AfterMarketPrice', 'KeyType': 'RANGE'}
+                    ],
+                    'Projection': {'ProjectionType': 'ALL'}
+                },
+                {
+                    'IndexName': 'Status-Timestamp-Index',
+                    'KeySchema': [
+                        {'AttributeName': 'Status', 'KeyType': 'HASH'},
+                        {'AttributeName': 'Timestamp', 'KeyType': 'RANGE'}
+                    ],
+                    'Projection': {'ProjectionType': 'ALL'}
+                }
+            ],
+            StreamSpecification={'StreamEnabled': True, 'StreamViewType': 'NEW_AND_OLD_IMAGES'},
+            BillingMode='PAY_PER_REQUEST'
+        )
+
+    if 'PPMT-AMP-Series' not in existing:
+        backend.create_table(
+            TableName='PPMT-AMP-Series',
+            KeySchema=[{'AttributeName': 'SeriesId', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[
+                {'AttributeName': 'SeriesId', 'AttributeType': 'S'},
+                {'AttributeName': 'IpCharacter', 'AttributeType': 'S'}
+            ],
+            GlobalSecondaryIndexes=[
+                {
+                    'IndexName': 'IpCharacter-Index',
+                    'KeySchema': [{'AttributeName': 'IpCharacter', 'KeyType': 'HASH'}],
+                    'Projection': {'ProjectionType': 'ALL'}
+                }
+            ],
+            BillingMode='PAY_PER_REQUEST'
+        )
+
+    if 'PPMT-AMP-RateLimits' not in existing:
+        backend.create_table(
+            TableName='PPMT-AMP-RateLimits',
+            KeySchema=[{'AttributeName': 'deviceId', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'deviceId', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+
+    if 'PPMT-AMP-AuditLog' not in existing:
+        backend.create_table(
+            TableName='PPMT-AMP-AuditLog',
+            KeySchema=[
+                {'AttributeName': 'logId', 'KeyType': 'HASH'},
+                {'AttributeName': 'timestamp', 'KeyType': 'RANGE'}
+            ],
+            AttributeDefinitions=[
+                {'AttributeName': 'logId', 'AttributeType': 'S'},
+                {'AttributeName': 'timestamp', 'AttributeType': 'N'},
+                {'AttributeName': 'userId', 'AttributeType': 'S'}
+            ],
+            GlobalSecondaryIndexes=[
+                {
+                    'IndexName': 'UserIndex',
+                    'KeySchema': [
+                        {'AttributeName': 'userId', 'KeyType': 'HASH'},
+                        {'AttributeName': 'timestamp', 'KeyType': 'RANGE'}
+                    ],
+                    'Projection': {'ProjectionType': 'ALL'}
+                }
+            ],
+            BillingMode='PAY_PER_REQUEST'
+        )
+
+    if 'PPMT-AMP-StreamCheckpoints' not in existing:
+        backend.create_table(
+            TableName='PPMT-AMP-StreamCheckpoints',
+            KeySchema=[{'AttributeName': 'consumer', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'consumer', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+
+    if 'PPMT-AMP-ReplayGuard' not in existing:
+        backend.create_table(
+            TableName='PPMT-AMP-ReplayGuard',
+            KeySchema=[{'AttributeName': 'block', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'block', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+
+    if 'PPMT-AMP-ChangeLog' not in existing:
+        backend.create_table(
+            TableName='PPMT-AMP-ChangeLog',
+            KeySchema=[
+                {'AttributeName': 'Feed', 'KeyType': 'HASH'},
+                {'AttributeName': 'Position', 'KeyType': 'RANGE'}
+            ],
+            AttributeDefinitions=[
+                {'AttributeName': 'Feed', 'AttributeType': 'S'},
+                {'AttributeName': 'Position', 'AttributeType': 'S'}
+            ],
+            BillingMode='PAY_PER_REQUEST'
+        )
+
+
+# PPMT-AMP-Series item whose Version every writer bumps along with its series' (it may have added
+# a series); pages that list series check it. Readers that scan the table skip it.
+CATALOG_VERSION_ID = '#catalog'
+
+
+def series_version_update(series_id, table='PPMT-AMP-Series'):
+    """UpdateItem arguments that atomically increment a series' Version counter
+
+    Every writer of PPMT-AMP-Items bumps the version of each series it changed, after (or in the
+    same transaction as) the item writes, so readers can key caches and ETags on it. It bumps
+    the catalog version (CATALOG_VERSION_ID) the same way.
+    """
+    return {
+        'TableName': table,
+        'Key': {'SeriesId': {'S': series_id}},
+        'UpdateExpression': 'ADD Version :one SET VersionUpdatedAt = :now',
+        'ExpressionAttributeValues': {':one': {'N': '1'}, ':now': {'S': datetime.utcnow().isoformat()}}
+    }
+
+
+def bump_series_versions(backend, series_ids):
+    """Increment the Version of each series, then the catalog version; returns {SeriesId: new version}"""
+    versions = {}
+    for series_id in sorted(set(series_ids)):
+        response = backend.update_item(ReturnValues='UPDATED_NEW', **series_version_update(series_id))
+        versions[series_id] = int(response.get('Attributes', {}).get('Version', {}).get('N', 0))
+    if versions:
+        backend.update_item(**series_version_update(CATALOG_VERSION_ID))
+    return versions
+
+
+def serialize_dynamodb_value(value):
+    """Convert a plain Python value to DynamoDB AttributeValue format"""
+    if value is None:
+        return {'NULL': True}
+    if isinstance(value, bool):
+        return {'BOOL': value}
+    if isinstance(value, (int, float, Decimal)):
+        return {'N': str(value)}
+    if isinstance(value, str):
+        return {'S': value}
+    if isinstance(value, bytes):
+        return {'B': value}
+    if isinstance(value, dict):
+        return {'M': serialize_dynamodb_item(value)}
+    if isinstance(value, (list, tuple)):
+        return {'L': [serialize_dynamodb_value(v) for v in value]}
+    raise TypeError(f"Unsupported type for DynamoDB: {type(value).__name__}")
+
+
+def serialize_dynamodb_item(item):
+    """Convert a plain Python dict to DynamoDB item format"""
+    return {key: serialize_dynamodb_value(value) for key, value in item.items()}
+
+
+def deserialize_dynamodb_item(item):
+    """Convert DynamoDB item format to plain Python dict"""
+    result = {}
+    for key, value in item.items():
+        if 'S' in value:
+            result[key] = value['S']
+        elif 'N' in value:
+            result[key] = float(value['N']) if '.' in value['N'] else int(value['N'])
+        elif 'BOOL' in value:
+            result[key] = value['BOOL']
+        elif 'L' in value:
+            result[key] = [deserialize_dynamodb_item({'item': v})['item'] for v in value['L']]
+        elif 'M' in value:
+            result[key] = deserialize_dynamodb_item(value['M'])
+        elif 'NULL' in value:
+            result[key] = None
+    return result
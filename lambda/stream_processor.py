@@ -0,0 +1,616 @@
+# Change-stream fan-out for PPMT-AMP
+# Consumes DynamoDB Streams records for PPMT-AMP-Items and keeps derived state fresh, so caches
+# do not have to rely on short TTLs. Records are read in batches and coalesced per item (one net
+# change per key), then dispatched to registered sinks: targeted CloudFront invalidations,
+# per-series aggregates, per-series version bumps and the delta sync change log (change_log.py).
+# Each sink checkpoints the last sequence number it finished, so a retry or restart resumes
+# every sink where it stopped. A sink that cannot keep up raises Backpressure: in Lambda the
+# batch is reported back from that record (ReportBatchItemFailures), locally the reader blocks
+# on the sink's bounded queue.
+#
+# Local stand-in: LocalDynamoDB writes stream records to LOCAL_STREAM_FILE, and
+# scripts/replay-stream.py replays such a file through the same sinks.
+
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from change_log import ChangeLog
+from storage_backend import deserialize_dynamodb_item, get_storage_backend
+
+ITEMS_TABLE = "PPMT-AMP-Items"
+SERIES_TABLE = "PPMT-AMP-Series"
+CHECKPOINT_TABLE = os.environ.get('STREAM_CHECKPOINT_TABLE', "PPMT-AMP-StreamCheckpoints")
+
+# Sinks run by the Lambda handler, in order
+STREAM_SINKS = [name.strip() for name in os.environ.get('STREAM_SINKS', 'aggregates,cdn,changelog').split(',')
+                if name.strip()]
+
+# CloudFront: paths are templates formatted with each changed item (e.g. '/prices?seriesId={SeriesId}*')
+CLOUDFRONT_DISTRIBUTION_ID = os.environ.get('CLOUDFRONT_DISTRIBUTION_ID')
+CDN_INVALIDATION_PATHS = json.loads(os.environ.get('CDN_INVALIDATION_PATHS', '["/prices*", "/series*"]'))
+CDN_MAX_PATHS = 3000        # paths per invalidation request
+CDN_MAX_IN_PROGRESS = 15    # CloudFront's limit on wildcard invalidations in progress
+
+BATCH_SIZE = 100            # stream records per sink batch
+MAX_PENDING_BATCHES = 8     # queued batches per sink before the reader blocks
+BACKPRESSURE_WAIT = 1.0     # initial wait before a backpressured batch is retried (doubles, capped)
+BACKPRESSURE_MAX_WAIT = 30.0
+MAX_ERRORS = 20             # latest error messages kept per sink (all are counted)
+
+
+class Backpressure(Exception):
+    """Raised by a sink whose downstream cannot take more work yet; the batch is retried later"""
+
+
+def sequence_number(value):
+    """Stream sequence numbers are decimal strings (up to 40 digits); compare them as integers"""
+    return int(value) if value is not None else -1
+
+
+def table_name(record):
+    arn = record.get('eventSourceARN', '')
+    return arn.split('/')[1] if '/' in arn else record.get('tableName', ITEMS_TABLE)
+
+
+def parse_record(record):
+    """Plain dict from a DynamoDB Streams record (images deserialized)"""
+    data = record['dynamodb']
+    return {
+        'table': table_name(record),
+        'event': record['eventName'],
+        'keys': deserialize_dynamodb_item(data['Keys']),
+        'old': deserialize_dynamodb_item(data['OldImage']) if 'OldImage' in data else None,
+        'new': deserialize_dynamodb_item(data['NewImage']) if 'NewImage' in data else None,
+        'sequence': data['SequenceNumber']
+    }
+
+
+# Net event of two consecutive events for the same item (None: the item never existed)
+_MERGED_EVENTS = {
+    ('INSERT', 'MODIFY'): 'INSERT',
+    ('INSERT', 'REMOVE'): None,
+    ('MODIFY', 'MODIFY'): 'MODIFY',
+    ('MODIFY', 'REMOVE'): 'REMOVE',
+    ('REMOVE', 'INSERT'): 'MODIFY'
+}
+
+
+class Change:
+    """Net effect of one or more stream records for a single item"""
+
+    __slots__ = ('table', 'keys', 'event', 'old', 'new', 'sequence', 'records')
+
+    def __init__(self, record):
+        self.table = record['table']
+        self.keys = record['keys']
+        self.event = record['event']
+        self.old = record['old']
+        self.new = record['new']
+        self.sequence = record['sequence']
+        self.records = 1
+
+    @property
+    def image(self):
+        """Latest known state of the item (the old image for removals)"""
+        return self.new if self.new is not None else (self.old or self.keys)
+
+    def merge(self, record):
+        self.event = _MERGED_EVENTS.get((self.event, record['event']), record['event'])
+        self.new = record['new']
+        self.sequence = record['sequence']
+        self.records += 1
+
+    def __repr__(self):
+        return f"Change({self.table}, {self.keys}, {self.event})"
+
+
+def coalesce(records):
+    """One Change per item in first-seen order; changes that cancel out (insert then remove,
+    or modifications back to the original image) are dropped"""
+    changes = {}
+    for record in records:
+        key = (record['table'], tuple(sorted(record['keys'].items())))
+        change = changes.get(key)
+        if change is None:
+            changes[key] = Change(record)
+        else:
+            change.merge(record)
+    return [change for change in changes.values()
+            if change.event and not (change.event == 'MODIFY' and change.old == change.new)]
+
+
+def series_ids(changes):
+    return sorted({change.image.get('SeriesId') for change in changes if change.image.get('SeriesId')})
+
+
+# --- Checkpoints ----------------------------------------------------------
+# A checkpoint is the last sequence number a sink finished, per scope (the replayed source
+# locally; the resume point of a retried batch in Lambda).
+
+class FileCheckpointStore:
+    """Checkpoints in a local JSON file: {scope: {sink: sequence}}"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self._data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self._data = {}
+
+    def load(self, scope):
+        with self._lock:
+            return dict(self._data.get(scope, {}))
+
+    def save(self, scope, progress):
+        with self._lock:
+            self._data.setdefault(scope, {}).update(progress)
+            self._write()
+
+    def clear(self, scope):
+        with self._lock:
+            if self._data.pop(scope, None) is not None:
+                self._write()
+
+    def _write(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class TableCheckpointStore:
+    """Checkpoints in the PPMT-AMP-StreamCheckpoints table: one item per scope, one attribute per sink"""
+
+    def __init__(self, dynamodb, table=CHECKPOINT_TABLE):
+        self.dynamodb = dynamodb
+        self.table = table
+
+    def load(self, scope):
+        response = self.dynamodb.get_item(TableName=self.table, Key={'consumer': {'S': scope}}, ConsistentRead=True)
+        item = deserialize_dynamodb_item(response.get('Item') or {})
+        return {name: value for name, value in item.items() if name not in ('consumer', 'updatedAt')}
+
+    def save(self, scope, progress):
+        if not progress:
+            return
+        names = {f"#s{index}": sink for index, sink in enumerate(progress)}
+        values = {f":s{index}": {'S': sequence} for index, sequence in enumerate(progress.values())}
+        values[':now'] = {'S': datetime.utcnow().isoformat()}
+        assignments = [f"#s{index} = :s{index}" for index in range(len(progress))] + ['updatedAt = :now']
+        self.dynamodb.update_item(
+            TableName=self.table,
+            Key={'consumer': {'S': scope}},
+            UpdateExpression='SET ' + ', '.join(assignments),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
+        )
+
+    def clear(self, scope):
+        self.dynamodb.delete_item(TableName=self.table, Key={'consumer': {'S': scope}})
+
+
+# --- Sinks ----------------------------------------------------------------
+
+class Sink:
+    """Consumer of coalesced changes. Delivery is at least once, so handle() must be safe to
+    repeat for changes it has already seen; it returns a dict of counters for the report."""
+
+    name = 'sink'
+    tables = (ITEMS_TABLE,)
+
+    def accepts(self, record):
+        return record['table'] in self.tables
+
+    def handle(self, changes):
+        raise NotImplementedError
+
+
+class SeriesVersionSink(Sink):
+    """Bumps the Version counter of every series with changed items (a cache key / ETag component)"""
+
+    name = 'versions'
+
+    def __init__(self, dynamodb):
+        self.dynamodb = dynamodb
+
+    def handle(self, changes):
+        bumped = missing = 0
+        for series_id in series_ids(changes):
+            try:
+                self.dynamodb.update_item(
+                    TableName=SERIES_TABLE,
+                    Key={'SeriesId': {'S': series_id}},
+                    UpdateExpression='ADD Version :one SET VersionUpdatedAt = :now',
+                    ConditionExpression='attribute_exists(SeriesId)',
+                    ExpressionAttributeValues={':one': {'N': '1'}, ':now': {'S': datetime.utcnow().isoformat()}}
+                )
+                bumped += 1
+            except self.dynamodb.exceptions.ConditionalCheckFailedException:
+                missing += 1
+        return {'series': bumped, 'unknown_series': missing}
+
+
+class SeriesAggregateSink(Sink):
+    """Recomputes per-series item count and market price range/average from the series' items
+
+    Aggregates are recomputed rather than adjusted by deltas, so replays cannot double count.
+    """
+
+    name = 'aggregates'
+
+    def __init__(self, dynamodb):
+        self.dynamodb = dynamodb
+
+    def series_stats(self, series_id):
+        params = {
+            'TableName': ITEMS_TABLE,
+            'KeyConditionExpression': 'SeriesId = :sid',
+            'ExpressionAttributeValues': {':sid': {'S': series_id}},
+            'ProjectionExpression': 'AfterMarketPrice'
+        }
+        count = 0
+        prices = []
+        while True:
+            response = self.dynamodb.query(**params)
+            for item in response.get('Items', []):
+                count += 1
+                price = item.get('AfterMarketPrice')
+                if price:
+                    prices.append(float(next(iter(price.values()))))
+            if not response.get('LastEvaluatedKey'):
+                break
+            params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        return count, prices
+
+    def handle(self, changes):
+        updated = missing = 0
+        for series_id in series_ids(changes):
+            count, prices = self.series_stats(series_id)
+            values = {':count': {'N': str(count)}, ':now': {'S': datetime.utcnow().isoformat()}}
+            assignments = ['ItemCount = :count', 'StatsUpdatedAt = :now']
+            if prices:
+                values.update({
+                    ':min': {'N': str(min(prices))},
+                    ':max': {'N': str(max(prices))},
+                    ':avg': {'N': str(round(sum(prices) / len(prices), 2))}
+                })
+                assignments += ['MinMarketPrice = :min', 'MaxMarketPrice = :max', 'AvgMarketPrice = :avg']
+            try:
+                self.dynamodb.update_item(
+                    TableName=SERIES_TABLE,
+                    Key={'SeriesId': {'S': series_id}},
+                    UpdateExpression='SET ' + ', '.join(assignments),
+                    ConditionExpression='attribute_exists(SeriesId)',
+                    ExpressionAttributeValues=values
+                )
+                updated += 1
+            except self.dynamodb.exceptions.ConditionalCheckFailedException:
+                missing += 1
+        return {'series': updated, 'unknown_series': missing}
+
+
+class ChangeLogSink(Sink):
+    """Appends each change to the delta sync change log, then compacts the log now and then
+
+    A retried batch writes its entries again under new positions; clients apply them again,
+    which leaves them with the same items.
+    """
+
+    name = 'changelog'
+
+    def __init__(self, dynamodb, log=None):
+        self.log = log or ChangeLog(dynamodb)
+
+    def handle(self, changes):
+        entries = self.log.append(changes)
+        return {'entries': entries, 'compacted': self.log.compact()}
+
+
+class LocalCloudFront:
+    """Stand-in for the CloudFront client: invalidations are appended to a JSON lines file and
+    complete after `duration` seconds"""
+
+    def __init__(self, path=None, duration=0.0):
+        self.path = path
+        self.duration = duration
+        self.invalidations = []
+        self._lock = threading.Lock()
+
+    def create_invalidation(self, DistributionId, InvalidationBatch):
+        with self._lock:
+            for invalidation in self.invalidations:
+                if invalidation['InvalidationBatch']['CallerReference'] == InvalidationBatch['CallerReference']:
+                    return {'Invalidation': invalidation}
+            invalidation = {
+                'Id': f"LOCAL{len(self.invalidations) + 1:06d}",
+                'CreateTime': time.time(),
+                'DistributionId': DistributionId,
+                'InvalidationBatch': InvalidationBatch
+            }
+            self.invalidations.append(invalidation)
+            if self.path:
+                with open(self.path, 'a') as f:
+                    f.write(json.dumps(invalidation) + '\n')
+        return {'Invalidation': dict(invalidation, Status='InProgress')}
+
+    def list_invalidations(self, DistributionId, MaxItems='100'):
+        now = time.time()
+        with self._lock:
+            items = [{'Id': invalidation['Id'],
+                      'Status': 'InProgress' if now - invalidation['CreateTime'] < self.duration else 'Completed'}
+                     for invalidation in reversed(self.invalidations)]
+        items = items[:int(MaxItems)]
+        return {'InvalidationList': {'Items': items, 'Quantity': len(items)}}
+
+
+class CloudFrontInvalidationSink(Sink):
+    """One invalidation per batch for the distinct paths affected by the batch's changes
+
+    Paths are templates formatted with each changed item ('/prices?seriesId={SeriesId}*'); a
+    template the item cannot fill is skipped. The caller reference is derived from the paths and
+    the batch's last sequence number, so a retried batch does not create a second invalidation.
+    """
+
+    name = 'cdn'
+
+    def __init__(self, distribution_id, client=None, paths=None, max_in_progress=CDN_MAX_IN_PROGRESS):
+        self.distribution_id = distribution_id
+        self._client = client
+        self.paths = list(paths or CDN_INVALIDATION_PATHS)
+        self.max_in_progress = max_in_progress
+
+    @property
+    def client(self):
+        if self._client is None:
+            import botocore.session
+            self._client = botocore.session.get_session().create_client('cloudfront')
+        return self._client
+
+    def paths_for(self, changes):
+        paths = set()
+        for change in changes:
+            for images in (change.old, change.new):
+                if images is None:
+                    continue
+                for template in self.paths:
+                    try:
+                        paths.add(template.format_map(images))
+                    except (KeyError, ValueError):
+                        continue
+        if len(paths) > CDN_MAX_PATHS:
+            # Too many targeted paths: fall back to one wildcard per route
+            paths = {path.split('?')[0].rstrip('*') + '*' for path in paths}
+        return sorted(paths)
+
+    def in_progress(self):
+        response = self.client.list_invalidations(DistributionId=self.distribution_id, MaxItems='100')
+        return sum(1 for item in response['InvalidationList'].get('Items', []) if item['Status'] == 'InProgress')
+
+    def handle(self, changes):
+        paths = self.paths_for(changes)
+        if not paths:
+            return {'paths': 0, 'invalidations': 0}
+        if any('*' in path for path in paths) and self.in_progress() >= self.max_in_progress:
+            raise Backpressure(f"{self.max_in_progress} invalidations already in progress")
+        last_sequence = max((change.sequence for change in changes), key=sequence_number)
+        reference = hashlib.sha256(json.dumps([paths, last_sequence]).encode()).hexdigest()[:32]
+        self.client.create_invalidation(
+            DistributionId=self.distribution_id,
+            InvalidationBatch={'Paths': {'Quantity': len(paths), 'Items': paths}, 'CallerReference': reference}
+        )
+        return {'paths': len(paths), 'invalidations': 1}
+
+
+def create_sinks(names=STREAM_SINKS, dynamodb=None, cloudfront=None, distribution_id=CLOUDFRONT_DISTRIBUTION_ID):
+    """Sinks by name ('versions', 'aggregates', 'cdn', 'changelog'); 'cdn' needs a distribution ID"""
+    dynamodb = dynamodb or get_storage_backend()
+    sinks = []
+    for name in names:
+        if name == 'versions':
+            sinks.append(SeriesVersionSink(dynamodb))
+        elif name == 'aggregates':
+            sinks.append(SeriesAggregateSink(dynamodb))
+        elif name == 'changelog':
+            sinks.append(ChangeLogSink(dynamodb))
+        elif name == 'cdn':
+            if distribution_id:
+                sinks.append(CloudFrontInvalidationSink(distribution_id, cloudfront))
+            else:
+                print("CDN sink disabled: CLOUDFRONT_DISTRIBUTION_ID is not set")
+        else:
+            raise ValueError(f"Unknown stream sink: {name}")
+    return sinks
+
+
+# --- Processor ------------------------------------------------------------
+
+class SinkStats:
+    def __init__(self):
+        self.batches = 0
+        self.records = 0
+        self.changes = 0
+        self.skipped = 0
+        self.backpressure = 0
+        self.error_count = 0
+        self.errors = deque(maxlen=MAX_ERRORS)
+        self.elapsed = 0.0
+        self.counters = {}
+        self.checkpoint = None
+
+    def add(self, records, changes, result, elapsed):
+        self.batches += 1
+        self.records += records
+        self.changes += changes
+        self.elapsed += elapsed
+        for name, value in (result or {}).items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def error(self, e):
+        self.error_count += 1
+        self.errors.append(f"{type(e).__name__}: {e}")
+
+    def to_dict(self):
+        return {
+            'batches': self.batches,
+            'records': self.records,
+            'changes': self.changes,
+            'skipped': self.skipped,
+            'backpressure': self.backpressure,
+            'error_count': self.error_count,
+            'errors': list(self.errors),
+            'elapsed_ms': round(self.elapsed * 1000, 3),
+            'checkpoint': self.checkpoint,
+            **self.counters
+        }
+
+
+class StreamProcessor:
+    """Feeds parsed stream records to sinks in coalesced batches, checkpointing each sink"""
+
+    def __init__(self, sinks, checkpoints, batch_size=BATCH_SIZE, max_pending=MAX_PENDING_BATCHES):
+        self.sinks = sinks
+        self.checkpoints = checkpoints
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {sink.name: SinkStats() for sink in self.sinks}
+
+    def _deliver(self, sink, records, done):
+        """Coalesce one batch and hand it to a sink, skipping records up to its checkpoint `done`;
+        returns the sequence number the sink is now done through"""
+        stats = self.stats[sink.name]
+        pending = [record for record in records if sequence_number(record['sequence']) > sequence_number(done)]
+        stats.skipped += len(records) - len(pending)
+        if not pending:
+            return done
+        changes = coalesce(record for record in pending if sink.accepts(record))
+        start = time.perf_counter()
+        result = sink.handle(changes) if changes else {}
+        stats.add(len(pending), len(changes), result, time.perf_counter() - start)
+        stats.checkpoint = pending[-1]['sequence']
+        return stats.checkpoint
+
+    def process_batch(self, records, progress=None):
+        """Deliver records to every sink synchronously (Lambda), starting each sink after its
+        entry in `progress`. Returns (sequence number of the first record some sink did not
+        finish or None, {sink: done through})."""
+        progress = dict(progress or {})
+        failed_at = None
+        for sink in self.sinks:
+            for start in range(0, len(records), self.batch_size):
+                batch = records[start:start + self.batch_size]
+                try:
+                    progress[sink.name] = self._deliver(sink, batch, progress.get(sink.name))
+                    continue
+                except Backpressure as e:
+                    self.stats[sink.name].backpressure += 1
+                    print(f"Stream sink {sink.name} backpressure: {e}")
+                except Exception as e:
+                    self.stats[sink.name].error(e)
+                    print(f"Stream sink {sink.name} error: {e}")
+                if failed_at is None or sequence_number(batch[0]['sequence']) < sequence_number(failed_at):
+                    failed_at = batch[0]['sequence']
+                break
+        return failed_at, {name: done for name, done in progress.items() if done is not None}
+
+    def _worker(self, sink, inbox, scope):
+        stats = self.stats[sink.name]
+        done = stats.checkpoint = self.checkpoints.load(scope).get(sink.name)
+        failed = False
+        while True:
+            batch = inbox.get()
+            if batch is None:
+                return
+            wait = BACKPRESSURE_WAIT
+            while not failed:
+                try:
+                    sequence = self._deliver(sink, batch, done)
+                    if sequence != done:
+                        done = sequence
+                        self.checkpoints.save(scope, {sink.name: done})
+                    break
+                except Backpressure:
+                    stats.backpressure += 1
+                    time.sleep(wait)
+                    wait = min(wait * 2, BACKPRESSURE_MAX_WAIT)
+                except Exception as e:
+                    # Stop this sink at its checkpoint but keep draining so the others can proceed
+                    stats.error(e)
+                    failed = True
+
+    def run(self, records, scope):
+        """Replay an iterable of parsed records through every sink concurrently (local). Each sink
+        has a bounded queue; the reader blocks while the slowest sink's queue is full."""
+        inboxes = {sink.name: queue.Queue(maxsize=self.max_pending) for sink in self.sinks}
+        workers = [threading.Thread(target=self._worker, args=(sink, inboxes[sink.name], scope), daemon=True)
+                   for sink in self.sinks]
+        for worker in workers:
+            worker.start()
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) == self.batch_size:
+                for inbox in inboxes.values():
+                    inbox.put(batch)
+                batch = []
+        for inbox in inboxes.values():
+            if batch:
+                inbox.put(batch)
+            inbox.put(None)
+        for worker in workers:
+            worker.join()
+        return {name: stats.to_dict() for name, stats in self.stats.items()}
+
+
+def read_stream_file(path):
+    """Parsed records from a JSON lines file of DynamoDB Streams records"""
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield parse_record(json.loads(line))
+
+
+_processor = None
+
+
+def get_processor():
+    global _processor
+    if _processor is None:
+        dynamodb = get_storage_backend()
+        _processor = StreamProcessor(create_sinks(dynamodb=dynamodb), TableCheckpointStore(dynamodb))
+    return _processor
+
+
+def lambda_handler(event, context):
+    """DynamoDB Streams trigger (configure FunctionResponseTypes=ReportBatchItemFailures)
+
+    A batch that a sink could not finish is reported from its first unfinished record, so Lambda
+    retries from there. Sink progress is checkpointed under that sequence number; on the retry,
+    sinks that already handled a record skip it.
+    """
+    records = [parse_record(record) for record in event.get('Records', [])]
+    if not records:
+        return {'batchItemFailures': []}
+    processor = get_processor()
+    processor.reset_stats()  # the processor outlives the invocation: log this batch's stats only
+    scope = f"resume#{records[0]['sequence']}"
+    resumed = processor.checkpoints.load(scope)
+    failed_at, progress = processor.process_batch(records, resumed)
+    if failed_at is not None:
+        processor.checkpoints.save(f"resume#{failed_at}", progress)
+    if resumed and failed_at != records[0]['sequence']:
+        processor.checkpoints.clear(scope)
+    print(json.dumps({'records': len(records), 'failedAt': failed_at,
+                      'sinks': {name: stats.to_dict() for name, stats in processor.stats.items()}}))
+    return {'batchItemFailures': [{'itemIdentifier': failed_at}] if failed_at is not None else []}
@@ -23,6 +23,16 @@ def generate_signature(app_id, device_id, timestamp, payload, secret):
     signature = hmac.new(secret.encode(), message.encode(), hashlib.sha256).digest()
     return base64.b64encode(signature).decode()
 
+def parse_server_timing(header):
+    """Parse a Server-Timing header into {metric: milliseconds}"""
+    timings = {}
+    for entry in header.split(','):
+        parts = [p.strip() for p in entry.split(';')]
+        for part in parts[1:]:
+            if part.startswith('dur='):
+                timings[parts[0]] = float(part[4:])
+    return timings
+
 def detailed_performance_test(num_tests=20):
     """Run detailed performance analysis"""
     
@@ -37,6 +47,7 @@ def detailed_performance_test(num_tests=20):
     ttfb_times = []  # Time to first byte
     download_times = []
     lambda_durations = []
+    server_timings = []  # Measured Lambda phases (requires SERVER_TIMING=true on the function)
     
     for i in range(num_tests):
         timestamp = int(time.time())
@@ -66,6 +77,9 @@ def detailed_performance_test(num_tests=20):
             if 'x-amzn-RequestId' in response.headers:
                 lambda_durations.append(total_ms)  # Approximate
             
+            if 'Server-Timing' in response.headers:
+                server_timings.append(parse_server_timing(response.headers['Server-Timing']))
+            
             print(f"Test {i+1:2d}: {total_ms:6.2f}ms - Status {response.status_code}")
             
             time.sleep(0.3)  # Small delay between tests
@@ -98,6 +112,17 @@ def detailed_performance_test(num_tests=20):
         print(f"  P99:        {p99:.2f}ms")
         print()
         
+        # Measured breakdown from the Lambda's Server-Timing header
+        if server_timings:
+            lambda_total = statistics.mean(t.get('total', 0) for t in server_timings)
+            print(f"Measured Lambda Breakdown ({len(server_timings)} responses with Server-Timing):")
+            for metric in ['sig', 'rl-check', 'rl-update', 'query', 'deser', 'ser', 'total']:
+                values = [t[metric] for t in server_timings if metric in t]
+                if values:
+                    print(f"  {metric:<10} avg {statistics.mean(values):8.2f}ms   max {max(values):8.2f}ms")
+            print(f"  Outside Lambda (network + API Gateway): ~{avg - lambda_total:.2f}ms")
+            print()
+        
         # Breakdown estimate
         print("Estimated Time Breakdown:")
         print(f"  1. Network latency (round-trip):    ~50-100ms")
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Query Cache Benchmark
+Exercises the two-tier query cache (lambda/query_cache.py) with each L2: none, /tmp on disk,
+and a Redis-protocol server (the local stand-in). Several workers (separate L1s) share one L2,
+as Lambda containers or ASGI worker processes would, and a restart replaces every L1, so the
+report shows what each tier serves and what a lookup costs. A second part hammers one hot key
+that keeps expiring, with and without probabilistic early expiration and stale-while-
+revalidate, and counts how many loads overlap and how many reads wait for one. A third part
+fails the backend for a while and counts failed lookups and stale answers.
+
+Usage:
+    python3 scripts/benchmark-cache.py
+    python3 scripts/benchmark-cache.py --workers 4 --lookups 20000 --keys 500 --load-ms 5
+    python3 scripts/benchmark-cache.py --stampede-seconds 5 --threads 32 --ttl 0.5
+    python3 scripts/benchmark-cache.py --outage-seconds 6
+"""
+
+import argparse
+import contextlib
+import io
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from local_api import IP_CHARACTERS, create_local_backend
+from latency_histogram import LatencyHistogram
+
+import query_cache  # noqa: E402  (lambda/ is put on sys.path by local_api)
+from local_redis import LocalRedisServer  # noqa: E402
+from price_query_handler import query_prices  # noqa: E402
+
+
+def sample_values(backend, keys):
+    """Realistic cached values: item query results of the local catalog, one per key"""
+    results = [query_prices(backend, ip_character=ip, limit=50)
+               for ip in IP_CHARACTERS]
+    return [results[i % len(results)] for i in range(keys)]
+
+
+def run_workload(workers, values, lookups, load_ms, ttl, seed):
+    """Zipf-like lookups spread over the workers; returns (lookup histogram, loads)"""
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(values))]
+    keys = rng.choices(range(len(values)), weights=weights, k=lookups)
+    histogram = LatencyHistogram()
+    loads = [0]
+
+    def loader(index):
+        loads[0] += 1
+        time.sleep(load_ms / 1000)
+        return values[index]
+
+    for i, index in enumerate(keys):
+        cache = workers[i % len(workers)]
+        start = time.perf_counter()
+        cache.get_or_load(f"/prices?key={index}", lambda: loader(index), ttl)
+        histogram.record((time.perf_counter() - start) * 1_000_000)
+    return histogram, loads[0]
+
+
+def tier_report(name, workers, histogram, loads, lookups):
+    hits = {'l1': 0, 'l2': 0}
+    for cache in workers:
+        summary = cache.summary()
+        for tier in hits:
+            hits[tier] += summary[tier]['hits']
+    s = histogram.summary_ms()
+    print(f"  {name:<22} L1 {hits['l1'] / lookups:6.1%}  L2 {hits['l2'] / lookups:6.1%}  "
+          f"loads {loads:>6}  mean {s['mean']:7.3f}ms  p50 {s['p50']:7.3f}ms  p99 {s['p99']:7.3f}ms")
+
+
+def stampede(workers, threads, seconds, ttl, stale_ttl, load_ms):
+    """Threads spread over the workers read one hot key; returns (loads, max overlapping loads, slow reads)"""
+    state = {'loads': 0, 'running': 0, 'max_running': 0, 'slow': 0, 'reads': 0}
+    lock = threading.Lock()
+
+    def loader():
+        with lock:
+            state['loads'] += 1
+            state['running'] += 1
+            state['max_running'] = max(state['max_running'], state['running'])
+        time.sleep(load_ms / 1000)
+        with lock:
+            state['running'] -= 1
+        return {'hot': True}
+
+    # Filled once before the readers start, so only expiries are counted
+    workers[0].get_or_load('/prices?hot', loader, ttl, stale_ttl)
+    state['loads'] = state['max_running'] = 0
+    deadline = time.monotonic() + seconds
+
+    def reader(cache):
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            cache.get_or_load('/prices?hot', loader, ttl, stale_ttl)
+            slow = time.perf_counter() - start >= load_ms / 2000
+            with lock:
+                state['reads'] += 1
+                state['slow'] += slow
+            time.sleep(0.001)
+
+    pool = [threading.Thread(target=reader, args=(workers[i % len(workers)],)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    time.sleep(load_ms / 1000 * 2)  # background refreshes still running
+    return state
+
+
+def outage(cache, values, seconds, ttl, stale_ttl, load_ms, seed):
+    """Lookups for `seconds`, the backend failing (after a timeout) in the middle third
+
+    Returns (lookup histogram, failed lookups, stale answers during the outage).
+    """
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(values))]
+    histogram = LatencyHistogram()
+    start = time.monotonic()
+    failed = stale = 0
+
+    def loader(index):
+        time.sleep(load_ms / 1000)
+        if seconds / 3 <= time.monotonic() - start < 2 * seconds / 3:
+            time.sleep(load_ms * 3 / 1000)
+            raise ConnectionError('backend unavailable')
+        return values[index]
+
+    while time.monotonic() - start < seconds:
+        index = rng.choices(range(len(values)), weights=weights)[0]
+        lookup_start = time.perf_counter()
+        try:
+            _, _, state = cache.get_or_load(f"/prices?key={index}", lambda: loader(index), ttl, stale_ttl)
+            stale += state == 'error'
+        except ConnectionError:
+            failed += 1
+        histogram.record((time.perf_counter() - lookup_start) * 1_000_000)
+        time.sleep(0.001)
+    return histogram, failed, stale
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4, help='Processes sharing the L2 (one L1 each)')
+    parser.add_argument('--lookups', type=int, default=5000)
+    parser.add_argument('--keys', type=int, default=300, help='Distinct queries')
+    parser.add_argument('--load-ms', type=float, default=5.0, help='Cost of a miss (query round trips)')
+    parser.add_argument('--l1-entries', type=int, default=64, help='L1 size per worker')
+    parser.add_argument('--stampede-seconds', type=float, default=3.0)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--ttl', type=float, default=0.5, help='TTL of the hot key in the stampede run')
+    parser.add_argument('--outage-seconds', type=float, default=3.0, help='Run length; the backend fails for a third')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    values = sample_values(create_local_backend(num_series=60, items_per_series=12), args.keys)
+    directory = tempfile.mkdtemp(prefix='ppmt-amp-cache-')
+    redis = LocalRedisServer().start()
+    l2_options = [
+        ('memory only', lambda: None),
+        ('memory + disk', lambda: query_cache.DiskTier(directory)),
+        ('memory + redis', lambda: query_cache.RedisTier(redis.url))
+    ]
+
+    print("=" * 70)
+    print(f"TIERS ({args.workers} workers, {args.lookups} lookups over {args.keys} keys, "
+          f"L1 {args.l1_entries} entries, miss {args.load_ms:g}ms)")
+    print("=" * 70)
+    try:
+        for name, create_l2 in l2_options:
+            l2 = create_l2()
+            workers = [query_cache.TieredCache(query_cache.MemoryTier(args.l1_entries), l2)
+                       for _ in range(args.workers)]
+            histogram, loads = run_workload(workers, values, args.lookups, args.load_ms, 600, args.seed)
+            tier_report(name, workers, histogram, loads, args.lookups)
+            # Restart: new processes (empty L1s), same L2
+            workers = [query_cache.TieredCache(query_cache.MemoryTier(args.l1_entries), l2)
+                       for _ in range(args.workers)]
+            histogram, loads = run_workload(workers, values, args.lookups, args.load_ms, 600, args.seed + 1)
+            tier_report('  after restart', workers, histogram, loads, args.lookups)
+
+        print()
+        print("=" * 70)
+        print(f"HOT KEY ({args.threads} threads on {args.workers} workers, TTL {args.ttl:g}s, "
+              f"load {args.load_ms:g}ms, {args.stampede_seconds:g}s)")
+        print("=" * 70)
+        beta = query_cache.BETA or 1.0
+        modes = [('expire at TTL', 0.0, args.ttl), ('early expiration', beta, args.ttl),
+                 ('stale-while-revalidate', 0.0, args.ttl * 4)]
+        for label, mode_beta, stale_ttl in modes:
+            l2 = query_cache.RedisTier(redis.url)
+            l2.command('FLUSHALL')
+            workers = [query_cache.TieredCache(query_cache.MemoryTier(), l2, beta=mode_beta)
+                       for _ in range(args.workers)]
+            state = stampede(workers, args.threads, args.stampede_seconds, args.ttl, stale_ttl, args.load_ms)
+            expiries = args.stampede_seconds / args.ttl
+            mark = '✓' if state['max_running'] <= 1 else '⚠️'
+            print(f"  {mark} {label:<22} loads {state['loads']:>4} ({state['loads'] / expiries:4.1f} per TTL)  "
+                  f"max overlapping {state['max_running']:>2}  reads waiting {state['slow']}/{state['reads']}")
+
+        print()
+        print("=" * 70)
+        print(f"BACKEND OUTAGE ({args.outage_seconds:g}s, failing for the middle third, TTL 0.2s, 50 keys)")
+        print("=" * 70)
+        modes = [('no stale serving', 0.2, 0.0), ('stale TTL 1s + stale-if-error', 1.0, query_cache.STALE_IF_ERROR)]
+        for label, stale_ttl, stale_if_error in modes:
+            cache = query_cache.TieredCache(query_cache.MemoryTier(), stale_if_error=stale_if_error)
+            # The cache's log lines (load errors, stale answers) are captured, not printed
+            with contextlib.redirect_stdout(io.StringIO()):
+                histogram, failed, stale = outage(cache, values[:50], args.outage_seconds, 0.2, stale_ttl,
+                                                  args.load_ms, args.seed)
+            s = histogram.summary_ms()
+            mark = '✓' if not failed else '✗'
+            print(f"  {mark} {label:<30} failed {failed:>5}  stale answers {stale:>5}  "
+                  f"p50 {s['p50']:7.3f}ms  p99 {s['p99']:7.3f}ms")
+    finally:
+        redis.stop()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Cold Start Benchmark
+Measures the Lambda handler's cold-start cost in fresh interpreter processes:
+module import time, init duration (storage client creation and warm-up) and the first
+request. Fails when a budget is exceeded, a baseline regresses, or a module that must stay
+lazy (boto3, sqlite3, the local backend, ...) is imported at module load.
+
+Usage:
+    python3 scripts/benchmark-cold-start.py --runs 20 --max-import-ms 80
+    python3 scripts/benchmark-cold-start.py --save-baseline cold-start.json
+    python3 scripts/benchmark-cold-start.py --compare cold-start.json --threshold 15
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda')
+
+# Modules that must not be loaded just by importing the handler
+LAZY_MODULES = ['boto3', 'botocore', 'sqlite3', 'local_dynamodb', 'local_redis', 'asyncio', 'urllib.request', 'email',
+                'concurrent.futures']
+
+# Runs inside a fresh interpreter; prints one JSON line of measurements
+PROBE = r'''
+import sys, time
+sys.path.insert(0, {lambda_dir!r})
+t0 = time.perf_counter()
+import price_query_handler as handler
+t1 = time.perf_counter()
+loaded_lazy = sorted(m for m in {lazy_modules!r} if m in sys.modules)
+handler.initialize()
+t2 = time.perf_counter()
+sys.path.insert(0, {scripts_dir!r})
+from local_api import build_event
+event = build_event('/prices', {{'limit': '50'}}, 'cold-start-probe')
+t3 = time.perf_counter()
+response = handler.lambda_handler(event, None)
+t4 = time.perf_counter()
+import json
+print(json.dumps({{
+    'import_ms': (t1 - t0) * 1000,
+    'init_ms': (t2 - t1) * 1000,
+    'first_request_ms': (t4 - t3) * 1000,
+    'status': response['statusCode'],
+    'loaded_lazy': loaded_lazy
+}}))
+'''
+
+
+def run_probe(env):
+    """Run the probe in a fresh interpreter; returns (measurements, importtime lines)"""
+    code = PROBE.format(lambda_dir=LAMBDA_DIR, scripts_dir=os.path.dirname(os.path.abspath(__file__)),
+                        lazy_modules=LAZY_MODULES)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        raise RuntimeError(f"Probe failed:\n{result.stderr[-2000:]}")
+    measurements = json.loads(result.stdout.strip().splitlines()[-1])
+    return measurements, [line for line in result.stderr.splitlines() if line.startswith('import time:')]
+
+
+def top_imports(importtime_lines, count=12):
+    """Slowest modules by cumulative import time (microseconds) under the handler import"""
+    entries = []
+    for line in importtime_lines[1:]:
+        parts = line.split('|')
+        try:
+            cumulative = int(parts[1])
+        except (IndexError, ValueError):
+            continue
+        entries.append((cumulative, parts[2].rstrip()))
+        # -X importtime lists children before their parent; stop at the handler itself
+        if parts[2].strip() == 'price_query_handler':
+            break
+    return sorted(entries, reverse=True)[:count]
+
+
+def summarize(samples, key):
+    values = sorted(s[key] for s in samples)
+    return {
+        'median': statistics.median(values),
+        'p90': values[min(len(values) - 1, int(len(values) * 0.9))],
+        'min': values[0],
+        'max': values[-1]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=15)
+    parser.add_argument('--backend', choices=['local', 'dynamodb'], default='local',
+                        help="Storage backend for init ('dynamodb' needs botocore and AWS credentials)")
+    parser.add_argument('--max-import-ms', type=float, help='Budget for median module import time')
+    parser.add_argument('--max-init-ms', type=float, help='Budget for median import + init time')
+    parser.add_argument('--save-baseline', metavar='PATH')
+    parser.add_argument('--compare', metavar='PATH')
+    parser.add_argument('--threshold', type=float, default=15.0,
+                        help='Percent slowdown of a median treated as a regression')
+    args = parser.parse_args()
+
+    env = dict(os.environ, STORAGE_BACKEND=args.backend, EAGER_INIT='false', METRICS_MODE='off')
+    samples = []
+    importtime_lines = []
+    for run in range(args.runs):
+        measurements, lines = run_probe(env)
+        samples.append(measurements)
+        if run == 0:
+            importtime_lines = lines
+
+    summary = {key: summarize(samples, key) for key in ('import_ms', 'init_ms', 'first_request_ms')}
+    summary['import_plus_init_ms'] = summarize(
+        [{'v': s['import_ms'] + s['init_ms']} for s in samples], 'v')
+
+    print("=" * 70)
+    print(f"COLD START ({args.runs} fresh interpreters, backend={args.backend})")
+    print("=" * 70)
+    for key, stats in summary.items():
+        print(f"  {key:<22} median {stats['median']:8.2f}ms  p90 {stats['p90']:8.2f}ms  "
+              f"min {stats['min']:8.2f}ms  max {stats['max']:8.2f}ms")
+    print("\nSlowest imports (cumulative, first run):")
+    for cumulative, module in top_imports(importtime_lines):
+        print(f"  {cumulative / 1000:8.2f}ms  {module}")
+
+    failures = []
+    loaded_lazy = sorted({m for s in samples for m in s['loaded_lazy']})
+    if loaded_lazy:
+        failures.append(f"modules loaded at import time that must stay lazy: {', '.join(loaded_lazy)}")
+    if args.max_import_ms is not None and summary['import_ms']['median'] > args.max_import_ms:
+        failures.append(f"import median {summary['import_ms']['median']:.2f}ms > budget {args.max_import_ms}ms")
+    if args.max_init_ms is not None and summary['import_plus_init_ms']['median'] > args.max_init_ms:
+        failures.append(f"import+init median {summary['import_plus_init_ms']['median']:.2f}ms "
+                        f"> budget {args.max_init_ms}ms")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nComparison with {args.compare}:")
+        for key, stats in summary.items():
+            before = baseline['summary'][key]['median']
+            after = stats['median']
+            change = (after - before) / before * 100 if before else 0.0
+            flag = 'REGRESSION ⚠️' if change > args.threshold else ''
+            print(f"  {key:<22} {before:8.2f} -> {after:8.2f}ms  {change:+6.1f}%  {flag}")
+            if change > args.threshold:
+                failures.append(f"{key} median regressed {change:.1f}% (threshold {args.threshold:.0f}%)")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'backend': args.backend,
+                       'runs': args.runs, 'summary': summary}, f, indent=2)
+        print(f"\n✓ Baseline saved to {args.save_baseline}")
+
+    if failures:
+        print()
+        for failure in failures:
+            print(f"✗ {failure}")
+        sys.exit(1)
+    print("\n✓ Cold start within budget")
+
+
+if __name__ == '__main__':
+    main()
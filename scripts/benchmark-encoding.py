@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Response Encoding Benchmark
+Encodes and decodes /prices responses of several sizes, taken from the seeded local
+PPMT-AMP-Items table, in every encoding the handler can send (lambda/response_encoding.py):
+JSON as it is sent today, the rows schema as JSON (the key table and typed values alone),
+MessagePack with one map per item (the binary format alone), and MessagePack and CBOR in the
+rows schema. Reports the body size, raw and gzip-compressed, and the median encode and decode
+time; decoding includes rebuilding the items as dicts.
+
+Usage:
+    python3 scripts/benchmark-encoding.py
+    python3 scripts/benchmark-encoding.py --sizes 50 500 --iterations 500
+"""
+
+import argparse
+import gzip
+import json
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from local_api import create_local_backend
+
+# lambda/ is put on sys.path by local_api
+os.environ.setdefault('METRICS_MODE', 'off')
+import price_query_handler as handler  # noqa: E402
+import response_encoding as encoding  # noqa: E402
+
+# Name -> (encode, decode); each decode returns the payload with items as dicts
+ENCODINGS = {
+    'json': (lambda p: json.dumps(p, default=str).encode(), json.loads),
+    'json rows': (lambda p: json.dumps(encoding.to_rows(p)).encode(), lambda b: encoding.from_rows(json.loads(b))),
+    'msgpack maps': (lambda p: encoding.pack_msgpack(encoding.from_rows(encoding.to_rows(p))), encoding.unpack_msgpack),
+    'msgpack rows': (lambda p: encoding.encode(p, 'msgpack'), lambda b: encoding.decode(b, 'msgpack')),
+    'cbor rows': (lambda p: encoding.encode(p, 'cbor'), lambda b: encoding.decode(b, 'cbor')),
+}
+
+
+def response_payload(items):
+    """The handler's response payload around a list of items"""
+    return {
+        'success': True,
+        'message': 'Query successful',
+        'data': items,
+        'rateLimitRemaining': 19,
+        'rateLimitReset': datetime.utcnow() + timedelta(seconds=handler.RATE_LIMIT_WINDOW)
+    }
+
+
+def median_us(func, arg, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func(arg)
+        samples.append((time.perf_counter() - start) * 1_000_000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 200, 500], help='Items per response')
+    parser.add_argument('--iterations', type=int, default=200, help='Encodes and decodes timed per size')
+    parser.add_argument('--series', type=int, default=60, help='Synthetic series')
+    parser.add_argument('--items-per-series', type=int, default=12)
+    args = parser.parse_args()
+
+    backend = create_local_backend(args.series, args.items_per_series)
+    codecs = (f"msgpack {'C extension' if encoding.msgpack else 'pure Python'}, "
+              f"cbor {'C extension' if encoding.cbor2 else 'pure Python'}")
+    print("=" * 70)
+    print(f"RESPONSE ENCODING BENCHMARK ({codecs}; {args.iterations} iterations)")
+    print("=" * 70)
+
+    failures = 0
+    for size in args.sizes:
+        items = handler.query_prices(backend, limit=size)
+        payload = response_payload(items)
+        # What the binary encodings should decode to: typed values, absent fields left out
+        expected = encoding.from_rows(encoding.to_rows(payload))
+        print()
+        print(f"{len(items)} items")
+        print(f"  {'encoding':<14} {'bytes':>9} {'gzip':>8} {'encode':>11} {'decode':>11}")
+        baseline = None
+        for name, (encode, decode) in ENCODINGS.items():
+            body = encode(payload)
+            decoded = decode(body)
+            if name != 'json' and decoded['data'] != expected['data']:
+                failures += 1
+                print(f"  ✗ {name}: decoded items differ from the response")
+            compressed = len(gzip.compress(body, mtime=0))
+            encode_us = median_us(encode, payload, args.iterations)
+            decode_us = median_us(decode, body, args.iterations)
+            if baseline is None:
+                baseline = (len(body), compressed)
+            print(f"  {name:<14} {len(body):>9,} {compressed:>8,} {encode_us:>9.0f}µs {decode_us:>9.0f}µs"
+                  f"  ({len(body) / baseline[0]:.0%} / {compressed / baseline[1]:.0%} of JSON)")
+
+    print()
+    if failures:
+        print(f"✗ {failures} encoding(s) did not round-trip")
+        raise SystemExit(1)
+    print("✓ Every binary encoding decodes to the response's items")
+
+
+if __name__ == '__main__':
+    main()
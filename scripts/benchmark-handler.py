@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+In-Process Handler Benchmark
+Drives lambda_handler with signed API Gateway events against the local storage backend
+(no network) and reports per-phase latency percentiles. Baselines can be saved and
+compared to flag regressions. --round-trip-ms adds a simulated network round trip to every
+storage call, so sequential and concurrent (--concurrent) execution can be compared. The
+query results cache is off unless --cache is given, so every request runs its query.
+
+Usage:
+    python3 scripts/benchmark-handler.py --iterations 2000 --save-baseline bench.json
+    python3 scripts/benchmark-handler.py --compare bench.json --threshold 10
+    python3 scripts/benchmark-handler.py --round-trip-ms 5 --iterations 200
+    python3 scripts/benchmark-handler.py --round-trip-ms 5 --iterations 200 --concurrent
+    python3 scripts/benchmark-handler.py --round-trip-ms 5 --iterations 200 --cache
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+
+from local_api import build_event, create_local_backend
+from latency_histogram import LatencyHistogram
+
+# lambda/ is put on sys.path by local_api
+os.environ.setdefault('METRICS_MODE', 'off')
+import metrics  # noqa: E402
+import price_query_handler as handler  # noqa: E402
+from storage_backend import get_storage_backend, set_storage_backend  # noqa: E402
+
+PHASES = ['signature', 'replay_check', 'rate_limit_check', 'rate_limit_update', 'version_check', 'cache', 'query',
+          'deserialize', 'serialize', 'total']
+
+# Phase -> field in the handler's metrics record (milliseconds)
+PHASE_METRICS = {
+    'signature': 'SignatureMs',
+    'replay_check': 'ReplayCheckMs',
+    'rate_limit_check': 'RateLimitCheckMs',
+    'rate_limit_update': 'RateLimitUpdateMs',
+    'version_check': 'VersionCheckMs',
+    'cache': 'CacheMs',
+    'query': 'QueryMs',
+    'deserialize': 'DeserializeMs',
+    'serialize': 'SerializeMs'
+}
+
+# Scenario name -> (path, extra query parameters)
+SCENARIOS = {
+    'prices-by-series': ('/prices', {'seriesId': 'SERIES-LABUBU-001', 'limit': '50'}),
+    'prices-by-ip': ('/prices', {'ipCharacter': 'Hirono', 'limit': '50'}),
+    'prices-by-category': ('/prices', {'category': 'Blind Box', 'limit': '50'}),
+    'prices-scan-filter': ('/prices', {'rarity': 'Secret', 'limit': '200'}),
+    'series-list': ('/series', {'limit': '50'}),
+    'series-by-ip': ('/series', {'ipCharacter': 'Molly', 'limit': '50'}),
+}
+
+
+class RoundTripBackend:
+    """Storage backend wrapper sleeping `seconds` before every call, like a network round trip"""
+
+    def __init__(self, backend, seconds):
+        self.backend = backend
+        self.seconds = seconds
+        self.exceptions = backend.exceptions
+
+    def __getattr__(self, name):
+        operation = getattr(self.backend, name)
+        if not callable(operation):
+            return operation
+
+        def call(*args, **kwargs):
+            time.sleep(self.seconds)
+            return operation(*args, **kwargs)
+        return call
+
+
+class MetricsCollector:
+    """Metrics sink keeping the handler's record for the most recent request"""
+
+    def __init__(self):
+        self.last = None
+
+    def __call__(self, record):
+        self.last = record
+
+
+def run_scenario(name, iterations, warmup, collector):
+    """Invoke the handler repeatedly and collect per-phase histograms"""
+    path, params = SCENARIOS[name]
+    # Rotate device IDs so no device crosses the per-window rate limit
+    devices = (warmup + iterations) // (handler.RATE_LIMIT_MAX_REQUESTS - 1) + 1
+    histograms = {phase: LatencyHistogram() for phase in PHASES}
+    status_codes = {}
+    # Each round over the devices signs one second earlier, so no request repeats a signature
+    # (the handler rejects replays within the timestamp window)
+    now = int(time.time())
+
+    for i in range(warmup + iterations):
+        event = build_event(path, params, f"bench-{name}-{i % devices}", timestamp=now - i // devices)
+        start = time.perf_counter()
+        response = handler.lambda_handler(event, None)
+        elapsed = time.perf_counter() - start
+        if i < warmup:
+            continue
+        status_codes[response['statusCode']] = status_codes.get(response['statusCode'], 0) + 1
+        # Phase timings come from the handler's own instrumentation (metrics.py)
+        record = collector.last
+        for phase in PHASES[:-1]:
+            histograms[phase].record(record.get(PHASE_METRICS[phase], 0.0) * 1000)
+        histograms['total'].record(elapsed * 1_000_000)
+
+    return histograms, status_codes
+
+
+def print_report(results):
+    print("=" * 96)
+    print("PER-PHASE LATENCY (ms)")
+    print("=" * 96)
+    for name, (histograms, status_codes) in results.items():
+        print(f"\n{name}  status={status_codes}")
+        print(f"  {'phase':<18} {'mean':>9} {'p50':>9} {'p90':>9} {'p95':>9} {'p99':>9} {'p99.9':>9} {'max':>9}")
+        for phase in PHASES:
+            s = histograms[phase].summary_ms()
+            print(f"  {phase:<18} {s['mean']:9.3f} {s['p50']:9.3f} {s['p90']:9.3f} {s['p95']:9.3f} "
+                  f"{s['p99']:9.3f} {s['p99.9']:9.3f} {s['max']:9.3f}")
+        print("\n  total distribution:")
+        print(histograms['total'].ascii_chart())
+
+
+def save_baseline(path, results, args):
+    data = {
+        'created': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'config': {
+            'iterations': args.iterations,
+            'series': args.series,
+            'items_per_series': args.items_per_series,
+            'seed': args.seed
+        },
+        'scenarios': {
+            name: {phase: histogram.to_dict() for phase, histogram in histograms.items()}
+            for name, (histograms, _) in results.items()
+        }
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+    print(f"\n✓ Baseline saved to {path}")
+
+
+def compare_baseline(path, results, threshold):
+    """Compare p50/p95 against a saved baseline; returns the list of regressions"""
+    with open(path) as f:
+        baseline = json.load(f)
+
+    print("\n" + "=" * 96)
+    print(f"COMPARISON WITH BASELINE {path} (threshold {threshold:.0f}%)")
+    print("=" * 96)
+    regressions = []
+    for name, (histograms, _) in results.items():
+        if name not in baseline['scenarios']:
+            print(f"{name}: not in baseline, skipped")
+            continue
+        for phase in PHASES:
+            old = LatencyHistogram.from_dict(baseline['scenarios'][name][phase])
+            new = histograms[phase]
+            for percent in (50, 95):
+                before = old.percentile(percent) / 1000
+                after = new.percentile(percent) / 1000
+                # Ignore sub-10µs phases where timer noise dominates
+                if before < 0.01:
+                    continue
+                change = (after - before) / before * 100
+                flag = ''
+                if change > threshold:
+                    flag = 'REGRESSION ⚠️'
+                    regressions.append((name, phase, percent, before, after, change))
+                elif change < -threshold:
+                    flag = 'improved ✓'
+                print(f"  {name:<20} {phase:<18} p{percent:<3} {before:9.3f} -> {after:9.3f}ms  {change:+7.1f}%  {flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--warmup', type=int, default=50)
+    parser.add_argument('--series', type=int, default=60)
+    parser.add_argument('--items-per-series', type=int, default=12)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='Scenario to run (repeatable, default: all)')
+    parser.add_argument('--save-baseline', metavar='PATH')
+    parser.add_argument('--compare', metavar='PATH')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='Percent slowdown of p50/p95 treated as a regression')
+    parser.add_argument('--round-trip-ms', type=float, default=0.0,
+                        help='Simulated network round trip added to every storage call')
+    parser.add_argument('--concurrent', action='store_true',
+                        help='Run the data query in parallel with rate limiting (CONCURRENT_QUERY)')
+    parser.add_argument('--cache', action='store_true', help='Serve repeated queries from the query cache')
+    args = parser.parse_args()
+
+    create_local_backend(args.series, args.items_per_series, args.seed)
+    print(f"Seeded {args.series} series x {args.items_per_series} items into local backend")
+    if args.round_trip_ms:
+        set_storage_backend(RoundTripBackend(get_storage_backend(), args.round_trip_ms / 1000))
+        print(f"Simulating a {args.round_trip_ms:g}ms round trip per storage call")
+    handler.CONCURRENT_QUERY = args.concurrent
+    handler.QUERY_CACHE = args.cache
+
+    collector = MetricsCollector()
+    metrics.add_sink(collector)
+
+    results = {}
+    for name in args.scenario or SCENARIOS:
+        print(f"Running {name} ({args.iterations} iterations)...")
+        results[name] = run_scenario(name, args.iterations, args.warmup, collector)
+
+    print_report(results)
+
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results, args)
+
+    if args.compare:
+        regressions = compare_baseline(args.compare, results, args.threshold)
+        if regressions:
+            print(f"\n✗ {len(regressions)} regression(s) above {args.threshold:.0f}%")
+            sys.exit(1)
+        print("\n✓ No regressions")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Signature Verification Benchmark
+Measures request signature verifications per second: the previous per-request HMAC
+(secret re-encoded, HMAC rebuilt, result base64-encoded and compared as text) against the
+key ring's precomputed HMAC states, with one key and during a rotation with several active
+keys (with and without the client naming its key).
+
+Usage:
+    python3 scripts/benchmark-signatures.py
+    python3 scripts/benchmark-signatures.py --iterations 500000 --keys 3
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import time
+
+from local_api import APP_ID, APP_SECRET, generate_signature
+
+from key_ring import KeyRing  # noqa: E402  (lambda/ is put on sys.path by local_api)
+
+DEVICE_ID = 'bench-device-0001'
+PAYLOAD = 'GET:/prices'
+
+
+def legacy_verify(app_id, device_id, timestamp, payload, signature, secret=APP_SECRET):
+    """verify_signature as it was before the key ring"""
+    message = f"{app_id}:{device_id}:{timestamp}:{payload}"
+    expected_signature = hmac.new(secret.encode(), message.encode(), hashlib.sha256).digest()
+    return hmac.compare_digest(signature, base64.b64encode(expected_signature).decode())
+
+
+def rotation_ring(keys):
+    """Ring whose newest key is APP_SECRET, preceded by `keys - 1` older keys still active"""
+    entries = [{'keyId': f"k{i}", 'secret': f"retiring-secret-{i}"} for i in range(keys - 1)]
+    entries.append({'keyId': 'current', 'secret': APP_SECRET})
+    return KeyRing.from_config({APP_ID: entries}, source='benchmark')
+
+
+def measure(verify, iterations, repeats=5):
+    """Verifications per second of verify(): best of `repeats` runs of `iterations` calls"""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            verify()
+        best = min(best, time.perf_counter() - start)
+    return iterations / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=100000)
+    parser.add_argument('--repeats', type=int, default=5, help='Runs per case; the fastest is reported')
+    parser.add_argument('--keys', type=int, default=3, help='Active keys of the app during rotation')
+    args = parser.parse_args()
+
+    timestamp = str(int(time.time()))
+    signature = generate_signature(APP_ID, DEVICE_ID, timestamp, PAYLOAD)
+    forged = generate_signature(APP_ID, DEVICE_ID, timestamp, PAYLOAD, secret='wrong-secret')
+    retiring = generate_signature(APP_ID, DEVICE_ID, timestamp, PAYLOAD, secret='retiring-secret-0')
+    single = rotation_ring(1)
+    rotating = rotation_ring(args.keys)
+
+    assert legacy_verify(APP_ID, DEVICE_ID, timestamp, PAYLOAD, signature)
+    assert single.verify(APP_ID, DEVICE_ID, timestamp, PAYLOAD, signature) == 'current'
+    assert rotating.verify(APP_ID, DEVICE_ID, timestamp, PAYLOAD, signature) == 'current'
+    assert rotating.verify(APP_ID, DEVICE_ID, timestamp, PAYLOAD, forged) is None
+    if args.keys > 1:
+        # Clients without a key ID keep working on an older key while it is active
+        assert rotating.verify(APP_ID, DEVICE_ID, timestamp, PAYLOAD, retiring) == 'k0'
+        assert rotating.verify(APP_ID, DEVICE_ID, timestamp, PAYLOAD, retiring, 'k0') == 'k0'
+        assert rotating.verify(APP_ID, DEVICE_ID, timestamp, PAYLOAD, retiring, 'current') is None
+
+    cases = [
+        ('legacy hmac.new per request', lambda: legacy_verify(APP_ID, DEVICE_ID, timestamp, PAYLOAD, signature)),
+        ('key ring, 1 key', lambda: single.verify(APP_ID, DEVICE_ID, timestamp, PAYLOAD, signature)),
+        (f"key ring, {args.keys} keys, keyId given",
+         lambda: rotating.verify(APP_ID, DEVICE_ID, timestamp, PAYLOAD, signature, 'current')),
+        (f"key ring, {args.keys} keys, no keyId",
+         lambda: rotating.verify(APP_ID, DEVICE_ID, timestamp, PAYLOAD, signature)),
+        (f"key ring, {args.keys} keys, no keyId, oldest",
+         lambda: rotating.verify(APP_ID, DEVICE_ID, timestamp, PAYLOAD, retiring)),
+        (f"key ring, {args.keys} keys, forged",
+         lambda: rotating.verify(APP_ID, DEVICE_ID, timestamp, PAYLOAD, forged)),
+    ]
+
+    print("=" * 70)
+    print(f"SIGNATURE VERIFICATION (best of {args.repeats} x {args.iterations} iterations per case)")
+    print("=" * 70)
+    baseline = None
+    for name, verify in cases:
+        rate = measure(verify, args.iterations, args.repeats)
+        baseline = baseline or rate
+        print(f"  {name:<36} {rate:>12,.0f}/s  {1e6 / rate:6.2f} µs  {rate / baseline:5.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -45,18 +45,25 @@ cat > /tmp/ppmt-cache-policy.json << 'EOF'
     "QueryStringsConfig": {
       "QueryStringBehavior": "whitelist",
       "QueryStrings": {
-        "Quantity": 5,
+        "Quantity": 6,
         "Items": [
           "productId",
           "category",
           "startDate",
           "endDate",
-          "limit"
+          "limit",
+          "since"
         ]
       }
     },
     "HeadersConfig": {
-      "HeaderBehavior": "none"
+      "HeaderBehavior": "whitelist",
+      "Headers": {
+        "Quantity": 1,
+        "Items": [
+          "Accept"
+        ]
+      }
     },
     "CookiesConfig": {
       "CookieBehavior": "none"
@@ -114,8 +121,9 @@ echo "Configuration Complete! ✅"
 echo "=========================================="
 echo ""
 echo "Cache Policy Applied:"
-echo "  - Cache Key: productId, category, startDate, endDate, limit"
+echo "  - Cache Key: productId, category, startDate, endDate, limit, since"
 echo "  - Ignored: appId, deviceId, timestamp, signature"
+echo "  - Accept header: JSON and binary (MessagePack/CBOR) responses are cached apart"
 echo "  - TTL: 60-300 seconds (default 120s)"
 echo ""
 echo "How it works:"
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Delta Sync Check
+Runs a day of catalog changes through the delta sync path on a seeded local backend. A client
+takes a sync token and a full copy of PPMT-AMP-Items. Then price updates, new items and
+deleted items are written with the stream captured. The stream is replayed through the
+stream processor's changelog sink, and the client follows GET /prices/changes from its token
+through lambda_handler. The client's copy must then equal the table. The bytes it downloaded
+are compared with a full re-download. Finally the log is compacted past its retention, and
+the old token must be refused with 410.
+
+Usage:
+    python3 scripts/delta-sync.py
+    python3 scripts/delta-sync.py --updates 200 --inserts 20 --deletes 10 --limit 100
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from decimal import Decimal
+
+from local_api import build_event, create_local_backend
+
+os.environ.setdefault('METRICS_MODE', 'off')
+os.environ.setdefault('CHANGE_LOG_SETTLE_SECONDS', '0')  # entries are read back at once
+
+import price_query_handler as handler  # noqa: E402
+import stream_processor  # noqa: E402
+from change_log import ChangeLog  # noqa: E402
+from storage_backend import deserialize_dynamodb_item, serialize_dynamodb_item  # noqa: E402
+
+ITEMS_TABLE = 'PPMT-AMP-Items'
+
+
+def scan_items(backend):
+    """Every item of the table, by key"""
+    items = {}
+    params = {'TableName': ITEMS_TABLE}
+    while True:
+        response = backend.scan(**params)
+        for item in response.get('Items', []):
+            item = deserialize_dynamodb_item(item)
+            items[(item['SeriesId'], item['ProductId'])] = item
+        if not response.get('LastEvaluatedKey'):
+            return items
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def request(path, params, device):
+    """One signed request through the handler: (status, body, body bytes)"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        response = handler.lambda_handler(build_event(path, params, device), None)
+    return response['statusCode'], json.loads(response['body']), len(response['body'])
+
+
+def apply_changes(backend, items, updates, inserts, deletes, rng):
+    """A day of ETL writes: price updates, new items and removed items"""
+    keys = sorted(items)
+    for key in rng.sample(keys, updates):
+        item = dict(items[key])
+        item['AfterMarketPrice'] = Decimal(str(round(float(item['AfterMarketPrice']) * rng.uniform(0.9, 1.1), 2)))
+        item['UpdatedAt'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        backend.put_item(TableName=ITEMS_TABLE, Item=serialize_dynamodb_item(item))
+    for key in rng.sample(keys, deletes):
+        backend.delete_item(TableName=ITEMS_TABLE, Key={'SeriesId': {'S': key[0]}, 'ProductId': {'S': key[1]}})
+    for index in range(inserts):
+        item = dict(items[rng.choice(keys)])
+        item['ProductId'] = f"{item['ProductId']}-NEW{index:03d}"
+        item['ProductName'] = f"{item['ProductName']} (new)"
+        backend.put_item(TableName=ITEMS_TABLE, Item=serialize_dynamodb_item(item))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--series', type=int, default=60, help='Synthetic series')
+    parser.add_argument('--items-per-series', type=int, default=12)
+    parser.add_argument('--updates', type=int, default=50, help='Items whose price changes')
+    parser.add_argument('--inserts', type=int, default=10, help='New items')
+    parser.add_argument('--deletes', type=int, default=5, help='Removed items')
+    parser.add_argument('--limit', type=int, default=500, help='Changes per sync request')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='ppmt-amp-sync-')
+    try:
+        stream_file = os.path.join(directory, 'items-stream.jsonl')
+        backend = create_local_backend(args.series, args.items_per_series)
+        backend.stream_path = stream_file
+        rng = random.Random(args.seed)
+
+        # The client: sync token first, then its full copy of the catalog
+        status, body, _ = request(handler.CHANGES_PATH, {}, 'sync-start')
+        start_token = token = body['syncToken']
+        client = scan_items(backend)
+        full_bytes = len(json.dumps(list(client.values()), default=str))
+        time.sleep(0.002)
+
+        apply_changes(backend, client, args.updates, args.inserts, args.deletes, rng)
+        sink = stream_processor.ChangeLogSink(backend)
+        processor = stream_processor.StreamProcessor([sink], stream_processor.FileCheckpointStore(
+            os.path.join(directory, 'checkpoints.json')))
+        records = list(stream_processor.read_stream_file(stream_file))
+        processor.process_batch(records)
+
+        # Follow the changes until the client is caught up
+        requests = synced_bytes = 0
+        counts = {'inserted': 0, 'updated': 0, 'deleted': 0}
+        more = True
+        while more:
+            status, body, size = request(handler.CHANGES_PATH, {'since': token, 'limit': str(args.limit)},
+                                         f"sync-{requests}")
+            if status != 200:
+                sys.exit(f"✗ /prices/changes returned {status}: {body}")
+            requests += 1
+            synced_bytes += size
+            for item in body['inserted'] + body['updated']:
+                client[(item['SeriesId'], item['ProductId'])] = item
+            for key in body['deleted']:
+                client.pop((key['SeriesId'], key['ProductId']), None)
+            for name in counts:
+                counts[name] += len(body[name])
+            token, more = body['syncToken'], body['hasMore']
+        status, body, _ = request(handler.CHANGES_PATH, {'since': token}, 'sync-caught-up')
+        idle = status == 200 and body['syncToken'] == token and not body['inserted'] + body['updated'] + body['deleted']
+
+        table = scan_items(backend)
+        print("=" * 70)
+        print(f"DELTA SYNC ({len(records)} stream records: {args.updates} updates, {args.inserts} inserts, "
+              f"{args.deletes} deletes)")
+        print("=" * 70)
+        print(f"  Synced:    {counts['inserted']} inserted, {counts['updated']} updated, {counts['deleted']} deleted "
+              f"in {requests} request(s)")
+        print(f"  Download:  {synced_bytes / 1024:.1f}KB of changes vs {full_bytes / 1024:.1f}KB to reload "
+              f"{len(table)} items ({synced_bytes / full_bytes:.1%})")
+        print(f"  {'✓' if client == table else '✗'} Client copy matches the table ({len(client)} vs {len(table)} items)")
+        print(f"  {'✓' if idle else '✗'} Caught-up token returns no changes and stays the same")
+
+        # Compaction: a week and a day later every entry is past retention
+        later = ChangeLog(backend, clock=lambda: time.time() + 8 * 86400)
+        compacted = later.compact(force=True)
+        status, body, _ = request(handler.CHANGES_PATH, {'since': start_token}, 'sync-expired')
+        expired = status == 410 and body.get('resync')
+        print(f"  {'✓' if expired else '✗'} {compacted} entries compacted; the old token gets {status} (resync)")
+        if client != table or not idle or not expired:
+            sys.exit(1)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
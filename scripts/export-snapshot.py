@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+PPMT-AMP-Items Snapshot Export
+Streams the table through a parallel Scan (or reads the files of a DynamoDB table export) into
+part files sorted by SeriesId and Timestamp under data/snapshots/<timestamp>/, with a manifest.
+Parts are Parquet when pyarrow is installed, otherwise memory-mappable .ppcol files. Read them
+with etl/snapshot.py (SnapshotReader) instead of scanning the live table.
+
+Usage:
+    # Local backend (seeded)
+    python3 scripts/export-snapshot.py --backend local
+
+    # DynamoDB parallel scan with 16 segments
+    python3 scripts/export-snapshot.py --backend dynamodb --segments 16
+
+    # From an ExportTableToPointInTime download (DYNAMODB_JSON)
+    python3 scripts/export-snapshot.py --export-dir exports/AWSDynamoDB/01234-abcd/
+
+    # Summarize an existing snapshot
+    python3 scripts/export-snapshot.py --inspect data/snapshots/20251221T020000
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'etl'))
+
+import snapshot  # noqa: E402
+from local_api import create_local_backend  # noqa: E402
+
+
+def open_backend(args):
+    if args.backend == 'local':
+        if args.db and os.path.exists(args.db):
+            from local_dynamodb import LocalDynamoDB
+            return LocalDynamoDB(args.db)
+        return create_local_backend(path=args.db or ':memory:')
+    from storage_backend import get_storage_backend
+    os.environ['STORAGE_BACKEND'] = 'dynamodb'
+    return get_storage_backend()
+
+
+def inspect(path):
+    reader = snapshot.SnapshotReader(path)
+    manifest = reader.manifest
+    print("=" * 70)
+    print(f"SNAPSHOT {path}")
+    print("=" * 70)
+    print(f"  Table:     {manifest['table']} (exported {manifest['exported_at']} from {manifest['source']})")
+    print(f"  Format:    {manifest['format']}, sorted by {', '.join(manifest['sort_keys'])}")
+    print(f"  Rows:      {manifest['num_rows']} in {len(manifest['parts'])} part(s), "
+          f"{sum(part['bytes'] for part in manifest['parts']) / 1e6:.2f}MB")
+    for part in manifest['parts']:
+        print(f"    {part['file']:<20} {part['num_rows']:>8} rows  {part['min_series_id']} .. {part['max_series_id']}")
+
+    start = time.perf_counter()
+    groups = reader.aggregate('IpCharacter', 'RetailPrice')
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"\n  RetailPrice by IpCharacter ({elapsed:.1f}ms, read in place):")
+    for ip_character, stats in sorted(groups.items(), key=lambda entry: str(entry[0])):
+        print(f"    {str(ip_character):<14} n={stats['count']:<7} mean={stats['mean']:>9.2f} "
+              f"min={stats['min']:>9.2f} max={stats['max']:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=['local', 'dynamodb'], default='local')
+    parser.add_argument('--db', metavar='PATH', help='Local backend: SQLite file (created and seeded if missing)')
+    parser.add_argument('--export-dir', metavar='PATH', help='Read a DynamoDB table export instead of scanning')
+    parser.add_argument('--segments', type=int, default=snapshot.SCAN_SEGMENTS, help='Parallel scan segments')
+    parser.add_argument('--out', help='Snapshot directory (default: data/snapshots/<timestamp>)')
+    parser.add_argument('--rows-per-part', type=int, default=snapshot.ROWS_PER_PART)
+    parser.add_argument('--format', choices=['parquet', 'ppcol'], help='Default: parquet if pyarrow is installed')
+    parser.add_argument('--inspect', metavar='PATH', help='Summarize an existing snapshot and exit')
+    args = parser.parse_args()
+
+    if args.inspect:
+        inspect(args.inspect)
+        return
+
+    start = time.perf_counter()
+    if args.export_dir:
+        items = list(snapshot.export_file_items(args.export_dir))
+        source = f"export:{args.export_dir}"
+    else:
+        items = snapshot.parallel_scan(open_backend(args), args.segments)
+        source = f"scan:{args.backend} ({args.segments} segments)"
+    read_seconds = time.perf_counter() - start
+
+    out = args.out or os.path.join(snapshot.SNAPSHOT_DIR, datetime.now().strftime('%Y%m%dT%H%M%S'))
+    start = time.perf_counter()
+    try:
+        manifest = snapshot.export_snapshot(items, out, args.rows_per_part, args.format, source)
+    except RuntimeError as e:
+        sys.exit(f"✗ {e}")
+    write_seconds = time.perf_counter() - start
+
+    print(f"✓ Read {len(items)} items in {read_seconds:.2f}s ({source})")
+    print(f"✓ Wrote {len(manifest['parts'])} {manifest['format']} part(s) in {write_seconds:.2f}s")
+    inspect(out)
+
+
+if __name__ == '__main__':
+    main()
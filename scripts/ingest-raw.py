@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Raw Feed Ingestion
+Verifies raw/YYYY-MM-DD/manifest.json checksums and parses every feed (CSV, JSON, JSON lines,
+XML) with streaming parsers across a process pool, writing one columnar staging format to
+data/staging/YYYY-MM-DD/<source>/part-NNNNN.col.gz. Feeds whose checksum is unchanged since
+the last ingest are skipped; a feed that fails verification keeps its previous staged copy.
+
+Usage:
+    # Local directory standing in for the S3 bucket (data/raw/YYYY-MM-DD/...)
+    python3 scripts/ingest-raw.py --root data --sample-partition 2025-12-21
+    python3 scripts/run-etl.py --staged
+
+    # S3 bucket
+    S3_BUCKET=ppmt-amp-data-sync-363416481362 python3 scripts/ingest-raw.py --bucket-from-env --partition 2025-12-21
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'etl'))
+
+import engine  # noqa: E402
+import ingest  # noqa: E402
+
+
+def make_sample(args, store_root):
+    from local_api import IP_CHARACTERS, seed_catalog
+    from local_dynamodb import LocalDynamoDB
+    from sample_feeds import generate_sample_partition
+    from storage_backend import create_default_tables
+
+    backend = LocalDynamoDB()
+    create_default_tables(backend)
+    seed_catalog(backend, args.series, args.items_per_series)
+    catalog = engine.load_catalog_from_backend(backend)
+    path = generate_sample_partition(catalog, args.sample_partition, os.path.join(store_root, ingest.RAW_PREFIX),
+                                     listings_per_product=args.listings_per_product)
+    print(f"Generated sample partition {path} ({len(catalog)} products, {len(IP_CHARACTERS)} IPs)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--root', default=ingest.DATA_ROOT, help='Local directory standing in for the bucket')
+    parser.add_argument('--bucket-from-env', action='store_true', help='Read from s3://$S3_BUCKET instead')
+    parser.add_argument('--staging-dir', default=engine.STAGING_DIR)
+    parser.add_argument('--partition', action='append', help='Partitions to ingest (default: all)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Parser processes')
+    parser.add_argument('--chunk-rows', type=int, default=ingest.CHUNK_ROWS, help='Rows per staged part file')
+    parser.add_argument('--force', action='store_true', help='Re-ingest feeds even if unchanged')
+    parser.add_argument('--sample-partition', metavar='YYYY-MM-DD', help='Generate synthetic feeds first (local)')
+    parser.add_argument('--series', type=int, default=60)
+    parser.add_argument('--items-per-series', type=int, default=12)
+    parser.add_argument('--listings-per-product', type=int, default=4)
+    args = parser.parse_args()
+
+    if args.bucket_from_env:
+        if not ingest.S3_BUCKET:
+            sys.exit("✗ S3_BUCKET is not set")
+        store = ingest.S3ObjectStore(ingest.S3_BUCKET)
+    else:
+        store = ingest.LocalObjectStore(args.root)
+        if args.sample_partition:
+            make_sample(args, args.root)
+
+    start = time.perf_counter()
+    results, notes = ingest.ingest(store, args.partition, args.staging_dir, args.workers, args.force, args.chunk_rows)
+    elapsed = time.perf_counter() - start
+
+    print("=" * 70)
+    print(f"INGESTION ({args.workers} workers)")
+    print("=" * 70)
+    for partition, note in sorted(notes.items()):
+        manifest = '✓ manifest' if note['manifest'] else '⚠️  no manifest (checksums not verified)'
+        removed = f", removed {', '.join(note['removed'])}" if note.get('removed') else ''
+        print(f"\nPartition {partition}: {note['files']} feeds, {manifest}{removed}")
+        for result in (r for r in results if r['partition'] == partition):
+            mark = {'ok': '✓', 'unchanged': '=', 'checksum_mismatch': '✗', 'error': '✗'}[result['status']]
+            mb = result['bytes'] / 1e6
+            rate = mb / (result['elapsed_ms'] / 1000) if result['elapsed_ms'] else 0.0
+            print(f"  {mark} {result['name']:<24} {result['status']:<18} {result['rows']:>9} rows "
+                  f"{result['parts']:>3} parts  {mb:7.2f}MB  {rate:7.1f}MB/s")
+            if result.get('error'):
+                print(f"      {result['error']}")
+
+    ingested = [r for r in results if r['status'] == 'ok']
+    failed = [r for r in results if r['status'] in ('checksum_mismatch', 'error')]
+    total_mb = sum(r['bytes'] for r in ingested) / 1e6
+    print(f"\n  Ingested {len(ingested)} feeds, {sum(r['rows'] for r in ingested)} rows, {total_mb:.2f}MB "
+          f"in {elapsed:.2f}s ({total_mb / elapsed if elapsed else 0:.1f}MB/s); "
+          f"{sum(1 for r in results if r['status'] == 'unchanged')} unchanged")
+    if failed:
+        print(f"\n✗ {len(failed)} feed(s) failed")
+        sys.exit(1)
+    print("\n✓ Ingestion complete")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+Latency Histogram
+HDR-style log-linear histogram shared by the benchmark and load-test scripts.
+Records values in microseconds with bounded relative error and fixed memory.
+"""
+
+import math
+
+# 7 significant bits => worst-case relative error of 1/64 (~1.6%)
+DEFAULT_SIGNIFICANT_BITS = 7
+
+
+class LatencyHistogram:
+    """Log-linear histogram of integer microsecond values"""
+
+    def __init__(self, significant_bits=DEFAULT_SIGNIFICANT_BITS):
+        self.significant_bits = significant_bits
+        self.sub_bucket_count = 1 << significant_bits
+        self.counts = {}
+        self.total_count = 0
+        self.total_sum = 0
+        self.min_value = None
+        self.max_value = None
+
+    def _bucket(self, value):
+        if value < self.sub_bucket_count:
+            return (0, value)
+        shift = value.bit_length() - self.significant_bits
+        return (shift, value >> shift)
+
+    @staticmethod
+    def _highest_equivalent(bucket):
+        shift, mantissa = bucket
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, value_us, count=1):
+        """Record a latency in microseconds"""
+        value = max(int(value_us), 0)
+        bucket = self._bucket(value)
+        self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.total_count += count
+        self.total_sum += value * count
+        self.min_value = value if self.min_value is None else min(self.min_value, value)
+        self.max_value = value if self.max_value is None else max(self.max_value, value)
+
+    def record_ms(self, value_ms, count=1):
+        """Record a latency in milliseconds"""
+        self.record(value_ms * 1000, count)
+
+    def merge(self, other):
+        """Add all samples from another histogram with the same precision"""
+        if other.significant_bits != self.significant_bits:
+            raise ValueError("Cannot merge histograms with different precision")
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.total_count += other.total_count
+        self.total_sum += other.total_sum
+        if other.min_value is not None:
+            self.min_value = other.min_value if self.min_value is None else min(self.min_value, other.min_value)
+            self.max_value = other.max_value if self.max_value is None else max(self.max_value, other.max_value)
+        return self
+
+    def percentile(self, percent):
+        """Value (microseconds) at or below which `percent` of samples fall"""
+        if self.total_count == 0:
+            return 0
+        target = max(1, math.ceil(self.total_count * percent / 100.0))
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= target:
+                return min(self._highest_equivalent(bucket), self.max_value)
+        return self.max_value
+
+    def mean(self):
+        return self.total_sum / self.total_count if self.total_count else 0
+
+    def summary_ms(self, percentiles=(50, 90, 95, 99, 99.9)):
+        """Summary statistics in milliseconds"""
+        summary = {
+            'count': self.total_count,
+            'mean': self.mean() / 1000,
+            'min': (self.min_value or 0) / 1000,
+            'max': (self.max_value or 0) / 1000
+        }
+        for percent in percentiles:
+            summary[f'p{percent:g}'] = self.percentile(percent) / 1000
+        return summary
+
+    def to_dict(self):
+        """Serializable form (for saved baselines)"""
+        return {
+            'significant_bits': self.significant_bits,
+            'counts': [[shift, mantissa, count] for (shift, mantissa), count in sorted(self.counts.items())],
+            'sum': self.total_sum,
+            'min': self.min_value,
+            'max': self.max_value
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data['significant_bits'])
+        for shift, mantissa, count in data['counts']:
+            histogram.counts[(shift, mantissa)] = count
+            histogram.total_count += count
+        histogram.total_sum = data['sum']
+        histogram.min_value = data['min']
+        histogram.max_value = data['max']
+        return histogram
+
+    def ascii_chart(self, width=40, rows=12):
+        """Text distribution chart with log-spaced rows"""
+        if self.total_count == 0:
+            return "  (no samples)"
+        low = max(self.min_value, 1)
+        high = max(self.max_value, low + 1)
+        ratio = (high / low) ** (1.0 / rows)
+        bounds = [low * ratio ** (i + 1) for i in range(rows)]
+        bins = [0] * rows
+        for bucket, count in self.counts.items():
+            value = self._highest_equivalent(bucket)
+            index = next((i for i, bound in enumerate(bounds) if value <= bound), rows - 1)
+            bins[index] += count
+        peak = max(bins)
+        lines = []
+        for bound, count in zip(bounds, bins):
+            bar = '#' * int(round(width * count / peak)) if peak else ''
+            lines.append(f"  <= {bound / 1000:9.3f}ms | {bar:<{width}} {count}")
+        return '\n'.join(lines)
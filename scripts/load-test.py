@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Open-Loop Load Generator
+Sends signed API requests on an asyncio event loop at a scheduled arrival rate (constant
+or Poisson), independent of response times, over a pool of keep-alive connections.
+Latency is measured from each request's intended send time, so queueing delay under
+overload is not hidden (no coordinated omission).
+
+Usage:
+    # Local HTTP wrapper around lambda_handler (no network)
+    python3 scripts/load-test.py --url local --rate 200 --duration 30
+
+    # The same through the ASGI app (asgi_app.py), or against scripts/serve-asgi.py workers
+    python3 scripts/load-test.py --url local --asgi --rate 200 --duration 30
+    python3 scripts/load-test.py --url http://127.0.0.1:8080 --rate 400 --duration 30
+
+    # Real endpoint, Poisson arrivals, ramp 10 -> 100 req/s over 60s then hold 60s
+    python3 scripts/load-test.py --url https://api.example.com/prod --arrival poisson \\
+        --profile 10-100:60,100:60 --devices 5000
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import ssl
+import sys
+import time
+from urllib.parse import urlencode, urlsplit
+
+from latency_histogram import LatencyHistogram
+from local_api import LocalApiServer, LocalAsgiServer, create_local_backend, signed_params
+
+# The in-process handler (--url local) would print a metrics line per request over the report
+os.environ.setdefault('METRICS_MODE', 'off')
+
+# Rate limit enforced by the handler (requests per device per window)
+RATE_LIMIT_MAX_REQUESTS = 20
+RATE_LIMIT_WINDOW = 300
+
+
+class HttpConnection:
+    """Minimal HTTP/1.1 keep-alive client connection"""
+
+    def __init__(self, host, port, use_ssl):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.reader = None
+        self.writer = None
+
+    async def open(self):
+        context = ssl.create_default_context() if self.use_ssl else None
+        self.reader, self.writer = await asyncio.open_connection(
+            self.host, self.port, ssl=context, server_hostname=self.host if self.use_ssl else None
+        )
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+
+    async def request(self, method, target, headers=None):
+        if self.writer is None:
+            await self.open()
+        lines = [f"{method} {target} HTTP/1.1", f"Host: {self.host}", "Connection: keep-alive"]
+        lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by server")
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = bytearray()
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                body.extend(await self.reader.readexactly(size))
+                await self.reader.readline()
+            body = bytes(body)
+        elif 'content-length' in response_headers:
+            body = await self.reader.readexactly(int(response_headers['content-length']))
+        else:
+            body = await self.reader.read()
+            self.close()
+
+        if response_headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, response_headers, body
+
+
+class ConnectionPool:
+    """Bounded pool of keep-alive connections shared by all in-flight requests"""
+
+    def __init__(self, base_url, size):
+        url = urlsplit(base_url)
+        self.use_ssl = url.scheme == 'https'
+        self.host = url.hostname
+        self.port = url.port or (443 if self.use_ssl else 80)
+        self.base_path = url.path.rstrip('/')
+        self.idle = asyncio.LifoQueue()
+        self.slots = asyncio.Semaphore(size)
+        self.opened = 0
+
+    async def request(self, method, path, params, headers=None):
+        target = f"{self.base_path}{path}?{urlencode(params)}"
+        async with self.slots:
+            connection = self.idle.get_nowait() if not self.idle.empty() else None
+            if connection is None:
+                connection = HttpConnection(self.host, self.port, self.use_ssl)
+                self.opened += 1
+            try:
+                result = await connection.request(method, target, headers)
+            except Exception:
+                connection.close()
+                raise
+            if connection.writer is not None:
+                self.idle.put_nowait(connection)
+            return result
+
+    def close(self):
+        while not self.idle.empty():
+            self.idle.get_nowait().close()
+
+
+def parse_profile(profile):
+    """Parse 'rate:seconds' or 'start-end:seconds' stages separated by commas"""
+    stages = []
+    for stage in profile.split(','):
+        rates, seconds = stage.split(':')
+        if '-' in rates:
+            start, end = (float(r) for r in rates.split('-'))
+        else:
+            start = end = float(rates)
+        stages.append((start, end, float(seconds)))
+    return stages
+
+
+def arrival_schedule(stages, arrival, seed):
+    """Yield (offset seconds, stage index) for every request in the open-loop schedule"""
+    rng = random.Random(seed)
+    stage_start = 0.0
+    for index, (start_rate, end_rate, seconds) in enumerate(stages):
+        t = 0.0
+        while True:
+            # Linear ramp: instantaneous rate at the current point in the stage
+            rate = start_rate + (end_rate - start_rate) * (t / seconds)
+            if rate <= 0:
+                t += 0.01
+                if t >= seconds:
+                    break
+                continue
+            t += rng.expovariate(rate) if arrival == 'poisson' else 1.0 / rate
+            if t >= seconds:
+                break
+            yield stage_start + t, index
+        stage_start += seconds
+
+
+class LoadStats:
+    def __init__(self, num_stages):
+        self.response_time = LatencyHistogram()
+        self.service_time = LatencyHistogram()
+        self.stage_response_time = [LatencyHistogram() for _ in range(num_stages)]
+        self.status_codes = {}
+        self.errors = {}
+        self.sent = 0
+        self.max_in_flight = 0
+        self.in_flight = 0
+
+
+async def fire(pool, stats, args, request_index, stage_index, intended, params_template):
+    device_id = f"load-device-{request_index % args.devices}"
+    params = signed_params(args.path, device_id, params_template)
+    stats.in_flight += 1
+    stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+    try:
+        sent = time.perf_counter()
+        status, _, _ = await asyncio.wait_for(pool.request('GET', args.path, params), args.timeout)
+        done = time.perf_counter()
+        stats.status_codes[status] = stats.status_codes.get(status, 0) + 1
+        stats.service_time.record((done - sent) * 1_000_000)
+        stats.response_time.record((done - intended) * 1_000_000)
+        stats.stage_response_time[stage_index].record((done - intended) * 1_000_000)
+    except Exception as e:
+        name = type(e).__name__
+        stats.errors[name] = stats.errors.get(name, 0) + 1
+    finally:
+        stats.in_flight -= 1
+
+
+async def run_load(args):
+    stages = parse_profile(args.profile) if args.profile else [(args.rate, args.rate, args.duration)]
+    params_template = dict(p.split('=', 1) for p in args.param)
+
+    # Signatures cover the device and a timestamp in whole seconds: a device sending twice in
+    # one second repeats its signature, and the replay guard answers the second request 403
+    total_seconds = sum(seconds for _, _, seconds in stages)
+    peak_rate = max(max(start, end) for start, end, _ in stages)
+    if peak_rate > args.devices:
+        sys.exit(f"✗ A peak rate of {peak_rate:g} req/s over {args.devices} devices repeats signatures within a "
+                 f"second, which the replay guard rejects with 403; use --devices {math.ceil(peak_rate)} or more")
+    if args.arrival == 'poisson' and peak_rate * 10 > args.devices:
+        print(f"⚠ Poisson bursts can send from one of {args.devices} devices twice in a second; "
+              f"expect some 403s (use --devices {math.ceil(peak_rate * 10)})")
+
+    # Warn if the device pool is too small for the handler's per-device rate limit
+    per_device = peak_rate * min(total_seconds, RATE_LIMIT_WINDOW) / args.devices
+    if per_device > RATE_LIMIT_MAX_REQUESTS:
+        print(f"⚠ ~{per_device:.0f} requests/device per {RATE_LIMIT_WINDOW}s window exceeds the rate limit "
+              f"of {RATE_LIMIT_MAX_REQUESTS}; expect 429s (use --devices)")
+
+    server = None
+    base_url = args.url
+    if args.url == 'local':
+        create_local_backend(args.series, args.items_per_series)
+        server = await (LocalAsgiServer() if args.asgi else LocalApiServer()).start()
+        base_url = server.url
+        print(f"Local {'ASGI app' if args.asgi else 'API wrapper'} listening on {base_url}")
+
+    pool = ConnectionPool(base_url, args.connections)
+    stats = LoadStats(len(stages))
+    tasks = []
+    print(f"Target: {base_url}{args.path}  arrival={args.arrival}  stages={stages}")
+
+    start = time.perf_counter()
+    for request_index, (offset, stage_index) in enumerate(arrival_schedule(stages, args.arrival, args.seed)):
+        intended = start + offset
+        delay = intended - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        stats.sent += 1
+        tasks.append(asyncio.ensure_future(
+            fire(pool, stats, args, request_index, stage_index, intended, params_template)
+        ))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    pool.close()
+    if server:
+        await server.stop()
+    return stats, stages, elapsed, pool.opened
+
+
+def print_report(stats, stages, elapsed, connections_opened):
+    completed = stats.response_time.total_count
+    print()
+    print("=" * 70)
+    print("LOAD TEST RESULTS")
+    print("=" * 70)
+    print(f"  Requests sent:        {stats.sent}")
+    print(f"  Completed:            {completed}")
+    print(f"  Errors:               {sum(stats.errors.values())} {stats.errors or ''}")
+    print(f"  Status codes:         {stats.status_codes}")
+    print(f"  Elapsed:              {elapsed:.2f}s")
+    print(f"  Achieved throughput:  {completed / elapsed:.1f} req/s")
+    print(f"  Connections opened:   {connections_opened}")
+    print(f"  Max in flight:        {stats.max_in_flight}")
+    print()
+    for label, histogram in (("Response time (from intended send)", stats.response_time),
+                             ("Service time (from actual send)", stats.service_time)):
+        s = histogram.summary_ms()
+        print(f"{label}:")
+        print(f"  mean {s['mean']:.2f}ms  p50 {s['p50']:.2f}ms  p90 {s['p90']:.2f}ms  p95 {s['p95']:.2f}ms  "
+              f"p99 {s['p99']:.2f}ms  p99.9 {s['p99.9']:.2f}ms  max {s['max']:.2f}ms")
+    if len(stages) > 1:
+        print("\nPer stage (response time):")
+        for (start_rate, end_rate, seconds), histogram in zip(stages, stats.stage_response_time):
+            s = histogram.summary_ms()
+            print(f"  {start_rate:g}->{end_rate:g} req/s for {seconds:g}s: n={s['count']} "
+                  f"p50 {s['p50']:.2f}ms  p99 {s['p99']:.2f}ms")
+    print("\nResponse time distribution:")
+    print(stats.response_time.ascii_chart())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='local', help="API base URL, or 'local' for the in-process wrapper")
+    parser.add_argument('--path', default='/prices')
+    parser.add_argument('--param', action='append', default=[], metavar='KEY=VALUE',
+                        help='Extra query parameter (repeatable), e.g. seriesId=SERIES-LABUBU-001')
+    parser.add_argument('--rate', type=float, default=50.0, help='Constant arrival rate (req/s)')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds at --rate')
+    parser.add_argument('--profile', help="Stages 'rate:seconds' or 'start-end:seconds', comma separated")
+    parser.add_argument('--arrival', choices=['constant', 'poisson'], default='constant')
+    parser.add_argument('--devices', type=int, default=1000, help='Simulated device IDs (round robin)')
+    parser.add_argument('--connections', type=int, default=32, help='Max pooled keep-alive connections')
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--series', type=int, default=60, help='Local mode: synthetic series')
+    parser.add_argument('--items-per-series', type=int, default=12, help='Local mode: items per series')
+    parser.add_argument('--asgi', action='store_true', help='Local mode: serve through the ASGI app (asgi_app.py)')
+    parser.add_argument('--json-out', metavar='PATH', help='Write summary and histograms as JSON')
+    args = parser.parse_args()
+    if not args.param:
+        args.param = ['limit=50']
+
+    stats, stages, elapsed, connections_opened = asyncio.run(run_load(args))
+    print_report(stats, stages, elapsed, connections_opened)
+
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump({
+                'sent': stats.sent,
+                'elapsed': elapsed,
+                'status_codes': stats.status_codes,
+                'errors': stats.errors,
+                'response_time': stats.response_time.summary_ms(),
+                'service_time': stats.service_time.summary_ms(),
+                'response_histogram': stats.response_time.to_dict()
+            }, f, indent=2)
+
+    if stats.errors:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,310 @@
+"""
+Local API Support
+Shared helpers for the offline benchmark and load-test scripts: request signing, signed
+API Gateway events, a deterministic synthetic catalog for the local storage backend, and
+a minimal asyncio HTTP server that wraps lambda_handler or drives an ASGI app.
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime
+from decimal import Decimal
+from urllib.parse import parse_qsl, urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda'))
+os.environ.setdefault('STORAGE_BACKEND', 'local')
+
+# Configuration (from appsettings.json)
+APP_ID = "ppmt-amp-ios-v1"
+APP_SECRET = os.environ.get('APP_SECRET', 'your-secret-key-change-this-in-production')
+
+IP_CHARACTERS = ['Labubu', 'Hirono', 'Molly', 'Skullpanda', 'Dimoo', 'Crybaby']
+CATEGORIES = ['Blind Box', 'Mini Figure', 'Mega Collection']
+RARITIES = ['Common', 'Common', 'Common', 'Rare', 'Secret']
+
+HTTP_REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+                405: 'Method Not Allowed', 410: 'Gone', 413: 'Payload Too Large', 429: 'Too Many Requests',
+                500: 'Internal Server Error', 502: 'Bad Gateway', 503: 'Service Unavailable'}
+
+
+def generate_signature(app_id, device_id, timestamp, payload, secret=APP_SECRET):
+    """Generate HMAC-SHA256 signature matching iOS app logic"""
+    message = f"{app_id}:{device_id}:{timestamp}:{payload}"
+    signature = hmac.new(secret.encode(), message.encode(), hashlib.sha256).digest()
+    return base64.b64encode(signature).decode()
+
+
+def signed_params(path, device_id, params=None, method='GET', app_id=APP_ID, secret=APP_SECRET, key_id=None,
+                  timestamp=None):
+    """Query string parameters for a signed request (key_id names the signing key during rotation)"""
+    timestamp = str(int(timestamp if timestamp is not None else time.time()))
+    query = {
+        'appId': app_id,
+        'deviceId': device_id,
+        'timestamp': timestamp,
+        'signature': generate_signature(app_id, device_id, timestamp, f"{method}:{path}", secret)
+    }
+    if key_id:
+        query['keyId'] = key_id
+    query.update(params or {})
+    return query
+
+
+def build_event(path, params, device_id, method='GET', headers=None, timestamp=None):
+    """Build a signed API Gateway proxy event"""
+    return {
+        'httpMethod': method,
+        'path': path,
+        'resource': path,
+        'queryStringParameters': signed_params(path, device_id, params, method, timestamp=timestamp),
+        'headers': headers or {'Accept': 'application/json'}
+    }
+
+
+def build_management_event(path, body, device_id, username='portal-admin', role='superuser', method='POST'):
+    """Build a signed price management event with Cognito authorizer claims"""
+    timestamp = str(int(time.time()))
+    return {
+        'httpMethod': method,
+        'path': path,
+        'resource': path,
+        'headers': {
+            'Content-Type': 'application/json',
+            'X-App-Id': APP_ID,
+            'X-Device-Id': device_id,
+            'X-Timestamp': timestamp,
+            'X-Signature': generate_signature(APP_ID, device_id, timestamp, f"{method}:{path}")
+        },
+        'requestContext': {'authorizer': {'claims': {
+            'sub': f"user-{username}",
+            'cognito:username': username,
+            'custom:role': role
+        }}},
+        'body': json.dumps(body) if body is not None else None
+    }
+
+
+def seed_catalog(backend, num_series, items_per_series, seed=42):
+    """Populate the local tables with a deterministic synthetic PopMart catalog"""
+    from storage_backend import serialize_dynamodb_item
+
+    rng = random.Random(seed)
+    for s in range(num_series):
+        ip_character = IP_CHARACTERS[s % len(IP_CHARACTERS)]
+        series_id = f"SERIES-{ip_character.upper()}-{s // len(IP_CHARACTERS) + 1:03d}"
+        category = CATEGORIES[s % len(CATEGORIES)]
+        backend.put_item(TableName='PPMT-AMP-Series', Item=serialize_dynamodb_item({
+            'SeriesId': series_id,
+            'SeriesName': f"{ip_character} Series {s}",
+            'IpCharacter': ip_character,
+            'Category': category,
+            'SeriesSize': items_per_series,
+            'Status': 'Active',
+            'Version': 1
+        }))
+        for i in range(items_per_series):
+            retail_price = 69
+            after_market_price = round(retail_price * rng.uniform(0.8, 9.0), 2)
+            backend.put_item(TableName='PPMT-AMP-Items', Item=serialize_dynamodb_item({
+                'SeriesId': series_id,
+                'ProductId': f"PROD-{series_id[7:]}-{i + 1:03d}",
+                'ProductName': f"{ip_character} Series {s} - Figure {i + 1}",
+                'IpCharacter': ip_character,
+                'SeriesName': f"{ip_character} Series {s}",
+                'Category': category,
+                'Rarity': rng.choice(RARITIES),
+                'RetailPrice': retail_price,
+                'AfterMarketPrice': Decimal(str(after_market_price)),
+                'PriceChange': Decimal(str(round(after_market_price - retail_price, 2))),
+                'Currency': 'CNY',
+                'Status': 'Active',
+                'Timestamp': f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T00:00:00",
+                'UpdatedAt': datetime(2025, 12, 21).isoformat()
+            }))
+
+
+def create_local_backend(num_series=60, items_per_series=12, seed=42, path=':memory:'):
+    """Create, seed and install a LocalDynamoDB backend for the handler"""
+    from local_dynamodb import LocalDynamoDB
+    from storage_backend import create_default_tables, set_storage_backend
+
+    backend = LocalDynamoDB(path)
+    create_default_tables(backend)
+    set_storage_backend(backend)
+    seed_catalog(backend, num_series, items_per_series, seed)
+    return backend
+
+
+class LocalApiServer:
+    """HTTP/1.1 keep-alive server translating requests into lambda_handler invocations
+
+    With reuse_port, several processes can listen on the same port (SO_REUSEPORT) and the
+    kernel spreads connections over them, like the workers of a multi-process server.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, handler=None, reuse_port=False):
+        if handler is None:
+            from price_query_handler import lambda_handler as handler
+        self.host = host
+        self.port = port
+        self.handler = handler
+        self.reuse_port = reuse_port
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port,
+                                                  reuse_port=self.reuse_port or None)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle_connection(self, reader, writer):
+        client = writer.get_extra_info('peername')
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip()] = value.strip()
+                content_length = int(headers.get('Content-Length', headers.get('content-length', 0)) or 0)
+                body = await reader.readexactly(content_length) if content_length else b''
+
+                response = await self.dispatch(method, target, headers, body, client)
+                writer.write(self._encode_response(response))
+                await writer.drain()
+                if headers.get('Connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            pass  # The server is shutting down: end the connection without a traceback
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, target, headers, body, client):
+        """Response (API Gateway proxy format) to one request"""
+        url = urlsplit(target)
+        event = {
+            'httpMethod': method,
+            'path': url.path,
+            'resource': url.path,
+            'queryStringParameters': dict(parse_qsl(url.query)) or None,
+            'headers': headers,
+            'body': body.decode() if body else None
+        }
+        return await asyncio.get_running_loop().run_in_executor(None, self.handler, event, None)
+
+    @staticmethod
+    def _encode_response(response):
+        status = response.get('statusCode', 200)
+        body = response.get('body', '')
+        if response.get('isBase64Encoded'):
+            payload = base64.b64decode(body)
+        elif isinstance(body, bytes):
+            payload = body
+        else:
+            payload = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+        lines = [f"HTTP/1.1 {status} {HTTP_REASONS.get(status, 'Unknown')}"]
+        headers = dict(response.get('headers') or {})
+        if not any(name.lower() == 'content-type' for name in headers):
+            headers['Content-Type'] = 'application/json'
+        headers['Content-Length'] = str(len(payload))
+        headers['Connection'] = 'keep-alive'
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + payload
+
+
+class LocalAsgiServer(LocalApiServer):
+    """The same HTTP/1.1 server driving an ASGI application (lambda/asgi_app.py by default)
+
+    start() runs the app's lifespan startup before the port is opened and stop() its shutdown,
+    as uvicorn does.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, app=None, reuse_port=False):
+        if app is None:
+            from asgi_app import app
+        super().__init__(host, port, handler=app, reuse_port=reuse_port)
+        self.app = app
+        self._lifespan = None
+
+    async def start(self):
+        self._lifespan = (asyncio.Queue(), asyncio.Queue())
+        inbox, outbox = self._lifespan
+        scope = {'type': 'lifespan', 'asgi': {'version': '3.0'}}
+        asyncio.create_task(self.app(scope, inbox.get, outbox.put))
+        await inbox.put({'type': 'lifespan.startup'})
+        message = await outbox.get()
+        if message['type'] != 'lifespan.startup.complete':
+            raise RuntimeError(f"ASGI startup failed: {message.get('message')}")
+        return await super().start()
+
+    async def stop(self):
+        await super().stop()
+        if self._lifespan:
+            inbox, outbox = self._lifespan
+            await inbox.put({'type': 'lifespan.shutdown'})
+            await outbox.get()
+
+    async def dispatch(self, method, target, headers, body, client):
+        url = urlsplit(target)
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': url.path,
+            'raw_path': url.path.encode('latin-1'),
+            'query_string': url.query.encode('latin-1'),
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()],
+            'client': client[:2] if client else None,
+            'server': (self.host, self.port)
+        }
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        disconnected = asyncio.Event()
+        response = {'headers': {}, 'body': b''}
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response['statusCode'] = message['status']
+                for name, value in message.get('headers', []):
+                    name = name.decode('latin-1')
+                    if name != 'content-length':  # set again by _encode_response
+                        response['headers'][name] = value.decode('latin-1')
+            elif message['type'] == 'http.response.body':
+                response['body'] += message.get('body', b'')
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            disconnected.set()
+        return response
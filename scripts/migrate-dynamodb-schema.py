@@ -6,14 +6,23 @@ Migrates PPMT-AMP-Prices table to PPMT-AMP-Items (PopMart-optimized schema)
 
 import boto3
 import json
+import os
+import sys
 import time
 from datetime import datetime, timedelta
 from decimal import Decimal
 
-# AWS Configuration
-REGION = 'us-east-1'
+# AWS Configuration (tables are created and written in the home region; global table
+# replicas pick the data up from there)
+REGION = os.environ.get('HOME_REGION', 'us-east-1')
 OLD_TABLE_NAME = 'PPMT-AMP-Prices'
 NEW_TABLE_NAME = 'PPMT-AMP-Items'
+SERIES_TABLE_NAME = 'PPMT-AMP-Series'
+CATALOG_VERSION_ID = '#catalog'  # storage_backend.CATALOG_VERSION_ID: bumped when series are added
+
+# Canonical catalog (JSON list of Items) used to resolve old product names
+CATALOG_FILE = os.environ.get('CATALOG_FILE')
+ETL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'etl')
 
 # Initialize AWS clients
 dynamodb = boto3.client('dynamodb', region_name=REGION)
@@ -211,6 +220,23 @@ def create_new_table():
         print(f"✗ Error creating new table: {str(e)}")
         raise
 
+def load_resolver():
+    """Entity resolver and catalog from CATALOG_FILE ((None, {}) without a catalog)"""
+    if not CATALOG_FILE:
+        print("⚠️  CATALOG_FILE not set - every product will map to SERIES-UNKNOWN-DEFAULT")
+        return None, {}
+    sys.path.insert(0, ETL_DIR)
+    from engine import load_catalog_file
+    from entity_resolution import ENTITY_INDEX_FILE, EntityResolver
+    
+    catalog = load_catalog_file(CATALOG_FILE)
+    resolver = EntityResolver.load(ENTITY_INDEX_FILE)
+    changes = resolver.update(catalog)
+    resolver.save(ENTITY_INDEX_FILE)
+    print(f"✓ Entity index: {changes['products']} catalog products "
+          f"(+{changes['added']} ~{changes['renamed']} -{changes['removed']})")
+    return resolver, catalog
+
 def transform_old_data_to_new_schema(old_items):
     """Transform old schema items to new schema format"""
     print(f"\n{'='*80}")
@@ -219,42 +245,8 @@ def transform_old_data_to_new_schema(old_items):
     
     new_items = []
     
-    # Mapping for old products to new PopMart structure
-    product_mapping = {
-        'iPhone 16 Pro': {
-            'SeriesId': 'SERIES-LABUBU-MONSTERS',
-            'ProductId': 'PROD-LABUBU-MONSTERS-001',
-            'ProductName': 'Labubu Sitting with Soda',
-            'IpCharacter': 'Labubu',
-            'SeriesName': 'Monsters Series',
-            'Rarity': 'Common',
-            'SeriesSize': 12,
-            'ImageUrl': 'https://cdn.popmart.com/labubu-monsters-001.jpg',
-            'Description': 'Labubu sitting with a refreshing soda drink'
-        },
-        'MacBook Pro 16': {
-            'SeriesId': 'SERIES-LABUBU-MONSTERS',
-            'ProductId': 'PROD-LABUBU-MONSTERS-SECRET',
-            'ProductName': 'Labubu Golden Monster (Secret)',
-            'IpCharacter': 'Labubu',
-            'SeriesName': 'Monsters Series',
-            'Rarity': 'Secret',
-            'SeriesSize': 12,
-            'ImageUrl': 'https://cdn.popmart.com/labubu-monsters-secret.jpg',
-            'Description': 'Ultra rare golden Labubu - 1/144 chance'
-        },
-        'AirPods Pro': {
-            'SeriesId': 'SERIES-HIRONO-WINTER2024',
-            'ProductId': 'PROD-HIRONO-WINTER2024-003',
-            'ProductName': 'Hirono with Snowflakes',
-            'IpCharacter': 'Hirono',
-            'SeriesName': 'Winter Collection 2024',
-            'Rarity': 'Rare',
-            'SeriesSize': 8,
-            'ImageUrl': 'https://cdn.popmart.com/hirono-winter-003.jpg',
-            'Description': 'Hirono surrounded by winter snowflakes'
-        }
-    }
+    # Resolve old product names against the canonical catalog
+    resolver, catalog = load_resolver()
     
     for idx, old_item in enumerate(old_items, 1):
         print(f"Transforming item {idx}/{len(old_items)}: {old_item.get('Product', 'Unknown')}")
@@ -262,10 +254,24 @@ def transform_old_data_to_new_schema(old_items):
         # Get product name from old schema
         old_product_name = old_item.get('Product', 'Unknown Product')
         
-        # Get mapped data or use defaults
-        if old_product_name in product_mapping:
-            mapped = product_mapping[old_product_name]
+        # Get matched catalog data or use defaults
+        product_id, score, status = resolver.match(old_product_name) if resolver else (None, 0.0, 'unmatched')
+        if product_id:
+            catalog_item = catalog[product_id]
+            mapped = {
+                'SeriesId': catalog_item['SeriesId'],
+                'ProductId': product_id,
+                'ProductName': catalog_item.get('ProductName', old_product_name),
+                'IpCharacter': catalog_item.get('IpCharacter', 'Unknown'),
+                'SeriesName': catalog_item.get('SeriesName', 'Unknown Series'),
+                'Rarity': catalog_item.get('Rarity', 'Common'),
+                'SeriesSize': int(catalog_item.get('SeriesSize', 1)),
+                'ImageUrl': catalog_item.get('ImageUrl', ''),
+                'Description': catalog_item.get('Description', '')
+            }
+            print(f"  Matched catalog product {product_id} ({status}, score {score:.2f})")
         else:
+            print(f"  ⚠️  No catalog match ({status}), using SERIES-UNKNOWN-DEFAULT")
             # Default mapping for unknown products
             mapped = {
                 'SeriesId': 'SERIES-UNKNOWN-DEFAULT',
@@ -337,6 +343,18 @@ def load_data_to_new_table(new_items):
             raise
     
     print(f"\n✓ Loaded {len(new_items)} items into '{NEW_TABLE_NAME}'")
+    
+    # Readers key cached responses on the series Version counter: bump every series loaded, then
+    # the catalog version that published series lists check
+    series_table = dynamodb_resource.Table(SERIES_TABLE_NAME)
+    series_ids = sorted({item['SeriesId'] for item in new_items})
+    for series_id in series_ids + [CATALOG_VERSION_ID]:
+        series_table.update_item(
+            Key={'SeriesId': series_id},
+            UpdateExpression='ADD Version :one SET VersionUpdatedAt = :now',
+            ExpressionAttributeValues={':one': 1, ':now': datetime.utcnow().isoformat()}
+        )
+    print(f"✓ Bumped the Version of {len(series_ids)} series")
 
 def enable_ttl():
     """Enable TTL on the new table"""
@@ -5,12 +5,14 @@ Populate DynamoDB with dummy PopMart product data for testing
 
 import boto3
 import json
+import os
 from datetime import datetime
 
-# Initialize DynamoDB client
-dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+# Initialize DynamoDB client (writes go to the home region; replicas follow)
+dynamodb = boto3.resource('dynamodb', region_name=os.environ.get('HOME_REGION', 'us-east-1'))
 items_table = dynamodb.Table('PPMT-AMP-Items')
 series_table = dynamodb.Table('PPMT-AMP-Series')
+CATALOG_VERSION_ID = '#catalog'  # storage_backend.CATALOG_VERSION_ID: bumped when series are added
 
 # Dummy product data for popular PopMart series
 dummy_items = [
@@ -411,11 +413,27 @@ def populate_series():
     
     for series in dummy_series:
         try:
-            series_table.put_item(Item=series)
+            # Update in place so the Version counter is incremented atomically (readers key cached
+            # responses on it); a put would have to read the old Version first and could lose a bump
+            fields = {name: value for name, value in series.items() if name != 'SeriesId'}
+            assignments = ', '.join(f"#f{i} = :f{i}" for i in range(len(fields)))
+            series_table.update_item(
+                Key={'SeriesId': series['SeriesId']},
+                UpdateExpression=f"SET {assignments}, VersionUpdatedAt = :now ADD Version :one",
+                ExpressionAttributeNames={f"#f{i}": name for i, name in enumerate(fields)},
+                ExpressionAttributeValues={**{f":f{i}": value for i, value in enumerate(fields.values())},
+                                           ':one': 1, ':now': datetime.utcnow().isoformat()}
+            )
             print(f"✓ Added: {series['SeriesName']} ({series['IpCharacter']})")
         except Exception as e:
             print(f"✗ Failed to add {series['SeriesName']}: {str(e)}")
     
+    # Published series lists check the catalog version for series added since the publish
+    series_table.update_item(
+        Key={'SeriesId': CATALOG_VERSION_ID},
+        UpdateExpression='SET VersionUpdatedAt = :now ADD Version :one',
+        ExpressionAttributeValues={':one': 1, ':now': datetime.utcnow().isoformat()}
+    )
     print(f"\n✅ Successfully added {len(dummy_series)} series to PPMT-AMP-Series")
 
 def main():
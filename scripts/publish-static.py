@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Static Page Publisher
+Renders the series list, every series' items and the items and series of every IpCharacter to
+gzip-compressed, content-addressed JSON pages with a versioned manifest (etl/publish.py), in a
+local directory or the static bucket (STATIC_BUCKET). Run it after each data load;
+run-pipeline.py does so with --publish. --verify answers every published query through the
+handler twice, once with a query and once from its page, and compares the two answers and
+their DynamoDB calls. With the local backend it then adds a series, as a populate or migration
+run would, and checks that the series list pages are no longer served; and bumps one series'
+Version, as a price management write would, and checks that the series' page is no longer served.
+
+Usage:
+    # Local backend (seeded), pages under data/static/
+    python3 scripts/publish-static.py --backend local --verify
+
+    # Live table to the bucket behind the CDN
+    STATIC_BUCKET=ppmt-amp-static python3 scripts/publish-static.py --backend dynamodb
+
+    # Summarize the current manifest
+    python3 scripts/publish-static.py --inspect
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from urllib.parse import parse_qsl
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'etl'))
+
+from local_api import build_event, create_local_backend  # noqa: E402
+
+os.environ.setdefault('METRICS_MODE', 'off')
+
+import metrics  # noqa: E402
+import price_query_handler as handler  # noqa: E402
+import publish  # noqa: E402
+from latency_histogram import LatencyHistogram  # noqa: E402
+from static_pages import StaticPages, page_key  # noqa: E402
+from storage_backend import bump_series_versions, serialize_dynamodb_item, set_storage_backend  # noqa: E402
+
+
+def open_backend(args):
+    if args.backend == 'local':
+        if args.db and os.path.exists(args.db):
+            from local_dynamodb import LocalDynamoDB
+            return LocalDynamoDB(args.db)
+        return create_local_backend(path=args.db or ':memory:')
+    from storage_backend import get_storage_backend
+    os.environ['STORAGE_BACKEND'] = 'dynamodb'
+    return get_storage_backend()
+
+
+def inspect(store, prefix):
+    manifest = publish.read_manifest(store, prefix)
+    if manifest is None:
+        sys.exit(f"✗ No manifest under {prefix}/")
+    pages = manifest['pages']
+    print("=" * 70)
+    print(f"STATIC PAGES v{manifest['version']} (published {manifest['publishedAt']} from {manifest['source']})")
+    print("=" * 70)
+    kinds = {}
+    for key, page in pages.items():
+        kind = key.split('=')[0]
+        counts = kinds.setdefault(kind, {'pages': 0, 'items': 0, 'bytes': 0, 'raw_bytes': 0, 'incomplete': 0})
+        counts['pages'] += 1
+        counts['items'] += page['items']
+        counts['bytes'] += page['bytes']
+        counts['raw_bytes'] += page['rawBytes']
+        counts['incomplete'] += not page['complete']
+    for kind, counts in sorted(kinds.items()):
+        print(f"  {kind:<24} {counts['pages']:>5} pages {counts['items']:>7} items  "
+              f"{counts['raw_bytes'] / 1024:8.1f}KB -> {counts['bytes'] / 1024:7.1f}KB gzip"
+              + (f"  ⚠️  {counts['incomplete']} over the page limit" if counts['incomplete'] else ''))
+
+
+def verify(location):
+    """Every published query answered by a query and by its page: (mismatches, dynamic, static)"""
+    pages = StaticPages(location, ttl=3600)
+    manifest = pages.current()
+    records = []
+    metrics.add_sink(records.append)
+    handler.QUERY_CACHE = False  # every dynamic answer runs its query
+    handler._static_pages = pages
+    stats = {mode: {'histogram': LatencyHistogram(), 'calls': 0, 'static': 0} for mode in ('off', 'serve')}
+    mismatches = []
+    now = int(time.time())
+    log = io.StringIO()
+    for i, key in enumerate(sorted(manifest['pages'])):
+        path, _, query = key.partition('?')
+        # The page's full row count, so the query returns what the page holds
+        params = dict(parse_qsl(query), limit=str(manifest['pageLimit']))
+        answers = {}
+        for mode in stats:
+            handler.STATIC_PAGES = mode
+            # One device per request keeps the run clear of rate limiting
+            event = build_event(path, params, f"publish-verify-{mode}-{i}", timestamp=now,
+                                headers={'Accept': 'application/json'})
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(log):
+                response = handler.lambda_handler(event, None)
+            stats[mode]['histogram'].record((time.perf_counter() - start) * 1_000_000)
+            stats[mode]['calls'] += records[-1].get('DynamoDBCalls', 0)
+            stats[mode]['static'] += 'X-Static-Version' in (response.get('headers') or {})
+            answers[mode] = json.loads(response['body'])['data'] if response['statusCode'] == 200 else None
+        if answers['off'] is None or json.dumps(answers['off'], default=str) != json.dumps(answers['serve']):
+            mismatches.append(key)
+    metrics.remove_sink(records.append)
+    handler.STATIC_PAGES = 'off'
+    return mismatches, stats, len(manifest['pages'])
+
+
+def answer(path, params, request_id):
+    """(whether the handler answered, whether from its static page) for one query"""
+    handler.STATIC_PAGES = 'serve'
+    event = build_event(path, params, request_id, headers={'Accept': 'application/json'})
+    with contextlib.redirect_stdout(io.StringIO()):
+        response = handler.lambda_handler(event, None)
+    handler.STATIC_PAGES = 'off'
+    return response['statusCode'] == 200, 'X-Static-Version' in (response.get('headers') or {})
+
+
+def verify_new_series(location, backend):
+    """[(page key, whether it was served before, whether a query answered after)] for the pages
+    listing series, around adding a series to one of their IpCharacters"""
+    pages = StaticPages(location, ttl=3600)
+    handler._static_pages = pages
+    ip_character = next(dict(parse_qsl(key.partition('?')[2]))['ipCharacter']
+                        for key in sorted(pages.current()['pages']) if key.startswith('/series?ipCharacter='))
+    limit = {'limit': str(pages.current()['pageLimit'])}  # what the pages hold
+    queries = [('/series', limit), ('/series', dict(limit, ipCharacter=ip_character)),
+               ('/prices', dict(limit, ipCharacter=ip_character))]
+    before = [answer(path, params, f"publish-verify-list-{i}") for i, (path, params) in enumerate(queries)]
+    backend.put_item(TableName=handler.SERIES_TABLE, Item=serialize_dynamodb_item({
+        'SeriesId': 'SERIES-VERIFY-NEW-001', 'SeriesName': 'Verify Series', 'IpCharacter': ip_character
+    }))
+    bump_series_versions(backend, ['SERIES-VERIFY-NEW-001'])
+    after = [answer(path, params, f"publish-verify-new-{i}") for i, (path, params) in enumerate(queries)]
+    return [(page_key(path, params), all(served), ok and not static)
+            for (path, params), served, (ok, static) in zip(queries, before, after)]
+
+
+def verify_outdated(location, backend):
+    """(page key, whether a query answered) for a series page after a write bumps the series' Version"""
+    pages = StaticPages(location, ttl=3600)
+    handler._static_pages = pages
+    key = next(key for key in sorted(pages.current()['pages']) if key.startswith('/prices?seriesId='))
+    path, _, query = key.partition('?')
+    params = dict(parse_qsl(query))
+    bump_series_versions(backend, [params['seriesId']])
+    ok, static = answer(path, params, 'publish-verify-outdated')
+    return key, ok and not static
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=['local', 'dynamodb'], default='local')
+    parser.add_argument('--db', metavar='PATH', help='Local backend: SQLite file (created and seeded if missing)')
+    parser.add_argument('--root', default=publish.STATIC_ROOT, help='Local directory standing in for the bucket')
+    parser.add_argument('--prefix', default=publish.STATIC_PREFIX)
+    parser.add_argument('--page-limit', type=int, default=publish.PAGE_LIMIT, help='Rows a page may hold')
+    parser.add_argument('--workers', type=int, default=publish.PUBLISH_WORKERS, help='Queries run in parallel')
+    parser.add_argument('--verify', action='store_true', help='Compare every page with the handler (local root)')
+    parser.add_argument('--inspect', action='store_true', help='Summarize the current manifest and exit')
+    args = parser.parse_args()
+
+    store = publish.open_static_store(args.root)
+    if args.inspect:
+        inspect(store, args.prefix)
+        return
+
+    backend = open_backend(args)
+    set_storage_backend(backend)
+    start = time.perf_counter()
+    summary = publish.publish(backend, store, args.prefix, args.page_limit, args.workers, source=args.backend)
+    elapsed = time.perf_counter() - start
+    print("=" * 70)
+    target = f"s3://{publish.STATIC_BUCKET}" if publish.STATIC_BUCKET else args.root
+    print(f"PUBLISHED v{summary['version']} in {elapsed:.2f}s to {target}/{args.prefix}")
+    print("=" * 70)
+    print(f"  Pages:     {summary['pages']} ({summary['written']} written, {summary['unchanged']} unchanged, "
+          f"{summary['removed']} old page(s) removed)")
+    print(f"  Size:      {summary['raw_bytes'] / 1024:.1f}KB JSON -> {summary['bytes'] / 1024:.1f}KB gzip "
+          f"({summary['bytes'] / max(summary['raw_bytes'], 1):.0%})")
+    if summary['incomplete']:
+        print(f"  ⚠️  {summary['incomplete']} page(s) over the {args.page_limit}-row limit are answered by queries")
+    print()
+    inspect(store, args.prefix)
+
+    if args.verify:
+        if publish.STATIC_BUCKET:
+            sys.exit("✗ --verify reads the pages from --root (unset STATIC_BUCKET)")
+        mismatches, stats, total = verify(os.path.join(args.root, args.prefix))
+        print()
+        print("=" * 70)
+        print(f"VERIFY ({total} published queries, each answered with a query and from its page)")
+        print("=" * 70)
+        for mode, label in (('off', 'query'), ('serve', 'static page')):
+            s = stats[mode]['histogram'].summary_ms()
+            print(f"  {label:<12} p50 {s['p50']:7.3f}ms  p95 {s['p95']:7.3f}ms  "
+                  f"DynamoDB calls {stats[mode]['calls'] / total:.1f}/request  "
+                  f"answered from a page {stats[mode]['static']}/{total}")
+        mark = '✓' if not mismatches else '✗'
+        print(f"  {mark} {total - len(mismatches)}/{total} pages match the handler's answer")
+        for key in mismatches[:10]:
+            print(f"      {key}")
+        queried = True
+        if args.backend == 'local':
+            for key, served, listed in verify_new_series(os.path.join(args.root, args.prefix), backend):
+                print(f"  {'✓' if served and listed else '✗'} After a series is added, {key} is "
+                      f"{'answered by a query' if listed else 'not answered by a query'}"
+                      f"{'' if served else ' (and it was not served from its page before)'}")
+                queried = queried and served and listed
+            key, outdated = verify_outdated(os.path.join(args.root, args.prefix), backend)
+            print(f"  {'✓' if outdated else '✗'} After a write to its series, {key} is "
+                  f"{'answered by a query' if outdated else 'not answered by a query'}")
+            queried = queried and outdated
+        if mismatches or not queried:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
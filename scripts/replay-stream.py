@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+PPMT-AMP Change Stream Replay
+Replays a file of DynamoDB Streams records (JSON lines, as written by the local backend with
+LOCAL_STREAM_FILE) through the stream processor sinks: series aggregates, CloudFront invalidations
+(recorded locally), the delta sync change log and, optionally, series version bumps. Each sink checkpoints its progress, so
+running the replay again only delivers records appended since.
+
+Usage:
+    # Generate a stream from random price updates on a seeded local table, then replay it
+    python3 scripts/replay-stream.py --demo 500 --stream-file /tmp/items-stream.jsonl --db /tmp/ppmt-amp.db
+
+    # Replay (or resume) a captured stream against a local database
+    python3 scripts/replay-stream.py --stream-file /tmp/items-stream.jsonl --db /tmp/ppmt-amp.db
+
+    # Simulate slow invalidations to exercise backpressure
+    python3 scripts/replay-stream.py --stream-file /tmp/items-stream.jsonl --db /tmp/ppmt-amp.db --cdn-duration 2
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+from local_api import build_management_event, create_local_backend
+
+os.environ.setdefault('METRICS_MODE', 'off')
+
+import stream_processor  # noqa: E402
+from local_dynamodb import LocalDynamoDB  # noqa: E402
+from storage_backend import create_default_tables, deserialize_dynamodb_item, set_storage_backend  # noqa: E402
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+DEFAULT_CHECKPOINTS = os.path.join(REPO_ROOT, 'data', 'processed', 'stream_checkpoints.json')
+
+
+def open_backend(path, stream_file=None):
+    """Local backend on `path` (created and seeded if missing), capturing Items changes to stream_file"""
+    if path and os.path.exists(path):
+        backend = LocalDynamoDB(path, stream_path=stream_file)
+        create_default_tables(backend)
+        set_storage_backend(backend)
+        return backend
+    backend = create_local_backend(path=path or ':memory:')
+    backend.stream_path = stream_file
+    return backend
+
+
+def generate_demo_stream(backend, updates, batch_size=25, seed=7):
+    """Apply random price corrections through the price management handler"""
+    from price_management_handler import lambda_handler
+
+    rng = random.Random(seed)
+    run_id = uuid.uuid4().hex[:8]
+    items = [deserialize_dynamodb_item(item) for item in backend.scan(TableName='PPMT-AMP-Items')['Items']]
+    applied = 0
+    while applied < updates:
+        batch = []
+        for _ in range(min(batch_size, updates - applied)):
+            item = rng.choice(items)
+            batch.append({'SeriesId': item['SeriesId'], 'ProductId': item['ProductId'],
+                          'AfterMarketPrice': round(float(item['AfterMarketPrice']) * rng.uniform(0.9, 1.1), 2)})
+        event = build_management_event('/prices/batch', {'requestId': f"demo-{run_id}-{applied}", 'updates': batch},
+                                       'replay-demo')
+        response = lambda_handler(event, None)
+        if response['statusCode'] != 200:
+            sys.exit(f"✗ Demo update failed: {response['body']}")
+        applied += len(batch)
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stream-file', required=True, help='JSON lines file of stream records')
+    parser.add_argument('--db', metavar='PATH', help='Local backend SQLite file (created and seeded if missing)')
+    parser.add_argument('--checkpoints', default=DEFAULT_CHECKPOINTS, help='Sink checkpoint file')
+    parser.add_argument('--sinks', default=','.join(stream_processor.STREAM_SINKS),
+                        help='Comma-separated sinks to run (add versions for writers that do not bump)')
+    parser.add_argument('--batch-size', type=int, default=stream_processor.BATCH_SIZE)
+    parser.add_argument('--max-pending', type=int, default=stream_processor.MAX_PENDING_BATCHES,
+                        help='Queued batches per sink before the reader blocks')
+    parser.add_argument('--invalidation-log', metavar='PATH', help='Append local CloudFront invalidations here')
+    parser.add_argument('--cdn-duration', type=float, default=0.0,
+                        help='Seconds a local invalidation stays in progress')
+    parser.add_argument('--demo', type=int, metavar='N', help='First apply N random price updates (captured)')
+    args = parser.parse_args()
+
+    if args.demo:
+        backend = open_backend(args.db, args.stream_file)
+        applied = generate_demo_stream(backend, args.demo)
+        print(f"✓ Applied {applied} price updates (stream: {args.stream_file})")
+    else:
+        backend = open_backend(args.db)
+
+    if not os.path.exists(args.stream_file):
+        sys.exit(f"✗ Stream file not found: {args.stream_file}")
+
+    cloudfront = stream_processor.LocalCloudFront(args.invalidation_log, args.cdn_duration)
+    sinks = stream_processor.create_sinks([name.strip() for name in args.sinks.split(',') if name.strip()],
+                                          dynamodb=backend, cloudfront=cloudfront, distribution_id='LOCAL')
+    # Few wildcard invalidations may be in flight locally, so a slow CDN visibly pushes back
+    for sink in sinks:
+        if isinstance(sink, stream_processor.CloudFrontInvalidationSink) and args.cdn_duration:
+            sink.max_in_progress = 2
+    checkpoints = stream_processor.FileCheckpointStore(args.checkpoints)
+    processor = stream_processor.StreamProcessor(sinks, checkpoints, args.batch_size, args.max_pending)
+
+    scope = os.path.abspath(args.stream_file)
+    start = time.perf_counter()
+    report = processor.run(stream_processor.read_stream_file(args.stream_file), scope)
+    elapsed = time.perf_counter() - start
+
+    print("=" * 70)
+    print(f"STREAM REPLAY {args.stream_file}")
+    print("=" * 70)
+    print(f"  Elapsed: {elapsed:.2f}s, batch size {args.batch_size}, {args.max_pending} pending batches per sink")
+    for name, stats in report.items():
+        mark = '✗' if stats['error_count'] else '✓'
+        extra = {key: value for key, value in stats.items()
+                 if key not in ('batches', 'records', 'changes', 'skipped', 'backpressure', 'errors',
+                                'error_count', 'elapsed_ms', 'checkpoint')}
+        print(f"  {mark} {name:<11} records={stats['records']:<7} changes={stats['changes']:<7} "
+              f"skipped={stats['skipped']:<7} batches={stats['batches']:<5} backpressure={stats['backpressure']:<4} "
+              f"{stats['elapsed_ms']:.1f}ms {json.dumps(extra)}")
+        if stats['error_count'] > len(stats['errors']):
+            print(f"      {stats['error_count']} errors, the latest {len(stats['errors'])}:")
+        for error in stats['errors']:
+            print(f"      {error}")
+        print(f"      checkpoint: {stats['checkpoint']}")
+    if cloudfront.invalidations:
+        paths = sum(len(i['InvalidationBatch']['Paths']['Items']) for i in cloudfront.invalidations)
+        print(f"  = {len(cloudfront.invalidations)} invalidation(s), {paths} path(s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Local Incremental ETL
+Runs the validate / normalize / deduplicate / match / enrich stages on raw daily partitions
+(data/raw/YYYY-MM-DD/) in process and produces PPMT-AMP-Items BatchWriteItem requests under
+data/output/YYYY-MM-DD/. Partitions whose files are unchanged since the last run are skipped.
+
+Usage:
+    # Offline: seeded local catalog plus a synthetic raw partition
+    python3 scripts/run-etl.py --backend local --sample-partition 2025-12-21
+
+    # Catalog from PPMT-AMP-Items, write the results back
+    python3 scripts/run-etl.py --backend dynamodb --apply
+
+    # Reprocess one partition even if unchanged
+    python3 scripts/run-etl.py --catalog catalog.json --partition 2025-12-21 --force
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'etl'))
+
+import engine  # noqa: E402
+from aggregation import PRICE_HISTORY_DB, PriceHistory  # noqa: E402
+from diff_sync import FINGERPRINT_DB, FingerprintIndex  # noqa: E402
+from entity_resolution import ENTITY_INDEX_FILE, EntityResolver  # noqa: E402
+from local_api import create_local_backend  # noqa: E402
+from snapshot import latest_snapshot, load_catalog_snapshot  # noqa: E402
+from sample_feeds import generate_sample_partition  # noqa: E402
+
+
+def open_backend(args):
+    if args.backend == 'local':
+        if args.db and os.path.exists(args.db):
+            from local_dynamodb import LocalDynamoDB
+            from storage_backend import set_storage_backend
+            backend = LocalDynamoDB(args.db)
+            set_storage_backend(backend)
+            return backend
+        return create_local_backend(path=args.db or ':memory:')
+    from storage_backend import get_storage_backend
+    os.environ['STORAGE_BACKEND'] = 'dynamodb'
+    return get_storage_backend()
+
+
+def print_report(results, elapsed):
+    print("=" * 70)
+    print("ETL RUN")
+    print("=" * 70)
+    if not results:
+        print("✓ No new or changed partitions")
+        return
+    for stats in results:
+        rejected = ', '.join(f"{reason}={count}" for reason, count in sorted(stats['rejected'].items())) or 'none'
+        print(f"\nPartition {stats['partition']}  ({stats['elapsed_ms']:.1f}ms)")
+        print(f"  Files:          {', '.join(f'{name} ({rows})' for name, rows in stats['files'].items())}")
+        print(f"  Rows in:        {stats['rows_in']}")
+        print(f"  Rejected:       {rejected}")
+        if 'match' in stats:
+            print(f"  Matched:        {', '.join(f'{status}={count}' for status, count in sorted(stats['match'].items()))}")
+        print(f"  Duplicates:     {stats['duplicates']}")
+        print(f"  Anomalies:      {stats['anomalies']}")
+        print(f"  Outliers:       {stats['outliers']} (MAD rejection)")
+        print(f"  Clean rows:     {stats['rows_clean']}")
+        stale = f" ({stats['stale']} older than the stored price, skipped)" if stats['stale'] else ''
+        print(f"  Items out:      {stats['items_out']}{stale}")
+        print(f"  Trends:         {', '.join(f'{trend}={count}' for trend, count in sorted(stats['trends'].items()))}")
+        if 'changes' in stats:
+            changes = stats['changes']
+            print(f"  Changes:        +{changes['inserts']} ~{changes['updates']} -{changes['deletes']} "
+                  f"={changes['unchanged']}  (change ratio {changes['change_ratio']:.1%})")
+        print(f"  Write batches:  {stats['batches']}")
+        print(f"  Stage ms:       {', '.join(f'{stage}={ms:.1f}' for stage, ms in stats['stage_ms'].items())}")
+        if stats.get('output_dir'):
+            print(f"  Output:         {stats['output_dir']}")
+    print(f"\n✓ Processed {len(results)} partition(s) in {elapsed:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--raw-dir', default=engine.RAW_DIR)
+    parser.add_argument('--staged', action='store_true',
+                        help='Read the ingested staging partitions (ingest-raw.py output) instead of raw feeds')
+    parser.add_argument('--staging-dir', default=engine.STAGING_DIR)
+    parser.add_argument('--output-dir', default=engine.OUTPUT_DIR)
+    parser.add_argument('--state', default=engine.STATE_FILE, help='Partition fingerprint state file')
+    parser.add_argument('--catalog', metavar='PATH', help='Catalog JSON (list of Items); default: scan the backend')
+    parser.add_argument('--catalog-snapshot', metavar='PATH',
+                        help="Catalog from a table snapshot (export-snapshot.py) instead of a scan, or 'latest'")
+    parser.add_argument('--backend', choices=['local', 'dynamodb'], default='local')
+    parser.add_argument('--db', metavar='PATH', help='Local backend: SQLite file (created and seeded if missing)')
+    parser.add_argument('--apply', action='store_true', help='Write the batches to the backend')
+    parser.add_argument('--partition', action='append', help='Only process these partitions (repeatable)')
+    parser.add_argument('--force', action='store_true', help='Reprocess partitions even if unchanged')
+    parser.add_argument('--no-save-state', action='store_true', help='Do not record processed partitions')
+    parser.add_argument('--index', default=FINGERPRINT_DB, help='Fingerprint index for change-only writes')
+    parser.add_argument('--full-writes', action='store_true', help='Write every item (ignore the fingerprint index)')
+    parser.add_argument('--full-load', action='store_true',
+                        help='Partitions price the whole catalog: delete indexed products they no longer price')
+    parser.add_argument('--rebuild-index', action='store_true',
+                        help='Rebuild the fingerprint index from the current table contents first')
+    parser.add_argument('--entity-index', default=ENTITY_INDEX_FILE, help='Persisted product-name resolver index')
+    parser.add_argument('--exact-match', action='store_true',
+                        help='Match listings by exact normalized name only (no entity resolution)')
+    parser.add_argument('--history', default=PRICE_HISTORY_DB, help='Daily price history for rolling trends')
+    parser.add_argument('--sample-partition', metavar='YYYY-MM-DD',
+                        help='Generate a synthetic raw partition from the catalog first')
+    args = parser.parse_args()
+
+    backend = None
+    if args.catalog:
+        catalog = engine.load_catalog_file(args.catalog)
+    elif args.catalog_snapshot:
+        path = latest_snapshot() if args.catalog_snapshot == 'latest' else args.catalog_snapshot
+        if not path:
+            sys.exit("✗ No snapshot found - run scripts/export-snapshot.py first")
+        catalog = load_catalog_snapshot(path)
+        print(f"Catalog snapshot: {path}")
+    else:
+        backend = open_backend(args)
+        catalog = engine.load_catalog_from_backend(backend)
+    print(f"Catalog: {len(catalog)} products")
+
+    if args.sample_partition:
+        path = generate_sample_partition(catalog, args.sample_partition, args.raw_dir)
+        print(f"Generated sample partition {path}")
+
+    if args.apply and backend is None:
+        backend = open_backend(args)
+
+    index = None
+    if not args.full_writes:
+        index = FingerprintIndex(args.index)
+        if args.rebuild_index:
+            if backend is None:
+                backend = open_backend(args)
+            from_file = args.catalog or args.catalog_snapshot
+            items = engine.load_catalog_from_backend(backend).values() if from_file else catalog.values()
+            print(f"Rebuilt fingerprint index: {index.rebuild(items)} items")
+
+    resolver = None
+    if not args.exact_match:
+        resolver = EntityResolver.load(args.entity_index)
+        changes = resolver.update(catalog)
+        print(f"Entity index: {changes['products']} products (+{changes['added']} ~{changes['renamed']} "
+              f"-{changes['removed']}), {len(resolver.aliases)} aliases, {len(resolver.suggested)} suggested")
+
+    start = time.perf_counter()
+    results = engine.run_incremental(
+        catalog,
+        raw_dir=args.staging_dir if args.staged else args.raw_dir,
+        state_path=args.state,
+        output_dir=args.output_dir,
+        backend=backend if args.apply else None,
+        only=set(args.partition) if args.partition else None,
+        force=args.force,
+        save=not args.no_save_state,
+        index=index,
+        resolver=resolver,
+        history=PriceHistory(args.history),
+        full_load=args.full_load
+    )
+    if resolver is not None:
+        resolver.save(args.entity_index)
+    print_report(results, time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Daily Pipeline
+Runs the daily chain from docs/ETL_PIPELINE.md as a DAG: one ingest stage per feed listed in
+raw/YYYY-MM-DD/manifest.json (load), then the transform stage (validate, clean, match, enrich and
+sync), and optionally a table snapshot and a static page publish. Stages whose inputs are
+unchanged since their last successful run are skipped, independent stages run in parallel, and
+every run is appended to data/processed/pipeline_runs.jsonl with per-stage timings and row
+counts. After one feed fails, a re-run ingests only that feed and then re-runs the stages
+downstream of it.
+
+Usage:
+    # Offline: synthetic partition, local backend
+    python3 scripts/run-pipeline.py --sample-partition 2025-12-21 --db /tmp/ppmt-local.db --apply
+
+    # All partitions in the bucket, write to DynamoDB, export a snapshot and publish static pages
+    S3_BUCKET=ppmt-amp-data-sync-363416481362 STATIC_BUCKET=ppmt-amp-static python3 scripts/run-pipeline.py \\
+        --bucket-from-env --backend dynamodb --apply --snapshot --publish
+
+    # Recent runs
+    python3 scripts/run-pipeline.py --log 5
+
+    # Check failure handling: a failed feed blocks its downstream stage, is logged and re-runs alone
+    python3 scripts/run-pipeline.py --verify-failed-feed
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'etl'))
+
+import engine  # noqa: E402
+import ingest  # noqa: E402
+from aggregation import PRICE_HISTORY_DB, PriceHistory  # noqa: E402
+from dag import MAX_WORKERS, PIPELINE_CACHE_FILE, RUN_LOG_FILE, Pipeline, Stage, StageFailed, read_run_log  # noqa: E402
+from diff_sync import FINGERPRINT_DB, FingerprintIndex  # noqa: E402
+from entity_resolution import ENTITY_INDEX_FILE, EntityResolver  # noqa: E402
+from local_api import create_local_backend  # noqa: E402
+from sample_feeds import generate_sample_partition  # noqa: E402
+
+
+def open_backend(args):
+    if args.backend == 'local':
+        if args.db and os.path.exists(args.db):
+            from local_dynamodb import LocalDynamoDB
+            return LocalDynamoDB(args.db)
+        return create_local_backend(path=args.db or ':memory:')
+    from storage_backend import get_storage_backend
+    os.environ['STORAGE_BACKEND'] = 'dynamodb'
+    return get_storage_backend()
+
+
+def ingest_stage(store, partition, entry, staging_dir, chunk_rows):
+    def run(stage):
+        task = {'store': store.spec, 'partition': partition, 'entry': entry, 'staging_dir': staging_dir,
+                'force': False, 'chunk_rows': chunk_rows}
+        result = ingest.ingest_file(task)
+        if result['status'] in ('checksum_mismatch', 'error'):
+            raise StageFailed(f"{result['status']}: {result.get('error')}")
+        return {'rows': result['rows'], 'parts': result['parts'], 'status': result['status']}
+
+    source = entry.get('source') or engine.source_name(entry['name'])
+    key = f"{ingest.RAW_PREFIX}/{partition}/{entry['name']}"
+    if isinstance(store, ingest.LocalObjectStore):
+        raw_input = os.path.join(store.root, key)
+    else:
+        raw_input = lambda: store.stat(key)['version']  # noqa: E731
+    return Stage(f"ingest:{partition}:{source}", run, inputs=[raw_input],
+                 outputs=[os.path.join(staging_dir, partition, source)], params={'entry': entry})
+
+
+def transform_stage(args, backend, partition, after):
+    def run(stage):
+        catalog = engine.load_catalog_from_backend(backend)
+        index = None if args.full_writes else FingerprintIndex(args.index)
+        resolver = EntityResolver.load(args.entity_index)
+        resolver.update(catalog)
+        history = PriceHistory(args.history)
+        try:
+            [stats] = engine.run_incremental(
+                catalog, raw_dir=args.staging_dir, state_path=args.state, output_dir=args.output_dir,
+                backend=backend if args.apply else None, only={partition}, force=True,
+                index=index, resolver=resolver, history=history, full_load=args.full_load
+            )
+        finally:
+            history.close()
+            if index is not None:
+                index.close()
+        resolver.save(args.entity_index)
+        return {'rows': stats['rows_in'], 'items_out': stats['items_out'], 'rejected': stats['rejected_total'],
+                'batches': stats['batches'], 'stage_ms': stats['stage_ms']}
+
+    return Stage(f"transform:{partition}", run, inputs=[os.path.join(args.staging_dir, partition)],
+                 outputs=[os.path.join(args.output_dir, partition)], params={'apply': args.apply}, after=after)
+
+
+def snapshot_stage(backend, inputs, after):
+    def run(stage):
+        import snapshot
+        from datetime import datetime
+        items = snapshot.parallel_scan(backend)
+        out = os.path.join(snapshot.SNAPSHOT_DIR, datetime.now().strftime('%Y%m%dT%H%M%S'))
+        manifest = snapshot.export_snapshot(items, out, source='pipeline')
+        return {'rows': manifest['num_rows'], 'path': out}
+
+    return Stage('snapshot', run, inputs=inputs, after=after)
+
+
+def publish_stage(args, backend, inputs, after):
+    def run(stage):
+        import publish
+        summary = publish.publish(backend, publish.open_static_store(args.root), source='pipeline')
+        return {'rows': summary['pages'], 'written': summary['written'], 'version': summary['version']}
+
+    return Stage('publish', run, inputs=inputs, after=after)
+
+
+def build_pipeline(args, store, backend):
+    partitions = args.partition or ingest.raw_partitions(store)
+    stages = []
+    previous_transform = []
+    for partition in sorted(partitions):
+        entries, has_manifest = ingest.read_manifest(store, partition)
+        os.makedirs(os.path.join(args.staging_dir, partition), exist_ok=True)
+        if has_manifest:
+            ingest.remove_dropped_sources(args.staging_dir, partition, entries)
+        stages.extend(ingest_stage(store, partition, entry, args.staging_dir, args.chunk_rows) for entry in entries)
+        transform = transform_stage(args, backend, partition, previous_transform)
+        stages.append(transform)
+        previous_transform = [transform.name]  # partitions are applied oldest first
+    if args.snapshot and args.apply:
+        stages.append(snapshot_stage(backend, [os.path.join(args.output_dir, p) for p in partitions],
+                                     previous_transform))
+    if args.publish and args.apply:
+        stages.append(publish_stage(args, backend, [os.path.join(args.output_dir, p) for p in partitions],
+                                    previous_transform))
+    return Pipeline('daily', stages, cache_path=args.cache, log_path=args.run_log, workers=args.workers)
+
+
+def print_run(run):
+    print("=" * 70)
+    print(f"PIPELINE RUN {run['run_id']}  ({run['started_at']})")
+    print("=" * 70)
+    marks = {'ok': '✓', 'skipped': '=', 'failed': '✗', 'blocked': '⚠️ '}
+    for record in run['stages']:
+        rows = record.get('rows')
+        rows = f"{rows:>9} rows" if rows is not None else ' ' * 14
+        print(f"  {marks[record['status']]} {record['stage']:<40} {record['status']:<8} {rows} "
+              f"{record['elapsed_ms']:>10.1f}ms")
+        if record.get('error'):
+            print(f"      {record['error']}")
+        if record.get('blocked_by'):
+            print(f"      blocked by {', '.join(record['blocked_by'])}")
+    counts = {}
+    for record in run['stages']:
+        counts[record['status']] = counts.get(record['status'], 0) + 1
+    summary = ', '.join(f"{status}={count}" for status, count in sorted(counts.items()))
+    mark = '✓' if run['status'] == 'ok' else '✗'
+    print(f"\n{mark} Run {run['status']} in {run['elapsed_ms'] / 1000:.2f}s ({summary})")
+
+
+def verify_failed_feed():
+    """Two feeds, one failing fast while the other is still running, both upstream of one transform"""
+    checks = []
+    with tempfile.TemporaryDirectory() as root:
+        feeds = {name: os.path.join(root, f"{name}.csv") for name in ('good', 'bad')}
+        for path in feeds.values():
+            with open(path, 'w') as f:
+                f.write('product_id,price\n1,10\n')
+        broken = {'bad': True}
+
+        def ingest_feed(name, delay):
+            def run(stage):
+                time.sleep(delay)
+                if broken.get(name):
+                    raise StageFailed(f"checksum_mismatch: {name}")
+                os.makedirs(stage.outputs[0], exist_ok=True)
+                shutil.copy(feeds[name], os.path.join(stage.outputs[0], 'part-0.csv'))
+                return {'rows': 1}
+            return Stage(f"ingest:{name}", run, inputs=[feeds[name]], outputs=[os.path.join(root, 'staged', name)])
+
+        def transform(stage):
+            return {'rows': len(stage.inputs)}
+
+        def build():
+            stages = [ingest_feed('bad', 0.0), ingest_feed('good', 0.5),
+                      Stage('transform', transform, inputs=[os.path.join(root, 'staged', name) for name in feeds])]
+            return Pipeline('verify', stages, cache_path=os.path.join(root, 'cache.json'),
+                            log_path=os.path.join(root, 'runs.jsonl'))
+
+        first = build().run()
+        statuses = {record['stage']: record['status'] for record in first['stages']}
+        checks.append(("Failed feed recorded, the other feed finished, the transform blocked",
+                       statuses == {'ingest:bad': 'failed', 'ingest:good': 'ok', 'transform': 'blocked'}))
+        logged = read_run_log(os.path.join(root, 'runs.jsonl'))
+        checks.append(("Run log has the failed run", len(logged) == 1 and logged[0]['status'] == 'failed'))
+
+        broken.clear()
+        second = build().run()
+        statuses = {record['stage']: record['status'] for record in second['stages']}
+        checks.append(("Re-run ingests only the failed feed, then the transform",
+                       statuses == {'ingest:bad': 'ok', 'ingest:good': 'skipped', 'transform': 'ok'}))
+
+    print("=" * 70)
+    print("FAILED FEED CHECK")
+    print("=" * 70)
+    for label, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {label}")
+    return all(ok for _, ok in checks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--root', default=ingest.DATA_ROOT, help='Local directory standing in for the bucket')
+    parser.add_argument('--bucket-from-env', action='store_true', help='Read from s3://$S3_BUCKET instead')
+    parser.add_argument('--partition', action='append', help='Partitions to run (default: all in the bucket)')
+    parser.add_argument('--backend', choices=['local', 'dynamodb'], default='local')
+    parser.add_argument('--db', metavar='PATH', help='Local backend: SQLite file (created and seeded if missing)')
+    parser.add_argument('--apply', action='store_true', help='Write the items to the backend')
+    parser.add_argument('--snapshot', action='store_true', help='Export a table snapshot after applying')
+    parser.add_argument('--publish', action='store_true',
+                        help='Publish static pages after applying (to STATIC_BUCKET, else <root>/static)')
+    parser.add_argument('--force', action='store_true', help='Run every stage even if its inputs are unchanged')
+    parser.add_argument('--only', action='append', help='Run these stages (and what they depend on)')
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS, help='Stages run in parallel')
+    parser.add_argument('--chunk-rows', type=int, default=ingest.CHUNK_ROWS)
+    parser.add_argument('--staging-dir', default=engine.STAGING_DIR)
+    parser.add_argument('--output-dir', default=engine.OUTPUT_DIR)
+    parser.add_argument('--state', default=engine.STATE_FILE)
+    parser.add_argument('--index', default=FINGERPRINT_DB)
+    parser.add_argument('--full-writes', action='store_true', help='Write every item (ignore the fingerprint index)')
+    parser.add_argument('--full-load', action='store_true',
+                        help='Partitions price the whole catalog: delete indexed products they no longer price')
+    parser.add_argument('--entity-index', default=ENTITY_INDEX_FILE)
+    parser.add_argument('--history', default=PRICE_HISTORY_DB)
+    parser.add_argument('--cache', default=PIPELINE_CACHE_FILE, help='Stage cache keys')
+    parser.add_argument('--run-log', default=RUN_LOG_FILE)
+    parser.add_argument('--log', type=int, metavar='N', help='Show the last N runs and exit')
+    parser.add_argument('--sample-partition', metavar='YYYY-MM-DD', help='Generate synthetic feeds first (local)')
+    parser.add_argument('--verify-failed-feed', action='store_true',
+                        help='Run a throwaway two-feed pipeline with one failing feed and check the outcome')
+    args = parser.parse_args()
+
+    if args.verify_failed_feed:
+        if not verify_failed_feed():
+            sys.exit(1)
+        return
+
+    if args.log:
+        for run in read_run_log(args.run_log, args.log):
+            print_run(run)
+            print()
+        return
+
+    if args.bucket_from_env:
+        if not ingest.S3_BUCKET:
+            sys.exit("✗ S3_BUCKET is not set")
+        store = ingest.S3ObjectStore(ingest.S3_BUCKET)
+    else:
+        store = ingest.LocalObjectStore(args.root)
+    backend = open_backend(args)
+    if args.sample_partition:
+        catalog = engine.load_catalog_from_backend(backend)
+        path = generate_sample_partition(catalog, args.sample_partition, os.path.join(args.root, ingest.RAW_PREFIX))
+        print(f"Generated sample partition {path}")
+
+    pipeline = build_pipeline(args, store, backend)
+    run = pipeline.run(force=args.force, only=args.only)
+    print_run(run)
+    if run['status'] != 'ok':
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
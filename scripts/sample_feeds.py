@@ -0,0 +1,119 @@
+"""
+Sample Raw Feeds
+Synthetic scraper output for offline ETL runs: an eBay CSV (CNY), an Amazon JSON feed (USD) and
+a retailer XML feed (HKD) under raw/YYYY-MM-DD/, with manifest.json checksums and metadata.json,
+plus title variations (case, filler words, typos), duplicates, mispriced lots, unusable rows,
+unmatched titles and a price anomaly.
+"""
+
+import csv
+import hashlib
+import json
+import os
+import random
+from datetime import datetime
+from xml.sax.saxutils import escape, quoteattr
+
+# 1 unit -> CNY (matches the ETL engine's example rates)
+RATES = {'CNY': 1.0, 'USD': 7.10, 'HKD': 0.91}
+
+
+def _listing_title(rng, name, listing):
+    """Marketplace-style variations of a catalog product name"""
+    if listing % 2:
+        return name
+    style = rng.randrange(4)
+    if style == 0:
+        return f"  {name.lower()} "
+    if style == 1:
+        return f"POP MART {name.replace(' - ', ' ')} Blind Box"
+    if style == 2:
+        return f"{name} (Authentic, Sealed)"
+    # One adjacent-letter swap in the longest word
+    words = name.split()
+    longest = max(range(len(words)), key=lambda i: len(words[i]))
+    word = words[longest]
+    if len(word) > 3 and word.isalpha():
+        i = rng.randrange(1, len(word) - 2)
+        words[longest] = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    return ' '.join(words)
+
+
+def _file_entry(partition_dir, name, source, fmt, rows):
+    path = os.path.join(partition_dir, name)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return {'name': name, 'source': source, 'format': fmt, 'rows': rows,
+            'size': os.path.getsize(path), 'sha256': digest.hexdigest()}
+
+
+def generate_sample_partition(catalog, partition, raw_dir, seed=42, listings_per_product=4, churn=0.1):
+    """Write one day's feeds for every catalog product
+
+    Listings are stable per product across days; a `churn` fraction of products moves price each day.
+    """
+    day_rng = random.Random(f"{seed}:{partition}")
+    partition_dir = os.path.join(raw_dir, partition)
+    os.makedirs(partition_dir, exist_ok=True)
+    feeds = {'ebay': [], 'amazon': [], 'retailer': []}
+    for index, item in enumerate(sorted(catalog.values(), key=lambda i: i['ProductId'])):
+        rng = random.Random(f"{seed}:{item['ProductId']}")
+        market_price = float(item.get('RetailPrice') or 69) * rng.uniform(0.8, 9.0)
+        if day_rng.random() < churn:
+            market_price *= day_rng.uniform(0.7, 1.4)
+        for listing in range(listings_per_product):
+            price = round(market_price * rng.uniform(0.85, 1.15), 2)
+            name = _listing_title(rng, item['ProductName'], listing)
+            scraped_at = f"{partition}T02:{listing % 60:02d}:00"
+            feed = rng.choice(['ebay', 'ebay', 'amazon', 'retailer'])
+            if feed == 'ebay':
+                feeds['ebay'].append({'listing_id': f"EB-{index}-{listing}", 'title': name, 'price': price,
+                                      'currency': 'CNY', 'scraped_at': scraped_at})
+            elif feed == 'amazon':
+                feeds['amazon'].append({'id': f"AMZ-{index}-{listing}", 'name': name,
+                                        'price': round(price / RATES['USD'], 2), 'currency': 'USD',
+                                        'scraped_at': scraped_at})
+            else:
+                feeds['retailer'].append({'sku': f"RT-{index}-{listing}", 'title': name,
+                                          'price': round(price / RATES['HKD'], 2), 'currency': 'HKD',
+                                          'scraped_at': scraped_at})
+    # Re-scraped listings, unusable rows, unmatched titles and an anomaly
+    ebay = feeds['ebay']
+    ebay.extend(dict(row) for row in ebay[:len(ebay) // 20])
+    ebay.extend(dict(row, listing_id=f"{row['listing_id']}-LOT", price=round(row['price'] * 6, 2))
+                for row in ebay[1:len(ebay):40])
+    ebay.append({'listing_id': 'EB-BAD-1', 'title': '', 'price': 99, 'currency': 'CNY', 'scraped_at': partition})
+    ebay.append({'listing_id': 'EB-BAD-2', 'title': 'Labubu Keychain', 'price': 'n/a', 'currency': 'CNY',
+                 'scraped_at': partition})
+    ebay.append({'listing_id': 'EB-BAD-3', 'title': 'Unknown Figure', 'price': 59, 'currency': 'CNY',
+                 'scraped_at': partition})
+    if len(ebay) > 3:
+        ebay.append(dict(ebay[0], listing_id='EB-ANOMALY', price=999999))
+
+    with open(os.path.join(partition_dir, 'ebay_prices.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['listing_id', 'title', 'price', 'currency', 'scraped_at'])
+        writer.writeheader()
+        writer.writerows(ebay)
+    with open(os.path.join(partition_dir, 'amazon_prices.json'), 'w') as f:
+        json.dump({'source': 'amazon', 'listings': feeds['amazon']}, f)
+    with open(os.path.join(partition_dir, 'retailer_feed.xml'), 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<feed source="retailer">\n')
+        for row in feeds['retailer']:
+            f.write(f"  <listing sku={quoteattr(row['sku'])}><title>{escape(row['title'])}</title>"
+                    f"<price currency=\"{row['currency']}\">{row['price']}</price>"
+                    f"<scraped_at>{row['scraped_at']}</scraped_at></listing>\n")
+        f.write('</feed>\n')
+
+    files = [
+        _file_entry(partition_dir, 'ebay_prices.csv', 'ebay_prices', 'csv', len(ebay)),
+        _file_entry(partition_dir, 'amazon_prices.json', 'amazon_prices', 'json', len(feeds['amazon'])),
+        _file_entry(partition_dir, 'retailer_feed.xml', 'retailer_feed', 'xml', len(feeds['retailer']))
+    ]
+    with open(os.path.join(partition_dir, 'manifest.json'), 'w') as f:
+        json.dump({'partition': partition, 'files': files}, f, indent=2)
+    with open(os.path.join(partition_dir, 'metadata.json'), 'w') as f:
+        json.dump({'partition': partition, 'generated_at': datetime.now().isoformat(), 'synthetic': True,
+                   'listings': sum(entry['rows'] for entry in files), 'errors': []}, f, indent=2)
+    return partition_dir
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Local Multi-Worker ASGI Server
+Serves lambda/asgi_app.py from several forked worker processes listening on one port
+(SO_REUSEPORT), as `uvicorn --workers N` does, over a seeded local backend in a SQLite file
+that every worker opens. Each worker has its own storage client, key ring, replay guard and
+query cache L1; the query cache L2 (/tmp), the rate limit table and the replay store
+(REPLAY_STORE_TABLE) are shared by all of them.
+
+Usage:
+    python3 scripts/serve-asgi.py --workers 4 --port 8080
+    python3 scripts/load-test.py --url http://127.0.0.1:8080 --rate 400 --duration 30 --devices 5000
+
+    # Share the L2 through a Redis-protocol server instead of /tmp
+    QUERY_CACHE_L2=redis://127.0.0.1:6379/0 python3 scripts/serve-asgi.py --workers 4
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import signal
+import socket
+import tempfile
+
+from local_api import LocalAsgiServer, create_local_backend
+
+
+def free_port(host):
+    """A port the workers can share (checks that SO_REUSEPORT is available)"""
+    probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        probe.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        probe.bind((host, 0))
+        return probe.getsockname()[1]
+    finally:
+        probe.close()
+
+
+def serve(host, port):
+    """One worker: its own event loop, storage client and caches, until SIGTERM or SIGINT"""
+    async def run():
+        server = await LocalAsgiServer(host, port, reuse_port=True).start()
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stop.set)
+        await stop.wait()
+        await server.stop()
+
+    asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080, help='0 picks a free port')
+    parser.add_argument('--workers', type=int, default=4, help='Worker processes')
+    parser.add_argument('--series', type=int, default=60, help='Synthetic series')
+    parser.add_argument('--items-per-series', type=int, default=12)
+    parser.add_argument('--db', help='SQLite file of the local tables (default: a new temporary file)')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='ppmt-amp-asgi-')
+    os.environ.setdefault('METRICS_MODE', 'off')
+    os.environ['LOCAL_DB_PATH'] = args.db or os.path.join(directory, 'tables.db')
+    os.environ.setdefault('QUERY_CACHE_L2', 'disk')
+    os.environ.setdefault('QUERY_CACHE_DIR', os.path.join(directory, 'cache'))
+    if args.workers > 1:
+        # One replay store for all workers, so a request replayed to another worker is still rejected
+        os.environ.setdefault('REPLAY_STORE_TABLE', 'PPMT-AMP-ReplayGuard')
+
+    # Imported once the environment is set (storage_backend reads LOCAL_DB_PATH at import)
+    from storage_backend import set_storage_backend
+
+    # Seeded once; the workers open the file after the fork (no SQLite connection crosses it)
+    backend = create_local_backend(args.series, args.items_per_series, path=os.environ['LOCAL_DB_PATH'])
+    backend._conn.close()
+    set_storage_backend(None)
+
+    port = args.port or free_port(args.host)
+    workers = []
+    for _ in range(args.workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                serve(args.host, port)
+            finally:
+                os._exit(0)
+        workers.append(pid)
+
+    print(f"{args.workers} ASGI worker(s) listening on http://{args.host}:{port}  "
+          f"(tables {os.environ['LOCAL_DB_PATH']}, query cache L2 {os.environ['QUERY_CACHE_L2']}, "
+          f"replay store {os.environ.get('REPLAY_STORE_TABLE', 'per worker')})")
+    print("Ctrl-C to stop")
+    try:
+        for pid in workers:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in workers:
+            os.waitpid(pid, 0)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Multi-Region Routing Simulation
+Runs the query handler against local stand-in regional endpoints (one shared local table set,
+a simulated round trip per region) behind the region router, then takes the nearest replica
+down for part of the run. Reports request latency before, during and after the outage, and
+each region's calls, failures and rolling latency.
+
+Usage:
+    # A function in Tokyo with a Tokyo replica; writes go home to us-east-1
+    python3 scripts/simulate-regions.py --regions ap-northeast-1:5,us-east-1:150 --home us-east-1
+
+    # Take Tokyo down for requests 100-199, with a 1s cooldown before it is probed again
+    python3 scripts/simulate-regions.py --requests 300 --outage 100-200 --cooldown 1
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import time
+
+from local_api import build_event, create_local_backend
+from latency_histogram import LatencyHistogram
+
+os.environ.setdefault('METRICS_MODE', 'off')
+
+import metrics  # noqa: E402
+import price_query_handler as handler  # noqa: E402
+import region_router  # noqa: E402
+from storage_backend import set_storage_backend  # noqa: E402
+
+SCENARIOS = [
+    ('/prices', {'seriesId': 'SERIES-LABUBU-001', 'limit': '50'}),
+    ('/prices', {'ipCharacter': 'Hirono', 'limit': '50'}),
+    ('/series', {'ipCharacter': 'Molly', 'limit': '50'}),
+]
+
+
+class RegionCollector:
+    """Metrics sink keeping the read region and failovers of the last request"""
+
+    def __init__(self):
+        self.last = {}
+
+    def __call__(self, record):
+        self.last = record
+
+
+def parse_regions(value):
+    """'ap-northeast-1:5,us-east-1:150' -> [(region, round trip ms)], own region first"""
+    regions = []
+    for part in value.split(','):
+        name, _, round_trip = part.partition(':')
+        regions.append((name.strip(), float(round_trip or 0)))
+    return regions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--regions', default='ap-northeast-1:5,us-east-1:150',
+                        help='region:round-trip-ms list, the function\'s own region first')
+    parser.add_argument('--home', default='us-east-1', help='Home (write) region')
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--outage', default='100-200', metavar='FROM-TO',
+                        help='Request range during which the own region is down (empty: none)')
+    parser.add_argument('--cooldown', type=float, default=1.0, help='Seconds a failing region is skipped')
+    parser.add_argument('--concurrent', action='store_true', help='Also run the query concurrently (CONCURRENT_QUERY)')
+    args = parser.parse_args()
+
+    backend = create_local_backend(num_series=60, items_per_series=12)
+    regions = parse_regions(args.regions)
+    endpoints = {name: region_router.SimulatedRegion(backend, name, round_trip) for name, round_trip in regions}
+    router = region_router.RegionRouter(endpoints, args.home)
+    set_storage_backend(router)
+    region_router.COOLDOWN_SECONDS = args.cooldown
+    handler.CONCURRENT_QUERY = args.concurrent
+    handler.QUERY_CACHE = False  # every request reads through the router
+
+    outage = range(*map(int, args.outage.split('-'))) if args.outage else range(0)
+    own_region = regions[0][0]
+    periods = {'before': LatencyHistogram(), 'outage': LatencyHistogram(), 'after': LatencyHistogram()}
+    read_regions = {period: {} for period in periods}
+    statuses = {}
+    collector = RegionCollector()
+    metrics.add_sink(collector)
+
+    now = int(time.time())
+    # Handler and router log lines (errors, failovers) are captured and counted, not printed
+    log = io.StringIO()
+    for i in range(args.requests):
+        endpoints[own_region].down = i in outage
+        period = 'outage' if i in outage else ('before' if not outage or i < outage.start else 'after')
+        path, params = SCENARIOS[i % len(SCENARIOS)]
+        # One device per request keeps the run clear of rate limiting; distinct timestamps avoid replays
+        event = build_event(path, params, f"region-sim-{i}", timestamp=now - i % 200)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(log):
+            response = handler.lambda_handler(event, None)
+        periods[period].record((time.perf_counter() - start) * 1_000_000)
+        statuses[response['statusCode']] = statuses.get(response['statusCode'], 0) + 1
+        region = collector.last.get('ReadRegion', 'none')
+        read_regions[period][region] = read_regions[period].get(region, 0) + 1
+
+    print("=" * 70)
+    print(f"REGION ROUTING ({args.requests} requests, home {args.home}, status {statuses})")
+    print("=" * 70)
+    print(f"  {len(log.getvalue().splitlines())} log line(s) from the handler and router (errors, failovers)")
+    print(f"  {'period':<8} {'requests':>8} {'p50 ms':>9} {'p95 ms':>9}  read regions")
+    for period, histogram in periods.items():
+        if not histogram.total_count:
+            continue
+        s = histogram.summary_ms()
+        print(f"  {period:<8} {histogram.total_count:>8} {s['p50']:9.1f} {s['p95']:9.1f}  {read_regions[period]}")
+    print()
+    for region, summary in router.summary().items():
+        mark = '✓' if summary['healthy'] else '✗'
+        print(f"  {mark} {region:<16} calls={summary['calls']:<6} failures={summary['failures']:<4} "
+              f"latency={summary['latency_ms']}ms")
+
+
+if __name__ == '__main__':
+    main()
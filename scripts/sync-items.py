@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+PPMT-AMP-Items Diff Sync
+Diffs a full snapshot of PPMT-AMP-Items (JSON list of items) against the local fingerprint
+index and writes only the inserts, updates and deletes with BatchWriteItem. Unchanged items
+cost nothing, so daily write volume follows churn rather than catalog size.
+
+Usage:
+    # Seed the index from the table once (or after out-of-band writes)
+    python3 scripts/sync-items.py --rebuild-index --backend dynamodb
+
+    # Sync a snapshot; keys missing from the snapshot are deleted
+    python3 scripts/sync-items.py snapshot.json --backend dynamodb
+
+    # Preview only
+    python3 scripts/sync-items.py snapshot.json --dry-run
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'etl'))
+
+import engine  # noqa: E402
+from diff_sync import FINGERPRINT_DB, FingerprintIndex  # noqa: E402
+
+
+def open_backend(name, db_path):
+    if name == 'local':
+        from local_api import create_local_backend
+        from local_dynamodb import LocalDynamoDB
+        from storage_backend import create_default_tables
+        if db_path and os.path.exists(db_path):
+            return LocalDynamoDB(db_path)
+        if db_path:
+            backend = LocalDynamoDB(db_path)
+            create_default_tables(backend)
+            return backend
+        return create_local_backend()
+    os.environ['STORAGE_BACKEND'] = 'dynamodb'
+    from storage_backend import get_storage_backend
+    return get_storage_backend()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('snapshot', nargs='?', help='JSON file with the full list of items')
+    parser.add_argument('--backend', choices=['local', 'dynamodb'], default='local')
+    parser.add_argument('--db', metavar='PATH', help='Local backend: SQLite file')
+    parser.add_argument('--index', default=FINGERPRINT_DB)
+    parser.add_argument('--rebuild-index', action='store_true', help='Rebuild the index from the table contents')
+    parser.add_argument('--no-deletes', action='store_true', help='Treat the snapshot as partial (upserts only)')
+    parser.add_argument('--dry-run', action='store_true', help='Report the diff without writing')
+    args = parser.parse_args()
+
+    backend = open_backend(args.backend, args.db)
+    index = FingerprintIndex(args.index)
+
+    if args.rebuild_index:
+        start = time.perf_counter()
+        count = index.rebuild(engine.load_catalog_from_backend(backend).values())
+        print(f"✓ Rebuilt fingerprint index from {engine.ITEMS_TABLE}: {count} items "
+              f"({time.perf_counter() - start:.2f}s)")
+    if not args.snapshot:
+        return
+
+    with open(args.snapshot) as f:
+        items = json.load(f)
+
+    start = time.perf_counter()
+    changes = index.diff(items, full=not args.no_deletes)
+    batches = changes.write_batches()
+    diff_seconds = time.perf_counter() - start
+
+    summary = changes.summary()
+    print("=" * 70)
+    print(f"DIFF SYNC: {args.snapshot}")
+    print("=" * 70)
+    print(f"  Snapshot items:  {len(items)}")
+    print(f"  Indexed items:   {len(index)}")
+    print(f"  Inserts:         {summary['inserts']}")
+    print(f"  Updates:         {summary['updates']}")
+    print(f"  Deletes:         {summary['deletes']}")
+    print(f"  Unchanged:       {summary['unchanged']}")
+    print(f"  Change ratio:    {summary['change_ratio']:.1%}")
+    print(f"  Write requests:  {changes.changed} in {len(batches)} BatchWriteItem calls "
+          f"(full rewrite: {len(items)})")
+    print(f"  Diff time:       {diff_seconds * 1000:.1f}ms")
+
+    if args.dry_run:
+        print("\n⚠️  Dry run - nothing written")
+        return
+
+    start = time.perf_counter()
+    versions = engine.apply_write_batches(backend, batches)
+    index.commit(changes)
+    print(f"\n✓ Wrote {changes.changed} changes in {time.perf_counter() - start:.2f}s "
+          f"(bumped {len(versions)} series versions)")
+
+
+if __name__ == '__main__':
+    main()